@@ -15,8 +15,21 @@ class Config:
     MATHPIX_APP_ID = os.getenv("MATHPIX_APP_ID", "")
     MATHPIX_APP_KEY = os.getenv("MATHPIX_APP_KEY", "")
     
+    # Cascade d'extraction: palier rapide (imprimé / basse résolution) puis palier manuscrit
+    EXTRACTION_CASCADE = os.getenv("EXTRACTION_CASCADE", "true").lower() == "true"
+    EXTRACTION_CONFIDENCE_THRESHOLD = float(os.getenv("EXTRACTION_CONFIDENCE_THRESHOLD", 0.85))
+    VISION_MODEL = os.getenv("VISION_MODEL", "gpt-4o")
+    VISION_FAST_MODEL = os.getenv("VISION_FAST_MODEL", "gpt-4o-mini")
+    
     # WolframAlpha (requis pour la résolution)
     WOLFRAM_APP_ID = os.getenv("WOLFRAM_APP_ID", "")
+    # Mode progressif de l'analyse en flux (/api/analyze/stream): solution rapide (Result/Solution)
+    # envoyée aussitôt, puis étapes détaillées en arrière-plan (deux requêtes au lieu d'une).
+    # /api/analyze, qui attend les étapes, fait toujours une seule requête
+    WOLFRAM_PROGRESSIVE = os.getenv("WOLFRAM_PROGRESSIVE", "true").lower() == "true"
+    WOLFRAM_SCAN_TIMEOUT = float(os.getenv("WOLFRAM_SCAN_TIMEOUT", 2.0))
+    WOLFRAM_POD_TIMEOUT = float(os.getenv("WOLFRAM_POD_TIMEOUT", 2.0))
+    WOLFRAM_STEPS_TIMEOUT = float(os.getenv("WOLFRAM_STEPS_TIMEOUT", 8.0))
     
     # LLM Configuration
     LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai").lower()  # "openai" ou "gemini"
@@ -24,6 +37,99 @@ class Config:
     GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "")
     OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
     GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
+    # Explications locales par modèles pour les problèmes courants (sans appel LLM)
+    TEMPLATE_EXPLANATIONS = os.getenv("TEMPLATE_EXPLANATIONS", "true").lower() == "true"
+    # Plafonds de tokens de sortie (les valeurs effectives s'adaptent à la complexité)
+    VISION_MAX_TOKENS = int(os.getenv("VISION_MAX_TOKENS", 600))
+    EXPLANATION_MAX_TOKENS = int(os.getenv("EXPLANATION_MAX_TOKENS", 2000))
+    # Solutions longues: étapes expliquées par parties, en parallèle (0: un seul appel LLM)
+    EXPLANATION_CHUNK_SIZE = int(os.getenv("EXPLANATION_CHUNK_SIZE", 6))  # Étapes par appel au plus
+    EXPLANATION_CHUNK_WORKERS = int(os.getenv("EXPLANATION_CHUNK_WORKERS", 4))  # Appels simultanés
+    # Explications par étape gardées en mémoire, réutilisées d'un problème à l'autre (0: désactivé)
+    STEP_CACHE_SIZE = int(os.getenv("STEP_CACHE_SIZE", 4096))
+    # Sortie JSON structurée native (schéma des étapes) pour les explications
+    LLM_STRUCTURED_OUTPUT = os.getenv("LLM_STRUCTURED_OUTPUT", "true").lower() == "true"
+    
+    # URLs des APIs externes (surchargées pour les tests de charge avec simulateurs)
+    MATHPIX_API_URL = os.getenv("MATHPIX_API_URL", "https://api.mathpix.com/v3/text")
+    WOLFRAM_API_URL = os.getenv("WOLFRAM_API_URL", "https://api.wolframalpha.com/v2/query")
+    OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "")
+    GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT", "")
+    
+    # Traçage distribué (spans par étape et par appel sortant)
+    TRACING_ENABLED = os.getenv("TRACING_ENABLED", "true").lower() == "true"
+    TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "math-assistant-backend")
+    TRACE_EXPORT_FILE = os.getenv("TRACE_EXPORT_FILE", "")  # Spans en JSON lignes (ex: traces/spans.jsonl)
+    TRACE_COLLECTOR_URL = os.getenv("TRACE_COLLECTOR_URL", "")  # Collecteur OTLP/HTTP (ex: http://localhost:4318/v1/traces)
+    TRACE_SLOW_REQUEST_MS = float(os.getenv("TRACE_SLOW_REQUEST_MS", 10000))  # Log du détail au-delà (0: désactivé)
+    
+    # Surveillance de la boucle d'événements (pile des callbacks qui la bloquent)
+    LOOP_WATCHDOG = os.getenv("LOOP_WATCHDOG", "true").lower() == "true"
+    LOOP_WATCHDOG_THRESHOLD_MS = float(os.getenv("LOOP_WATCHDOG_THRESHOLD_MS", 100))
+    LOOP_WATCHDOG_INTERVAL_MS = float(os.getenv("LOOP_WATCHDOG_INTERVAL_MS", 50))
+    
+    # Endpoints de diagnostic (/debug/*): désactivés si ADMIN_TOKEN est vide
+    ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+    PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", 60))
+    
+    # Logs: format (json ou text), échantillonnage des logs INFO par route
+    # (ex: "/api/latex=0.1,/api/analyze=0.2,*=1"); les requêtes en erreur ou
+    # plus lentes que LOG_SLOW_REQUEST_MS sont toujours loggées
+    LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+    LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "")
+    LOG_SLOW_REQUEST_MS = float(os.getenv("LOG_SLOW_REQUEST_MS", 2000))
+    LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+    
+    # Cache des résultats (ETag = empreinte de l'entrée + version du pipeline)
+    # Incrémenter PIPELINE_VERSION invalide les résultats et ETags existants
+    PIPELINE_VERSION = os.getenv("PIPELINE_VERSION", "1")
+    RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", 512))  # Nombre de résultats en mémoire
+    RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", 86400))  # Secondes
+    # Base SQLite partagée par les workers et le préchauffage (warm_cache.py); vide: mémoire seule
+    RESULT_CACHE_DB = os.getenv("RESULT_CACHE_DB", "")
+    
+    # Historique des analyses (SQLite): relecture sans recalcul, par client; vide: désactivé
+    HISTORY_DB = os.getenv("HISTORY_DB", "")
+    # Problèmes similaires déjà résolus (index dans HISTORY_DB)
+    SIMILAR_MIN_SCORE = float(os.getenv("SIMILAR_MIN_SCORE", 0.75))  # Similarité structurelle (0 à 1)
+    SIMILAR_CANDIDATES_PER_BAND = int(os.getenv("SIMILAR_CANDIDATES_PER_BAND", 100))
+    
+    # Clés d'idempotence (en-tête Idempotency-Key): durée de rejeu du résultat, en secondes
+    IDEMPOTENCY_KEY_TTL = float(os.getenv("IDEMPOTENCY_KEY_TTL", 3600))
+    
+    # Export PDF côté serveur (pool de threads dédié, formules composées gardées en cache)
+    PDF_EXPORT_WORKERS = int(os.getenv("PDF_EXPORT_WORKERS", 2))
+    PDF_EXPORT_MAX_ITEMS = int(os.getenv("PDF_EXPORT_MAX_ITEMS", 100))  # Analyses par export
+    PDF_FORMULA_CACHE_SIZE = int(os.getenv("PDF_FORMULA_CACHE_SIZE", 2048))
+    
+    # Pages à plusieurs équations (/api/latex/regions): régions extraites en parallèle
+    SEGMENT_MAX_REGIONS = int(os.getenv("SEGMENT_MAX_REGIONS", 20))
+    SEGMENT_WORKERS = int(os.getenv("SEGMENT_WORKERS", 4))  # Extractions simultanées
+    
+    # Documents de plusieurs pages (/api/ingest: PDF ou archive zip d'images)
+    INGEST_MAX_SIZE = int(os.getenv("INGEST_MAX_SIZE", 52428800))  # 50MB par défaut
+    INGEST_MAX_PAGES = int(os.getenv("INGEST_MAX_PAGES", 200))
+    INGEST_PDF_DPI = int(os.getenv("INGEST_PDF_DPI", 150))  # Résolution du rendu des pages PDF
+    INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", 4))  # Pages traitées simultanément
+    
+    # Analyse en flux (/api/analyze/stream: étapes envoyées au fil de la réponse du LLM)
+    ANALYZE_STREAM_WORKERS = int(os.getenv("ANALYZE_STREAM_WORKERS", 8))  # Threads dédiés
+    
+    # Ordonnancement des calculs: priorités (interactive, batch, warmup) et file
+    # équitable pondérée par locataire (X-Tenant-Id ou X-API-Key)
+    SCHEDULER_SLOTS = int(os.getenv("SCHEDULER_SLOTS", 16))  # Calculs simultanés (0: désactivé)
+    SCHEDULER_INTERACTIVE_RESERVE = int(os.getenv("SCHEDULER_INTERACTIVE_RESERVE", 4))  # Places réservées
+    SCHEDULER_TENANT_WEIGHTS = os.getenv("SCHEDULER_TENANT_WEIGHTS", "")  # ex: "ecole-a=3,ecole-b=1"
+    
+    # Pré-rendu des formules dans /api/analyze ("mathml" ou "svg"; vide: seulement sur demande)
+    PRERENDER_FORMAT = os.getenv("PRERENDER_FORMAT", "").lower()
+    PRERENDER_CACHE_SIZE = int(os.getenv("PRERENDER_CACHE_SIZE", 4096))  # Fragments rendus
+    
+    # Compression des réponses (brotli utilisé seulement si le paquet est installé)
+    RESPONSE_COMPRESSION = os.getenv("RESPONSE_COMPRESSION", "true").lower() == "true"
+    COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", 1024))  # Octets
+    COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", 6))
+    COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", 4))
     
     # Server Configuration
     HOST = os.getenv("HOST", "0.0.0.0")
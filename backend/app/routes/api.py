@@ -1,34 +1,251 @@
 """
 Routes API pour Math Assistant
 """
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException
-from fastapi.responses import JSONResponse
-from typing import Optional
+from fastapi import APIRouter, Depends, UploadFile, File, Form, Header, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ValidationError
+from typing import Any, Callable, Dict, Optional, Tuple, Type, Union
 import logging
+import re
+from datetime import date
 
-from app.services.latex_extraction_service import latex_extraction_service
-from app.services.wolfram_service import wolfram_service
-from app.services.llm_service import llm_service
+from app.services.analysis_pipeline import NoEquationError, analysis_pipeline
+from app.services.analysis_stream_service import analysis_stream_service
+from app.services.history_service import history_service
+from app.services.prompt_service import prompt_service
+from app.services.similarity_service import similarity_service
+from app.services.pdf_export_service import pdf_export_service
+from app.services.formula_render_service import FORMATS, formula_render_service
+from app.services.ingestion_service import ingestion_service
+from app.services.inflight_service import IdempotencyConflict, idempotency_store, inflight_registry
+from app.services.result_cache import result_cache
+from app.services.scheduler_service import WorkClass, work_scheduler
 from app.config import config
+from app.schemas import (
+    AnalyzeResponse, HistoryPage, LatexRegionsResponse, LatexResponse, PDFExportRequest, RenderedAnalyzeResponse,
+    SimilarProblemsResponse, StoredAnalysis
+)
 from app.utils.file_validation import validate_image_file
 from app.utils.error_handler import handle_service_error
+from app.utils.ingestion import iter_upload
+from app.utils.http_cache import cache_headers, etag_matches, format_etag, not_modified
+from app.utils.responses import FastJSONResponse
+from app.utils.tracing import tracer
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api", tags=["api"])
 
+# Identifiant de client accepté (généré aléatoirement par le frontend)
+CLIENT_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{8,64}$")
 
-@router.post("/latex")
-async def extract_latex(image: UploadFile = File(...)):
+
+def _typed_response(model: Type[BaseModel], result: Dict[str, Any]) -> FastJSONResponse:
+    """
+    Réponse JSON sérialisée depuis le modèle typé (pydantic-core, sans copie en dicts)
+    Si le résultat ne respecte pas le modèle, il est renvoyé tel quel.
+    """
+    try:
+        return FastJSONResponse(content=model.model_validate(result))
+    except ValidationError as e:
+        logger.warning("Réponse non conforme au modèle %s: %s", model.__name__, e)
+        return FastJSONResponse(content=result)
+
+
+def _result_headers(result_id: str, render_format: Optional[str] = None) -> Dict[str, str]:
+    """
+    En-têtes de cache d'un résultat calculé par POST: le client peut conserver
+    sa copie mais doit la revalider (If-None-Match); la version GET-able du
+    résultat est indiquée par Content-Location
+    """
+    if render_format:
+        return cache_headers(
+            format_etag(f"{result_id}-{render_format}"), "no-cache",
+            location=f"/api/results/{result_id}?render={render_format}"
+        )
+    return cache_headers(format_etag(result_id), "no-cache", location=f"/api/results/{result_id}")
+
+
+def _render_format(render: Optional[str]) -> Optional[str]:
+    """
+    Format de pré-rendu des formules (champ render, sinon PRERENDER_FORMAT)
+
+    Returns:
+        "mathml" ou "svg", ou None sans pré-rendu
+    """
+    requested = (render if render is not None else config.PRERENDER_FORMAT).lower()
+    if requested in ("", "none"):
+        return None
+    if requested not in FORMATS:
+        raise HTTPException(
+            status_code=400, detail=f"Format de rendu inconnu (attendu: {', '.join(FORMATS)} ou none)."
+        )
+    return formula_render_service.output_format(requested)
+
+
+async def _analysis_response(result: Dict[str, Any], render_format: Optional[str]) -> FastJSONResponse:
+    """Réponse d'analyse, avec les formules pré-rendues si un format est demandé"""
+    if not render_format:
+        return _typed_response(AnalyzeResponse, result)
+    rendered = await run_in_threadpool(formula_render_service.prerender, result, render_format)
+    return _typed_response(RenderedAnalyzeResponse, rendered)
+
+
+def _work_class(request: Request, default: str) -> WorkClass:
+    """Priorité (X-Priority, seulement pour l'abaisser) et locataire de la requête"""
+    return work_scheduler.classify(
+        default,
+        requested=request.headers.get("X-Priority"),
+        tenant_id=request.headers.get("X-Tenant-Id"),
+        api_key=request.headers.get("X-API-Key"),
+        client_host=request.client.host if request.client else None
+    )
+
+
+def interactive_work(request: Request) -> WorkClass:
+    """Dépendance FastAPI: classe d'une requête interactive (élève qui attend sa réponse)"""
+    return _work_class(request, "interactive")
+
+
+def batch_work(request: Request) -> WorkClass:
+    """Dépendance FastAPI: classe d'un traitement en masse"""
+    return _work_class(request, "batch")
+
+
+async def _compute_once(
+    kind: str,
+    result_id: str,
+    idempotency_key: Optional[str],
+    work: WorkClass,
+    function: Callable,
+    *args
+) -> Tuple[Any, bool]:
+    """
+    Exécute un calcul au plus une fois par entrée et par clé d'idempotence
+    (rattachement au calcul identique en cours, rejeu du résultat enregistré),
+    dans une place d'exécution attribuée selon la classe de la requête
+    
+    Returns:
+        Tuple (résultat, rejoué) - rejoué vaut True si le résultat enregistré
+        pour la clé d'idempotence est renvoyé
+        
+    Raises:
+        HTTPException: 422 si la clé a déjà servi pour une autre entrée
+    """
+    scoped_key = f"{kind}:{idempotency_key}" if idempotency_key else None
+    if scoped_key:
+        try:
+            record = idempotency_store.begin(scoped_key, result_id)
+        except IdempotencyConflict:
+            raise HTTPException(
+                status_code=422,
+                detail="Idempotency-Key déjà utilisée pour une autre requête."
+            )
+        if record is not None and record.result is not None:
+            tracer.set_attributes({"idempotency.replayed": True})
+            return record.result, True
+    try:
+        result, shared = await inflight_registry.run(
+            result_id, function, *args, slot=work_scheduler.slot(work)
+        )
+    except BaseException:
+        if scoped_key:
+            idempotency_store.discard(scoped_key)
+        raise
+    if scoped_key:
+        idempotency_store.complete(scoped_key, result)
+    tracer.set_attributes({"inflight.shared": shared})
+    return result, False
+
+
+def _client_id(header: Optional[str]) -> Optional[str]:
+    """Identifiant de client de l'en-tête X-Client-Id, ou None s'il est absent ou invalide"""
+    if header and CLIENT_ID_PATTERN.match(header):
+        return header
+    return None
+
+
+def _load_stored_analysis(result_id: str) -> Optional[Dict[str, Any]]:
+    """Dernière analyse complète de l'historique pour cette entrée, remise dans le cache"""
+    record = history_service.latest(result_id)
+    if record is None:
+        return None
+    result = history_service.analysis_result(record)
+    result_cache.put(result_id, result)
+    return result
+
+
+async def _record_history(response, result_id: str, result: Dict[str, Any], complete: bool,
+                          source: str, timings: Dict[str, float], client_id: Optional[str]):
+    """Enregistre l'analyse servie dans l'historique (identifiant dans X-Analysis-Id)"""
+    analysis_id = await run_in_threadpool(
+        history_service.record, result_id, result, complete, source, timings, client_id
+    )
+    if analysis_id:
+        response.headers["X-Analysis-Id"] = analysis_id
+
+
+async def _similar_precheck(result_id: str, latex: Optional[str], image_bytes: Optional[bytes],
+                            work: WorkClass) -> Optional[FastJSONResponse]:
+    """
+    Problèmes déjà résolus de même structure, proposés avant de payer une résolution
+    
+    Returns:
+        Réponse listant les problèmes proches, ou None s'il n'y en a pas
+    """
+    if not latex:
+        latex_result_id = analysis_pipeline.latex_result_id(image_bytes)
+        latex_result, _ = await _compute_once(
+            "latex", latex_result_id, None, work, analysis_pipeline.extract_latex, image_bytes
+        )
+        latex = latex_result.get("latex", "")
+        if not latex:
+            raise NoEquationError("Impossible de détecter d'équation mathématique dans l'image.")
+    similar = await run_in_threadpool(
+        similarity_service.search, latex, 3, config.SIMILAR_MIN_SCORE, result_id
+    )
+    tracer.set_attributes({"similar.count": len(similar)})
+    if not similar:
+        return None
+    logger.info("%d problème(s) similaire(s) proposé(s) avant résolution", len(similar))
+    response = _typed_response(SimilarProblemsResponse, {"latex": latex, "similar": similar})
+    response.headers["Cache-Control"] = "no-store"
+    return response
+
+
+def _log_usage(usage):
+    """Log la consommation LLM cumulée de la requête"""
+    summary = usage.summary()
+    if summary["calls"]:
+        logger.info(
+            "Consommation LLM: %d appel(s), %d tokens en entrée (cache: %d), %d en sortie, coût≈$%.5f",
+            summary["calls"], summary["prompt_tokens"], summary["cached_tokens"],
+            summary["completion_tokens"], summary["cost_usd"],
+            extra={"llm_usage": summary}
+        )
+
+
+@router.post("/latex", response_model=LatexResponse)
+async def extract_latex(
+    image: UploadFile = File(...),
+    if_none_match: Optional[str] = Header(None),
+    idempotency_key: Optional[str] = Header(None),
+    work: WorkClass = Depends(interactive_work)
+):
     """
     Extrait le LaTeX depuis une image
     
     Args:
         image: Fichier image uploadé
+        if_none_match: ETag d'un résultat déjà reçu pour cette image (304 s'il est à jour)
+        idempotency_key: Clé d'idempotence du client (rejeu sans nouveau calcul)
+        work: Priorité et locataire de la requête (ordonnancement des calculs)
         
     Returns:
-        JSON avec 'latex' et 'confidence'
+        JSON avec 'latex' et 'confidence', ETag du résultat
     """
+    usage = prompt_service.start_request()
     try:
         # Lit l'image
         image_bytes = await image.read()
@@ -43,10 +260,20 @@ async def extract_latex(image: UploadFile = File(...)):
         if not is_valid:
             raise HTTPException(status_code=400, detail=error_message)
         
-        logger.info(f"Extraction LaTeX demandée pour un fichier de {len(image_bytes)} bytes")
+        tracer.set_attributes({"image.size_bytes": len(image_bytes)})
+        logger.info("Extraction LaTeX demandée pour un fichier de %d bytes", len(image_bytes))
+        
+        # Résultat identifié par l'empreinte de l'image et la version du pipeline
+        result_id = analysis_pipeline.latex_result_id(image_bytes)
+        headers = _result_headers(result_id)
+        if etag_matches(if_none_match, headers["ETag"]):
+            tracer.set_attributes({"http.not_modified": True})
+            return not_modified(headers)
         
-        # Extrait le LaTeX
-        result = latex_extraction_service.extract_latex(image_bytes)
+        # Extrait le LaTeX (hors de la boucle d'événements, une fois par image)
+        result, replayed = await _compute_once(
+            "latex", result_id, idempotency_key, work, analysis_pipeline.extract_latex, image_bytes
+        )
         
         if not result.get("latex"):
             raise HTTPException(
@@ -54,9 +281,14 @@ async def extract_latex(image: UploadFile = File(...)):
                 detail="Impossible de détecter d'équation mathématique dans l'image."
             )
         
-        logger.info(f"LaTeX extrait avec succès (confidence: {result.get('confidence', 0):.2f})")
+        logger.info("LaTeX extrait avec succès (confidence: %.2f)", result.get('confidence', 0))
+        _log_usage(usage)
         
-        return JSONResponse(content=result)
+        response = _typed_response(LatexResponse, result)
+        response.headers.update(headers)
+        if replayed:
+            response.headers["Idempotent-Replayed"] = "true"
+        return response
         
     except HTTPException:
         raise
@@ -68,10 +300,91 @@ async def extract_latex(image: UploadFile = File(...)):
         raise handle_service_error(e)
 
 
-@router.post("/analyze")
+@router.post("/latex/regions", response_model=LatexRegionsResponse)
+async def extract_latex_regions(
+    image: UploadFile = File(...),
+    if_none_match: Optional[str] = Header(None),
+    idempotency_key: Optional[str] = Header(None),
+    work: WorkClass = Depends(interactive_work)
+):
+    """
+    Extrait les équations d'une page (exercice photographié en entier)
+    La page est découpée en régions, une par équation, extraites en parallèle.
+    
+    Args:
+        image: Fichier image uploadé
+        if_none_match: ETag d'un résultat déjà reçu pour cette image (304 s'il est à jour)
+        idempotency_key: Clé d'idempotence du client (rejeu sans nouveau calcul)
+        work: Priorité et locataire de la requête (ordonnancement des calculs)
+        
+    Returns:
+        JSON avec 'regions' dans l'ordre de lecture ('latex', 'confidence' et
+        position 'box' de chaque équation), ETag du résultat
+    """
+    usage = prompt_service.start_request()
+    try:
+        image_bytes = await image.read()
+        
+        is_valid, error_message = validate_image_file(
+            image_bytes,
+            content_type=image.content_type,
+            max_size=config.MAX_UPLOAD_SIZE
+        )
+        
+        if not is_valid:
+            raise HTTPException(status_code=400, detail=error_message)
+        
+        tracer.set_attributes({"image.size_bytes": len(image_bytes)})
+        logger.info("Extraction des équations d'une page de %d bytes", len(image_bytes))
+        
+        result_id = analysis_pipeline.regions_result_id(image_bytes)
+        headers = _result_headers(result_id)
+        if etag_matches(if_none_match, headers["ETag"]):
+            tracer.set_attributes({"http.not_modified": True})
+            return not_modified(headers)
+        
+        # Découpage et extractions hors de la boucle d'événements, une fois par image
+        result, replayed = await _compute_once(
+            "latex_regions", result_id, idempotency_key, work, analysis_pipeline.extract_regions, image_bytes
+        )
+        
+        if not result["regions"]:
+            raise HTTPException(
+                status_code=422,
+                detail="Impossible de détecter d'équation mathématique dans l'image."
+            )
+        
+        logger.info("%d équations extraites", len(result["regions"]))
+        _log_usage(usage)
+        
+        response = _typed_response(LatexRegionsResponse, result)
+        response.headers.update(headers)
+        if replayed:
+            response.headers["Idempotent-Replayed"] = "true"
+        return response
+        
+    except HTTPException:
+        raise
+    except ValueError as e:
+        logger.error(f"ValueError lors de l'extraction des équations: {str(e)}")
+        raise handle_service_error(e)
+    except Exception as e:
+        logger.error(f"Erreur inattendue lors de l'extraction des équations: {str(e)}", exc_info=True)
+        raise handle_service_error(e)
+
+
+@router.post(
+    "/analyze", response_model=Union[RenderedAnalyzeResponse, AnalyzeResponse, SimilarProblemsResponse]
+)
 async def analyze_problem(
     image: UploadFile = File(...),
-    latex: Optional[str] = Form(None)
+    latex: Optional[str] = Form(None),
+    check_similar: bool = Form(False),
+    render: Optional[str] = Form(None),
+    if_none_match: Optional[str] = Header(None),
+    idempotency_key: Optional[str] = Header(None),
+    x_client_id: Optional[str] = Header(None),
+    work: WorkClass = Depends(interactive_work)
 ):
     """
     Analyse complète : LaTeX → Résolution → Explication
@@ -79,11 +392,25 @@ async def analyze_problem(
     Args:
         image: Fichier image uploadé
         latex: LaTeX confirmé par l'utilisateur (optionnel)
+        check_similar: Propose d'abord les problèmes déjà résolus de même structure
+        render: Pré-rendu des formules ("mathml", "svg" ou "none"; défaut: PRERENDER_FORMAT)
+        if_none_match: ETag d'une analyse déjà reçue pour cette entrée (304 si elle est à jour)
+        idempotency_key: Clé d'idempotence du client (rejeu sans nouveau calcul)
+        x_client_id: Identifiant du client, pour son historique (optionnel)
+        work: Priorité et locataire de la requête (ordonnancement des calculs)
         
     Returns:
-        JSON avec 'problem', 'latex', 'solution' et 'steps'
+        JSON avec 'problem', 'latex', 'solution' et 'steps', ETag du résultat,
+        identifiant de l'analyse dans l'historique (X-Analysis-Id).
+        Avec render, 'rendered_format', 'latex_rendered' et 'formula_rendered'
+        dans chaque étape (balisage à afficher sans composition côté client).
+        Avec check_similar, JSON avec 'latex' et 'similar' si des problèmes
+        proches sont déjà résolus (aucun calcul lancé: renvoyer la requête
+        sans check_similar pour résoudre celui-ci)
     """
+    usage = prompt_service.start_request()
     try:
+        render_format = _render_format(render)
         # Lit l'image si nécessaire
         image_bytes = None
         if not latex:
@@ -98,123 +425,57 @@ async def analyze_problem(
             
             if not is_valid:
                 raise HTTPException(status_code=400, detail=error_message)
+            tracer.set_attributes({"image.size_bytes": len(image_bytes)})
         
-        logger.info(f"Analyse complète demandée (latex fourni: {latex is not None})")
+        logger.info("Analyse complète demandée (latex fourni: %s)", latex is not None)
         
-        # 1. Extraction LaTeX
-        extracted_latex = latex
-        if not extracted_latex:
-            logger.info("Extraction LaTeX depuis l'image...")
-            latex_result = latex_extraction_service.extract_latex(image_bytes)
-            extracted_latex = latex_result.get("latex", "")
+        # Résultat identifié par l'empreinte de l'entrée (LaTeX confirmé ou image)
+        result_id = analysis_pipeline.analysis_result_id(latex, image_bytes)
+        headers = _result_headers(result_id, render_format)
+        if etag_matches(if_none_match, headers["ETag"]):
+            tracer.set_attributes({"http.not_modified": True})
+            return not_modified(headers)
+        client_id = _client_id(x_client_id)
+        cached = result_cache.get(result_id)
+        if cached is None and history_service.enabled:
+            cached = await run_in_threadpool(_load_stored_analysis, result_id)
+        if cached is not None:
+            tracer.set_attributes({"result_cache.hit": True})
+            logger.info("Analyse servie depuis le cache de résultats")
+            response = await _analysis_response(cached, render_format)
+            response.headers.update(headers)
+            if client_id:
+                await _record_history(response, result_id, cached, True, "cache", {}, client_id)
+            return response
         
-        if not extracted_latex:
-            raise HTTPException(
-                status_code=422,
-                detail="Impossible de détecter d'équation mathématique dans l'image."
-            )
+        if check_similar and similarity_service.enabled:
+            response = await _similar_precheck(result_id, latex, image_bytes, work)
+            if response is not None:
+                return response
         
-        logger.info(f"LaTeX extrait: {extracted_latex[:50]}...")
+        outcome, replayed = await _compute_once(
+            "analyze", result_id, idempotency_key, work, analysis_pipeline.analyze_cached, latex, image_bytes
+        )
         
-        # 2. Résolution avec WolframAlpha
-        logger.info("Résolution avec WolframAlpha...")
-        solution = ""
-        raw_steps = []
+        logger.debug("Analyse complète terminée avec succès")
+        _log_usage(usage)
         
-        try:
-            wolfram_result = wolfram_service.solve(extracted_latex)
-            solution = wolfram_result.get("solution", "")
-            raw_steps = wolfram_result.get("steps", [])
-            
-            if solution:
-                logger.info(f"Solution trouvée: {solution[:50]}...")
-            else:
-                logger.warning("Aucune solution trouvée par WolframAlpha")
-        except Exception as e:
-            logger.warning(f"Erreur WolframAlpha: {str(e)}, tentative de calcul direct")
-            # Si WolframAlpha échoue, on essaie un calcul direct
-            try:
-                # Convertit le LaTeX en expression calculable
-                import re
-                calc_expr = extracted_latex
-                
-                # Remplace les puissances: 4^{2} -> 4**2, 4^2 -> 4**2
-                calc_expr = re.sub(r'\^{(\d+)}', r'**\1', calc_expr)
-                calc_expr = re.sub(r'\^(\d+)', r'**\1', calc_expr)
-                
-                # Nettoie les autres caractères LaTeX
-                calc_expr = calc_expr.replace('\\', '').replace('{', '').replace('}', '')
-                calc_expr = calc_expr.replace(' ', '')
-                
-                # Calcule directement
-                import math
-                allowed_names = {
-                    k: v for k, v in math.__dict__.items() if not k.startswith("__")
-                }
-                allowed_names.update({'abs': abs, 'round': round})
-                
-                result = eval(calc_expr, {"__builtins__": {}}, allowed_names)
-                
-                if isinstance(result, float):
-                    if result.is_integer():
-                        solution = str(int(result))
-                    else:
-                        solution = str(round(result, 10))
-                else:
-                    solution = str(result)
-                
-                raw_steps = [{
-                    "title": "Calcul direct",
-                    "description": f"Calcul de l'expression: {extracted_latex}",
-                    "formula": f"{extracted_latex} = {solution}",
-                    "explanation": f"Le résultat de {extracted_latex} est {solution}."
-                }]
-                logger.info(f"Calcul direct réussi: {solution}")
-            except Exception as calc_error:
-                logger.warning(f"Calcul direct échoué: {str(calc_error)}")
-                solution = ""
-                raw_steps = []
-        
-        if not solution and not raw_steps:
-            # Dernier fallback si tout échoue
-            solution = "Résolution disponible"
-            raw_steps = [{
-                "title": "Analyse du problème",
-                "description": extracted_latex,
-                "formula": extracted_latex,
-                "explanation": "Analyse du problème mathématique. Les étapes détaillées seront générées par l'IA."
-            }]
-        
-        # 3. Enrichissement avec LLM
-        logger.info(f"Enrichissement avec LLM ({llm_service.provider})...")
-        try:
-            enriched_steps = llm_service.generate_explanation(
-                problem=extracted_latex,
-                solution=solution,
-                steps=raw_steps
+        response = await _analysis_response(outcome.result, render_format)
+        if outcome.complete:
+            response.headers.update(headers)
+        else:
+            response.headers["Cache-Control"] = "no-store"
+        if replayed:
+            response.headers["Idempotent-Replayed"] = "true"
+        else:
+            await _record_history(
+                response, result_id, outcome.result, outcome.complete,
+                "computed", outcome.timings_ms, client_id
             )
-            
-            if enriched_steps and len(enriched_steps) > 0:
-                logger.info(f"{len(enriched_steps)} étapes enrichies générées")
-            else:
-                logger.warning("Aucune étape enrichie générée, utilisation des étapes brutes")
-                enriched_steps = raw_steps
-        except Exception as e:
-            logger.warning(f"Erreur LLM: {str(e)}, utilisation des étapes brutes")
-            enriched_steps = raw_steps
-        
-        # Format la réponse
-        result = {
-            "problem": extracted_latex,
-            "latex": extracted_latex,
-            "solution": solution,
-            "steps": enriched_steps if enriched_steps else raw_steps
-        }
-        
-        logger.info("Analyse complète terminée avec succès")
-        
-        return JSONResponse(content=result)
+        return response
         
+    except NoEquationError as e:
+        raise HTTPException(status_code=422, detail=str(e))
     except HTTPException:
         raise
     except ValueError as e:
@@ -224,3 +485,245 @@ async def analyze_problem(
         logger.error(f"Erreur inattendue lors de l'analyse: {str(e)}", exc_info=True)
         raise handle_service_error(e)
 
+
+@router.post("/analyze/stream", response_class=StreamingResponse)
+async def analyze_problem_stream(
+    image: UploadFile = File(...),
+    latex: Optional[str] = Form(None),
+    x_client_id: Optional[str] = Header(None),
+    work: WorkClass = Depends(interactive_work)
+):
+    """
+    Analyse complète envoyée au fil du calcul (même entrée que /api/analyze)
+    Chaque étape expliquée est envoyée dès que le LLM l'a écrite, sans attendre
+    la fin de sa réponse.
+    
+    Args:
+        image: Fichier image uploadé
+        latex: LaTeX confirmé par l'utilisateur (optionnel)
+        x_client_id: Identifiant du client, pour son historique (optionnel)
+        work: Priorité et locataire de la requête (ordonnancement des calculs)
+        
+    Returns:
+        Flux NDJSON: 'latex', 'solution', une ligne 'step' par étape expliquée
+        ('index': rang de l'étape), puis 'done' avec l'analyse complète
+        ('result', 'complete', 'analysis_id') ou 'error' ('status', 'detail')
+    """
+    image_bytes = None
+    if not latex:
+        image_bytes = await image.read()
+        is_valid, error_message = validate_image_file(
+            image_bytes,
+            content_type=image.content_type,
+            max_size=config.MAX_UPLOAD_SIZE
+        )
+        if not is_valid:
+            raise HTTPException(status_code=400, detail=error_message)
+        tracer.set_attributes({"image.size_bytes": len(image_bytes)})
+    
+    logger.info("Analyse en flux demandée (latex fourni: %s)", latex is not None)
+    result_id = analysis_pipeline.analysis_result_id(latex, image_bytes)
+    cached = result_cache.get(result_id)
+    if cached is None and history_service.enabled:
+        cached = await run_in_threadpool(_load_stored_analysis, result_id)
+    if cached is not None:
+        tracer.set_attributes({"result_cache.hit": True})
+    return StreamingResponse(
+        analysis_stream_service.stream(latex, image_bytes, work, cached, _client_id(x_client_id)),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-store"}
+    )
+
+
+@router.get("/results/{result_id}", response_model=Union[RenderedAnalyzeResponse, AnalyzeResponse, LatexResponse])
+async def get_result(
+    result_id: str,
+    render: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None)
+):
+    """
+    Résultat déjà calculé (URL indiquée par Content-Location)
+    Son contenu est figé pour un identifiant donné: navigateurs et CDN
+    peuvent le conserver pendant sa durée de validité.
+    
+    Args:
+        result_id: Identifiant du résultat (valeur de l'ETag)
+        render: Pré-rendu des formules d'une analyse ("mathml" ou "svg")
+        if_none_match: ETag de la copie du client
+        
+    Returns:
+        JSON du résultat (analyse ou extraction LaTeX), 304 si la copie est à jour
+    """
+    render_format = _render_format(render or "none")
+    etag = format_etag(f"{result_id}-{render_format}" if render_format else result_id)
+    result = result_cache.get(result_id)
+    if result is None and history_service.enabled:
+        result = await run_in_threadpool(_load_stored_analysis, result_id)
+    if result is None:
+        if etag_matches(if_none_match, etag):
+            return not_modified(cache_headers(etag, "no-cache"))
+        raise HTTPException(status_code=404, detail="Résultat introuvable ou expiré.")
+    
+    headers = cache_headers(etag, f"public, max-age={result_cache.remaining_ttl(result_id)}, immutable")
+    if etag_matches(if_none_match, etag):
+        return not_modified(headers)
+    if "steps" in result:
+        response = await _analysis_response(result, render_format)
+    else:
+        response = _typed_response(LatexResponse, result)
+    response.headers.update(headers)
+    return response
+
+
+@router.get("/history", response_model=HistoryPage)
+async def get_history(
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    x_client_id: Optional[str] = Header(None)
+):
+    """
+    Historique des analyses du client, de la plus récente à la plus ancienne
+    
+    Args:
+        limit: Nombre d'analyses par page
+        cursor: Curseur de la page suivante (next_cursor de la page précédente)
+        x_client_id: Identifiant du client (celui envoyé à /api/analyze)
+        
+    Returns:
+        JSON avec 'items' (résumés) et 'next_cursor'
+    """
+    client_id = _client_id(x_client_id)
+    if client_id is None:
+        raise HTTPException(status_code=400, detail="En-tête X-Client-Id manquant ou invalide.")
+    if not history_service.enabled:
+        raise HTTPException(status_code=404, detail="Historique désactivé.")
+    try:
+        items, next_cursor = await run_in_threadpool(history_service.list, client_id, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    response = _typed_response(HistoryPage, {"items": items, "next_cursor": next_cursor})
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+
+@router.get("/history/{analysis_id}", response_model=StoredAnalysis)
+async def get_history_entry(analysis_id: str, if_none_match: Optional[str] = Header(None)):
+    """
+    Analyse enregistrée, relue directement depuis l'historique (sans recalcul)
+    
+    Args:
+        analysis_id: Identifiant de l'analyse (en-tête X-Analysis-Id de /api/analyze)
+        if_none_match: ETag de la copie du client
+        
+    Returns:
+        JSON de l'analyse avec sa date, son fournisseur et la durée de ses étapes
+    """
+    record = await run_in_threadpool(history_service.get, analysis_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Analyse introuvable.")
+    
+    # Une analyse enregistrée ne change plus
+    headers = cache_headers(format_etag(analysis_id), "private, max-age=86400, immutable")
+    if etag_matches(if_none_match, headers["ETag"]):
+        return not_modified(headers)
+    response = _typed_response(StoredAnalysis, record)
+    response.headers.update(headers)
+    return response
+
+
+@router.get("/similar", response_model=SimilarProblemsResponse)
+async def get_similar(
+    latex: str = Query(..., min_length=1, max_length=2000),
+    k: int = Query(5, ge=1, le=20),
+    min_score: Optional[float] = Query(None, ge=0, le=1)
+):
+    """
+    Problèmes déjà résolus les plus proches structurellement
+    
+    Args:
+        latex: LaTeX du problème
+        k: Nombre de problèmes au plus
+        min_score: Similarité minimale (par défaut SIMILAR_MIN_SCORE)
+        
+    Returns:
+        JSON avec 'latex' et 'similar' (analysis_id à ouvrir avec /api/history/{id})
+    """
+    if not similarity_service.enabled:
+        raise HTTPException(status_code=404, detail="Historique désactivé.")
+    threshold = config.SIMILAR_MIN_SCORE if min_score is None else min_score
+    similar = await run_in_threadpool(similarity_service.search, latex, k, threshold)
+    response = _typed_response(SimilarProblemsResponse, {"latex": latex, "similar": similar})
+    response.headers["Cache-Control"] = "no-store"
+    return response
+
+
+@router.post("/export/pdf", response_class=StreamingResponse)
+async def export_pdf(export: PDFExportRequest):
+    """
+    Export PDF d'une ou plusieurs analyses (fiche de solution ou d'exercices)
+    Les pages sont envoyées au fil de leur composition.
+    
+    Args:
+        export: Analyses (format de /api/analyze) et/ou identifiants de l'historique, titre
+        
+    Returns:
+        Document PDF en pièce jointe
+    """
+    analyses = [analysis.model_dump() for analysis in export.analyses]
+    if export.ids:
+        records = await run_in_threadpool(lambda: [history_service.get(analysis_id) for analysis_id in export.ids])
+        missing = [analysis_id for analysis_id, record in zip(export.ids, records) if record is None]
+        if missing:
+            raise HTTPException(status_code=404, detail=f"Analyse(s) introuvable(s): {', '.join(missing[:5])}")
+        analyses += [history_service.analysis_result(record) for record in records]
+    if not analyses:
+        raise HTTPException(status_code=400, detail="Aucune analyse à exporter.")
+    if len(analyses) > config.PDF_EXPORT_MAX_ITEMS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Trop d'analyses dans un même export (maximum {config.PDF_EXPORT_MAX_ITEMS})."
+        )
+    
+    tracer.set_attributes({"pdf_export.analyses": len(analyses)})
+    filename = f"solution_math_{date.today().isoformat()}.pdf"
+    return StreamingResponse(
+        pdf_export_service.stream(analyses, export.title),
+        media_type="application/pdf",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"', "Cache-Control": "no-store"}
+    )
+
+
+@router.post("/ingest", response_class=StreamingResponse)
+async def ingest_document(
+    file: UploadFile = File(...),
+    analyze: bool = Form(False),
+    work: WorkClass = Depends(batch_work)
+):
+    """
+    Traite un document de plusieurs pages: PDF, archive zip d'images ou image seule
+    Les pages sont lues une à une et traitées en parallèle; chaque résultat
+    est envoyé dès que sa page est traitée.
+    
+    Args:
+        file: Document uploadé
+        analyze: Analyse complète de chaque page (sinon extraction LaTeX seule)
+        work: Classe batch (X-Priority peut l'abaisser à warmup) et locataire
+        
+    Returns:
+        Flux NDJSON: une ligne par page (champ 'page'), puis une ligne de bilan ('done')
+    """
+    if file.size is not None and file.size > config.INGEST_MAX_SIZE:
+        size_mb = config.INGEST_MAX_SIZE / 1024 / 1024
+        raise HTTPException(status_code=413, detail=f"Document trop grand. Taille maximale: {size_mb:.1f}MB")
+    try:
+        pages = await run_in_threadpool(iter_upload, file.file, file.filename or "")
+    except ValueError as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    
+    tracer.set_attributes({"ingest.filename": file.filename or "", "ingest.analyze": analyze})
+    return StreamingResponse(
+        ingestion_service.stream(pages, analyze, work),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-store"}
+    )
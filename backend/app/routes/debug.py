@@ -0,0 +1,113 @@
+"""
+Routes de diagnostic (profilage du service en production)
+Protégées par ADMIN_TOKEN (en-tête X-Admin-Token ou Authorization: Bearer);
+elles répondent 404 tant qu'aucun jeton n'est configuré.
+"""
+import secrets
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse
+
+from app.config import config
+from app.services.latex_extraction_service import latex_extraction_service
+from app.services.scheduler_service import work_scheduler
+from app.utils.loop_watchdog import loop_watchdog
+from app.utils.profiling import profile_store, sampling_profiler
+
+router = APIRouter(prefix="/debug", tags=["debug"])
+
+
+def is_admin_request(request: Request) -> bool:
+    """Vérifie le jeton d'administration de la requête"""
+    if not config.ADMIN_TOKEN:
+        return False
+    token: Optional[str] = request.headers.get("X-Admin-Token")
+    authorization = request.headers.get("Authorization", "")
+    if not token and authorization.startswith("Bearer "):
+        token = authorization[len("Bearer "):]
+    return bool(token) and secrets.compare_digest(token, config.ADMIN_TOKEN)
+
+
+def require_admin(request: Request):
+    """Dépendance FastAPI: refuse les requêtes sans jeton d'administration valide"""
+    if not config.ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not is_admin_request(request):
+        raise HTTPException(status_code=403, detail="Jeton d'administration invalide.")
+
+
+@router.get("/profile", dependencies=[Depends(require_admin)], response_class=PlainTextResponse)
+async def profile(
+    seconds: float = Query(10.0, gt=0),
+    interval_ms: float = Query(5.0, ge=1.0, le=100.0)
+):
+    """
+    Profile le worker par échantillonnage pendant 'seconds' secondes
+    Le trafic continue d'être servi pendant la mesure.
+
+    Returns:
+        Piles au format collapsed (flamegraph.pl, speedscope)
+    """
+    seconds = min(seconds, config.PROFILE_MAX_SECONDS)
+    try:
+        # Thread dédié: la boucle d'événements reste disponible pour les requêtes profilées
+        result = await run_in_threadpool(sampling_profiler.profile, seconds, interval_ms / 1000)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return PlainTextResponse(
+        result["collapsed"],
+        headers={
+            "X-Profile-Samples": str(result["samples"]),
+            "X-Profile-Duration": str(result["duration"]),
+        }
+    )
+
+
+@router.get("/profile/{profile_id}", dependencies=[Depends(require_admin)], response_class=PlainTextResponse)
+async def request_profile(profile_id: str):
+    """
+    Retourne le profil déterministe d'une requête (en-tête X-Profile: 1 sur /api/analyze)
+
+    Returns:
+        Piles au format collapsed, poids en microsecondes
+    """
+    collapsed = profile_store.get(profile_id)
+    if collapsed is None:
+        raise HTTPException(status_code=404, detail="Profil introuvable ou expiré.")
+    return PlainTextResponse(collapsed)
+
+
+@router.get("/loop", dependencies=[Depends(require_admin)])
+async def loop_stats(reset: bool = Query(False)):
+    """
+    Retard de la boucle d'événements et derniers blocages détectés
+    (route, durée et pile du code bloquant)
+
+    Args:
+        reset: Efface les mesures après lecture
+    """
+    stats = loop_watchdog.stats()
+    if reset:
+        loop_watchdog.reset()
+    return stats
+
+
+@router.get("/scheduler", dependencies=[Depends(require_admin)])
+async def scheduler_stats():
+    """
+    Ordonnancement des calculs: places occupées, profondeur des files et
+    temps d'attente (p50, p95, max) par classe de priorité, calculs en
+    attente par locataire
+    """
+    return work_scheduler.stats()
+
+
+@router.get("/extraction", dependencies=[Depends(require_admin)])
+async def extraction_stats():
+    """
+    Cascade d'extraction: tentatives, résultats acceptés et taux
+    d'acceptation (hit_rate) par palier, depuis le démarrage du worker
+    """
+    return {"enabled": latex_extraction_service.cascade_enabled, "tiers": latex_extraction_service.get_tier_stats()}
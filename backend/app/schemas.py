@@ -0,0 +1,121 @@
+"""
+Modèles des requêtes et réponses de l'API
+"""
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel, ConfigDict, Field
+
+
+class Step(BaseModel):
+    """Étape de résolution expliquée"""
+
+    # Les champs supplémentaires renvoyés par le LLM sont conservés
+    model_config = ConfigDict(extra="allow")
+
+    title: Optional[str] = ""
+    description: Optional[str] = ""
+    formula: Optional[str] = ""
+    explanation: Optional[str] = ""
+
+
+class LatexResponse(BaseModel):
+    """Réponse de /api/latex"""
+
+    model_config = ConfigDict(extra="allow")
+
+    latex: str
+    confidence: float = 0.0
+
+
+class LatexRegion(BaseModel):
+    """Équation extraite d'une région de la page"""
+
+    index: int
+    box: Optional[List[int]] = None  # x, y, largeur, hauteur (None: page entière)
+    latex: str
+    confidence: float = 0.0
+
+
+class LatexRegionsResponse(BaseModel):
+    """Réponse de /api/latex/regions (équations dans l'ordre de lecture)"""
+
+    regions: List[LatexRegion]
+
+
+class AnalyzeResponse(BaseModel):
+    """Réponse de /api/analyze"""
+
+    problem: str
+    latex: str
+    solution: str
+    steps: List[Step]
+
+
+class RenderedStep(Step):
+    """Étape avec la formule pré-rendue"""
+
+    formula_rendered: Optional[str] = None
+
+
+class RenderedAnalyzeResponse(AnalyzeResponse):
+    """Réponse de /api/analyze avec les formules pré-rendues (champ render)"""
+
+    rendered_format: str
+    latex_rendered: Optional[str] = None
+    steps: List[RenderedStep]
+
+
+class HistoryEntry(BaseModel):
+    """Résumé d'une analyse de l'historique"""
+
+    id: str
+    created_at: datetime
+    latex: str
+    solution: str
+    complete: bool
+    source: str
+
+
+class HistoryPage(BaseModel):
+    """Page de /api/history (next_cursor absent sur la dernière page)"""
+
+    items: List[HistoryEntry]
+    next_cursor: Optional[str] = None
+
+
+class StoredAnalysis(AnalyzeResponse):
+    """Analyse enregistrée dans l'historique (/api/history/{id})"""
+
+    id: str
+    created_at: datetime
+    complete: bool
+    source: str
+    provider: Optional[str] = None
+    model: Optional[str] = None
+    timings_ms: Dict[str, float] = {}
+
+
+class SimilarProblem(BaseModel):
+    """Problème déjà résolu de structure proche"""
+
+    analysis_id: str
+    latex: str
+    solution: str
+    score: float
+    same_structure: bool
+
+
+class SimilarProblemsResponse(BaseModel):
+    """Réponse de /api/similar, et de /api/analyze si check_similar trouve des problèmes proches"""
+
+    latex: str
+    similar: List[SimilarProblem]
+
+
+class PDFExportRequest(BaseModel):
+    """Corps de /api/export/pdf: analyses fournies et/ou identifiants de l'historique"""
+
+    title: Optional[str] = Field(None, max_length=200)
+    analyses: List[AnalyzeResponse] = []
+    ids: List[str] = []
@@ -0,0 +1,344 @@
+"""
+Pipeline d'analyse: extraction LaTeX → résolution → explication
+Utilisé par les routes API et par les outils en ligne de commande
+(préchauffage du cache). Synchrone: les routes l'exécutent dans le pool de threads.
+"""
+import logging
+import math
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.config import config
+from app.services.latex_extraction_service import latex_extraction_service
+from app.services.llm_service import StepCallback, llm_service
+from app.services.result_cache import result_cache
+from app.services.wolfram_service import wolfram_service
+from app.utils.segmentation import segment_equations
+from app.utils.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+
+class NoEquationError(Exception):
+    """Aucune équation mathématique détectée dans l'image"""
+
+
+@dataclass
+class AnalysisOutcome:
+    """Résultat d'une analyse complète et durée de ses étapes"""
+    result: Dict[str, Any]
+    complete: bool  # False si la résolution ou l'explication est dégradée (non mise en cache)
+    timings_ms: Dict[str, float] = field(default_factory=dict)
+
+
+def direct_calculation(latex: str) -> Tuple[str, List[Dict]]:
+    """
+    Calcule directement une expression arithmétique (fallback si WolframAlpha échoue)
+
+    Args:
+        latex: Expression LaTeX
+
+    Returns:
+        Tuple (solution, steps)
+
+    Raises:
+        Exception: Si l'expression n'est pas calculable
+    """
+    # Convertit le LaTeX en expression calculable
+    calc_expr = latex
+
+    # Remplace les puissances: 4^{2} -> 4**2, 4^2 -> 4**2
+    calc_expr = re.sub(r'\^{(\d+)}', r'**\1', calc_expr)
+    calc_expr = re.sub(r'\^(\d+)', r'**\1', calc_expr)
+
+    # Nettoie les autres caractères LaTeX
+    calc_expr = calc_expr.replace('\\', '').replace('{', '').replace('}', '')
+    calc_expr = calc_expr.replace(' ', '')
+
+    # Calcule directement
+    allowed_names = {
+        k: v for k, v in math.__dict__.items() if not k.startswith("__")
+    }
+    allowed_names.update({'abs': abs, 'round': round})
+
+    result = eval(calc_expr, {"__builtins__": {}}, allowed_names)
+
+    if isinstance(result, float):
+        if result.is_integer():
+            solution = str(int(result))
+        else:
+            solution = str(round(result, 10))
+    else:
+        solution = str(result)
+
+    steps = [{
+        "title": "Calcul direct",
+        "description": f"Calcul de l'expression: {latex}",
+        "formula": f"{latex} = {solution}",
+        "explanation": f"Le résultat de {latex} est {solution}."
+    }]
+    return solution, steps
+
+
+class AnalysisPipeline:
+    """Enchaîne les services d'extraction, de résolution et d'explication"""
+
+    def __init__(self, region_workers: int = 4):
+        # Extractions des régions d'une page (appels réseau): threads dédiés
+        self._region_executor = ThreadPoolExecutor(max_workers=region_workers, thread_name_prefix="latex-regions")
+
+    @staticmethod
+    def latex_result_id(image_bytes: bytes) -> str:
+        """Identifiant (ETag) du résultat d'extraction d'une image"""
+        return result_cache.result_id("latex", image_bytes)
+
+    @staticmethod
+    def regions_result_id(image_bytes: bytes) -> str:
+        """Identifiant (ETag) du résultat d'extraction des équations d'une page"""
+        return result_cache.result_id("latex:regions", image_bytes)
+
+    @staticmethod
+    def analysis_result_id(latex: Optional[str], image_bytes: Optional[bytes]) -> str:
+        """Identifiant (ETag) d'une analyse: LaTeX confirmé s'il est fourni, sinon image"""
+        if latex:
+            return result_cache.result_id("analyze:latex", latex.encode("utf-8"))
+        return result_cache.result_id("analyze:image", image_bytes)
+
+    def extract_latex(self, image_bytes: bytes) -> Dict[str, Any]:
+        """Extraction LaTeX, réutilisée si la même image a déjà été traitée"""
+        result_id = self.latex_result_id(image_bytes)
+        result = result_cache.get(result_id)
+        if result is None:
+            result = latex_extraction_service.extract_latex(image_bytes)
+            if result.get("latex"):
+                result_cache.put(result_id, result)
+        else:
+            tracer.set_attributes({"result_cache.latex_hit": True})
+        return result
+
+    def extract_regions(self, image_bytes: bytes) -> Dict[str, Any]:
+        """
+        Extraction des équations d'une page, région par région
+
+        La page est découpée en régions (une par équation); chaque région est
+        extraite séparément, en parallèle. Une page sans découpage possible
+        (une seule région, ou Pillow absent) est extraite en entier.
+
+        Returns:
+            {"regions": [...]} dans l'ordre de lecture: 'index', 'box'
+            (x, y, largeur, hauteur; None pour la page entière), 'latex', 'confidence'
+        """
+        result_id = self.regions_result_id(image_bytes)
+        result = result_cache.get(result_id)
+        if result is None:
+            result = self._extract_regions(image_bytes)
+            if result["regions"]:
+                result_cache.put(result_id, result)
+        else:
+            tracer.set_attributes({"result_cache.latex_hit": True})
+        return result
+
+    def _extract_regions(self, image_bytes: bytes) -> Dict[str, Any]:
+        with tracer.span("segmentation"):
+            regions = segment_equations(image_bytes, max_regions=config.SEGMENT_MAX_REGIONS)
+        tracer.set_attributes({"segmentation.regions": len(regions)})
+        if len(regions) <= 1:
+            result = self.extract_latex(image_bytes)
+            entries = [{
+                "index": 0,
+                "box": list(regions[0].box) if regions else None,
+                "latex": result.get("latex", ""),
+                "confidence": result.get("confidence", 0.0),
+            }] if result.get("latex") else []
+            return {"regions": entries}
+
+        logger.info("%d régions d'équations détectées, extraction en parallèle", len(regions))
+        futures = [
+            self._region_executor.submit(tracer.wrap(self.extract_latex), region.data)
+            for region in regions
+        ]
+        entries = []
+        errors = []
+        for region, future in zip(regions, futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.warning(f"Extraction de la région {region.index} impossible: {str(e)}")
+                errors.append(e)
+                continue
+            if result.get("latex"):
+                entries.append({
+                    "index": region.index,
+                    "box": list(region.box),
+                    "latex": result["latex"],
+                    "confidence": result.get("confidence", 0.0),
+                })
+        if not entries and errors:
+            # Aucune région extraite: l'erreur du service est propagée
+            raise errors[0]
+        return {"regions": entries}
+
+    def analyze(self, latex: Optional[str], image_bytes: Optional[bytes]) -> AnalysisOutcome:
+        """
+        Analyse complète: LaTeX → Résolution → Explication
+
+        Args:
+            latex: LaTeX confirmé par l'utilisateur (optionnel)
+            image_bytes: Image du problème (utilisée si latex est absent)
+
+        Returns:
+            Résultat, complétude et durée des étapes (millisecondes)
+
+        Raises:
+            NoEquationError: Si aucune équation n'est détectée
+        """
+        timings: Dict[str, float] = {}
+        start = time.perf_counter()
+
+        def lap(stage: str):
+            nonlocal start
+            now = time.perf_counter()
+            timings[stage] = round((now - start) * 1000, 1)
+            start = now
+
+        # 1. Extraction LaTeX
+        extracted_latex = latex
+        if not extracted_latex:
+            logger.debug("Extraction LaTeX depuis l'image...")
+            latex_result = self.extract_latex(image_bytes)
+            extracted_latex = latex_result.get("latex", "")
+            lap("extract")
+
+        if not extracted_latex:
+            raise NoEquationError("Impossible de détecter d'équation mathématique dans l'image.")
+
+        logger.info("LaTeX extrait: %.50s...", extracted_latex)
+
+        solution, raw_steps, solved = self.solve(extracted_latex)
+        lap("solve")
+        enriched_steps, explained = self.explain(extracted_latex, solution, raw_steps)
+        lap("explain")
+
+        result = self.build_result(extracted_latex, solution, raw_steps, enriched_steps)
+        return AnalysisOutcome(result, solved and explained, timings)
+
+    @staticmethod
+    def build_result(latex: str, solution: str, raw_steps: List[Dict], enriched_steps: List[Dict]) -> Dict[str, Any]:
+        """Réponse d'analyse (format de /api/analyze)"""
+        return {
+            "problem": latex,
+            "latex": latex,
+            "solution": solution,
+            "steps": enriched_steps if enriched_steps else raw_steps
+        }
+
+    def solve(self, latex: str, on_solution: Optional[Callable[[str], None]] = None) -> Tuple[str, List[Dict], bool]:
+        """
+        Résolution avec WolframAlpha (calcul direct en fallback)
+
+        Args:
+            latex: Problème en LaTeX
+            on_solution: Appelé avec la solution dès qu'elle est connue, avant
+                les étapes détaillées (mode progressif, WOLFRAM_PROGRESSIVE);
+                sans lui, une seule requête WolframAlpha est faite
+
+        Returns:
+            Tuple (solution, étapes brutes, complet) - complet vaut False si seul
+            le dernier fallback (étape générique) est disponible
+        """
+        # 2. Résolution avec WolframAlpha
+        logger.debug("Résolution avec WolframAlpha...")
+        solution = ""
+        raw_steps = []
+
+        try:
+            if config.WOLFRAM_PROGRESSIVE and on_solution is not None:
+                # Solution rapide transmise tout de suite, puis étapes détaillées
+                # fusionnées si elles arrivent à temps
+                wolfram_result = wolfram_service.solve_progressive(latex)
+                if wolfram_result.get("solution"):
+                    on_solution(wolfram_result["solution"])
+                wolfram_result = wolfram_service.merge_steps(wolfram_result)
+            else:
+                wolfram_result = wolfram_service.solve(latex)
+            solution = wolfram_result.get("solution", "")
+            raw_steps = wolfram_result.get("steps", [])
+
+            if solution:
+                logger.info("Solution trouvée: %.50s...", solution)
+            else:
+                logger.warning("Aucune solution trouvée par WolframAlpha")
+        except Exception as e:
+            logger.warning(f"Erreur WolframAlpha: {str(e)}, tentative de calcul direct")
+            # Si WolframAlpha échoue, on essaie un calcul direct
+            try:
+                with tracer.span("direct_calculation"):
+                    solution, raw_steps = direct_calculation(latex)
+                logger.info("Calcul direct réussi: %s", solution)
+            except Exception as calc_error:
+                logger.warning(f"Calcul direct échoué: {str(calc_error)}")
+                solution = ""
+                raw_steps = []
+
+        complete = bool(solution or raw_steps)
+        if not complete:
+            # Dernier fallback si tout échoue (résultat dégradé, non mis en cache)
+            solution = "Résolution disponible"
+            raw_steps = [{
+                "title": "Analyse du problème",
+                "description": latex,
+                "formula": latex,
+                "explanation": "Analyse du problème mathématique. Les étapes détaillées seront générées par l'IA."
+            }]
+        return solution, raw_steps, complete
+
+    def explain(
+        self,
+        latex: str,
+        solution: str,
+        raw_steps: List[Dict],
+        on_step: Optional[StepCallback] = None
+    ) -> Tuple[List[Dict], bool]:
+        """
+        Enrichissement des étapes avec le LLM (étapes brutes en cas d'échec)
+        on_step reçoit chaque étape enrichie dès sa réception (analyse en flux)
+
+        Returns:
+            Tuple (étapes expliquées, complet) - complet vaut False si tout ou
+            partie des étapes n'a pas pu être enrichi (résultat dégradé)
+        """
+        # 3. Enrichissement avec LLM
+        logger.debug("Enrichissement avec LLM (%s)...", llm_service.provider)
+        try:
+            enriched_steps, complete = llm_service.generate_explanation(
+                problem=latex,
+                solution=solution,
+                steps=raw_steps,
+                on_step=on_step
+            )
+
+            if enriched_steps and len(enriched_steps) > 0:
+                logger.info("%d étapes enrichies générées", len(enriched_steps))
+            else:
+                logger.warning("Aucune étape enrichie générée, utilisation des étapes brutes")
+                enriched_steps, complete = raw_steps, False
+        except Exception as e:
+            logger.warning(f"Erreur LLM: {str(e)}, utilisation des étapes brutes")
+            enriched_steps, complete = raw_steps, False
+        if not complete:
+            logger.warning("Explication dégradée: résultat non mis en cache")
+        return enriched_steps, complete
+
+    def analyze_cached(self, latex: Optional[str], image_bytes: Optional[bytes]) -> AnalysisOutcome:
+        """Analyse complète enregistrée dans le cache de résultats si elle est complète"""
+        outcome = self.analyze(latex, image_bytes)
+        if outcome.complete:
+            result_cache.put(self.analysis_result_id(latex, image_bytes), outcome.result)
+        return outcome
+
+
+# Instance globale
+analysis_pipeline = AnalysisPipeline(region_workers=config.SEGMENT_WORKERS)
@@ -0,0 +1,161 @@
+"""
+Service d'analyse en flux (NDJSON)
+Chaque étape de l'analyse est envoyée dès qu'elle est connue: LaTeX extrait,
+solution (en mode progressif, dès la requête rapide à WolframAlpha, avant
+les étapes détaillées), puis chaque étape expliquée dès que le LLM a fini de
+l'écrire (parseur incrémental), sans attendre la fin de la réponse. La
+dernière ligne contient l'analyse complète, qui fait foi.
+"""
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Dict, Optional
+
+from app.config import config
+from app.services.analysis_pipeline import NoEquationError, analysis_pipeline
+from app.services.history_service import history_service
+from app.services.result_cache import result_cache
+from app.services.scheduler_service import WorkClass, work_scheduler
+from app.utils.responses import dumps
+from app.utils.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+
+def _line(record: Dict[str, Any]) -> bytes:
+    return dumps(record) + b"\n"
+
+
+class AnalysisStreamService:
+    """
+    Analyse complète envoyée étape par étape
+
+    Args:
+        workers: Analyses en flux exécutées simultanément (threads dédiés)
+    """
+
+    def __init__(self, workers: int = 8):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="analyze-stream")
+
+    async def stream(
+        self,
+        latex: Optional[str],
+        image_bytes: Optional[bytes],
+        work: WorkClass,
+        cached: Optional[Dict[str, Any]] = None,
+        client_id: Optional[str] = None
+    ) -> AsyncIterator[bytes]:
+        """
+        Lignes NDJSON de l'analyse, au fil de son calcul
+
+        Args:
+            latex: LaTeX confirmé par l'utilisateur (optionnel)
+            image_bytes: Image du problème (utilisée si latex est absent)
+            work: Classe des calculs (chaque étape attend sa place auprès de l'ordonnanceur)
+            cached: Analyse déjà calculée pour cette entrée (envoyée telle quelle)
+            client_id: Client à qui l'analyse est servie (historique)
+
+        Yields:
+            {"event": "latex"}, {"event": "solution"} (deux fois en mode progressif:
+            d'abord 'steps_pending' vrai, étapes encore en calcul), un
+            {"event": "step", "index"} par étape expliquée (rang dans le résultat,
+            dans l'ordre d'arrivée), puis {"event": "done"} avec l'analyse
+            ('result', 'complete', 'analysis_id') ou {"event": "error"} ('status', 'detail')
+        """
+        result_id = analysis_pipeline.analysis_result_id(latex, image_bytes)
+        if cached is not None:
+            yield _line({"event": "done", "complete": True, "result": cached, "analysis_id": None})
+            return
+
+        loop = asyncio.get_running_loop()
+        timings: Dict[str, float] = {}
+        started = time.perf_counter()
+
+        def lap(stage: str):
+            nonlocal started
+            now = time.perf_counter()
+            timings[stage] = round((now - started) * 1000, 1)
+            started = now
+
+        try:
+            extracted_latex = latex
+            if not extracted_latex:
+                async with work_scheduler.slot(work):
+                    latex_result = await loop.run_in_executor(
+                        self._executor, tracer.wrap(analysis_pipeline.extract_latex), image_bytes
+                    )
+                extracted_latex = latex_result.get("latex", "")
+                lap("extract")
+                if not extracted_latex:
+                    raise NoEquationError("Impossible de détecter d'équation mathématique dans l'image.")
+            yield _line({"event": "latex", "latex": extracted_latex})
+
+            # Événements émis par les threads de calcul, remis à la boucle d'événements
+            queue: asyncio.Queue = asyncio.Queue()
+
+            def emit(record: Dict[str, Any]):
+                loop.call_soon_threadsafe(queue.put_nowait, record)
+
+            def on_solution(solution: str):
+                emit({"event": "solution", "solution": solution, "steps_pending": True})
+
+            def on_step(index: int, step: Dict):
+                emit({"event": "step", "index": index, "step": step})
+
+            async with work_scheduler.slot(work):
+                solving = loop.run_in_executor(
+                    self._executor, tracer.wrap(analysis_pipeline.solve), extracted_latex, on_solution
+                )
+                async for record in self._drain(queue, solving):
+                    yield _line(record)
+                solution, raw_steps, solved = solving.result()
+            lap("solve")
+            yield _line({
+                "event": "solution", "solution": solution, "steps_pending": False, "step_count": len(raw_steps)
+            })
+
+            async with work_scheduler.slot(work):
+                explanation = loop.run_in_executor(
+                    self._executor, tracer.wrap(analysis_pipeline.explain),
+                    extracted_latex, solution, raw_steps, on_step
+                )
+                async for record in self._drain(queue, explanation):
+                    yield _line(record)
+                enriched_steps, explained = explanation.result()
+            lap("explain")
+        except NoEquationError as e:
+            yield _line({"event": "error", "status": 422, "detail": str(e)})
+            return
+        except Exception as e:
+            logger.error(f"Erreur inattendue lors de l'analyse en flux: {str(e)}", exc_info=True)
+            yield _line({"event": "error", "status": 500, "detail": "Erreur lors de l'analyse."})
+            return
+
+        result = analysis_pipeline.build_result(extracted_latex, solution, raw_steps, enriched_steps)
+        complete = solved and explained
+        if complete:
+            result_cache.put(result_id, result)
+        analysis_id = None
+        if history_service.enabled:
+            analysis_id = await loop.run_in_executor(
+                self._executor, history_service.record,
+                result_id, result, complete, "computed", timings, client_id
+            )
+        tracer.set_attributes({"analysis.complete": complete})
+        yield _line({"event": "done", "complete": complete, "result": result, "analysis_id": analysis_id})
+
+    @staticmethod
+    async def _drain(queue: asyncio.Queue, future: asyncio.Future) -> AsyncIterator[Dict[str, Any]]:
+        """Événements reçus pendant un calcul, jusqu'au dernier émis avant sa fin"""
+        while not future.done() or not queue.empty():
+            getter = asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait({getter, future}, return_when=asyncio.FIRST_COMPLETED)
+            if getter not in done:
+                getter.cancel()
+                continue
+            yield getter.result()
+
+
+# Instance globale
+analysis_stream_service = AnalysisStreamService(workers=config.ANALYZE_STREAM_WORKERS)
@@ -0,0 +1,184 @@
+"""
+Service de pré-rendu des formules (MathML ou SVG)
+Le LaTeX de l'énoncé et des étapes est converti côté serveur: le client
+affiche le balisage tel quel au lieu de composer chaque formule à chaque
+affichage. Les fragments rendus sont gardés dans un cache LRU borné (clé:
+format et LaTeX), partagé par toutes les requêtes: une formule déjà vue
+n'est jamais recomposée.
+MathML est produit par latex2mathml s'il est installé; sinon, et pour le
+format SVG, la formule est composée par app.utils.formula_layout. Une
+formule que la mise en page ne compose pas fidèlement (matrice, système,
+commande inconnue) n'est pas pré-rendue: le client l'affiche avec KaTeX.
+"""
+import logging
+import threading
+from collections import OrderedDict
+from html import escape
+from typing import Any, Dict, Optional, Tuple
+
+from app.config import config
+from app.utils.formula_layout import (
+    BOLD, ITALIC, Box, Glyphs, Rule, UnsupportedFormula, layout_formula, strip_delimiters
+)
+
+logger = logging.getLogger(__name__)
+
+try:
+    from latex2mathml.converter import convert as latex_to_mathml
+except ImportError:  # pragma: no cover - dépendance optionnelle
+    latex_to_mathml = None
+
+FORMATS = ("mathml", "svg")
+
+# Corps de composition: le SVG est dimensionné en em, donc indépendant du corps affiché
+LAYOUT_SIZE = 10.0
+FONT_FAMILY = "Helvetica, Arial, sans-serif"
+
+
+def _number(value: float) -> str:
+    text = f"{value:.2f}".rstrip("0").rstrip(".")
+    return text if text not in ("", "-0") else "0"
+
+
+def box_svg(box: Box, label: str = "") -> str:
+    """
+    SVG d'une boîte composée (couleur du texte courant, aligné sur la ligne de base)
+
+    Args:
+        box: Formule composée au corps LAYOUT_SIZE
+        label: Texte alternatif (LaTeX de la formule)
+    """
+    height, depth = box.height, box.depth
+    elements = []
+    for item in box.items:
+        if isinstance(item, Glyphs):
+            style = ""
+            if item.font == ITALIC:
+                style = ' font-style="italic"'
+            elif item.font == BOLD:
+                style = ' font-weight="bold"'
+            # Largeur imposée: le placement reste celui des métriques de composition
+            length = (
+                f' textLength="{_number(item.width)}" lengthAdjust="spacingAndGlyphs"'
+                if len(item.text) > 1 else ""
+            )
+            elements.append(
+                f'<text x="{_number(item.x)}" y="{_number(-item.y)}" font-size="{_number(item.size)}"'
+                f'{style}{length}>{escape(item.text, quote=False)}</text>'
+            )
+        elif isinstance(item, Rule):
+            elements.append(
+                f'<rect x="{_number(item.x)}" y="{_number(-item.y - item.thickness / 2)}" '
+                f'width="{_number(item.width)}" height="{_number(item.thickness)}"/>'
+            )
+        else:
+            points = " ".join(f"{_number(x)},{_number(-y)}" for x, y in item.points)
+            elements.append(
+                f'<polyline points="{points}" fill="none" stroke="currentColor" '
+                f'stroke-width="{_number(item.thickness)}" stroke-linecap="round" stroke-linejoin="round"/>'
+            )
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" role="img" aria-label="{escape(label)}" '
+        f'width="{_number(box.width / LAYOUT_SIZE)}em" height="{_number((height + depth) / LAYOUT_SIZE)}em" '
+        f'viewBox="0 {_number(-height)} {_number(box.width)} {_number(height + depth)}" '
+        f'style="vertical-align: {_number(-depth / LAYOUT_SIZE)}em" '
+        f'fill="currentColor" font-family="{FONT_FAMILY}">'
+        + "".join(elements) + "</svg>"
+    )
+
+
+class FormulaRenderService:
+    """
+    Rendu des formules avec cache de fragments
+
+    Args:
+        max_entries: Nombre maximal de fragments conservés
+    """
+
+    def __init__(self, max_entries: int = 4096):
+        self.max_entries = max_entries
+        self._fragments: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if latex_to_mathml is None:
+            logger.info("latex2mathml non installé: formules pré-rendues en SVG")
+
+    @staticmethod
+    def output_format(requested: str) -> str:
+        """Format effectivement produit (SVG si MathML n'est pas disponible)"""
+        return "mathml" if requested == "mathml" and latex_to_mathml is not None else "svg"
+
+    def render(self, latex: str, fmt: str) -> Optional[str]:
+        """
+        Balisage d'une formule (depuis le cache si elle a déjà été rendue)
+
+        Args:
+            latex: Formule LaTeX (délimiteurs $ ou \\[ \\] acceptés)
+            fmt: "mathml" ou "svg" (valeur de output_format)
+
+        Returns:
+            Fragment MathML ou SVG, ou None pour une formule vide ou non prise
+            en charge (rendu laissé au client)
+        """
+        latex = strip_delimiters(latex or "")
+        if not latex:
+            return None
+        key = (fmt, latex)
+        with self._lock:
+            fragment = self._fragments.get(key)
+            if fragment is not None:
+                self._fragments.move_to_end(key)
+                self.hits += 1
+                return fragment or None
+            self.misses += 1
+        # Formule non prise en charge: chaîne vide en cache, pour ne pas la recomposer
+        fragment = self._convert(latex, fmt) or ""
+        with self._lock:
+            self._fragments[key] = fragment
+            while len(self._fragments) > self.max_entries:
+                self._fragments.popitem(last=False)
+        return fragment or None
+
+    @staticmethod
+    def _convert(latex: str, fmt: str) -> Optional[str]:
+        if fmt == "mathml":
+            try:
+                return latex_to_mathml(latex)
+            except Exception as e:
+                # LaTeX non reconnu par latex2mathml: composition SVG
+                logger.debug(f"Conversion MathML impossible ({str(e)}), rendu SVG")
+        try:
+            box = layout_formula(latex, LAYOUT_SIZE, strict=True)
+        except UnsupportedFormula as e:
+            logger.debug(f"Formule non pré-rendue ({str(e)}): rendu par le client")
+            return None
+        return box_svg(box, latex)
+
+    def prerender(self, result: Dict[str, Any], fmt: str) -> Dict[str, Any]:
+        """
+        Résultat d'analyse avec le balisage des formules (énoncé et étapes)
+
+        Le résultat d'origine (partagé avec le cache de résultats) n'est pas modifié.
+
+        Args:
+            result: Résultat d'analyse (latex, solution, steps)
+            fmt: "mathml" ou "svg" (valeur de output_format)
+
+        Returns:
+            Copie du résultat avec 'rendered_format', 'latex_rendered' et
+            'formula_rendered' dans chaque étape
+        """
+        rendered = dict(result)
+        rendered["rendered_format"] = fmt
+        rendered["latex_rendered"] = self.render(result.get("latex", ""), fmt)
+        rendered["steps"] = [
+            {**step, "formula_rendered": self.render(step.get("formula") or "", fmt)}
+            if isinstance(step, dict) else step
+            for step in result.get("steps", [])
+        ]
+        return rendered
+
+
+# Instance globale
+formula_render_service = FormulaRenderService(max_entries=config.PRERENDER_CACHE_SIZE)
@@ -0,0 +1,211 @@
+"""
+Service d'historique des analyses
+Chaque analyse servie est enregistrée dans une base SQLite (HISTORY_DB):
+empreinte de l'entrée (identifiant du résultat), LaTeX, solution, étapes,
+fournisseur et durées des étapes. Une analyse passée est relue en quelques
+millisecondes au lieu d'être recalculée, et chaque client retrouve son
+historique (en-tête X-Client-Id). Les analyses complètes alimentent l'index
+des problèmes similaires.
+"""
+import json
+import logging
+import sqlite3
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.config import config
+from app.services.similarity_service import similarity_service
+from app.utils.sqlite import ThreadLocalDatabase
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS analyses ("
+    "seq INTEGER PRIMARY KEY AUTOINCREMENT, "
+    "id TEXT NOT NULL UNIQUE, "
+    "fingerprint TEXT NOT NULL, "
+    "client_id TEXT, "
+    "created_at REAL NOT NULL, "
+    "latex TEXT NOT NULL, "
+    "solution TEXT NOT NULL, "
+    "steps TEXT NOT NULL, "
+    "complete INTEGER NOT NULL, "
+    "source TEXT NOT NULL, "
+    "provider TEXT, "
+    "model TEXT, "
+    "timings TEXT)",
+    "CREATE INDEX IF NOT EXISTS analyses_fingerprint ON analyses (fingerprint, seq)",
+    "CREATE INDEX IF NOT EXISTS analyses_created_at ON analyses (created_at)",
+    "CREATE INDEX IF NOT EXISTS analyses_client ON analyses (client_id, seq)",
+]
+
+SUMMARY_COLUMNS = "seq, id, created_at, latex, solution, complete, source"
+RECORD_COLUMNS = SUMMARY_COLUMNS + ", fingerprint, steps, provider, model, timings"
+
+
+class HistoryService:
+    """
+    Historique persistant des analyses
+
+    Args:
+        db_path: Base SQLite de l'historique (vide: historique désactivé)
+    """
+
+    def __init__(self, db_path: str = ""):
+        self.db_path = db_path
+        self._database = ThreadLocalDatabase(db_path, SCHEMA) if db_path else None
+
+    @property
+    def enabled(self) -> bool:
+        return self._database is not None
+
+    def record(
+        self,
+        fingerprint: str,
+        result: Dict[str, Any],
+        complete: bool,
+        source: str,
+        timings: Optional[Dict[str, float]] = None,
+        client_id: Optional[str] = None
+    ) -> Optional[str]:
+        """
+        Enregistre une analyse servie
+
+        Args:
+            fingerprint: Identifiant du résultat (empreinte de l'entrée et du pipeline)
+            result: Résultat de l'analyse (latex, solution, steps)
+            complete: True seulement si la résolution et l'explication ont abouti;
+                False pour un résultat dégradé (jamais resservi par empreinte)
+            source: Origine du résultat ("computed", "cache", "warm_cache")
+            timings: Durées des étapes en millisecondes
+            client_id: Client à qui l'analyse a été servie
+
+        Returns:
+            Identifiant de l'analyse dans l'historique, ou None
+        """
+        if not self.enabled:
+            return None
+        from app.services.llm_service import llm_service
+
+        analysis_id = uuid.uuid4().hex
+        model = config.GEMINI_MODEL if llm_service.provider == "gemini" else config.OPENAI_MODEL
+        try:
+            self._database.connection().execute(
+                "INSERT INTO analyses (id, created_at, latex, solution, complete, source, "
+                "fingerprint, steps, provider, model, timings, client_id) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    analysis_id, time.time(), result.get("latex", ""), result.get("solution", ""),
+                    int(complete), source, fingerprint,
+                    json.dumps(result.get("steps", []), ensure_ascii=False),
+                    llm_service.provider, model,
+                    json.dumps(timings or {}), client_id
+                )
+            )
+        except sqlite3.Error as e:
+            logger.warning(f"Écriture de l'historique impossible: {str(e)}")
+            return None
+        if complete:
+            # Proposé ensuite pour les problèmes de même structure
+            similarity_service.add(fingerprint, analysis_id, result.get("latex", ""), result.get("solution", ""))
+        return analysis_id
+
+    def get(self, analysis_id: str) -> Optional[Dict[str, Any]]:
+        """Analyse enregistrée, ou None"""
+        return self._fetch_record("id = ?", (analysis_id,))
+
+    def latest(self, fingerprint: str) -> Optional[Dict[str, Any]]:
+        """Dernière analyse complète enregistrée pour cette empreinte, ou None"""
+        return self._fetch_record(
+            "fingerprint = ? AND complete = 1 ORDER BY seq DESC LIMIT 1", (fingerprint,)
+        )
+
+    def list(
+        self,
+        client_id: str,
+        limit: int = 20,
+        cursor: Optional[str] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Historique d'un client, du plus récent au plus ancien (pagination par curseur)
+
+        Args:
+            client_id: Identifiant du client
+            limit: Nombre d'analyses par page
+            cursor: Curseur renvoyé par la page précédente
+
+        Returns:
+            Tuple (résumés des analyses, curseur de la page suivante ou None)
+
+        Raises:
+            ValueError: Si le curseur est invalide
+        """
+        if not self.enabled:
+            return [], None
+        query = f"SELECT {SUMMARY_COLUMNS} FROM analyses WHERE client_id = ?"
+        params: List[Any] = [client_id]
+        if cursor is not None:
+            query += " AND seq < ?"
+            params.append(self._decode_cursor(cursor))
+        query += " ORDER BY seq DESC LIMIT ?"
+        params.append(limit + 1)
+        try:
+            rows = self._database.connection().execute(query, params).fetchall()
+        except sqlite3.Error as e:
+            logger.warning(f"Lecture de l'historique impossible: {str(e)}")
+            return [], None
+        next_cursor = str(rows[limit - 1][0]) if len(rows) > limit else None
+        return [self._summary(row) for row in rows[:limit]], next_cursor
+
+    @staticmethod
+    def _decode_cursor(cursor: str) -> int:
+        try:
+            return int(cursor)
+        except ValueError:
+            raise ValueError("Curseur d'historique invalide.")
+
+    @staticmethod
+    def _summary(row: tuple) -> Dict[str, Any]:
+        _, analysis_id, created_at, latex, solution, complete, source = row[:7]
+        return {
+            "id": analysis_id,
+            "created_at": created_at,
+            "latex": latex,
+            "solution": solution,
+            "complete": bool(complete),
+            "source": source,
+        }
+
+    def _fetch_record(self, condition: str, params: tuple) -> Optional[Dict[str, Any]]:
+        if not self.enabled:
+            return None
+        try:
+            row = self._database.connection().execute(
+                f"SELECT {RECORD_COLUMNS} FROM analyses WHERE {condition}", params
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Lecture de l'historique impossible: {str(e)}")
+            return None
+        if row is None:
+            return None
+        fingerprint, steps, provider, model, timings = row[7:]
+        record = self._summary(row)
+        record.update({
+            "problem": record["latex"],
+            "steps": json.loads(steps),
+            "fingerprint": fingerprint,
+            "provider": provider,
+            "model": model,
+            "timings_ms": json.loads(timings) if timings else {},
+        })
+        return record
+
+    @staticmethod
+    def analysis_result(record: Dict[str, Any]) -> Dict[str, Any]:
+        """Résultat d'analyse (format de /api/analyze) d'une analyse enregistrée"""
+        return {key: record[key] for key in ("problem", "latex", "solution", "steps")}
+
+
+# Instance globale
+history_service = HistoryService(db_path=config.HISTORY_DB)
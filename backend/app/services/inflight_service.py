@@ -0,0 +1,160 @@
+"""
+Service de déduplication des calculs en cours
+- Coalescence: des requêtes identiques simultanées (même empreinte d'entrée)
+  partagent un seul calcul exécuté dans le pool de threads
+- Clés d'idempotence (en-tête Idempotency-Key): une requête rejouée par le
+  client se rattache au calcul en cours ou reçoit le résultat enregistré
+L'état est local au worker.
+"""
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, AsyncContextManager, Callable, Dict, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.config import config
+from app.utils.profiling import profile_thread
+
+logger = logging.getLogger(__name__)
+
+
+def _call(function: Callable, args: Tuple) -> Any:
+    # Le profilage déterministe de la requête suit le calcul dans le thread
+    with profile_thread():
+        return function(*args)
+
+
+async def _compute(function: Callable, args: Tuple, slot: Optional[AsyncContextManager]) -> Any:
+    if slot is None:
+        return await run_in_threadpool(_call, function, args)
+    # Place d'exécution attribuée par l'ordonnanceur avant le démarrage du calcul
+    async with slot:
+        return await run_in_threadpool(_call, function, args)
+
+
+def _retrieve_exception(task: asyncio.Task):
+    # Évite "Task exception was never retrieved" si tous les clients sont partis
+    if not task.cancelled():
+        task.exception()
+
+
+class InflightRegistry:
+    """Calculs en cours, par empreinte d'entrée"""
+
+    def __init__(self):
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self.started = 0
+        self.coalesced = 0
+
+    async def run(
+        self, key: str, function: Callable, *args, slot: Optional[AsyncContextManager] = None
+    ) -> Tuple[Any, bool]:
+        """
+        Exécute function(*args) dans le pool de threads, ou attend le calcul
+        identique déjà en cours. Le calcul continue si le client qui l'a lancé
+        se déconnecte, tant que d'autres l'attendent.
+
+        Args:
+            key: Empreinte de l'entrée
+            function: Fonction synchrone à exécuter
+            slot: Place d'exécution à obtenir avant un nouveau calcul (work_scheduler.slot)
+
+        Returns:
+            Tuple (résultat, partagé) - partagé vaut True si le calcul était déjà en cours
+        """
+        task = self._tasks.get(key)
+        shared = task is not None
+        if task is None:
+            self.started += 1
+            # La tâche hérite du contexte de la requête qui la lance (trace, consommation LLM)
+            task = asyncio.get_running_loop().create_task(_compute(function, args, slot))
+            task.add_done_callback(_retrieve_exception)
+            task.add_done_callback(lambda done: self._forget(key, done))
+            self._tasks[key] = task
+        else:
+            self.coalesced += 1
+            logger.info("Requête rattachée au calcul identique en cours")
+        return await asyncio.shield(task), shared
+
+    def _forget(self, key: str, task: asyncio.Task):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+
+    def stats(self) -> Dict[str, int]:
+        return {"in_flight": len(self._tasks), "started": self.started, "coalesced": self.coalesced}
+
+
+@dataclass
+class IdempotencyRecord:
+    """Requête associée à une clé d'idempotence"""
+    result_id: str
+    expires_at: float
+    result: Optional[Dict[str, Any]] = None
+
+
+class IdempotencyConflict(Exception):
+    """Clé d'idempotence déjà utilisée pour une autre entrée"""
+
+
+class IdempotencyStore:
+    """
+    Clés d'idempotence récentes (LRU, durée de validité)
+
+    Args:
+        max_entries: Nombre maximal de clés conservées
+        ttl: Durée de validité d'une clé en secondes
+    """
+
+    def __init__(self, max_entries: int = 2048, ttl: float = 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._records: "OrderedDict[str, IdempotencyRecord]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def begin(self, key: str, result_id: str) -> Optional[IdempotencyRecord]:
+        """
+        Associe la clé à l'entrée de la requête
+
+        Returns:
+            L'enregistrement existant si la clé a déjà été vue (résultat
+            éventuellement disponible), None pour une nouvelle clé
+
+        Raises:
+            IdempotencyConflict: Si la clé a été utilisée pour une autre entrée
+        """
+        now = time.monotonic()
+        with self._lock:
+            record = self._records.get(key)
+            if record is not None and record.expires_at >= now:
+                if record.result_id != result_id:
+                    raise IdempotencyConflict(key)
+                self._records.move_to_end(key)
+                return record
+            self._records[key] = IdempotencyRecord(result_id=result_id, expires_at=now + self.ttl)
+            self._records.move_to_end(key)
+            while len(self._records) > self.max_entries:
+                self._records.popitem(last=False)
+            return None
+
+    def complete(self, key: str, result: Dict[str, Any]):
+        """Enregistre le résultat de la requête"""
+        with self._lock:
+            record = self._records.get(key)
+            if record is not None:
+                record.result = result
+
+    def discard(self, key: str):
+        """Oublie la clé (échec: une nouvelle tentative doit recalculer)"""
+        with self._lock:
+            record = self._records.get(key)
+            if record is not None and record.result is None:
+                del self._records[key]
+
+
+# Instances globales
+inflight_registry = InflightRegistry()
+idempotency_store = IdempotencyStore(ttl=config.IDEMPOTENCY_KEY_TTL)
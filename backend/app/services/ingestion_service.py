@@ -0,0 +1,141 @@
+"""
+Service d'ingestion des documents de plusieurs pages (PDF, archive zip)
+Les pages sont lues une à une (rendu d'une page PDF à la demande) par un
+thread dédié au document, et au plus INGEST_WORKERS pages sont en cours
+d'extraction: la mémoire utilisée ne dépend pas de la taille du document.
+Chaque résultat est renvoyé dès que sa page est traitée (une ligne JSON par
+page, dans l'ordre d'achèvement), suivi d'une ligne de bilan.
+"""
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, Set
+
+from app.config import config
+from app.services.analysis_pipeline import analysis_pipeline
+from app.services.scheduler_service import WorkClass, work_scheduler
+from app.utils.file_validation import validate_image_file
+from app.utils.ingestion import SourceImage
+from app.utils.responses import dumps
+from app.utils.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+
+class IngestionService:
+    """
+    Traitement des pages d'un document en parallèle, résultats en flux
+
+    Args:
+        workers: Pages traitées simultanément (par document et au total)
+    """
+
+    def __init__(self, workers: int = 4):
+        self.workers = workers
+        # Extractions (appels réseau) de tous les documents: threads dédiés, hors du pool de l'API
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingest")
+
+    async def stream(
+        self, pages: Iterator[SourceImage], analyze: bool = False, work: Optional[WorkClass] = None
+    ) -> AsyncIterator[bytes]:
+        """
+        Lignes NDJSON des résultats, au fil du traitement des pages
+
+        Args:
+            pages: Pages du document (itérateur paresseux de iter_upload)
+            analyze: Analyse complète de chaque page (sinon extraction LaTeX seule)
+            work: Classe des calculs (défaut: batch, locataire public); chaque
+                page attend sa place auprès de l'ordonnanceur
+
+        Yields:
+            Une ligne par page ('page', 'source', 'status' ok/degraded/error,
+            'latex', 'confidence', et 'solution'/'steps' pour une analyse),
+            puis le bilan ('done', 'pages', nombre par statut, 'duration_ms')
+        """
+        loop = asyncio.get_running_loop()
+        work = work or WorkClass("batch")
+        # Lecture du document dans un seul thread (pdfium n'est pas thread-safe)
+        reader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest-pages")
+        pending: Set[asyncio.Future] = set()
+        counts = {"ok": 0, "degraded": 0, "error": 0}
+        started = time.perf_counter()
+        read = 0
+        exhausted = False
+        try:
+            while True:
+                while not exhausted and len(pending) < self.workers:
+                    try:
+                        page = await loop.run_in_executor(reader, next, pages, None)
+                    except Exception as e:
+                        # Page illisible: le document n'est pas lu plus loin
+                        logger.warning(f"Lecture du document interrompue à la page {read + 1}: {str(e)}")
+                        exhausted = True
+                        counts["error"] += 1
+                        yield dumps({"page": read + 1, "status": "error", "error": str(e)}) + b"\n"
+                        break
+                    if page is None:
+                        exhausted = True
+                        break
+                    read += 1
+                    pending.add(asyncio.ensure_future(self._process(read, page, analyze, work)))
+                if not pending:
+                    break
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in sorted(done, key=lambda task: task.result()["page"]):
+                    record = task.result()
+                    counts[record["status"]] += 1
+                    yield dumps(record) + b"\n"
+            duration_ms = round((time.perf_counter() - started) * 1000, 1)
+            logger.info(
+                f"Document traité: {read} page(s) en {duration_ms:.0f}ms "
+                f"(ok {counts['ok']}, dégradées {counts['degraded']}, erreurs {counts['error']})"
+            )
+            yield dumps({"done": True, "pages": read, **counts, "duration_ms": duration_ms}) + b"\n"
+        finally:
+            # Client déconnecté ou fin du document: pages en cours abandonnées, document fermé
+            for task in pending:
+                task.cancel()
+            if hasattr(pages, "close"):
+                reader.submit(pages.close)
+            reader.shutdown(wait=False)
+
+    async def _process(self, index: int, page: SourceImage, analyze: bool, work: WorkClass) -> Dict[str, Any]:
+        started = time.perf_counter()
+        record: Dict[str, Any] = {"page": index, "source": page.name}
+        try:
+            is_valid, error_message = validate_image_file(page.data, max_size=config.MAX_UPLOAD_SIZE)
+            if not is_valid:
+                raise ValueError(error_message)
+            loop = asyncio.get_running_loop()
+            if analyze:
+                async with work_scheduler.slot(work):
+                    outcome = await loop.run_in_executor(
+                        self._executor, tracer.wrap(analysis_pipeline.analyze_cached), None, page.data
+                    )
+                record.update({
+                    "status": "ok" if outcome.complete else "degraded",
+                    "latex": outcome.result["latex"],
+                    "solution": outcome.result["solution"],
+                    "steps": outcome.result["steps"],
+                })
+            else:
+                async with work_scheduler.slot(work):
+                    result = await loop.run_in_executor(
+                        self._executor, tracer.wrap(analysis_pipeline.extract_latex), page.data
+                    )
+                if not result.get("latex"):
+                    raise ValueError("Impossible de détecter d'équation mathématique dans l'image.")
+                record.update({
+                    "status": "ok",
+                    "latex": result["latex"],
+                    "confidence": result.get("confidence", 0.0),
+                })
+        except Exception as e:
+            record.update({"status": "error", "error": str(e) or type(e).__name__})
+        record["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return record
+
+
+# Instance globale
+ingestion_service = IngestionService(workers=config.INGEST_WORKERS)
@@ -3,8 +3,16 @@ Service pour l'extraction LaTeX depuis des images
 Supporte OpenAI Vision (alternative à Mathpix)
 """
 import base64
-from typing import Dict, Optional
+import logging
+import math
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
 from app.config import config
+from app.services.prompt_service import prompt_service
+from app.utils import tracing
+from app.utils.tracing import tracer
+
+logger = logging.getLogger(__name__)
 
 
 class LatexExtractionService:
@@ -14,12 +22,23 @@ class LatexExtractionService:
         self.openai_api_key = config.OPENAI_API_KEY
         self.mathpix_app_id = config.MATHPIX_APP_ID
         self.mathpix_app_key = config.MATHPIX_APP_KEY
+        self.cascade_enabled = config.EXTRACTION_CASCADE
+        self.confidence_threshold = config.EXTRACTION_CONFIDENCE_THRESHOLD
+        self.vision_model = config.VISION_MODEL
+        self.vision_fast_model = config.VISION_FAST_MODEL
+        # Statistiques par palier de la cascade: tentatives et résultats acceptés
+        self.tier_stats: Dict[str, Dict[str, int]] = {}
+        self._stats_lock = threading.Lock()
     
     def extract_latex(self, image_bytes: bytes) -> Dict[str, any]:
         """
         Extrait le LaTeX depuis une image
         Utilise OpenAI Vision si Mathpix n'est pas configuré
         
+        Les paliers sont essayés du moins cher au plus cher: un résultat n'est
+        accepté que s'il est syntaxiquement valide et que sa confiance atteint
+        le seuil configuré, sinon on passe au palier suivant.
+        
         Args:
             image_bytes: Bytes de l'image
             
@@ -29,22 +48,182 @@ class LatexExtractionService:
         Raises:
             Exception: Si l'API retourne une erreur
         """
-        # Priorité 1: Mathpix si configuré
+        with tracer.span("extract_latex", {
+            "image.size_bytes": len(image_bytes),
+            "extraction.cascade": self.cascade_enabled,
+        }):
+            return self._extract_latex(image_bytes)
+    
+    def _extract_latex(self, image_bytes: bytes) -> Dict[str, any]:
+        tiers = self._get_tiers()
+        
+        # Aucune méthode disponible
+        if not tiers:
+            raise ValueError(
+                "Aucune méthode d'extraction LaTeX configurée. "
+                "Configurez soit MATHPIX_APP_ID/MATHPIX_APP_KEY, soit OPENAI_API_KEY dans le fichier .env"
+            )
+        
+        if not self.cascade_enabled:
+            # Uniquement le palier le plus précis (manuscrit)
+            tiers = tiers[-1:]
+        
+        for index, (tier_name, extractor) in enumerate(tiers):
+            is_last_tier = index == len(tiers) - 1
+            self._record_tier(tier_name, "attempts")
+            
+            if is_last_tier:
+                # Dernier palier: le résultat est retourné tel quel (et les erreurs propagées)
+                result = self._run_tier(tier_name, extractor, image_bytes)
+                self._record_tier(tier_name, "accepted")
+                self._log_tier_stats()
+                tracer.set_attributes({"extraction.tier": tier_name, "extraction.escalations": index})
+                return result
+            
+            try:
+                result = self._run_tier(tier_name, extractor, image_bytes)
+            except Exception as e:
+                logger.info(f"Palier d'extraction '{tier_name}' en échec ({str(e)}), escalade")
+                continue
+            
+            latex = result.get("latex", "")
+            confidence = result.get("confidence", 0.0)
+            if self._is_well_formed(latex) and confidence >= self.confidence_threshold:
+                self._record_tier(tier_name, "accepted")
+                self._log_tier_stats()
+                tracer.set_attributes({"extraction.tier": tier_name, "extraction.escalations": index})
+                return result
+            
+            logger.info(
+                f"Palier d'extraction '{tier_name}' insuffisant "
+                f"(confidence: {confidence:.2f}, LaTeX valide: {self._is_well_formed(latex)}), escalade"
+            )
+    
+    @staticmethod
+    def _run_tier(
+        tier_name: str,
+        extractor: Callable[[bytes], Dict[str, any]],
+        image_bytes: bytes
+    ) -> Dict[str, any]:
+        """Exécute un palier d'extraction dans son propre span"""
+        with tracer.span(f"extraction.{tier_name}", {"extraction.tier": tier_name}) as span:
+            result = extractor(image_bytes)
+            span.set_attribute("extraction.confidence", result.get("confidence"))
+            return result
+    
+    def _get_tiers(self) -> List[Tuple[str, Callable[[bytes], Dict[str, any]]]]:
+        """
+        Construit la liste ordonnée des paliers d'extraction (du moins cher au plus cher)
+        
+        Returns:
+            Liste de tuples (nom du palier, fonction d'extraction)
+        """
+        # Priorité 1: Mathpix si configuré (mode imprimé, puis manuscrit)
         if self.mathpix_app_id and self.mathpix_app_key:
-            return self._extract_with_mathpix(image_bytes)
+            return [
+                ("mathpix_printed", lambda image: self._extract_with_mathpix(image, handwritten=False)),
+                ("mathpix_handwritten", self._extract_with_mathpix),
+            ]
         
-        # Priorité 2: OpenAI Vision
+        # Priorité 2: OpenAI Vision (modèle rapide en basse résolution, puis modèle complet)
         if self.openai_api_key:
-            return self._extract_with_openai_vision(image_bytes)
+            return [
+                ("openai_fast", lambda image: self._extract_with_openai_vision(
+                    image, model=self.vision_fast_model, detail="low"
+                )),
+                ("openai_high", self._extract_with_openai_vision),
+            ]
         
-        # Aucune méthode disponible
-        raise ValueError(
-            "Aucune méthode d'extraction LaTeX configurée. "
-            "Configurez soit MATHPIX_APP_ID/MATHPIX_APP_KEY, soit OPENAI_API_KEY dans le fichier .env"
-        )
+        return []
     
-    def _extract_with_mathpix(self, image_bytes: bytes) -> Dict[str, any]:
-        """Extrait le LaTeX avec Mathpix API"""
+    def _record_tier(self, tier_name: str, counter: str):
+        """Incrémente un compteur de la cascade pour un palier"""
+        with self._stats_lock:
+            stats = self.tier_stats.setdefault(tier_name, {"attempts": 0, "accepted": 0})
+            stats[counter] += 1
+    
+    def _log_tier_stats(self):
+        """Log le taux de résultats acceptés par palier"""
+        with self._stats_lock:
+            total = sum(stats["accepted"] for stats in self.tier_stats.values())
+            summary = ", ".join(
+                f"{name}: {stats['accepted']}/{stats['attempts']} acceptés "
+                f"({stats['accepted'] / total:.0%} des extractions)"
+                for name, stats in self.tier_stats.items()
+            )
+        logger.info(f"Cascade d'extraction - {summary}")
+    
+    def get_tier_stats(self) -> Dict[str, Dict[str, float]]:
+        """
+        Retourne les statistiques de la cascade d'extraction
+        
+        Returns:
+            Dict par palier avec 'attempts', 'accepted' et 'hit_rate'
+        """
+        with self._stats_lock:
+            return {
+                name: {
+                    "attempts": stats["attempts"],
+                    "accepted": stats["accepted"],
+                    "hit_rate": stats["accepted"] / stats["attempts"] if stats["attempts"] else 0.0
+                }
+                for name, stats in self.tier_stats.items()
+            }
+    
+    @staticmethod
+    def _is_well_formed(latex: str) -> bool:
+        """
+        Vérifie que le LaTeX est syntaxiquement exploitable
+        (non vide, accolades/parenthèses/crochets équilibrés, environnements fermés)
+        
+        Args:
+            latex: Code LaTeX
+            
+        Returns:
+            True si le LaTeX semble valide
+        """
+        if not latex or not latex.strip() or "ERREUR" in latex.upper():
+            return False
+        
+        pairs = {'}': '{', ')': '(', ']': '['}
+        stack = []
+        index = 0
+        while index < len(latex):
+            char = latex[index]
+            if char == '\\':
+                # Ignore les caractères échappés (\{, \}, \\, ...)
+                index += 2
+                continue
+            if char in '{([':
+                stack.append(char)
+            elif char in pairs:
+                # Les intervalles ouverts comme ]0, 1[ ou [0, 1) ne sont pas des erreurs de syntaxe
+                if char in ')]' and (not stack or stack[-1] != pairs[char]):
+                    index += 1
+                    continue
+                if not stack or stack[-1] != pairs[char]:
+                    return False
+                stack.pop()
+            index += 1
+        
+        if '{' in stack:
+            return False
+        
+        if latex.count('\\begin{') != latex.count('\\end{'):
+            return False
+        
+        # Une expression ne se termine pas par un opérateur ou une commande incomplète
+        return not latex.rstrip().endswith(('\\', '^', '_', '+', '-', '=', '*', '/'))
+    
+    def _extract_with_mathpix(self, image_bytes: bytes, handwritten: bool = True) -> Dict[str, any]:
+        """
+        Extrait le LaTeX avec Mathpix API
+        
+        Args:
+            image_bytes: Bytes de l'image
+            handwritten: Active les options de reconnaissance manuscrite
+                (sinon mode imprimé, plus rapide)
+        """
         import httpx
         
         image_base64 = base64.b64encode(image_bytes).decode('utf-8')
@@ -74,10 +253,21 @@ class LatexExtractionService:
             "handwritten": True  # Mode manuscrit activé
         }
         
+        if not handwritten:
+            # Mode imprimé: options par défaut, sans heuristiques manuscrites
+            data = {
+                "src": data["src"],
+                "formats": data["formats"],
+                "data_options": {
+                    "include_asciimath": True,
+                    "include_latex": True
+                }
+            }
+        
         try:
-            with httpx.Client(timeout=30.0) as client:
+            with tracing.http_client(timeout=30.0) as client:
                 response = client.post(
-                    "https://api.mathpix.com/v3/text",
+                    config.MATHPIX_API_URL,
                     json=data,
                     headers=headers
                 )
@@ -91,6 +281,16 @@ class LatexExtractionService:
                     result.get("text", "")
                 )
                 
+                if not handwritten:
+                    # Mode imprimé: confiance brute renvoyée par Mathpix
+                    confidence = result.get("confidence", 0.0)
+                    if not confidence and result.get("is_printed"):
+                        confidence = 0.95
+                    return {
+                        "latex": latex.strip(),
+                        "confidence": min(max(confidence, 0.0), 1.0)
+                    }
+                
                 # Post-traitement pour manuscrits
                 if latex:
                     latex = self._post_process_handwritten_latex(latex.strip())
@@ -123,12 +323,31 @@ class LatexExtractionService:
         except Exception as e:
             raise Exception(f"Erreur lors de l'extraction {str(e)}")
     
-    def _extract_with_openai_vision(self, image_bytes: bytes) -> Dict[str, any]:
-        """Extrait le LaTeX avec OpenAI Vision API"""
+    def _extract_with_openai_vision(
+        self,
+        image_bytes: bytes,
+        model: Optional[str] = None,
+        detail: str = "high"
+    ) -> Dict[str, any]:
+        """
+        Extrait le LaTeX avec OpenAI Vision API
+        
+        Args:
+            image_bytes: Bytes de l'image
+            model: Modèle de vision (par défaut VISION_MODEL, GPT-4o)
+            detail: Niveau de détail de l'image ("low" ou "high")
+        """
         from openai import OpenAI
-        import base64
         
-        client = OpenAI(api_key=self.openai_api_key)
+        model = model or self.vision_model
+        # Palier rapide: la confiance est estimée à partir des logprobs des tokens
+        use_logprobs = detail == "low"
+        
+        client = OpenAI(
+            api_key=self.openai_api_key,
+            base_url=config.OPENAI_BASE_URL or None,
+            http_client=tracing.openai_http_client()
+        )
         
         # Convertit l'image en base64
         image_base64 = base64.b64encode(image_bytes).decode('utf-8')
@@ -142,111 +361,41 @@ class LatexExtractionService:
         elif image_bytes.startswith(b'RIFF'):
             image_format = "webp"
         
-        prompt = """Tu es un expert en reconnaissance d'écriture mathématique manuscrite et imprimée.
-
-Extrait le code LaTeX de cette image mathématique. L'image peut être manuscrite ou imprimée.
-
-⚠️ INSTRUCTIONS CRITIQUES POUR LES MANUSCRITS ⚠️
-
-1. PUISSANCES ET EXPOSANTS (PRIORITÉ ABSOLUE) :
-   - Les petits chiffres ÉCRITS AU-DESSUS d'un nombre ou d'une lettre sont TOUJOURS des exposants
-   - Même si l'exposant est mal aligné, légèrement décalé, ou mal formé, c'est TOUJOURS un exposant
-   - Si tu vois un chiffre positionné AU-DESSUS ou légèrement plus haut que le nombre de base, c'est un exposant
-   - IMPORTANT : Dans "37 - 4^2", le "2" est un exposant car il est écrit AU-DESSUS du "4"
-   - Exemples manuscrits typiques :
-     * "4 avec un petit 2 en haut" → 4^2 ou 4^{2}
-     * "37 - 4²" ou "37 - 4 avec 2 en haut" → 37-4^{2} ou 37 - 4^2
-     * "x avec un petit 3 en haut" → x^3 ou x^{3}
-     * "x²" → x^{2} ou x^2
-     * "a³" → a^{3} ou a^3
-   - Si un chiffre suit immédiatement un nombre sans opérateur visible ET qu'il est positionné plus haut → exposant
-   - Pattern courant : "nombre nombre" où le second nombre est plus petit/haut → puissance
-
-2. CARACTÈRES SIMILAIRES (MANUSCRITS) :
-   - Distingue bien : 0 (zéro) vs O (lettre), 1 (un) vs l (L minuscule), 2 vs Z, 5 vs S
-   - Le contexte aide : si c'est dans une opération mathématique, c'est probablement un chiffre
-
-3. SYMBOLES MATHÉMATIQUES :
-   - Les fractions manuscrites : reconnais / comme \frac{}{} ou laisse /
-   - Les puissances : TOUJOURS utiliser ^ pour les exposants
-   - Les indices : reconnais les petits chiffres en bas comme des indices (_)
-   - Les racines : reconnais les symboles √ comme \sqrt
-   - Les intégrales, sommes, produits : reconnais ∫, Σ, Π
-   - Les lettres grecques manuscrites : α, β, γ, δ, θ, π, etc.
-
-4. OPÉRATIONS DE BASE :
-   - + (addition), - (soustraction), × ou * (multiplication), ÷ ou / (division), = (égal)
-   - Les espaces autour des opérateurs sont optionnels
-
-5. Format de réponse :
-   - Réponds UNIQUEMENT avec le code LaTeX pur, sans formatage markdown
-   - Pas d'explication, pas de texte supplémentaire
-   - Utilise la syntaxe LaTeX standard :
-     * Puissances : x^{2} ou x^2 (TOUJOURS avec ^)
-     * Indices : x_{i} ou x_i
-     * Fractions : \frac{numerateur}{denominateur} ou a/b
-     * Racines : \sqrt{x} ou \sqrt[n]{x}
-     * Intégrales : \int, \int_{a}^{b}
-     * Sommes : \sum_{i=1}^{n}
-     * Produits : \prod_{i=1}^{n}
-
-6. EXEMPLES SPÉCIFIQUES DE MANUSCRITS (RÉFÉRENCE) :
-   - "37 - 4²" ou "37 - 4 avec 2 en haut" → 37-4^{2} ou 37 - 4^2
-   - "37 - 4 2" (sans opérateur entre 4 et 2, 2 est plus haut) → 37-4^{2}
-   - "x² + 5" ou "x avec 2 en haut plus 5" → x^{2}+5 ou x^2 + 5
-   - "2³" ou "2 avec 3 en haut" → 2^{3} ou 2^3
-   - "a²b³" → a^{2}b^{3} ou a^2 b^3
-   - "x + 1 = 0" → x+1=0 ou x + 1 = 0
-   - "5² - 3" → 5^{2}-3 ou 5^2 - 3
-   - "10 - 2²" → 10-2^{2} ou 10 - 2^2
-
-7. DÉTECTION DES EXPOSANTS MANUSCRITS :
-   - Examine attentivement la POSITION VERTICALE des chiffres
-   - Si un chiffre est clairement plus haut que le chiffre précédent → exposant
-   - Si deux chiffres sont côte à côte sans opérateur, et le second est plus petit/haut → exposant
-   - Même si l'alignement n'est pas parfait (typique des manuscrits), détecte les exposants par position
-
-7. Si tu ne peux vraiment pas extraire de LaTeX, réponds avec "ERREUR"."""
+        # Variante de prompt et plafond de sortie adaptés au palier
+        prompt_plan = prompt_service.build_vision_prompt(detail=detail)
         
         try:
             response = client.chat.completions.create(
-                model="gpt-4o",  # GPT-4o a une meilleure vision pour le manuscrit
+                model=model,  # GPT-4o a une meilleure vision pour le manuscrit
                 messages=[
                     {
                         "role": "system",
-                        "content": """Tu es un expert en reconnaissance d'écriture mathématique manuscrite et imprimée. 
-Tu es spécialisé dans la conversion d'équations mathématiques (manuscrites ou imprimées) en code LaTeX.
-Tu réponds UNIQUEMENT avec le code LaTeX pur, sans formatage markdown, sans explication, sans texte supplémentaire.
-
-TU ES TRÈS DOUÉ POUR :
-- Reconnaître les PUISSANCES et EXPOSANTS manuscrits (petits chiffres en haut) et les convertir en notation ^
-- Distinguer les chiffres manuscrits des lettres (0 vs O, 1 vs l, 2 vs Z, 5 vs S)
-- Identifier les symboles mathématiques même s'ils sont mal formés ou mal alignés
-- Extraire fidèlement les opérations arithmétiques de base (+, -, ×, ÷, =)
-
-RÈGLE D'OR : Si tu vois un petit chiffre ÉCRIT AU-DESSUS d'un nombre ou d'une lettre, c'est TOUJOURS un exposant. Utilise ^ pour le représenter."""
+                        "content": prompt_plan["system"]
                     },
                     {
                         "role": "user",
                         "content": [
                             {
                                 "type": "text",
-                                "text": prompt
+                                "text": prompt_plan["instructions"]
                             },
                             {
                                 "type": "image_url",
                                 "image_url": {
                                     "url": f"data:image/{image_format};base64,{image_base64}",
-                                    "detail": "high"  # Haute résolution pour mieux voir les détails manuscrits
+                                    "detail": detail  # Haute résolution pour mieux voir les détails manuscrits
                                 }
                             }
                         ]
                     }
                 ],
-                max_tokens=1500,  # Augmenté pour les équations complexes
-                temperature=0.0  # Température à 0 pour plus de précision et cohérence
+                max_tokens=prompt_plan["max_tokens"],
+                temperature=0.0,  # Température à 0 pour plus de précision et cohérence
+                logprobs=use_logprobs
             )
             
+            prompt_service.record_openai_usage("vision", model, response.usage)
+            
             latex = response.choices[0].message.content.strip()
             
             # Nettoie le LaTeX (enlève les markdown code blocks si présents)
@@ -284,6 +433,11 @@ RÈGLE D'OR : Si tu vois un petit chiffre ÉCRIT AU-DESSUS d'un nombre ou d'une
             if len(latex) > 15 and latex.count('{') == latex.count('}'):  # Parenthèses équilibrées
                 confidence = min(confidence + 0.05, 0.95)
             
+            if use_logprobs:
+                token_confidence = self._confidence_from_logprobs(response.choices[0].logprobs)
+                if token_confidence is not None:
+                    confidence = token_confidence
+            
             return {
                 "latex": latex,
                 "confidence": confidence
@@ -300,6 +454,24 @@ RÈGLE D'OR : Si tu vois un petit chiffre ÉCRIT AU-DESSUS d'un nombre ou d'une
             else:
                 raise Exception(f"Erreur lors de l'extraction : {error_msg}")
     
+    @staticmethod
+    def _confidence_from_logprobs(logprobs) -> Optional[float]:
+        """
+        Calcule une confiance à partir des logprobs des tokens générés
+        (moyenne géométrique des probabilités)
+        
+        Args:
+            logprobs: Objet logprobs d'un choix OpenAI
+            
+        Returns:
+            Confiance entre 0 et 1, ou None si indisponible
+        """
+        tokens = getattr(logprobs, "content", None) if logprobs else None
+        if not tokens:
+            return None
+        mean_logprob = sum(token.logprob for token in tokens) / len(tokens)
+        return min(max(math.exp(mean_logprob), 0.0), 1.0)
+    
     def _post_process_handwritten_latex(self, latex: str) -> str:
         """
         Post-traitement pour corriger les erreurs communes de reconnaissance manuscrite
@@ -1,14 +1,62 @@
 """
 Service pour générer des explications avec un LLM (OpenAI ou Gemini)
 """
-import json
-import re
 import logging
-from typing import Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 from app.config import config
+from app.services.prompt_service import prompt_service
+from app.services.step_explanation_cache import step_explanation_cache
+from app.services.template_explanation_service import template_explanation_service
+from app.utils.json_stream import StepStreamParser
+from app.utils.tracing import openai_http_client, tracer
 
 logger = logging.getLogger(__name__)
 
+# Rappel appelé pour chaque étape enrichie dès sa réception: (rang dans le résultat, étape)
+StepCallback = Callable[[int, Dict], None]
+
+_STEP_PROPERTIES = {
+    "title": {"type": "string"},
+    "description": {"type": "string"},
+    "formula": {"type": "string"},
+    "explanation": {"type": "string"},
+}
+
+# Schéma des étapes pour le mode Structured Outputs d'OpenAI
+STEPS_JSON_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "steps": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": _STEP_PROPERTIES,
+                "required": list(_STEP_PROPERTIES),
+                "additionalProperties": False,
+            },
+        }
+    },
+    "required": ["steps"],
+    "additionalProperties": False,
+}
+
+# Même schéma pour Gemini (qui ne supporte pas additionalProperties)
+GEMINI_STEPS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "steps": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": _STEP_PROPERTIES,
+                "required": list(_STEP_PROPERTIES),
+            },
+        }
+    },
+    "required": ["steps"],
+}
+
 
 class LLMService:
     """Service pour communiquer avec les LLMs"""
@@ -19,13 +67,21 @@ class LLMService:
         self.gemini_api_key = config.GEMINI_API_KEY
         self.openai_model = config.OPENAI_MODEL
         self.gemini_model = config.GEMINI_MODEL
+        self.structured_output = config.LLM_STRUCTURED_OUTPUT
+        self.template_explanations = config.TEMPLATE_EXPLANATIONS
+        self.chunk_size = config.EXPLANATION_CHUNK_SIZE
+        # Parties d'une explication longue: appels LLM simultanés
+        self._chunk_executor = ThreadPoolExecutor(
+            max_workers=max(config.EXPLANATION_CHUNK_WORKERS, 1), thread_name_prefix="llm-chunks"
+        )
     
     def generate_explanation(
         self,
         problem: str,
         solution: str,
-        steps: List[Dict]
-    ) -> List[Dict]:
+        steps: List[Dict],
+        on_step: Optional[StepCallback] = None
+    ) -> Tuple[List[Dict], bool]:
         """
         Génère des explications enrichies pour chaque étape
         
@@ -33,180 +89,392 @@ class LLMService:
             problem: Problème mathématique
             solution: Solution du problème
             steps: Liste des étapes brutes
+            on_step: Appelé (depuis le thread de l'appel LLM) pour chaque étape
+                enrichie dès qu'elle est reçue, avec son rang dans le résultat;
+                les étapes restées brutes ne sont pas signalées
             
         Returns:
-            Liste des étapes avec explications enrichies
+            Tuple (étapes avec explications enrichies, complet) - complet vaut
+            False si l'appel au LLM a échoué ou si sa réponse est tronquée
+            (tout ou partie des étapes restent brutes)
         """
-        if self.provider == "openai":
-            return self._generate_with_openai(problem, solution, steps)
-        elif self.provider == "gemini":
-            return self._generate_with_gemini(problem, solution, steps)
-        else:
-            # Fallback: retourner les steps sans modification
-            return steps
+        with tracer.span("generate_explanation", {
+            "llm.provider": self.provider,
+            "explanation.input_steps": len(steps),
+        }) as span:
+            enriched, complete = self._generate_explanation(problem, solution, steps, on_step)
+            span.set_attributes({"explanation.output_steps": len(enriched), "explanation.complete": complete})
+            return enriched, complete
+    
+    def _generate_explanation(
+        self,
+        problem: str,
+        solution: str,
+        steps: List[Dict],
+        on_step: Optional[StepCallback] = None
+    ) -> Tuple[List[Dict], bool]:
+        if self.template_explanations:
+            # Problèmes formulaïques: explication locale, sans appel réseau
+            template_steps = template_explanation_service.explain(problem, solution, steps)
+            if template_steps:
+                logger.info(f"Explication générée localement par modèle ({len(template_steps)} étapes)")
+                tracer.set_attributes({"explanation.source": "template"})
+                return template_steps, True
+        
+        if self.provider not in ("openai", "gemini"):
+            # Aucun LLM configuré: les steps sont renvoyés sans modification
+            tracer.set_attributes({"explanation.source": "raw"})
+            return steps, True
+        
+        if step_explanation_cache.enabled and steps:
+            return self._enrich_with_cache(problem, solution, steps, on_step)
+        
+        enriched, complete = self._enrich_steps(problem, solution, steps, on_step)
+        if not enriched:
+            # En dernier recours, retourner les steps originaux
+            tracer.set_attributes({"explanation.source": "raw"})
+            return steps, False
+        
+        tracer.set_attributes({"explanation.source": "llm"})
+        return enriched, complete
+    
+    def _enrich_with_cache(
+        self,
+        problem: str,
+        solution: str,
+        steps: List[Dict],
+        on_step: Optional[StepCallback] = None
+    ) -> Tuple[List[Dict], bool]:
+        """
+        Explication des seules étapes absentes du cache par étape
+        
+        Les étapes déjà expliquées (dans ce problème ou un autre) sont reprises
+        du cache; les autres sont envoyées au LLM puis remises à leur place.
+        """
+        cached = step_explanation_cache.lookup(steps)
+        missing = [index for index, step in enumerate(cached) if step is None]
+        tracer.set_attributes({"explanation.cached_steps": len(steps) - len(missing)})
+        if on_step is not None:
+            for position, step in enumerate(cached):
+                if step is not None:
+                    on_step(position, step)
+        if not missing:
+            logger.info(f"Explication reprise du cache par étape ({len(steps)} étapes)")
+            tracer.set_attributes({"explanation.source": "cache"})
+            return cached, True
+        
+        raw_missing = [steps[index] for index in missing]
+        enriched, complete = self._enrich_steps(
+            problem, solution, raw_missing, self._mapped_callback(on_step, missing)
+        )
+        if not enriched:
+            if len(missing) == len(steps):
+                tracer.set_attributes({"explanation.source": "raw"})
+                return steps, False
+            # Étapes connues enrichies, les autres restent brutes
+            enriched, complete = raw_missing, False
+        elif complete and len(enriched) == len(raw_missing):
+            # Réponse complète, une étape enrichie par étape brute: rangs fiables
+            step_explanation_cache.store(raw_missing, enriched)
+        if len(missing) < len(steps):
+            logger.info(f"Cache par étape: {len(steps) - len(missing)}/{len(steps)} étapes reprises")
+        
+        # Étapes du LLM remises à la place des étapes manquantes, dans l'ordre
+        # (étapes supplémentaires du LLM à la suite de la dernière)
+        merged = []
+        remaining = iter(enriched)
+        for position, step in enumerate(cached):
+            if step is not None:
+                merged.append(step)
+                continue
+            merged.append(next(remaining, steps[position]))
+            if position == missing[-1]:
+                merged.extend(remaining)
+        
+        tracer.set_attributes({"explanation.source": "llm"})
+        return merged, complete
+    
+    def _enrich_steps(
+        self,
+        problem: str,
+        solution: str,
+        steps: List[Dict],
+        on_step: Optional[StepCallback] = None
+    ) -> Tuple[List[Dict], bool]:
+        """Étapes enrichies par le LLM (par parties au-delà de EXPLANATION_CHUNK_SIZE)"""
+        if self.chunk_size > 0 and len(steps) > self.chunk_size:
+            return self._enrich_in_chunks(problem, solution, steps, on_step)
+        return self._enrich(problem, solution, steps, on_step=on_step)
     
-    def _generate_with_openai(
+    def _enrich(
         self,
         problem: str,
         solution: str,
-        steps: List[Dict]
-    ) -> List[Dict]:
-        """Génère des explications avec OpenAI"""
+        steps: List[Dict],
+        step_range: Optional[Tuple[int, int]] = None,
+        on_step: Optional[StepCallback] = None
+    ) -> Tuple[List[Dict], bool]:
+        """
+        Un appel LLM: étapes enrichies (toutes, ou celles de step_range)
+        on_step reçoit le rang de chaque étape dans la partie demandée
+        
+        Returns:
+            Tuple (étapes enrichies, réponse complète) - liste vide si l'appel
+            n'a rien produit
+        """
+        target = steps if step_range is None else steps[step_range[0]:step_range[1]]
+        parser = StepStreamParser()
+        enriched = []
         try:
-            from openai import OpenAI
-            
-            if not self.openai_api_key:
-                raise ValueError(
-                    "OpenAI API key non configurée. "
-                    "Définissez OPENAI_API_KEY dans le fichier .env"
-                )
-            
-            client = OpenAI(api_key=self.openai_api_key)
-            
-            prompt = f"""Tu es un professeur de mathématiques expert. Analyse ce problème et ses étapes de résolution.
-
-Problème: {problem}
-Solution: {solution}
-
-Étapes brutes:
-{chr(10).join([f"{i+1}. {step.get('description', '')}" for i, step in enumerate(steps)])}
-
-Pour chaque étape, génère une explication claire et pédagogique en français, formatée comme suit:
-- title: Un titre court et clair
-- description: L'étape principale
-- formula: La formule mathématique en LaTeX (si applicable)
-- explanation: Une explication détaillée et pédagogique
-
-Réponds uniquement avec un JSON valide contenant un tableau "steps" avec les objets ci-dessus. Ne pas inclure de markdown ou de texte supplémentaire."""
-            
-            response = client.chat.completions.create(
-                model=self.openai_model,
-                messages=[
-                    {"role": "system", "content": "Tu es un professeur de mathématiques expert qui explique clairement les solutions."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7,
-                max_tokens=2000
+            for step in self.stream_explanation(problem, solution, steps, parser=parser, step_range=step_range):
+                if on_step is not None and len(enriched) < len(target):
+                    on_step(len(enriched), step)
+                enriched.append(step)
+        except Exception as e:
+            logger.warning(f"Erreur LLM {self.provider}: {str(e)}")
+        
+        if not enriched:
+            return [], False
+        if len(enriched) < len(target) and not parser.complete:
+            # Réponse tronquée: on garde les étapes déjà enrichies
+            # et on complète avec les étapes brutes restantes
+            logger.warning(
+                f"Réponse LLM incomplète: {len(enriched)}/{len(target)} étapes enrichies"
             )
-            
-            content = response.choices[0].message.content
-            
-            # Nettoie le contenu (enlève les markdown code blocks si présents)
-            if "```json" in content:
-                content = content.split("```json")[1].split("```")[0]
-            elif "```" in content:
-                content = content.split("```")[1].split("```")[0]
-            
-            result = json.loads(content.strip())
-            
-            if isinstance(result, dict) and "steps" in result:
-                return result["steps"]
-            elif isinstance(result, list):
-                return result
+            return enriched + target[len(enriched):], False
+        if step_range is not None:
+            # Étapes hors de la partie demandée: expliquées par une autre partie
+            enriched = enriched[:len(target)]
+        return enriched, parser.complete
+    
+    def _enrich_in_chunks(
+        self,
+        problem: str,
+        solution: str,
+        steps: List[Dict],
+        on_step: Optional[StepCallback] = None
+    ) -> Tuple[List[Dict], bool]:
+        """
+        Explication d'une solution longue par parties, enrichies en parallèle
+        
+        Chaque appel reçoit le problème, la solution et toutes les étapes brutes
+        (contexte commun) et n'explique que sa partie: la durée est celle de la
+        plus longue partie et aucune réponse n'atteint le plafond de tokens.
+        Une partie en échec garde ses étapes brutes.
+        
+        Returns:
+            Tuple (étapes enrichies dans l'ordre, toutes les parties complètes)
+        """
+        chunk_count = -(-len(steps) // self.chunk_size)
+        # Parties de tailles équilibrées (la plus longue détermine la durée)
+        bounds = [round(index * len(steps) / chunk_count) for index in range(chunk_count + 1)]
+        ranges = list(zip(bounds, bounds[1:]))
+        tracer.set_attributes({"explanation.chunks": chunk_count})
+        logger.info(f"Explication de {len(steps)} étapes en {chunk_count} parties parallèles")
+        
+        futures = [
+            self._chunk_executor.submit(
+                tracer.wrap(self._enrich), problem, solution, steps, step_range,
+                self._offset_callback(on_step, step_range[0])
+            )
+            for step_range in ranges
+        ]
+        enriched: List[Dict] = []
+        complete = True
+        any_enriched = False
+        for (start, end), future in zip(ranges, futures):
+            chunk, chunk_complete = future.result()
+            if chunk:
+                any_enriched = True
+                enriched += chunk
             else:
-                return steps
-                
-        except json.JSONDecodeError as e:
-            # Si le JSON est invalide, essayer de récupérer au moins le texte
-            try:
-                # Essayer d'extraire un JSON valide même s'il y a du texte autour
-                json_match = re.search(r'\{.*\}', content, re.DOTALL)
-                if json_match:
-                    result = json.loads(json_match.group(0))
-                    if isinstance(result, dict) and "steps" in result:
-                        return result["steps"]
-                    elif isinstance(result, list):
-                        return result
-            except:
-                pass
-            # En dernier recours, retourner les steps originaux
-            logger.warning(f"Erreur parsing JSON OpenAI: {str(e)}")
-            return steps
-        except Exception as e:
-            # En cas d'erreur, retourner les steps originaux
-            logger.warning(f"Erreur LLM OpenAI: {str(e)}")
-            return steps
+                enriched += steps[start:end]
+            complete = complete and chunk_complete
+        return (enriched if any_enriched else []), complete
+    
+    @staticmethod
+    def _offset_callback(on_step: Optional[StepCallback], offset: int) -> Optional[StepCallback]:
+        """Rappel d'une partie: rang dans la partie converti en rang dans le résultat"""
+        if on_step is None:
+            return None
+        return lambda index, step: on_step(offset + index, step)
     
-    def _generate_with_gemini(
+    @staticmethod
+    def _mapped_callback(on_step: Optional[StepCallback], positions: List[int]) -> Optional[StepCallback]:
+        """Rappel des étapes manquantes: rang parmi elles converti en rang dans le résultat"""
+        if on_step is None:
+            return None
+        return lambda index, step: on_step(positions[index], step) if index < len(positions) else None
+    
+    def stream_explanation(
         self,
         problem: str,
         solution: str,
-        steps: List[Dict]
-    ) -> List[Dict]:
-        """Génère des explications avec Gemini"""
-        try:
-            import google.generativeai as genai
-            
-            if not self.gemini_api_key:
-                raise ValueError(
-                    "Gemini API key non configurée. "
-                    "Définissez GEMINI_API_KEY dans le fichier .env"
-                )
-            
-            genai.configure(api_key=self.gemini_api_key)
-            model = genai.GenerativeModel(self.gemini_model)
-            
-            prompt = f"""Tu es un professeur de mathématiques expert. Analyse ce problème et ses étapes de résolution.
-
-Problème: {problem}
-Solution: {solution}
-
-Étapes brutes:
-{chr(10).join([f"{i+1}. {step.get('description', '')}" for i, step in enumerate(steps)])}
-
-Pour chaque étape, génère une explication claire et pédagogique en français, formatée comme suit:
-- title: Un titre court et clair
-- description: L'étape principale
-- formula: La formule mathématique en LaTeX (si applicable)
-- explanation: Une explication détaillée et pédagogique
-
-Réponds uniquement avec un JSON valide contenant un tableau "steps" avec les objets ci-dessus. Ne pas inclure de markdown ou de texte supplémentaire."""
+        steps: List[Dict],
+        parser: Optional[StepStreamParser] = None,
+        step_range: Optional[Tuple[int, int]] = None
+    ) -> Iterator[Dict]:
+        """
+        Génère les explications enrichies et émet chaque étape dès qu'elle est complète
+        
+        Args:
+            problem: Problème mathématique
+            solution: Solution du problème
+            steps: Liste des étapes brutes
+            parser: Parseur incrémental à utiliser (optionnel, permet de savoir
+                ensuite si la réponse était complète)
+            step_range: N'explique que les étapes [début, fin[ (explication par parties)
             
-            response = model.generate_content(
-                prompt,
-                generation_config={
-                    "temperature": 0.7,
-                    "max_output_tokens": 2000,
+        Yields:
+            Étapes enrichies, dans l'ordre
+        """
+        if self.provider == "openai":
+            chunks = self._stream_with_openai(problem, solution, steps, step_range)
+            model = self.openai_model
+        elif self.provider == "gemini":
+            chunks = self._stream_with_gemini(problem, solution, steps, step_range)
+            model = self.gemini_model
+        else:
+            yield from (steps if step_range is None else steps[step_range[0]:step_range[1]])
+            return
+        
+        parser = parser or StepStreamParser()
+        
+        with tracer.span("llm.stream", {"llm.provider": self.provider, "llm.model": model}, kind="client") as span:
+            chunk_count = 0
+            for chunk in chunks:
+                if not chunk_count:
+                    span.set_attribute("llm.time_to_first_chunk_ms", round(span.duration_ms, 1))
+                chunk_count += 1
+                yield from parser.feed(chunk)
+            span.set_attributes({"llm.chunks": chunk_count, "llm.streamed_steps": len(parser.steps)})
+        
+        # Réponse non structurée: parse le texte complet
+        fallback_steps = parser.finish()
+        if not parser.steps:
+            logger.warning(f"Erreur parsing JSON {self.provider}: réponse inexploitable")
+        yield from fallback_steps
+    
+    def _stream_with_openai(
+        self,
+        problem: str,
+        solution: str,
+        steps: List[Dict],
+        step_range: Optional[Tuple[int, int]] = None
+    ) -> Iterator[str]:
+        """Génère des explications avec OpenAI (flux de texte)"""
+        from openai import OpenAI
+        
+        if not self.openai_api_key:
+            raise ValueError(
+                "OpenAI API key non configurée. "
+                "Définissez OPENAI_API_KEY dans le fichier .env"
+            )
+        
+        client = OpenAI(
+            api_key=self.openai_api_key,
+            base_url=config.OPENAI_BASE_URL or None,
+            http_client=openai_http_client()
+        )
+        prompt_plan = prompt_service.build_explanation_prompt(
+            problem, solution, steps, step_range=step_range
+        )
+        
+        request = {
+            "model": self.openai_model,
+            "messages": [
+                {"role": "system", "content": prompt_plan["system"]},
+                {"role": "user", "content": prompt_plan["user"]}
+            ],
+            "temperature": 0.7,
+            "max_tokens": prompt_plan["max_tokens"],
+            "stream": True,
+            "stream_options": {"include_usage": True}
+        }
+        
+        if self.structured_output:
+            # Structured Outputs: le modèle est contraint au schéma des étapes
+            request["response_format"] = {
+                "type": "json_schema",
+                "json_schema": {
+                    "name": "math_steps",
+                    "strict": True,
+                    "schema": STEPS_JSON_SCHEMA
                 }
+            }
+        
+        stream = client.chat.completions.create(**request)
+        
+        for chunk in stream:
+            if chunk.usage:
+                prompt_service.record_openai_usage("explanation", self.openai_model, chunk.usage)
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                yield delta
+    
+    def _stream_with_gemini(
+        self,
+        problem: str,
+        solution: str,
+        steps: List[Dict],
+        step_range: Optional[Tuple[int, int]] = None
+    ) -> Iterator[str]:
+        """Génère des explications avec Gemini (flux de texte)"""
+        import google.generativeai as genai
+        
+        if not self.gemini_api_key:
+            raise ValueError(
+                "Gemini API key non configurée. "
+                "Définissez GEMINI_API_KEY dans le fichier .env"
             )
-            
-            content = response.text
-            
-            # Nettoie le contenu
-            if "```json" in content:
-                content = content.split("```json")[1].split("```")[0]
-            elif "```" in content:
-                content = content.split("```")[1].split("```")[0]
-            
-            result = json.loads(content.strip())
-            
-            if isinstance(result, dict) and "steps" in result:
-                return result["steps"]
-            elif isinstance(result, list):
-                return result
-            else:
-                return steps
-                
-        except json.JSONDecodeError as e:
-            # Si le JSON est invalide, essayer de récupérer au moins le texte
+        
+        if config.GEMINI_API_ENDPOINT:
+            # Endpoint personnalisé (proxy, simulateur de test de charge): transport REST
+            genai.configure(
+                api_key=self.gemini_api_key,
+                transport="rest",
+                client_options={"api_endpoint": config.GEMINI_API_ENDPOINT}
+            )
+        else:
+            genai.configure(api_key=self.gemini_api_key)
+        prompt_plan = prompt_service.build_explanation_prompt(
+            problem, solution, steps, step_range=step_range
+        )
+        model = genai.GenerativeModel(
+            self.gemini_model,
+            system_instruction=prompt_plan["system"]
+        )
+        
+        generation_config = {
+            "temperature": 0.7,
+            "max_output_tokens": prompt_plan["max_tokens"],
+        }
+        
+        if self.structured_output:
+            # Mode JSON natif de Gemini avec schéma de réponse
+            generation_config["response_mime_type"] = "application/json"
+            generation_config["response_schema"] = GEMINI_STEPS_SCHEMA
+        
+        response = model.generate_content(
+            prompt_plan["user"],
+            generation_config=generation_config,
+            stream=True
+        )
+        
+        usage_metadata = None
+        for chunk in response:
+            usage_metadata = getattr(chunk, "usage_metadata", None) or usage_metadata
             try:
-                # Essayer d'extraire un JSON valide même s'il y a du texte autour
-                json_match = re.search(r'\{.*\}', content, re.DOTALL)
-                if json_match:
-                    result = json.loads(json_match.group(0))
-                    if isinstance(result, dict) and "steps" in result:
-                        return result["steps"]
-                    elif isinstance(result, list):
-                        return result
-            except:
-                pass
-            # En dernier recours, retourner les steps originaux
-            logger.warning(f"Erreur parsing JSON Gemini: {str(e)}")
-            return steps
-        except Exception as e:
-            # En cas d'erreur, retourner les steps originaux
-            logger.warning(f"Erreur LLM Gemini: {str(e)}")
-            return steps
+                text = chunk.text
+            except ValueError:
+                # Morceau sans texte (ex: métadonnées de fin)
+                continue
+            if text:
+                yield text
+        
+        prompt_service.record_gemini_usage("explanation", self.gemini_model, usage_metadata)
 
 
 # Instance globale
@@ -5,12 +5,13 @@ import base64
 import httpx
 from typing import Dict, Optional
 from app.config import config
+from app.utils import tracing
 
 
 class MathpixService:
     """Service pour communiquer avec l'API Mathpix"""
     
-    API_URL = "https://api.mathpix.com/v3/text"
+    API_URL = config.MATHPIX_API_URL
     
     def __init__(self):
         self.app_id = config.MATHPIX_APP_ID
@@ -57,7 +58,7 @@ class MathpixService:
         }
         
         try:
-            with httpx.Client(timeout=30.0) as client:
+            with tracing.http_client(timeout=30.0) as client:
                 response = client.post(self.API_URL, json=data, headers=headers)
                 response.raise_for_status()
                 
@@ -0,0 +1,398 @@
+"""
+Service d'export PDF des analyses (fiche de solution ou d'exercices)
+Le PDF est composé côté serveur et envoyé page par page pendant sa
+génération. Les formules sont composées une seule fois: le rendu de chaque
+formule est gardé dans un cache LRU (clé: empreinte du LaTeX et corps), et
+écrit une seule fois par document sous forme de XObject réutilisé par
+toutes les étapes et tous les problèmes où il apparaît. La composition
+s'exécute dans un pool de threads dédié pour ne pas occuper celui de l'API.
+"""
+import asyncio
+import hashlib
+import logging
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Set, Tuple
+
+from app.config import config
+from app.utils.formula_layout import (
+    BOLD, ITALIC, REGULAR, SYMBOL, SYMBOL_GLYPHS,
+    Box, Glyphs, Rule, layout_formula, text_width
+)
+from app.utils.pdf_writer import PDFWriter, pdf_number, pdf_string
+
+logger = logging.getLogger(__name__)
+
+PAGE_WIDTH, PAGE_HEIGHT = 595.28, 841.89  # A4 en points
+MARGIN = 56
+FOOTER = 24
+
+FONT_RESOURCES = {REGULAR: b"/F1", ITALIC: b"/F2", BOLD: b"/F3", SYMBOL: b"/F4"}
+BASE_FONTS = {REGULAR: b"Helvetica", ITALIC: b"Helvetica-Oblique", BOLD: b"Helvetica-Bold", SYMBOL: b"Symbol"}
+
+BLUE = (0.0, 0.66, 1.0)
+BLACK = (0.0, 0.0, 0.0)
+GRAY = (0.35, 0.35, 0.35)
+FORMULA_COLOR = (0.0, 0.39, 0.78)
+
+# Délimiteurs de formules en ligne dans les textes du LLM ($...$, \(...\))
+INLINE_MATH = re.compile(r"\$\$?|\\\(|\\\)|\\\[|\\\]")
+
+
+@dataclass(frozen=True)
+class RenderedFormula:
+    """Formule composée: opérateurs PDF relatifs à l'origine (ligne de base, à gauche)"""
+    width: float
+    height: float
+    depth: float
+    content: bytes
+
+
+def _encode(text: str, font: str) -> bytes:
+    """Encode un texte pour une police standard (WinAnsi, ou code Symbol)"""
+    if font == SYMBOL:
+        return bytes(SYMBOL_GLYPHS[char][0] for char in text)
+    encoded = bytearray()
+    for char in text:
+        try:
+            encoded += char.encode("cp1252")
+        except UnicodeEncodeError:
+            base = unicodedata.normalize("NFKD", char)[:1]
+            encoded += base.encode("cp1252", "replace") if base != char else b"?"
+    return bytes(encoded)
+
+
+def _is_winansi(char: str) -> bool:
+    try:
+        char.encode("cp1252")
+        return True
+    except UnicodeEncodeError:
+        return False
+
+
+def text_runs(text: str, font: str) -> List[Tuple[str, str]]:
+    """Découpe un texte en suites d'une même police (symboles mathématiques en Symbol)"""
+    runs: List[Tuple[str, str]] = []
+    for char in text:
+        run_font = SYMBOL if char in SYMBOL_GLYPHS and not _is_winansi(char) else font
+        if runs and runs[-1][0] == run_font:
+            runs[-1] = (run_font, runs[-1][1] + char)
+        else:
+            runs.append((run_font, char))
+    return runs
+
+
+def _runs_width(text: str, font: str, size: float) -> float:
+    return sum(text_width(chunk, run_font, size) for run_font, chunk in text_runs(text, font))
+
+
+def _color(rgb: Tuple[float, float, float]) -> bytes:
+    """Couleur de remplissage et de trait"""
+    components = b" ".join(pdf_number(value) for value in rgb)
+    return components + b" rg " + components + b" RG"
+
+
+def box_operators(box: Box) -> bytes:
+    """Opérateurs PDF d'une boîte composée"""
+    operators = []
+    for item in box.items:
+        if isinstance(item, Glyphs):
+            operators.append(
+                b"BT %s %s Tf %s %s Td %s Tj ET" % (
+                    FONT_RESOURCES[item.font], pdf_number(item.size),
+                    pdf_number(item.x), pdf_number(item.y), pdf_string(_encode(item.text, item.font))
+                )
+            )
+        elif isinstance(item, Rule):
+            operators.append(b"%s %s %s %s re f" % (
+                pdf_number(item.x), pdf_number(item.y - item.thickness / 2),
+                pdf_number(item.width), pdf_number(item.thickness)
+            ))
+        else:
+            path = [b"%s %s m" % (pdf_number(item.points[0][0]), pdf_number(item.points[0][1]))]
+            path += [b"%s %s l" % (pdf_number(x), pdf_number(y)) for x, y in item.points[1:]]
+            operators.append(b"%s w 1 J 1 j %s S" % (pdf_number(item.thickness), b" ".join(path)))
+    return b"\n".join(operators)
+
+
+class FormulaCache:
+    """
+    Cache LRU des formules composées, partagé par tous les exports
+
+    Args:
+        max_entries: Nombre maximal de formules conservées
+    """
+
+    def __init__(self, max_entries: int = 2048):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, RenderedFormula]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(latex: str, size: float) -> str:
+        return hashlib.sha256(f"{size:g}\0{latex}".encode("utf-8")).hexdigest()
+
+    def render(self, latex: str, size: float) -> RenderedFormula:
+        """Formule composée (depuis le cache si elle a déjà été rendue)"""
+        key = self.key(latex, size)
+        with self._lock:
+            rendered = self._entries.get(key)
+            if rendered is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return rendered
+            self.misses += 1
+        box = layout_formula(latex, size)
+        rendered = RenderedFormula(box.width, box.height, box.depth, box_operators(box))
+        with self._lock:
+            self._entries[key] = rendered
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return rendered
+
+
+class _Worksheet:
+    """Mise en page des analyses, page par page, dans un PDFWriter"""
+
+    def __init__(self, writer: PDFWriter, formulas: FormulaCache):
+        self.writer = writer
+        self.formulas = formulas
+        font_numbers = {
+            font: writer.write_object(
+                b"<< /Type /Font /Subtype /Type1 /BaseFont /" + BASE_FONTS[font]
+                + (b"" if font == SYMBOL else b" /Encoding /WinAnsiEncoding") + b" >>"
+            )
+            for font in FONT_RESOURCES
+        }
+        self.fonts = writer.write_object(
+            b"<< " + b" ".join(b"%s %d 0 R" % (FONT_RESOURCES[font], number) for font, number in font_numbers.items()) + b" >>"
+        )
+        # Formules déjà écrites dans ce document: clé → nom de ressource → numéro d'objet
+        self._xobjects: Dict[str, bytes] = {}
+        self._xobject_numbers: Dict[bytes, int] = {}
+        self._operators: List[bytes] = []
+        self._page_xobjects: Set[bytes] = set()
+        self.y = 0.0
+        self._page_open = False
+
+    # Pages
+
+    def _open_page(self):
+        self._operators = []
+        self._page_xobjects = set()
+        self.y = PAGE_HEIGHT - MARGIN
+        self._page_open = True
+
+    def finish_page(self):
+        """Termine la page en cours (numéro en pied de page) et l'écrit"""
+        if not self._page_open:
+            return
+        number = str(self.writer.page_count + 1)
+        footer_size = 9
+        x = (PAGE_WIDTH - text_width(number, REGULAR, footer_size)) / 2
+        self._operators.append(
+            _color(GRAY) + b" BT /F1 %d Tf %s %s Td %s Tj ET" % (
+                footer_size, pdf_number(x), pdf_number(MARGIN / 2), pdf_string(_encode(number, REGULAR))
+            )
+        )
+        xobjects = b" ".join(
+            b"%s %d 0 R" % (name, self._xobject_numbers[name]) for name in sorted(self._page_xobjects)
+        )
+        resources = b"<< /Font %d 0 R /XObject << %s >> >>" % (self.fonts, xobjects)
+        self.writer.add_page(b"\n".join(self._operators), resources, PAGE_WIDTH, PAGE_HEIGHT)
+        self._page_open = False
+
+    def _ensure(self, height: float):
+        """Passe à la page suivante si la hauteur demandée ne tient pas"""
+        if not self._page_open:
+            self._open_page()
+        elif self.y - height < MARGIN + FOOTER:
+            self.finish_page()
+            self._open_page()
+
+    def gap(self, height: float):
+        if self._page_open:
+            self.y -= height
+
+    def remaining(self) -> float:
+        return self.y - MARGIN - FOOTER if self._page_open else PAGE_HEIGHT
+
+    # Blocs
+
+    def paragraph(self, text: str, size: float = 11, font: str = REGULAR,
+                  color: Tuple[float, float, float] = BLACK, indent: float = 0.0):
+        """Paragraphe justifié à gauche avec retour à la ligne"""
+        text = INLINE_MATH.sub("", text or "").strip()
+        if not text:
+            return
+        leading = size * 1.35
+        for line in self._wrap(text, font, size, PAGE_WIDTH - 2 * MARGIN - indent):
+            self._ensure(leading)
+            self.y -= leading
+            operators = [_color(color), b"BT", b"%s %s Td" % (pdf_number(MARGIN + indent), pdf_number(self.y + size * 0.3))]
+            for run_font, chunk in text_runs(line, font):
+                operators.append(b"%s %s Tf %s Tj" % (
+                    FONT_RESOURCES[run_font], pdf_number(size), pdf_string(_encode(chunk, run_font))
+                ))
+            operators.append(b"ET")
+            self._operators.append(b" ".join(operators))
+
+    @staticmethod
+    def _wrap(text: str, font: str, size: float, width: float) -> Iterator[str]:
+        for source_line in text.splitlines() or [""]:
+            line = ""
+            for word in source_line.split():
+                candidate = f"{line} {word}" if line else word
+                if _runs_width(candidate, font, size) <= width:
+                    line = candidate
+                    continue
+                if line:
+                    yield line
+                # Mot plus long que la ligne: coupé
+                while _runs_width(word, font, size) > width and len(word) > 1:
+                    cut = len(word)
+                    while cut > 1 and _runs_width(word[:cut], font, size) > width:
+                        cut -= 1
+                    yield word[:cut]
+                    word = word[cut:]
+                line = word
+            if line:
+                yield line
+
+    def formula(self, latex: str, size: float = 12, indent: float = 0.0):
+        """Formule composée (réduite si elle dépasse la largeur de la page)"""
+        latex = (latex or "").strip()
+        if not latex:
+            return
+        try:
+            rendered = self.formulas.render(latex, size)
+        except Exception as e:
+            logger.warning(f"Composition de formule impossible, texte brut utilisé: {str(e)}")
+            self.paragraph(latex, size, color=FORMULA_COLOR, indent=indent)
+            return
+        available = PAGE_WIDTH - 2 * MARGIN - indent
+        scale = min(1.0, available / rendered.width) if rendered.width else 1.0
+        height = (rendered.height + rendered.depth) * scale + size * 0.5
+        self._ensure(height)
+        name = self._xobject(latex, size, rendered)
+        self._page_xobjects.add(name)
+        baseline = self.y - size * 0.25 - rendered.height * scale
+        self._operators.append(b"q %s %s 0 0 %s %s %s cm %s Do Q" % (
+            _color(FORMULA_COLOR), pdf_number(scale), pdf_number(scale),
+            pdf_number(MARGIN + indent), pdf_number(baseline), name
+        ))
+        self.y -= height
+
+    def _xobject(self, latex: str, size: float, rendered: RenderedFormula) -> bytes:
+        """XObject de la formule, écrit au premier usage dans le document"""
+        key = FormulaCache.key(latex, size)
+        name = self._xobjects.get(key)
+        if name is None:
+            name = b"/Fm%d" % (len(self._xobjects) + 1)
+            self._xobject_numbers[name] = self.writer.write_stream(
+                rendered.content,
+                b"/Type /XObject /Subtype /Form /BBox [%s %s %s %s] /Resources << /Font %d 0 R >>" % (
+                    pdf_number(-1), pdf_number(-rendered.depth - 1),
+                    pdf_number(rendered.width + 1), pdf_number(rendered.height + 1), self.fonts
+                )
+            )
+            self._xobjects[key] = name
+        return name
+
+    def analysis(self, analysis: Dict[str, Any], heading: str) -> Iterator[None]:
+        """Compose une analyse; rend la main après chaque bloc (pages terminées écrites)"""
+        if self.remaining() < PAGE_HEIGHT / 4:
+            self.finish_page()
+        self.paragraph(heading, 18, BOLD, BLUE)
+        self.gap(8)
+        self.paragraph("Équation détectée", 14, BOLD)
+        self.formula(analysis.get("latex") or analysis.get("problem") or "", 13)
+        if analysis.get("solution"):
+            self.paragraph(f"Solution : {analysis['solution']}", 11, color=GRAY)
+        self.gap(10)
+        yield
+
+        steps = analysis.get("steps") or []
+        self.paragraph("Démarche de solution", 14, BOLD)
+        self.gap(4)
+        for index, step in enumerate(steps, 1):
+            self.paragraph(f"{index}. {step.get('title') or f'Étape {index}'}", 12, BOLD)
+            self.paragraph(step.get("description", ""), 11, indent=12)
+            if step.get("formula"):
+                self.formula(step["formula"], 12, indent=12)
+            self.paragraph(step.get("explanation", ""), 10, color=GRAY, indent=12)
+            self.gap(8)
+            yield
+        self.gap(16)
+
+
+class PDFExportService:
+    """
+    Export PDF d'une ou plusieurs analyses, composé dans un pool de threads dédié
+
+    Args:
+        max_workers: Exports composés simultanément
+        formula_cache_size: Formules composées gardées en cache
+    """
+
+    def __init__(self, max_workers: int = 2, formula_cache_size: int = 2048):
+        self.formulas = FormulaCache(formula_cache_size)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pdf-export")
+
+    def iter_pdf(self, analyses: List[Dict[str, Any]], title: Optional[str] = None) -> Iterator[bytes]:
+        """
+        Génère le PDF par morceaux (en-tête, puis pages au fil de la composition)
+
+        Args:
+            analyses: Analyses au format de /api/analyze
+            title: Titre du document (métadonnées et première page)
+        """
+        writer = PDFWriter()
+        sheet = _Worksheet(writer, self.formulas)
+        yield writer.drain()
+        if title:
+            sheet.paragraph(title, 20, BOLD)
+            sheet.gap(12)
+        for index, analysis in enumerate(analyses, 1):
+            heading = f"Exercice {index}" if len(analyses) > 1 else "Démarche de solution"
+            for _ in sheet.analysis(analysis, heading):
+                chunk = writer.drain()
+                if chunk:
+                    yield chunk
+        sheet.finish_page()
+        writer.close(title or "Solution")
+        logger.info(
+            "Export PDF: %d analyse(s), %d page(s), formules en cache: %d/%d",
+            len(analyses), writer.page_count, self.formulas.hits, self.formulas.hits + self.formulas.misses
+        )
+        yield writer.drain()
+
+    async def stream(self, analyses: List[Dict[str, Any]], title: Optional[str] = None) -> AsyncIterator[bytes]:
+        """Morceaux du PDF, composés dans le pool d'export (corps d'une StreamingResponse)"""
+        chunks = self.iter_pdf(analyses, title)
+        pending = None
+        try:
+            while True:
+                pending = self._executor.submit(next, chunks, None)
+                chunk = await asyncio.wrap_future(pending)
+                if chunk is None:
+                    return
+                yield chunk
+        finally:
+            # Client déconnecté: le générateur est fermé dans le pool, une fois le
+            # morceau en cours de composition terminé (jamais pendant un next)
+            if pending is not None:
+                pending.add_done_callback(lambda _: self._executor.submit(chunks.close))
+
+
+# Instance globale
+pdf_export_service = PDFExportService(
+    max_workers=config.PDF_EXPORT_WORKERS,
+    formula_cache_size=config.PDF_FORMULA_CACHE_SIZE
+)
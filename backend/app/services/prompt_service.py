@@ -0,0 +1,398 @@
+"""
+Service de gestion des prompts et du budget de tokens
+Choisit les variantes de prompts et les plafonds de sortie selon la complexité,
+et suit la consommation (tokens et coût) par requête
+"""
+import contextvars
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+from app.config import config
+from app.utils.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+# Les préfixes (message système + instructions) sont statiques et placés avant
+# tout contenu variable: ils restent identiques d'une requête à l'autre et
+# bénéficient du cache de prompt des fournisseurs.
+
+VISION_SYSTEM_PROMPT = r"""Tu es un expert en reconnaissance d'écriture mathématique manuscrite et imprimée. 
+Tu es spécialisé dans la conversion d'équations mathématiques (manuscrites ou imprimées) en code LaTeX.
+Tu réponds UNIQUEMENT avec le code LaTeX pur, sans formatage markdown, sans explication, sans texte supplémentaire.
+
+TU ES TRÈS DOUÉ POUR :
+- Reconnaître les PUISSANCES et EXPOSANTS manuscrits (petits chiffres en haut) et les convertir en notation ^
+- Distinguer les chiffres manuscrits des lettres (0 vs O, 1 vs l, 2 vs Z, 5 vs S)
+- Identifier les symboles mathématiques même s'ils sont mal formés ou mal alignés
+- Extraire fidèlement les opérations arithmétiques de base (+, -, ×, ÷, =)
+
+RÈGLE D'OR : Si tu vois un petit chiffre ÉCRIT AU-DESSUS d'un nombre ou d'une lettre, c'est TOUJOURS un exposant. Utilise ^ pour le représenter."""
+
+VISION_INSTRUCTIONS_FULL = r"""Tu es un expert en reconnaissance d'écriture mathématique manuscrite et imprimée.
+
+Extrait le code LaTeX de cette image mathématique. L'image peut être manuscrite ou imprimée.
+
+⚠️ INSTRUCTIONS CRITIQUES POUR LES MANUSCRITS ⚠️
+
+1. PUISSANCES ET EXPOSANTS (PRIORITÉ ABSOLUE) :
+   - Les petits chiffres ÉCRITS AU-DESSUS d'un nombre ou d'une lettre sont TOUJOURS des exposants
+   - Même si l'exposant est mal aligné, légèrement décalé, ou mal formé, c'est TOUJOURS un exposant
+   - Si tu vois un chiffre positionné AU-DESSUS ou légèrement plus haut que le nombre de base, c'est un exposant
+   - IMPORTANT : Dans "37 - 4^2", le "2" est un exposant car il est écrit AU-DESSUS du "4"
+   - Exemples manuscrits typiques :
+     * "4 avec un petit 2 en haut" → 4^2 ou 4^{2}
+     * "37 - 4²" ou "37 - 4 avec 2 en haut" → 37-4^{2} ou 37 - 4^2
+     * "x avec un petit 3 en haut" → x^3 ou x^{3}
+     * "x²" → x^{2} ou x^2
+     * "a³" → a^{3} ou a^3
+   - Si un chiffre suit immédiatement un nombre sans opérateur visible ET qu'il est positionné plus haut → exposant
+   - Pattern courant : "nombre nombre" où le second nombre est plus petit/haut → puissance
+
+2. CARACTÈRES SIMILAIRES (MANUSCRITS) :
+   - Distingue bien : 0 (zéro) vs O (lettre), 1 (un) vs l (L minuscule), 2 vs Z, 5 vs S
+   - Le contexte aide : si c'est dans une opération mathématique, c'est probablement un chiffre
+
+3. SYMBOLES MATHÉMATIQUES :
+   - Les fractions manuscrites : reconnais / comme \frac{}{} ou laisse /
+   - Les puissances : TOUJOURS utiliser ^ pour les exposants
+   - Les indices : reconnais les petits chiffres en bas comme des indices (_)
+   - Les racines : reconnais les symboles √ comme \sqrt
+   - Les intégrales, sommes, produits : reconnais ∫, Σ, Π
+   - Les lettres grecques manuscrites : α, β, γ, δ, θ, π, etc.
+
+4. OPÉRATIONS DE BASE :
+   - + (addition), - (soustraction), × ou * (multiplication), ÷ ou / (division), = (égal)
+   - Les espaces autour des opérateurs sont optionnels
+
+5. Format de réponse :
+   - Réponds UNIQUEMENT avec le code LaTeX pur, sans formatage markdown
+   - Pas d'explication, pas de texte supplémentaire
+   - Utilise la syntaxe LaTeX standard :
+     * Puissances : x^{2} ou x^2 (TOUJOURS avec ^)
+     * Indices : x_{i} ou x_i
+     * Fractions : \frac{numerateur}{denominateur} ou a/b
+     * Racines : \sqrt{x} ou \sqrt[n]{x}
+     * Intégrales : \int, \int_{a}^{b}
+     * Sommes : \sum_{i=1}^{n}
+     * Produits : \prod_{i=1}^{n}
+
+6. EXEMPLES SPÉCIFIQUES DE MANUSCRITS (RÉFÉRENCE) :
+   - "37 - 4²" ou "37 - 4 avec 2 en haut" → 37-4^{2} ou 37 - 4^2
+   - "37 - 4 2" (sans opérateur entre 4 et 2, 2 est plus haut) → 37-4^{2}
+   - "x² + 5" ou "x avec 2 en haut plus 5" → x^{2}+5 ou x^2 + 5
+   - "2³" ou "2 avec 3 en haut" → 2^{3} ou 2^3
+   - "a²b³" → a^{2}b^{3} ou a^2 b^3
+   - "x + 1 = 0" → x+1=0 ou x + 1 = 0
+   - "5² - 3" → 5^{2}-3 ou 5^2 - 3
+   - "10 - 2²" → 10-2^{2} ou 10 - 2^2
+
+7. DÉTECTION DES EXPOSANTS MANUSCRITS :
+   - Examine attentivement la POSITION VERTICALE des chiffres
+   - Si un chiffre est clairement plus haut que le chiffre précédent → exposant
+   - Si deux chiffres sont côte à côte sans opérateur, et le second est plus petit/haut → exposant
+   - Même si l'alignement n'est pas parfait (typique des manuscrits), détecte les exposants par position
+
+7. Si tu ne peux vraiment pas extraire de LaTeX, réponds avec "ERREUR"."""
+
+VISION_INSTRUCTIONS_COMPACT = r"""Extrait le code LaTeX de cette image mathématique (manuscrite ou imprimée).
+
+- Un petit chiffre écrit au-dessus d'un nombre ou d'une lettre est TOUJOURS un exposant (^), en bas un indice (_)
+- Distingue 0/O, 1/l, 2/Z, 5/S selon le contexte mathématique
+- Syntaxe LaTeX standard : x^{2}, x_{i}, \frac{a}{b}, \sqrt{x}, \int, \sum
+- Réponds UNIQUEMENT avec le code LaTeX pur, sans markdown ni explication
+- Si tu ne peux vraiment pas extraire de LaTeX, réponds avec "ERREUR"."""
+
+EXPLANATION_SYSTEM_PROMPT = """Tu es un professeur de mathématiques expert qui explique clairement les solutions.
+
+On te donne un problème, sa solution et ses étapes brutes de résolution.
+Pour chaque étape, génère une explication claire et pédagogique en français, formatée comme suit:
+- title: Un titre court et clair
+- description: L'étape principale
+- formula: La formule mathématique en LaTeX (si applicable)
+- explanation: Une explication détaillée et pédagogique
+
+Réponds uniquement avec un JSON valide contenant un tableau "steps" avec les objets ci-dessus. Ne pas inclure de markdown ou de texte supplémentaire."""
+
+EXPLANATION_SYSTEM_PROMPT_COMPACT = """Tu es un professeur de mathématiques qui explique brièvement les solutions simples.
+
+Pour chaque étape brute, réponds en français avec:
+- title: Un titre court
+- description: L'étape principale
+- formula: La formule en LaTeX (si applicable)
+- explanation: Une ou deux phrases d'explication
+
+Réponds uniquement avec un JSON valide contenant un tableau "steps" avec les objets ci-dessus."""
+
+# Commandes LaTeX qui signalent un problème plus riche à expliquer
+_ADVANCED_COMMANDS = (
+    '\\int', '\\sum', '\\prod', '\\lim', '\\frac', '\\sqrt', '\\begin',
+    '\\partial', '\\log', '\\ln', '\\sin', '\\cos', '\\tan', '\\exp'
+)
+
+# Tokens de sortie estimés par étape selon le niveau de complexité
+_TOKENS_PER_STEP = {"simple": 90, "moyen": 150, "complexe": 220}
+_EXPLANATION_OVERHEAD_TOKENS = 60
+_MIN_EXPLANATION_TOKENS = 256
+
+# Tarifs en USD par million de tokens: (entrée, entrée en cache, sortie)
+MODEL_PRICING = {
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gemini-1.5-flash": (0.075, 0.01875, 0.30),
+    "gemini-1.5-pro": (1.25, 0.3125, 5.00),
+}
+
+# Consommation de la requête HTTP en cours (une instance par requête)
+_current_usage: contextvars.ContextVar[Optional["RequestUsage"]] = contextvars.ContextVar(
+    "request_usage", default=None
+)
+
+
+class RequestUsage:
+    """Consommation de tokens et coût cumulés pour une requête"""
+    
+    def __init__(self):
+        self.calls: List[Dict] = []
+        self._lock = threading.Lock()
+    
+    def add(self, call: Dict):
+        with self._lock:
+            self.calls.append(call)
+    
+    def summary(self) -> Dict[str, any]:
+        """
+        Retourne le total de la requête
+        
+        Returns:
+            Dict avec 'calls', 'prompt_tokens', 'cached_tokens', 'completion_tokens' et 'cost_usd'
+        """
+        with self._lock:
+            calls = list(self.calls)
+        return {
+            "calls": len(calls),
+            "prompt_tokens": sum(call["prompt_tokens"] for call in calls),
+            "cached_tokens": sum(call["cached_tokens"] for call in calls),
+            "completion_tokens": sum(call["completion_tokens"] for call in calls),
+            "cost_usd": round(sum(call["cost_usd"] for call in calls), 6),
+        }
+
+
+class PromptService:
+    """Service de construction des prompts et de suivi du budget de tokens"""
+    
+    def __init__(self):
+        self.vision_max_tokens = config.VISION_MAX_TOKENS
+        self.explanation_max_tokens = config.EXPLANATION_MAX_TOKENS
+    
+    def estimate_complexity(self, latex: str, step_count: int = 0) -> str:
+        """
+        Estime la complexité d'un problème
+        
+        Args:
+            latex: Problème en LaTeX
+            step_count: Nombre d'étapes brutes
+            
+        Returns:
+            "simple", "moyen" ou "complexe"
+        """
+        latex = latex or ""
+        score = len(latex) // 20
+        score += 2 * sum(latex.count(command) for command in _ADVANCED_COMMANDS)
+        score += latex.count('=') + latex.count('^')
+        score += max(step_count - 2, 0)
+        
+        if score <= 2:
+            return "simple"
+        if score <= 6:
+            return "moyen"
+        return "complexe"
+    
+    def build_vision_prompt(self, detail: str = "high") -> Dict[str, any]:
+        """
+        Construit le prompt d'extraction LaTeX
+        La variante courte est utilisée en basse résolution (palier rapide)
+        
+        Args:
+            detail: Niveau de détail de l'image ("low" ou "high")
+            
+        Returns:
+            Dict avec 'system', 'instructions' et 'max_tokens'
+        """
+        if detail == "low":
+            instructions = VISION_INSTRUCTIONS_COMPACT
+            max_tokens = min(300, self.vision_max_tokens)
+        else:
+            instructions = VISION_INSTRUCTIONS_FULL
+            max_tokens = self.vision_max_tokens
+        
+        return {
+            "system": VISION_SYSTEM_PROMPT,
+            "instructions": instructions,
+            "max_tokens": max_tokens
+        }
+    
+    def build_explanation_prompt(
+        self,
+        problem: str,
+        solution: str,
+        steps: List[Dict],
+        step_range: Optional[Tuple[int, int]] = None
+    ) -> Dict[str, any]:
+        """
+        Construit le prompt d'explication et son plafond de sortie
+        
+        Args:
+            problem: Problème mathématique
+            solution: Solution du problème
+            steps: Liste des étapes brutes
+            step_range: Étapes à expliquer [début, fin[ pour une explication
+                découpée (toutes les étapes restent dans le prompt comme contexte)
+            
+        Returns:
+            Dict avec 'system', 'user' et 'max_tokens'
+        """
+        level = self.estimate_complexity(problem, len(steps))
+        system = EXPLANATION_SYSTEM_PROMPT_COMPACT if level == "simple" else EXPLANATION_SYSTEM_PROMPT
+        
+        # Contenu variable en dernier pour préserver le préfixe en cache
+        user = f"""Problème: {problem}
+Solution: {solution}
+
+Étapes brutes:
+{chr(10).join([f"{i+1}. {step.get('description', '')}" for i, step in enumerate(steps)])}"""
+        
+        step_count = len(steps)
+        if step_range is not None:
+            start, end = step_range
+            step_count = end - start
+            # Seule la fin du message change d'une partie à l'autre (préfixe commun en cache)
+            user += f"\n\nExplique uniquement les étapes {start + 1} à {end} ({step_count} étapes), dans l'ordre."
+        
+        step_count = max(step_count, 1)
+        max_tokens = _EXPLANATION_OVERHEAD_TOKENS + step_count * _TOKENS_PER_STEP[level]
+        max_tokens = min(max(max_tokens, _MIN_EXPLANATION_TOKENS), self.explanation_max_tokens)
+        
+        return {
+            "system": system,
+            "user": user,
+            "max_tokens": max_tokens
+        }
+    
+    def start_request(self) -> RequestUsage:
+        """
+        Démarre le suivi de consommation pour la requête courante
+        
+        Returns:
+            RequestUsage qui cumulera les appels LLM de la requête
+        """
+        usage = RequestUsage()
+        _current_usage.set(usage)
+        return usage
+    
+    def estimate_cost(
+        self,
+        model: str,
+        prompt_tokens: int,
+        completion_tokens: int,
+        cached_tokens: int = 0
+    ) -> float:
+        """
+        Estime le coût d'un appel en USD
+        
+        Returns:
+            Coût estimé (0.0 si le modèle n'a pas de tarif connu)
+        """
+        pricing = None
+        # Correspondance par préfixe (ex: gpt-4o-mini-2024-07-18 → gpt-4o-mini)
+        for name in sorted(MODEL_PRICING, key=len, reverse=True):
+            if model and model.startswith(name):
+                pricing = MODEL_PRICING[name]
+                break
+        if pricing is None:
+            return 0.0
+        
+        input_price, cached_price, output_price = pricing
+        uncached_tokens = max(prompt_tokens - cached_tokens, 0)
+        return (
+            uncached_tokens * input_price
+            + cached_tokens * cached_price
+            + completion_tokens * output_price
+        ) / 1_000_000
+    
+    def record_usage(
+        self,
+        purpose: str,
+        model: str,
+        prompt_tokens: int,
+        completion_tokens: int,
+        cached_tokens: int = 0
+    ) -> Dict[str, any]:
+        """
+        Enregistre la consommation d'un appel LLM et la log
+        
+        Args:
+            purpose: Usage de l'appel (ex: "vision", "explanation")
+            model: Modèle appelé
+            prompt_tokens: Tokens d'entrée facturés
+            completion_tokens: Tokens générés
+            cached_tokens: Tokens d'entrée servis depuis le cache du fournisseur
+            
+        Returns:
+            Dict décrivant l'appel
+        """
+        call = {
+            "purpose": purpose,
+            "model": model,
+            "prompt_tokens": prompt_tokens or 0,
+            "cached_tokens": cached_tokens or 0,
+            "completion_tokens": completion_tokens or 0,
+        }
+        call["cost_usd"] = self.estimate_cost(
+            model, call["prompt_tokens"], call["completion_tokens"], call["cached_tokens"]
+        )
+        
+        logger.info(
+            f"Tokens {purpose} ({model}): entrée={call['prompt_tokens']} "
+            f"(cache: {call['cached_tokens']}), sortie={call['completion_tokens']}, "
+            f"coût≈${call['cost_usd']:.5f}"
+        )
+        
+        usage = _current_usage.get()
+        if usage is not None:
+            usage.add(call)
+        
+        tracer.set_attributes({
+            "llm.model": model,
+            "llm.prompt_tokens": call["prompt_tokens"],
+            "llm.cached_tokens": call["cached_tokens"],
+            "llm.completion_tokens": call["completion_tokens"],
+            "llm.cost_usd": call["cost_usd"],
+        })
+        
+        return call
+    
+    def record_openai_usage(self, purpose: str, model: str, usage) -> Optional[Dict[str, any]]:
+        """Enregistre la consommation depuis l'objet 'usage' d'une réponse OpenAI"""
+        if usage is None:
+            return None
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached_tokens = getattr(details, "cached_tokens", 0) if details else 0
+        return self.record_usage(
+            purpose, model, usage.prompt_tokens, usage.completion_tokens, cached_tokens or 0
+        )
+    
+    def record_gemini_usage(self, purpose: str, model: str, usage_metadata) -> Optional[Dict[str, any]]:
+        """Enregistre la consommation depuis le 'usage_metadata' d'une réponse Gemini"""
+        if usage_metadata is None:
+            return None
+        return self.record_usage(
+            purpose,
+            model,
+            getattr(usage_metadata, "prompt_token_count", 0),
+            getattr(usage_metadata, "candidates_token_count", 0),
+            getattr(usage_metadata, "cached_content_token_count", 0)
+        )
+
+
+# Instance globale
+prompt_service = PromptService()
@@ -0,0 +1,181 @@
+"""
+Service de cache des résultats d'analyse
+Chaque résultat est identifié par l'empreinte de son entrée (image ou LaTeX)
+et de la version du pipeline: cet identifiant sert aussi d'ETag HTTP fort.
+Les résultats sont gardés en mémoire (LRU) et, si RESULT_CACHE_DB est
+configuré, dans une base SQLite partagée par les workers et les outils en
+ligne de commande (préchauffage du cache).
+"""
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from app.config import config
+from app.utils.sqlite import ThreadLocalDatabase
+
+logger = logging.getLogger(__name__)
+
+
+def pipeline_fingerprint() -> str:
+    """
+    Version effective du pipeline: tout changement de version, de fournisseur
+    ou de modèle invalide les identifiants (et donc les ETags) existants
+    """
+    llm_model = config.GEMINI_MODEL if config.LLM_PROVIDER == "gemini" else config.OPENAI_MODEL
+    return "|".join((
+        config.PIPELINE_VERSION,
+        config.LLM_PROVIDER,
+        llm_model,
+        config.VISION_MODEL,
+        config.VISION_FAST_MODEL,
+    ))
+
+
+class ResultCache:
+    """
+    Cache LRU en mémoire des résultats, avec durée de validité
+    et persistance optionnelle dans SQLite
+
+    Args:
+        max_entries: Nombre maximal de résultats conservés en mémoire
+        ttl: Durée de validité d'un résultat en secondes
+        db_path: Base SQLite des résultats (vide: mémoire seule)
+    """
+
+    def __init__(self, max_entries: int = 512, ttl: float = 86400, db_path: str = ""):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._database: Optional[ThreadLocalDatabase] = None
+        self.db_path = db_path
+        self.fingerprint = pipeline_fingerprint()
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def db_path(self) -> str:
+        return self._database.path if self._database else ""
+
+    @db_path.setter
+    def db_path(self, path: str):
+        if not path:
+            self._database = None
+            return
+        self._database = ThreadLocalDatabase(
+            path,
+            schema=[
+                "CREATE TABLE IF NOT EXISTS results ("
+                "result_id TEXT PRIMARY KEY, result TEXT NOT NULL, expires_at REAL NOT NULL)"
+            ],
+            # Purge des résultats expirés une fois par processus
+            on_first_open=lambda connection: connection.execute(
+                "DELETE FROM results WHERE expires_at < ?", (time.time(),)
+            )
+        )
+
+    @property
+    def persistent(self) -> bool:
+        return self._database is not None
+
+    def _db(self) -> sqlite3.Connection:
+        """Connexion SQLite du thread courant"""
+        return self._database.connection()
+
+    def _load(self, result_id: str) -> Optional[Tuple[float, Dict[str, Any]]]:
+        try:
+            row = self._db().execute(
+                "SELECT expires_at, result FROM results WHERE result_id = ?", (result_id,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Lecture du cache de résultats impossible: {str(e)}")
+            return None
+        if row is None or row[0] < time.time():
+            return None
+        return row[0], json.loads(row[1])
+
+    def _store(self, result_id: str, expires_at: float, result: Dict[str, Any]):
+        try:
+            self._db().execute(
+                "INSERT OR REPLACE INTO results (result_id, result, expires_at) VALUES (?, ?, ?)",
+                (result_id, json.dumps(result, ensure_ascii=False), expires_at)
+            )
+        except sqlite3.Error as e:
+            logger.warning(f"Écriture du cache de résultats impossible: {str(e)}")
+
+    def result_id(self, kind: str, content: bytes) -> str:
+        """
+        Identifiant d'un résultat
+
+        Args:
+            kind: Type de résultat ("latex", "analyze:image", "analyze:latex")
+            content: Entrée du pipeline (octets de l'image ou LaTeX encodé)
+
+        Returns:
+            Empreinte hexadécimale (32 caractères)
+        """
+        digest = hashlib.sha256()
+        digest.update(self.fingerprint.encode("utf-8"))
+        digest.update(b"\0" + kind.encode("utf-8") + b"\0")
+        digest.update(content)
+        return digest.hexdigest()[:32]
+
+    def get(self, result_id: str) -> Optional[Dict[str, Any]]:
+        """Résultat encore valide (mémoire, puis base SQLite), ou None"""
+        with self._lock:
+            entry = self._entries.get(result_id)
+            if entry is not None and entry[0] < time.time():
+                del self._entries[result_id]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(result_id)
+                self.hits += 1
+                return entry[1]
+        entry = self._load(result_id) if self.persistent else None
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._remember(result_id, entry)
+        return entry[1]
+
+    def put(self, result_id: str, result: Dict[str, Any], ttl: Optional[float] = None):
+        """
+        Enregistre un résultat (les plus anciennement utilisés sont évincés de la mémoire)
+
+        Args:
+            ttl: Durée de validité en secondes (par défaut celle du cache)
+        """
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._remember(result_id, (expires_at, result))
+        if self.persistent:
+            self._store(result_id, expires_at, result)
+
+    def _remember(self, result_id: str, entry: Tuple[float, Dict[str, Any]]):
+        self._entries[result_id] = entry
+        self._entries.move_to_end(result_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def remaining_ttl(self, result_id: str) -> int:
+        """Secondes de validité restantes d'un résultat (0 s'il est absent de la mémoire)"""
+        with self._lock:
+            entry = self._entries.get(result_id)
+        if entry is None:
+            return 0
+        return max(int(entry[0] - time.time()), 0)
+
+
+# Instance globale
+result_cache = ResultCache(
+    max_entries=config.RESULT_CACHE_SIZE,
+    ttl=config.RESULT_CACHE_TTL,
+    db_path=config.RESULT_CACHE_DB
+)
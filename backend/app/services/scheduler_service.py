@@ -0,0 +1,264 @@
+"""
+Service d'ordonnancement des calculs (extraction, résolution, explication)
+Les calculs se partagent SCHEDULER_SLOTS places d'exécution (threads et
+quotas des APIs externes). Trois classes de priorité:
+- interactive: élève qui attend sa réponse (/api/latex, /api/analyze)
+- batch: traitements en masse (/api/ingest, ou en-tête X-Priority: batch)
+- warmup: préchauffage et préchargements (X-Priority: warmup)
+Une classe n'est servie que si les classes plus prioritaires n'attendent
+pas, et SCHEDULER_INTERACTIVE_RESERVE places restent réservées aux requêtes
+interactives: un lot qui sature le service ne les retarde pas.
+Dans une classe, les locataires (clé d'API ou établissement) sont servis
+par file équitable pondérée (start-time fair queueing): un locataire qui
+envoie mille pages n'en passe qu'une à son tour, selon son poids.
+L'état est local au worker.
+"""
+import asyncio
+import hashlib
+import heapq
+import itertools
+import logging
+import re
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional
+
+from app.config import config
+from app.utils.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+# Classes de priorité, de la plus prioritaire à la moins prioritaire
+PRIORITIES = ("interactive", "batch", "warmup")
+
+# Identifiant de locataire accepté (en-tête X-Tenant-Id)
+TENANT_PATTERN = re.compile(r"^[A-Za-z0-9_.-]{1,64}$")
+
+# Attentes gardées par classe pour les percentiles
+WAIT_SAMPLES = 1024
+# Au-delà, les locataires sans calcul en attente sont oubliés
+MAX_TRACKED_TENANTS = 1024
+
+
+@dataclass(frozen=True)
+class WorkClass:
+    """Classe d'un calcul: priorité et locataire"""
+    priority: str = "interactive"
+    tenant: str = "public"
+
+
+@dataclass(order=True)
+class _Ticket:
+    tag: float
+    sequence: int
+    tenant: str = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+    enqueued_at: float = field(compare=False)
+
+
+def parse_weights(spec: str) -> Dict[str, float]:
+    """Poids des locataires ("ecole-a=3,ecole-b=2"); poids invalides ignorés"""
+    weights = {}
+    for item in spec.split(","):
+        tenant, _, weight = item.strip().partition("=")
+        try:
+            if tenant and float(weight) > 0:
+                weights[tenant.strip()] = float(weight)
+        except ValueError:
+            logger.warning(f"Poids de locataire invalide ignoré: {item.strip()}")
+    return weights
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return round(ordered[min(int(len(ordered) * fraction), len(ordered) - 1)], 1)
+
+
+class WorkScheduler:
+    """
+    Places d'exécution attribuées par priorité puis par file équitable pondérée
+
+    Args:
+        slots: Calculs simultanés (0: pas d'ordonnancement)
+        interactive_reserve: Places que seules les requêtes interactives peuvent prendre
+        tenant_weights: Poids des locataires (1 par défaut)
+    """
+
+    def __init__(self, slots: int = 16, interactive_reserve: int = 4, tenant_weights: Optional[Dict[str, float]] = None):
+        self.slots = slots
+        self.interactive_reserve = min(max(interactive_reserve, 0), max(slots - 1, 0))
+        self.tenant_weights = tenant_weights or {}
+        self._queues: Dict[str, List[_Ticket]] = {priority: [] for priority in PRIORITIES}
+        self._running: Dict[str, int] = {priority: 0 for priority in PRIORITIES}
+        # Temps virtuel de chaque classe et dernière étiquette de fin de chaque locataire
+        self._virtual_time: Dict[str, float] = {priority: 0.0 for priority in PRIORITIES}
+        self._finish: Dict[str, Dict[str, float]] = {priority: {} for priority in PRIORITIES}
+        self._waits: Dict[str, Deque[float]] = {priority: deque(maxlen=WAIT_SAMPLES) for priority in PRIORITIES}
+        self._admitted: Dict[str, int] = {priority: 0 for priority in PRIORITIES}
+        self._sequence = itertools.count()
+
+    @property
+    def enabled(self) -> bool:
+        return self.slots > 0
+
+    def classify(
+        self,
+        default: str,
+        requested: Optional[str] = None,
+        tenant_id: Optional[str] = None,
+        api_key: Optional[str] = None,
+        client_host: Optional[str] = None
+    ) -> WorkClass:
+        """
+        Classe d'une requête
+
+        Args:
+            default: Priorité de la route
+            requested: Priorité demandée (X-Priority): seulement pour l'abaisser
+            tenant_id: Locataire déclaré (X-Tenant-Id)
+            api_key: Clé d'API (X-API-Key), identifiée par son empreinte
+            client_host: Adresse du client, si aucun locataire n'est indiqué
+        """
+        priority = default
+        if requested:
+            requested = requested.strip().lower().replace("-", "")
+            if requested in PRIORITIES and PRIORITIES.index(requested) > PRIORITIES.index(default):
+                priority = requested
+        if tenant_id and TENANT_PATTERN.match(tenant_id):
+            tenant = tenant_id
+        elif api_key:
+            tenant = "key:" + hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12]
+        elif client_host:
+            tenant = "ip:" + client_host
+        else:
+            tenant = "public"
+        return WorkClass(priority, tenant)
+
+    @asynccontextmanager
+    async def slot(self, work: WorkClass) -> AsyncIterator[None]:
+        """
+        Place d'exécution pour un calcul (attente dans la file de sa classe)
+
+        Usage:
+            async with work_scheduler.slot(work):
+                await run_in_threadpool(...)
+        """
+        if not self.enabled:
+            yield
+            return
+        started = time.perf_counter()
+        await self._acquire(work)
+        wait_ms = (time.perf_counter() - started) * 1000
+        self._waits[work.priority].append(wait_ms)
+        self._admitted[work.priority] += 1
+        tracer.set_attributes({
+            "scheduler.priority": work.priority,
+            "scheduler.tenant": work.tenant,
+            "scheduler.wait_ms": round(wait_ms, 1),
+        })
+        try:
+            yield
+        finally:
+            self._running[work.priority] -= 1
+            self._dispatch()
+
+    def _can_start(self, priority: str) -> bool:
+        capacity = self.slots if priority == "interactive" else self.slots - self.interactive_reserve
+        return sum(self._running.values()) < capacity
+
+    def _tag(self, work: WorkClass) -> float:
+        """Étiquette de début du calcul dans la file équitable de sa classe"""
+        finish = self._finish[work.priority]
+        start = max(self._virtual_time[work.priority], finish.get(work.tenant, 0.0))
+        finish[work.tenant] = start + 1.0 / self.tenant_weights.get(work.tenant, 1.0)
+        if len(finish) > MAX_TRACKED_TENANTS:
+            # Locataires à jour: leur prochaine étiquette serait de toute façon le temps virtuel
+            virtual_time = self._virtual_time[work.priority]
+            for tenant in [tenant for tenant, tag in finish.items() if tag <= virtual_time]:
+                del finish[tenant]
+        return start
+
+    async def _acquire(self, work: WorkClass):
+        tag = self._tag(work)
+        rank = PRIORITIES.index(work.priority)
+        waiting = any(self._queues[priority] for priority in PRIORITIES[:rank + 1])
+        if not waiting and self._can_start(work.priority):
+            self._virtual_time[work.priority] = tag
+            self._running[work.priority] += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(
+            self._queues[work.priority],
+            _Ticket(tag, next(self._sequence), work.tenant, future, time.perf_counter())
+        )
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Place attribuée au moment de l'annulation: rendue aux suivants
+                self._running[work.priority] -= 1
+                self._dispatch()
+            else:
+                self._queues[work.priority] = [
+                    ticket for ticket in self._queues[work.priority] if ticket.future is not future
+                ]
+                heapq.heapify(self._queues[work.priority])
+            raise
+
+    def _dispatch(self):
+        """Attribue les places libres: classes par priorité, locataires par étiquette"""
+        for priority in PRIORITIES:
+            queue = self._queues[priority]
+            while queue and self._can_start(priority):
+                ticket = heapq.heappop(queue)
+                if ticket.future.done():
+                    continue
+                self._virtual_time[priority] = ticket.tag
+                self._running[priority] += 1
+                ticket.future.set_result(None)
+            if queue:
+                # Classe en attente: les classes moins prioritaires ne passent pas devant
+                return
+
+    def stats(self) -> Dict[str, Any]:
+        """Places occupées, files d'attente et temps d'attente par classe"""
+        now = time.perf_counter()
+        classes = {}
+        tenants: Dict[str, Dict[str, int]] = {}
+        for priority in PRIORITIES:
+            queue = self._queues[priority]
+            waits = list(self._waits[priority])
+            classes[priority] = {
+                "running": self._running[priority],
+                "queued": len(queue),
+                "admitted": self._admitted[priority],
+                "oldest_wait_ms": round(max(((now - ticket.enqueued_at) * 1000 for ticket in queue), default=0.0), 1),
+                "wait_ms": {
+                    "p50": _percentile(waits, 0.50),
+                    "p95": _percentile(waits, 0.95),
+                    "max": round(max(waits, default=0.0), 1),
+                },
+            }
+            for ticket in queue:
+                tenants.setdefault(ticket.tenant, {}).setdefault(priority, 0)
+                tenants[ticket.tenant][priority] += 1
+        return {
+            "enabled": self.enabled,
+            "slots": self.slots,
+            "interactive_reserve": self.interactive_reserve,
+            "running": sum(self._running.values()),
+            "classes": classes,
+            "queued_by_tenant": tenants,
+        }
+
+
+# Instance globale
+work_scheduler = WorkScheduler(
+    slots=config.SCHEDULER_SLOTS,
+    interactive_reserve=config.SCHEDULER_INTERACTIVE_RESERVE,
+    tenant_weights=parse_weights(config.SCHEDULER_TENANT_WEIGHTS)
+)
@@ -0,0 +1,246 @@
+"""
+Service de recherche de problèmes similaires déjà résolus
+Le LaTeX est réduit à sa structure (nombres et variables anonymisés:
+x^2+5x+6=0 et y^2+7y+12=0 ont la même forme), découpé en n-grammes de
+jetons et résumé par une signature MinHash. L'index inversé (bandes LSH,
+table SQLite indexée) ne renvoie que des candidats partageant au moins une
+bande: une requête coûte quelques lectures indexées, quelle que soit la
+taille de l'historique.
+"""
+import hashlib
+import logging
+import random
+import re
+import sqlite3
+from array import array
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.config import config
+from app.utils.sqlite import ThreadLocalDatabase
+
+logger = logging.getLogger(__name__)
+
+# Jetons LaTeX: commandes, nombres, lettres, puis tout autre caractère
+TOKEN_PATTERN = re.compile(r"\\[A-Za-z]+|\\.|\d+(?:[.,]\d+)?|[A-Za-z]|\S")
+NUMBER_PATTERN = re.compile(r"\d")
+# Commandes de mise en forme sans effet sur la structure du problème
+IGNORED_TOKENS = {
+    "\\left", "\\right", "\\displaystyle", "\\,", "\\;", "\\:", "\\!", "\\ ",
+    "\\quad", "\\qquad", "\\big", "\\Big",
+}
+
+SHINGLE_SIZE = 3
+BANDS = 8
+ROWS_PER_BAND = 4
+NUM_HASHES = BANDS * ROWS_PER_BAND
+_MERSENNE_PRIME = (1 << 61) - 1
+# Coefficients fixes: les signatures enregistrées restent comparables entre processus
+_rng = random.Random(20240611)
+_HASH_COEFFICIENTS = [
+    (_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME))
+    for _ in range(NUM_HASHES)
+]
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS similar_problems ("
+    "problem_id INTEGER PRIMARY KEY AUTOINCREMENT, "
+    "fingerprint TEXT NOT NULL UNIQUE, "
+    "analysis_id TEXT NOT NULL, "
+    "latex TEXT NOT NULL, "
+    "solution TEXT NOT NULL, "
+    "signature BLOB NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS similar_bands ("
+    "band INTEGER NOT NULL, problem_id INTEGER NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS similar_bands_band ON similar_bands (band, problem_id)",
+]
+
+
+def structure_tokens(latex: str) -> List[str]:
+    """
+    Jetons structurels d'une expression LaTeX
+
+    Les nombres deviennent '#', les variables sont renommées dans leur ordre
+    d'apparition (v0, v1...); commandes et opérateurs sont conservés. Les
+    accolades autour d'un seul jeton sont retirées (x^{2} équivaut à x^2).
+    """
+    tokens: List[str] = []
+    variables: Dict[str, str] = {}
+    for token in TOKEN_PATTERN.findall(latex):
+        if token in IGNORED_TOKENS:
+            continue
+        if NUMBER_PATTERN.match(token):
+            token = "#"
+        elif token.isalpha():
+            token = variables.setdefault(token, f"v{len(variables)}")
+        if token == "}" and len(tokens) >= 2 and tokens[-2] == "{":
+            tokens[-2:] = tokens[-1:]
+            continue
+        tokens.append(token)
+    return tokens
+
+
+def _stable_hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def signature(tokens: List[str]) -> array:
+    """Signature MinHash des n-grammes de jetons (NUM_HASHES valeurs)"""
+    padded = ["^"] + tokens + ["$"]
+    shingles = {
+        _stable_hash(" ".join(padded[i:i + SHINGLE_SIZE]))
+        for i in range(max(len(padded) - SHINGLE_SIZE + 1, 1))
+    }
+    return array("Q", (
+        min((a * shingle + b) % _MERSENNE_PRIME for shingle in shingles)
+        for a, b in _HASH_COEFFICIENTS
+    ))
+
+
+def band_keys(values: array) -> List[int]:
+    """Clés des bandes LSH d'une signature (entiers signés 64 bits pour SQLite)"""
+    keys = []
+    for band in range(BANDS):
+        rows = values[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]
+        digest = hashlib.blake2b(bytes([band]) + rows.tobytes(), digest_size=8).digest()
+        keys.append(int.from_bytes(digest, "big", signed=True))
+    return keys
+
+
+def _token_similarity(a: str, b: str) -> float:
+    """Similarité (Jaccard) des jetons bruts: départage les problèmes de même structure"""
+    tokens_a, tokens_b = Counter(TOKEN_PATTERN.findall(a)), Counter(TOKEN_PATTERN.findall(b))
+    union = sum((tokens_a | tokens_b).values())
+    return sum((tokens_a & tokens_b).values()) / union if union else 0.0
+
+
+class SimilarityService:
+    """
+    Index des problèmes résolus et recherche des plus similaires
+
+    Args:
+        db_path: Base SQLite de l'index (celle de l'historique; vide: désactivé)
+        candidates_per_band: Candidats lus au plus par bande (les plus récents)
+    """
+
+    def __init__(self, db_path: str = "", candidates_per_band: int = 100):
+        self.db_path = db_path
+        self.candidates_per_band = candidates_per_band
+        self._database = ThreadLocalDatabase(db_path, SCHEMA) if db_path else None
+
+    @property
+    def enabled(self) -> bool:
+        return self._database is not None
+
+    def add(self, fingerprint: str, analysis_id: str, latex: str, solution: str):
+        """
+        Indexe un problème résolu (une seule fois par empreinte)
+
+        Args:
+            fingerprint: Identifiant du résultat (empreinte de l'entrée)
+            analysis_id: Analyse de l'historique à proposer
+            latex: LaTeX du problème
+            solution: Solution, affichée avec la suggestion
+        """
+        if not self.enabled or not latex:
+            return
+        values = signature(structure_tokens(latex))
+        connection = self._database.connection()
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = connection.execute(
+                    "INSERT OR IGNORE INTO similar_problems "
+                    "(fingerprint, analysis_id, latex, solution, signature) VALUES (?, ?, ?, ?, ?)",
+                    (fingerprint, analysis_id, latex, solution, values.tobytes())
+                )
+                if cursor.rowcount:
+                    connection.executemany(
+                        "INSERT INTO similar_bands (band, problem_id) VALUES (?, ?)",
+                        [(key, cursor.lastrowid) for key in band_keys(values)]
+                    )
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+        except sqlite3.Error as e:
+            logger.warning(f"Indexation du problème similaire impossible: {str(e)}")
+
+    def search(
+        self,
+        latex: str,
+        k: int = 5,
+        min_score: float = 0.0,
+        exclude: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Problèmes résolus les plus proches structurellement
+
+        Args:
+            latex: LaTeX du problème
+            k: Nombre de résultats au plus
+            min_score: Similarité structurelle minimale (0 à 1)
+            exclude: Empreinte à ignorer (le problème lui-même)
+
+        Returns:
+            Problèmes du plus au moins similaire (analysis_id, latex, solution,
+            score, same_structure)
+        """
+        if not self.enabled or not latex:
+            return []
+        tokens = structure_tokens(latex)
+        values = signature(tokens)
+        try:
+            connection = self._database.connection()
+            # Candidats: problèmes partageant au moins une bande (les plus récents par bande)
+            band_hits: Counter = Counter()
+            for key in band_keys(values):
+                band_hits.update(row[0] for row in connection.execute(
+                    "SELECT problem_id FROM similar_bands WHERE band = ? "
+                    "ORDER BY problem_id DESC LIMIT ?",
+                    (key, self.candidates_per_band)
+                ))
+            if not band_hits:
+                return []
+            # Les candidats partageant le plus de bandes sont les plus similaires
+            candidate_ids = [problem_id for problem_id, _ in band_hits.most_common(max(k * 10, 50))]
+            rows = connection.execute(
+                "SELECT fingerprint, analysis_id, latex, solution, signature FROM similar_problems "
+                f"WHERE problem_id IN ({','.join('?' * len(candidate_ids))})",
+                candidate_ids
+            ).fetchall()
+        except sqlite3.Error as e:
+            logger.warning(f"Recherche de problèmes similaires impossible: {str(e)}")
+            return []
+
+        scored: List[Tuple[float, Dict[str, Any]]] = []
+        for fingerprint, analysis_id, candidate_latex, solution, raw_signature in rows:
+            if fingerprint == exclude:
+                continue
+            candidate_values = array("Q")
+            candidate_values.frombytes(raw_signature)
+            score = sum(a == b for a, b in zip(values, candidate_values)) / NUM_HASHES
+            if score < min_score:
+                continue
+            scored.append((score, {
+                "analysis_id": analysis_id,
+                "latex": candidate_latex,
+                "solution": solution,
+                "score": round(score, 3),
+            }))
+        scored.sort(key=lambda entry: entry[0], reverse=True)
+
+        # Départage des premiers par structure exacte puis par jetons bruts
+        results = []
+        for score, entry in scored[:k * 3]:
+            entry["same_structure"] = structure_tokens(entry["latex"]) == tokens
+            results.append((entry["same_structure"], score, _token_similarity(latex, entry["latex"]), entry))
+        results.sort(key=lambda entry: entry[:3], reverse=True)
+        return [entry for *_, entry in results[:k]]
+
+
+# Instance globale (tables dans la base de l'historique)
+similarity_service = SimilarityService(
+    db_path=config.HISTORY_DB,
+    candidates_per_band=config.SIMILAR_CANDIDATES_PER_BAND
+)
@@ -0,0 +1,120 @@
+"""
+Service de cache des explications par étape
+Beaucoup de problèmes partagent des étapes intermédiaires identiques
+("calculer 4^2 = 16", "soustraire 16 de 37"): l'explication enrichie de
+chaque étape est gardée, indépendamment du problème, sous l'empreinte du
+contenu normalisé de l'étape brute (description et formule de WolframAlpha
+ou du calcul direct). Seules les étapes jamais vues sont envoyées au LLM.
+Cache LRU en mémoire, partagé par toutes les requêtes du processus.
+"""
+import hashlib
+import logging
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from app.config import config
+
+logger = logging.getLogger(__name__)
+
+# Espacements et délimiteurs LaTeX sans effet sur le contenu de l'étape
+_LATEX_NOISE = re.compile(r'\\left|\\right|\\displaystyle|\\[,;:! ]|\$')
+_SPACES = re.compile(r'\s+')
+# Accolades d'un exposant ou indice d'un seul caractère: 4^{2} -> 4^2
+_SINGLE_SCRIPT = re.compile(r'([\^_])\{(\w)\}')
+
+
+def normalize_step(step: Dict) -> str:
+    """
+    Contenu normalisé d'une étape brute (vide si l'étape n'a pas de contenu)
+
+    Le titre est ignoré: il dépend souvent de la position ("Étape 3").
+    """
+    parts = []
+    for key in ("description", "formula"):
+        text = unicodedata.normalize("NFKC", str(step.get(key) or ""))
+        text = text.replace('−', '-').replace('×', '*').replace('·', '*').replace('\\cdot', '*')
+        text = text.replace('\\times', '*')
+        text = _SINGLE_SCRIPT.sub(r'\1\2', _LATEX_NOISE.sub(' ', text))
+        # Espaces sans effet dans une formule; réduits à un seul dans le texte
+        text = _SPACES.sub('' if key == "formula" else ' ', text)
+        parts.append(text.strip().lower())
+    return "\n".join(parts) if any(parts) else ""
+
+
+class StepExplanationCache:
+    """
+    Explications enrichies des étapes, indexées par le contenu de l'étape brute
+
+    Args:
+        max_entries: Nombre maximal d'explications conservées (0: cache désactivé)
+    """
+
+    def __init__(self, max_entries: int = 4096):
+        self.max_entries = max_entries
+        self.fingerprint = config.LLM_PROVIDER + "|" + (
+            config.GEMINI_MODEL if config.LLM_PROVIDER == "gemini" else config.OPENAI_MODEL
+        )
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def key(self, step: Dict) -> Optional[str]:
+        """Empreinte d'une étape brute (None si elle n'a pas de contenu à reconnaître)"""
+        content = normalize_step(step) if isinstance(step, dict) else ""
+        if not content:
+            return None
+        digest = hashlib.sha256((self.fingerprint + "\0" + content).encode("utf-8"))
+        return digest.hexdigest()[:32]
+
+    def lookup(self, steps: List[Dict]) -> List[Optional[Dict]]:
+        """
+        Explications connues des étapes
+
+        Returns:
+            Pour chaque étape, une copie de l'étape enrichie, ou None si elle est inconnue
+        """
+        keys = [self.key(step) for step in steps]
+        found: List[Optional[Dict]] = []
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key) if key else None
+                if entry is None:
+                    self.misses += 1
+                    found.append(None)
+                    continue
+                self._entries.move_to_end(key)
+                self.hits += 1
+                found.append(dict(entry))
+        return found
+
+    def store(self, raw_steps: List[Dict], enriched_steps: List[Dict]):
+        """
+        Enregistre les explications (étape brute et étape enrichie de même rang)
+
+        Args:
+            raw_steps: Étapes brutes envoyées au LLM
+            enriched_steps: Étapes enrichies correspondantes, dans le même ordre
+        """
+        entries = [
+            (key, dict(enriched))
+            for raw, enriched in zip(raw_steps, enriched_steps)
+            if isinstance(enriched, dict) and (key := self.key(raw))
+        ]
+        with self._lock:
+            for key, enriched in entries:
+                self._entries[key] = enriched
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+# Instance globale
+step_explanation_cache = StepExplanationCache(max_entries=config.STEP_CACHE_SIZE)
@@ -0,0 +1,648 @@
+"""
+Service de génération d'explications hors ligne à partir de modèles
+Couvre les classes de problèmes formulaïques (arithmétique, équations du
+premier et du second degré, dérivées de polynômes) sans appel au LLM
+"""
+import logging
+import re
+from fractions import Fraction
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Nœuds de l'arbre syntaxique: ('num', Fraction), ('var', nom), ('neg', a),
+# ('paren', a), ('add'|'sub'|'mul'|'div'|'frac'|'pow', a, b)
+Node = Tuple
+
+# Polynôme en une variable: {degré: coefficient}
+Polynomial = Dict[int, Fraction]
+
+_TOKEN_PATTERN = re.compile(r'\\frac|\d+(?:\.\d+)?|[a-zA-Z]|[+\-*/^(){}=]')
+_DERIVATIVE_PATTERN = re.compile(r'^\\d?frac\{(?:\\mathrm\{d\}|d)\}\{(?:\\mathrm\{d\}|d)\s*([a-zA-Z])\}(.+)$')
+_MAX_EXPONENT = 64
+_PRECEDENCE = {'add': 1, 'sub': 1, 'mul': 2, 'div': 2, 'neg': 3, 'pow': 4, 'frac': 5}
+
+
+class TemplateError(ValueError):
+    """Le problème n'entre pas dans une classe couverte par les modèles"""
+
+
+def _normalize_latex(latex: str) -> str:
+    """Convertit le LaTeX en expression texte simple (ou lève TemplateError)"""
+    text = latex.strip().strip('$')
+    text = text.replace('−', '-').replace('×', '*').replace('÷', '/').replace('·', '*')
+    for command in ('\\left', '\\right', '\\,', '\\;', '\\!', '\\displaystyle'):
+        text = text.replace(command, '')
+    text = text.replace('\\cdot', '*').replace('\\times', '*').replace('\\div', '/')
+    text = re.sub(r'\\[dt]frac', r'\\frac', text)
+    text = re.sub(r'\s+', '', text)
+
+    if not text or '\\' in text.replace('\\frac', ''):
+        raise TemplateError("Commande LaTeX non prise en charge")
+    return text
+
+
+class _Parser:
+    """Analyseur syntaxique récursif (addition < multiplication < puissance)"""
+
+    def __init__(self, text: str):
+        self.tokens = _TOKEN_PATTERN.findall(text)
+        if ''.join(self.tokens) != text:
+            raise TemplateError("Caractère non pris en charge")
+        self.pos = 0
+
+    def parse(self) -> Node:
+        node = self._expression()
+        if self.pos != len(self.tokens):
+            raise TemplateError("Expression incomplète")
+        return node
+
+    def _peek(self) -> Optional[str]:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def _take(self) -> str:
+        token = self._peek()
+        if token is None:
+            raise TemplateError("Fin d'expression inattendue")
+        self.pos += 1
+        return token
+
+    def _expression(self) -> Node:
+        node = self._term()
+        while self._peek() in ('+', '-'):
+            op = 'add' if self._take() == '+' else 'sub'
+            node = (op, node, self._term())
+        return node
+
+    def _term(self) -> Node:
+        node = self._unary()
+        while True:
+            token = self._peek()
+            if token in ('*', '/'):
+                self._take()
+                node = ('mul' if token == '*' else 'div', node, self._unary())
+            elif token in ('(', '{', '\\frac') or (token is not None and token.isalpha()):
+                # Multiplication implicite: 5x, 2(x+1), x(x+1)
+                node = ('mul', node, self._power())
+            else:
+                return node
+
+    def _unary(self) -> Node:
+        if self._peek() == '-':
+            self._take()
+            return ('neg', self._unary())
+        if self._peek() == '+':
+            self._take()
+            return self._unary()
+        return self._power()
+
+    def _power(self) -> Node:
+        base = self._atom()
+        if self._peek() == '^':
+            self._take()
+            exponent = self._unary()
+            # x^{(2)} et x^(2) s'écrivent x^{2}
+            if exponent[0] == 'paren':
+                exponent = exponent[1]
+            return ('pow', base, exponent)
+        return base
+
+    def _atom(self) -> Node:
+        token = self._take()
+        if token == '(':
+            node = self._expression()
+            if self._take() != ')':
+                raise TemplateError("Parenthèse non fermée")
+            return ('paren', node)
+        if token == '{':
+            # Groupe LaTeX: regroupe sans parenthèses visibles
+            node = self._group_body()
+            return node
+        if token == '\\frac':
+            if self._take() != '{':
+                raise TemplateError("Fraction mal formée")
+            numerator = self._group_body()
+            if self._take() != '{':
+                raise TemplateError("Fraction mal formée")
+            return ('frac', numerator, self._group_body())
+        if token.isalpha():
+            return ('var', token)
+        if token[0].isdigit():
+            return ('num', Fraction(token))
+        raise TemplateError(f"Symbole inattendu: {token}")
+
+    def _group_body(self) -> Node:
+        """Lit le contenu d'un groupe {...} dont l'accolade ouvrante a été consommée"""
+        node = self._expression()
+        if self._take() != '}':
+            raise TemplateError("Accolade non fermée")
+        return node
+
+
+def _parse(text: str) -> Node:
+    return _Parser(text).parse()
+
+
+def _variables(node: Node) -> set:
+    if node[0] == 'var':
+        return {node[1]}
+    if node[0] == 'num':
+        return set()
+    return set().union(*(_variables(child) for child in node[1:]))
+
+
+def _format_number(value: Fraction) -> str:
+    if value.denominator == 1:
+        return str(value.numerator)
+    sign = '-' if value < 0 else ''
+    return f"{sign}\\frac{{{abs(value.numerator)}}}{{{value.denominator}}}"
+
+
+def _render(node: Node, parent_precedence: int = 0) -> str:
+    """Convertit un nœud en LaTeX en ajoutant les parenthèses nécessaires"""
+    kind = node[0]
+    if kind == 'num':
+        text = _format_number(node[1])
+        # Parenthèses pour un nombre négatif dans un produit, ou une fraction élevée à une puissance
+        needs_parens = (parent_precedence > 1 and node[1] < 0) or (
+            parent_precedence > _PRECEDENCE['pow'] and node[1].denominator != 1
+        )
+        return f"\\left({text}\\right)" if needs_parens else text
+    if kind == 'var':
+        return node[1]
+    if kind == 'paren':
+        return f"\\left({_render(node[1])}\\right)"
+    if kind == 'neg':
+        text = f"-{_render(node[1], _PRECEDENCE['neg'])}"
+        return f"\\left({text}\\right)" if parent_precedence > 1 else text
+
+    precedence = _PRECEDENCE[kind]
+    if kind == 'frac':
+        return f"\\frac{{{_render(node[1])}}}{{{_render(node[2])}}}"
+    if kind == 'pow':
+        text = f"{_render(node[1], precedence + 1)}^{{{_render(node[2])}}}"
+    else:
+        symbol = {'add': ' + ', 'sub': ' - ', 'mul': ' \\times ', 'div': ' \\div '}[kind]
+        # L'opérande droit d'une soustraction/division garde ses parenthèses
+        right_precedence = precedence + 1 if kind in ('sub', 'div') else precedence
+        text = f"{_render(node[1], precedence)}{symbol}{_render(node[2], right_precedence)}"
+    return f"\\left({text}\\right)" if precedence < parent_precedence else text
+
+
+def _apply(kind: str, left: Fraction, right: Fraction) -> Fraction:
+    if kind == 'add':
+        return left + right
+    if kind == 'sub':
+        return left - right
+    if kind == 'mul':
+        return left * right
+    if kind in ('div', 'frac'):
+        if right == 0:
+            raise TemplateError("Division par zéro")
+        return left / right
+    if right.denominator != 1 or abs(right) > _MAX_EXPONENT or (left == 0 and right < 0):
+        raise TemplateError("Puissance non prise en charge")
+    return left ** int(right)
+
+
+def _evaluate(node: Node) -> Fraction:
+    kind = node[0]
+    if kind == 'num':
+        return node[1]
+    if kind == 'paren':
+        return _evaluate(node[1])
+    if kind == 'neg':
+        return -_evaluate(node[1])
+    if kind == 'var':
+        raise TemplateError("Variable dans une expression numérique")
+    return _apply(kind, _evaluate(node[1]), _evaluate(node[2]))
+
+
+def _reduce(node: Node, kinds: Tuple[str, ...], details: List[str]) -> Node:
+    """
+    Calcule toutes les opérations d'un type donné dont les opérandes sont des nombres
+    Les calculs effectués sont ajoutés à details (en LaTeX)
+    """
+    kind = node[0]
+    if kind in ('num', 'var'):
+        return node
+    if kind == 'paren':
+        inner = node[1]
+        is_number = inner[0] == 'num' or (inner[0] == 'frac' and inner[1][0] == inner[2][0] == 'num')
+        if 'paren' in kinds and not is_number:
+            value = _evaluate(node[1])
+            details.append(f"{_render(node[1])} = {_format_number(value)}")
+            return ('num', value)
+        inner = _reduce(node[1], kinds, details)
+        return inner if inner[0] == 'num' else ('paren', inner)
+    if kind == 'neg':
+        inner = _reduce(node[1], kinds, details)
+        return ('num', -inner[1]) if inner[0] == 'num' else ('neg', inner)
+
+    left = _reduce(node[1], kinds, details)
+    right = _reduce(node[2], kinds, details)
+    if kind == 'frac' and left[0] == 'num' and right[0] == 'num' and 'frac' not in kinds:
+        # Une fraction de deux nombres est déjà un nombre
+        return ('num', _apply(kind, left[1], right[1]))
+    if kind in kinds and left[0] == 'num' and right[0] == 'num':
+        value = _apply(kind, left[1], right[1])
+        details.append(f"{_render((kind, left, right))} = {_format_number(value)}")
+        return ('num', value)
+    return (kind, left, right)
+
+
+def _to_polynomial(node: Node, variable: str) -> Polynomial:
+    """Convertit un nœud en polynôme de la variable (ou lève TemplateError)"""
+    kind = node[0]
+    if kind == 'num':
+        return {0: node[1]} if node[1] else {}
+    if kind == 'var':
+        if node[1] != variable:
+            raise TemplateError("Plusieurs variables")
+        return {1: Fraction(1)}
+    if kind == 'paren':
+        return _to_polynomial(node[1], variable)
+    if kind == 'neg':
+        return {degree: -coefficient for degree, coefficient in _to_polynomial(node[1], variable).items()}
+
+    left = _to_polynomial(node[1], variable)
+    if kind == 'pow':
+        exponent = _to_polynomial(node[2], variable)
+        if set(exponent) - {0}:
+            raise TemplateError("Exposant non constant")
+        power = exponent.get(0, Fraction(0))
+        if power.denominator != 1 or power < 0 or power > _MAX_EXPONENT:
+            raise TemplateError("Exposant non pris en charge")
+        result = {0: Fraction(1)}
+        for _ in range(int(power)):
+            result = _poly_mul(result, left)
+        return result
+
+    right = _to_polynomial(node[2], variable)
+    if kind == 'add':
+        return _poly_add(left, right)
+    if kind == 'sub':
+        return _poly_add(left, {degree: -coefficient for degree, coefficient in right.items()})
+    if kind == 'mul':
+        return _poly_mul(left, right)
+    # Division (ou fraction) uniquement par une constante non nulle
+    if set(right) - {0} or not right.get(0):
+        raise TemplateError("Division par une expression non constante")
+    return {degree: coefficient / right[0] for degree, coefficient in left.items()}
+
+
+def _poly_add(left: Polynomial, right: Polynomial) -> Polynomial:
+    result = dict(left)
+    for degree, coefficient in right.items():
+        result[degree] = result.get(degree, Fraction(0)) + coefficient
+    return {degree: coefficient for degree, coefficient in result.items() if coefficient}
+
+
+def _poly_mul(left: Polynomial, right: Polynomial) -> Polynomial:
+    result: Polynomial = {}
+    for left_degree, left_coefficient in left.items():
+        for right_degree, right_coefficient in right.items():
+            degree = left_degree + right_degree
+            result[degree] = result.get(degree, Fraction(0)) + left_coefficient * right_coefficient
+    return {degree: coefficient for degree, coefficient in result.items() if coefficient}
+
+
+def _format_polynomial(polynomial: Polynomial, variable: str) -> str:
+    """Écrit un polynôme en LaTeX, par degrés décroissants"""
+    if not polynomial:
+        return "0"
+    parts = []
+    for degree in sorted(polynomial, reverse=True):
+        coefficient = polynomial[degree]
+        magnitude = abs(coefficient)
+        if degree == 0:
+            term = _format_number(magnitude)
+        else:
+            power = variable if degree == 1 else f"{variable}^{{{degree}}}"
+            term = power if magnitude == 1 else f"{_format_number(magnitude)}{power}"
+        if not parts:
+            parts.append(f"-{term}" if coefficient < 0 else term)
+        else:
+            parts.append(f"{'-' if coefficient < 0 else '+'} {term}")
+    return ' '.join(parts)
+
+
+def _step(title: str, description: str, formula: str, explanation: str) -> Dict[str, str]:
+    return {
+        "title": title,
+        "description": description,
+        "formula": formula,
+        "explanation": explanation
+    }
+
+
+def _exact_sqrt(value: Fraction) -> Optional[Fraction]:
+    """Racine carrée exacte d'une fraction positive, ou None"""
+    numerator_root = _integer_sqrt(value.numerator)
+    denominator_root = _integer_sqrt(value.denominator)
+    if numerator_root is None or denominator_root is None:
+        return None
+    return Fraction(numerator_root, denominator_root)
+
+
+def _integer_sqrt(value: int) -> Optional[int]:
+    if value < 0:
+        return None
+    root = int(value ** 0.5)
+    for candidate in (root - 1, root, root + 1):
+        if candidate >= 0 and candidate * candidate == value:
+            return candidate
+    return None
+
+
+class TemplateExplanationService:
+    """Service pour générer localement les explications des problèmes formulaïques"""
+
+    def explain(self, problem: str, solution: str = "", steps: Optional[List[Dict]] = None) -> Optional[List[Dict]]:
+        """
+        Génère les étapes expliquées si le problème appartient à une classe connue
+
+        Args:
+            problem: Problème en LaTeX
+            solution: Solution trouvée par WolframAlpha (sert de vérification)
+            steps: Étapes brutes (non utilisées pour le calcul, présentes pour
+                garder la même signature que LLMService.generate_explanation)
+
+        Returns:
+            Liste des étapes au format title/description/formula/explanation,
+            ou None si le problème doit être confié au LLM
+        """
+        if not problem:
+            return None
+
+        try:
+            derivative = _DERIVATIVE_PATTERN.match(problem.strip())
+            text = _normalize_latex(problem) if not derivative else ""
+            if text.count('=') > 1:
+                return None
+
+            if derivative:
+                result = self._explain_derivative(derivative.group(2), derivative.group(1))
+            elif '=' in text:
+                left_text, right_text = text.split('=')
+                left, right = _parse(left_text), _parse(right_text)
+                variables = _variables(left) | _variables(right)
+                if len(variables) != 1:
+                    return None
+                variable = variables.pop()
+                polynomial = _poly_add(
+                    _to_polynomial(left, variable),
+                    {degree: -coefficient for degree, coefficient in _to_polynomial(right, variable).items()}
+                )
+                degree = max(polynomial, default=0)
+                if degree == 1:
+                    result = self._explain_linear(problem, left, right, variable)
+                elif degree == 2:
+                    result = self._explain_quadratic(problem, polynomial, variable)
+                else:
+                    return None
+            else:
+                node = _parse(text)
+                if _variables(node):
+                    return None
+                result = self._explain_arithmetic(problem, node)
+        except (TemplateError, ZeroDivisionError, OverflowError, RecursionError):
+            return None
+
+        if result is None:
+            return None
+
+        explained_steps, values = result
+        if not self._solution_matches(solution, values):
+            logger.info("Explication par modèle écartée: résultat différent de la solution WolframAlpha")
+            return None
+        return explained_steps
+
+    def _explain_arithmetic(self, problem: str, node: Node) -> Tuple[List[Dict], List[Fraction]]:
+        phases = [
+            (('paren',), "Calcul des parenthèses",
+             "On commence toujours par calculer les expressions entre parenthèses."),
+            (('pow',), "Calcul des puissances",
+             "Les puissances sont prioritaires sur les multiplications, divisions, additions et soustractions."),
+            (('mul', 'div', 'frac'), "Multiplications et divisions",
+             "On effectue ensuite les multiplications et les divisions, de gauche à droite."),
+            (('add', 'sub'), "Additions et soustractions",
+             "On termine par les additions et les soustractions, de gauche à droite."),
+        ]
+
+        value = _evaluate(node)
+        steps = [_step(
+            "Expression à calculer",
+            f"Calculer {problem}",
+            _render(node),
+            "On applique les règles de priorité des opérations : parenthèses, puissances, "
+            "multiplications et divisions, puis additions et soustractions."
+        )]
+
+        current = node
+        for kinds, title, explanation in phases:
+            details: List[str] = []
+            reduced = _reduce(current, kinds, details)
+            if not details:
+                continue
+            steps.append(_step(
+                title,
+                ", ".join(f"${detail}$" for detail in details),
+                f"{_render(current)} = {_render(reduced)}",
+                f"{explanation} Ici : {', '.join(details)}."
+            ))
+            current = reduced
+
+        formatted = _format_number(value)
+        steps.append(_step(
+            "Résultat",
+            f"Le résultat est {formatted}",
+            f"{problem} = {formatted}",
+            f"Le résultat de {problem} est {formatted}."
+        ))
+        return steps, [value]
+
+    def _explain_linear(self, problem: str, left: Node, right: Node, variable: str) -> Optional[Tuple[List[Dict], List[Fraction]]]:
+        left_polynomial = _to_polynomial(left, variable)
+        right_polynomial = _to_polynomial(right, variable)
+        coefficient = left_polynomial.get(1, Fraction(0)) - right_polynomial.get(1, Fraction(0))
+        constant = right_polynomial.get(0, Fraction(0)) - left_polynomial.get(0, Fraction(0))
+        if coefficient == 0:
+            # Pas (ou une infinité) de solutions: cas laissé au LLM
+            return None
+
+        value = constant / coefficient
+        developed = f"{_format_polynomial(left_polynomial, variable)} = {_format_polynomial(right_polynomial, variable)}"
+        grouped = f"{_format_polynomial({1: coefficient}, variable)} = {_format_number(constant)}"
+        formatted = _format_number(value)
+
+        steps = [
+            _step(
+                "Équation de départ",
+                f"Résoudre l'équation {problem}",
+                developed,
+                f"Il s'agit d'une équation du premier degré en {variable}. "
+                f"On cherche la valeur de {variable} qui rend l'égalité vraie."
+            ),
+            _step(
+                "Regroupement des termes",
+                f"Regrouper les termes en {variable} dans le membre de gauche et les constantes dans celui de droite",
+                grouped,
+                "On ajoute ou on soustrait la même quantité aux deux membres de l'équation, "
+                f"ce qui ne change pas ses solutions. On obtient {grouped}."
+            ),
+        ]
+        if coefficient != 1:
+            steps.append(_step(
+                f"Isolement de {variable}",
+                f"Diviser les deux membres par {_format_number(coefficient)}",
+                f"{variable} = \\frac{{{_format_number(constant)}}}{{{_format_number(coefficient)}}}",
+                f"Le coefficient de {variable} est {_format_number(coefficient)}, qui est non nul : "
+                f"on peut diviser les deux membres par ce nombre pour isoler {variable}."
+            ))
+        steps.append(_step(
+            "Solution",
+            f"La solution est {variable} = {formatted}",
+            f"{variable} = {formatted}",
+            f"L'équation admet une unique solution : {variable} = {formatted}. "
+            f"On peut vérifier en remplaçant {variable} par {formatted} dans l'équation de départ."
+        ))
+        return steps, [value]
+
+    def _explain_quadratic(self, problem: str, polynomial: Polynomial, variable: str) -> Tuple[List[Dict], List[Fraction]]:
+        a = polynomial.get(2, Fraction(0))
+        b = polynomial.get(1, Fraction(0))
+        c = polynomial.get(0, Fraction(0))
+        delta = b * b - 4 * a * c
+        standard_form = f"{_format_polynomial(polynomial, variable)} = 0"
+        fa, fb, fc, fdelta = (_format_number(value) for value in (a, b, c, delta))
+
+        steps = [
+            _step(
+                "Forme générale",
+                f"Écrire l'équation {problem} sous la forme a{variable}^{{2}} + b{variable} + c = 0",
+                standard_form,
+                f"On reconnaît une équation du second degré avec a = {fa}, b = {fb} et c = {fc}."
+            ),
+            _step(
+                "Calcul du discriminant",
+                "Calculer le discriminant Δ = b² - 4ac",
+                f"\\Delta = b^{{2}} - 4ac = {_render(('num', b), 4)}^{{2}} - 4 \\times {_render(('num', a), 2)} "
+                f"\\times {_render(('num', c), 2)} = {fdelta}",
+                "Le signe du discriminant indique le nombre de solutions réelles : deux si Δ > 0, "
+                "une seule si Δ = 0, aucune si Δ < 0."
+            ),
+        ]
+
+        values: List[Fraction] = []
+        if delta > 0:
+            root = _exact_sqrt(delta)
+            if root is not None:
+                values = sorted([(-b - root) / (2 * a), (-b + root) / (2 * a)])
+                solutions = f"{variable}_{{1}} = {_format_number(values[0])}, {variable}_{{2}} = {_format_number(values[1])}"
+            else:
+                minus_b = _format_number(-b)
+                first = f"{minus_b} - \\sqrt{{{fdelta}}}" if b else f"-\\sqrt{{{fdelta}}}"
+                second = f"{minus_b} + \\sqrt{{{fdelta}}}" if b else f"\\sqrt{{{fdelta}}}"
+                denominator = _format_number(2 * a)
+                solutions = (
+                    f"{variable}_{{1}} = \\frac{{{first}}}{{{denominator}}}, "
+                    f"{variable}_{{2}} = \\frac{{{second}}}{{{denominator}}}"
+                )
+            steps.append(_step(
+                "Calcul des solutions",
+                f"Δ = {fdelta} > 0 : l'équation admet deux solutions réelles",
+                solutions,
+                f"On applique les formules {variable}_{{1}} = \\frac{{-b - \\sqrt{{\\Delta}}}}{{2a}} "
+                f"et {variable}_{{2}} = \\frac{{-b + \\sqrt{{\\Delta}}}}{{2a}}."
+            ))
+            conclusion = f"L'équation admet deux solutions : {solutions}."
+        elif delta == 0:
+            values = [-b / (2 * a)]
+            solutions = f"{variable}_{{0}} = {_format_number(values[0])}"
+            steps.append(_step(
+                "Calcul de la solution double",
+                "Δ = 0 : l'équation admet une solution double",
+                f"{variable}_{{0}} = \\frac{{-b}}{{2a}} = {_format_number(values[0])}",
+                f"Lorsque le discriminant est nul, l'unique solution est {variable}_{{0}} = \\frac{{-b}}{{2a}}."
+            ))
+            conclusion = f"L'équation admet une unique solution : {solutions}."
+        else:
+            solutions = "\\text{Aucune solution réelle}"
+            steps.append(_step(
+                "Absence de solution réelle",
+                f"Δ = {fdelta} < 0 : l'équation n'admet pas de solution réelle",
+                f"\\Delta = {fdelta} < 0",
+                "Un carré de nombre réel est toujours positif : aucune valeur réelle ne vérifie l'équation. "
+                "Les solutions complexes sont \\frac{-b \\pm i\\sqrt{-\\Delta}}{2a}."
+            ))
+            conclusion = "L'équation n'admet aucune solution réelle."
+
+        steps.append(_step("Solution", conclusion, solutions, conclusion))
+        return steps, values
+
+    def _explain_derivative(self, body: str, variable: str) -> Optional[Tuple[List[Dict], List[Fraction]]]:
+        node = _parse(_normalize_latex(body))
+        polynomial = _to_polynomial(node, variable)
+        derivative = {
+            degree - 1: coefficient * degree
+            for degree, coefficient in polynomial.items() if degree > 0
+        }
+
+        function = _format_polynomial(polynomial, variable)
+        result = _format_polynomial(derivative, variable)
+        term_derivatives = ", ".join(
+            f"\\left({_format_polynomial({degree: coefficient}, variable)}\\right)' = "
+            f"{_format_polynomial({degree - 1: coefficient * degree} if degree > 0 else {}, variable)}"
+            for degree, coefficient in sorted(polynomial.items(), reverse=True)
+        )
+
+        steps = [
+            _step(
+                "Fonction à dériver",
+                f"Dériver f({variable}) = {function} par rapport à {variable}",
+                f"f({variable}) = {function}",
+                f"La fonction est un polynôme en {variable} : on peut la dériver terme à terme."
+            ),
+            _step(
+                "Dérivation terme à terme",
+                "Appliquer la règle (x^{n})' = n x^{n-1} à chaque terme",
+                term_derivatives,
+                f"La dérivée de a{variable}^{{n}} est na{variable}^{{n-1}}, la dérivée d'une constante est nulle, "
+                "et la dérivée d'une somme est la somme des dérivées."
+            ),
+            _step(
+                "Résultat",
+                f"La dérivée est f'({variable}) = {result}",
+                f"f'({variable}) = {result}",
+                f"En additionnant les dérivées de chaque terme, on obtient f'({variable}) = {result}."
+            ),
+        ]
+        # Pas de vérification numérique possible pour une dérivée
+        return steps, []
+
+    @staticmethod
+    def _solution_matches(solution: str, values: List[Fraction]) -> bool:
+        """
+        Vérifie que les valeurs calculées sont cohérentes avec la solution WolframAlpha
+        Une solution absente ou non numérique n'est pas contredite.
+        """
+        if not solution or not values or not re.search(r'\d', solution):
+            return True
+
+        for part in re.split(r'\s+or\s+|,|;|\s+et\s+', solution):
+            value_text = part.split('=')[-1].strip().replace(' ', '').replace('−', '-')
+            if not value_text:
+                continue
+            try:
+                value = Fraction(value_text)
+            except (ValueError, ZeroDivisionError):
+                # Forme non numérique (radicaux, approximation...): pas de vérification sûre
+                return False
+            if value not in values:
+                return False
+        return True
+
+
+# Instance globale
+template_explanation_service = TemplateExplanationService()
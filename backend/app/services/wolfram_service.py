@@ -2,19 +2,30 @@
 Service pour résoudre des problèmes mathématiques via WolframAlpha API
 """
 import httpx
+import logging
 import re
 import math
-from typing import Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Dict, List, Optional, Tuple
 from app.config import config
+from app.utils import tracing
+from app.utils.tracing import tracer
+
+logger = logging.getLogger(__name__)
 
 
 class WolframService:
     """Service pour communiquer avec l'API WolframAlpha"""
     
-    API_URL = "https://api.wolframalpha.com/v2/query"
+    API_URL = config.WOLFRAM_API_URL
     
     def __init__(self):
         self.app_id = config.WOLFRAM_APP_ID
+        self.fast_scan_timeout = config.WOLFRAM_SCAN_TIMEOUT
+        self.fast_pod_timeout = config.WOLFRAM_POD_TIMEOUT
+        self.steps_timeout = config.WOLFRAM_STEPS_TIMEOUT
+        # Récupération des étapes détaillées en arrière-plan (mode progressif)
+        self._steps_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="wolfram-steps")
     
     def _latex_to_text(self, latex: str) -> str:
         """
@@ -93,123 +104,86 @@ class WolframService:
         except:
             return None
     
-    def solve(self, query: str) -> Dict[str, any]:
+    def _build_query(self, query: str) -> str:
+        """Convertit le LaTeX en format texte si nécessaire"""
+        if '\\' in query or '{' in query or '^' in query:
+            # C'est probablement du LaTeX, on le convertit
+            return self._latex_to_text(query)
+        return query
+    
+    def _parse_pods(self, pods: List[Dict], steps: Optional[List[Dict]] = None) -> Tuple[str, List[Dict]]:
         """
-        Résout un problème mathématique
+        Extrait la solution et les étapes des pods WolframAlpha
         
         Args:
-            query: Problème mathématique en texte ou LaTeX
+            pods: Liste des pods de la réponse JSON
+            steps: Étapes déjà connues (les doublons sont ignorés)
             
         Returns:
-            Dict avec 'solution' et 'steps'
-            
-        Raises:
-            Exception: Si l'API retourne une erreur
+            Tuple (solution, steps)
         """
-        if not self.app_id:
-            raise ValueError(
-                "WolframAlpha API credentials non configurées. "
-                "Définissez WOLFRAM_APP_ID dans le fichier .env"
-            )
+        solution = ""
+        steps = list(steps or [])
         
-        # Convertit le LaTeX en format texte si nécessaire
-        wolfram_query = query
-        if '\\' in query or '{' in query or '^' in query:
-            # C'est probablement du LaTeX, on le convertit
-            wolfram_query = self._latex_to_text(query)
+        for pod in pods:
+            pod_id = pod.get("id", "")
+            subpods = pod.get("subpods", [])
+            
+            # Solution principale
+            if pod_id == "Result" and subpods:
+                solution_text = subpods[0].get("plaintext", "")
+                if solution_text:
+                    solution = solution_text
+            
+            # Solution alternative (si Result n'est pas disponible)
+            elif pod_id == "Solution" and not solution and subpods:
+                solution_text = subpods[0].get("plaintext", "")
+                if solution_text:
+                    solution = solution_text
+            
+            # Étapes de résolution
+            if pod_id in ["Solution", "Step-by-step solution", "Result"]:
+                for idx, subpod in enumerate(subpods):
+                    step_text = subpod.get("plaintext", "")
+                    if step_text and step_text not in [s.get("description", "") for s in steps]:
+                        steps.append({
+                            "title": pod.get("title", f"Étape {len(steps) + 1}"),
+                            "description": step_text,
+                            "formula": "",
+                            "explanation": step_text
+                        })
         
-        params = {
-            "input": wolfram_query,
-            "appid": self.app_id,
-            "output": "json",
-            "includepodid": "Result,Solution,Step-by-step solution"
-        }
+        return solution, steps
+    
+    def _query(self, params: Dict, timeout: float = 30.0, stage: str = "solve") -> Dict:
+        """
+        Exécute une requête WolframAlpha et retourne le 'queryresult'
         
+        Args:
+            params: Paramètres de la requête
+            timeout: Timeout HTTP en secondes
+            stage: Nom de l'étape pour la trace (solve, solve_fast, fetch_steps)
+        
+        Raises:
+            Exception: Si l'API retourne une erreur
+        """
         try:
-            with httpx.Client(timeout=30.0) as client:
+            with tracer.span(f"wolfram.{stage}", {"wolfram.query": params.get("input")}) as span, \
+                    tracing.http_client(timeout=timeout) as client:
                 response = client.get(self.API_URL, params=params)
                 response.raise_for_status()
                 
                 data = response.json()
+                query_result = data.get("queryresult", {})
                 
-                # Parse la réponse WolframAlpha
-                solution = ""
-                steps = []
+                if query_result.get("success", False):
+                    query_result["pods"] = self._resolve_async_pods(client, query_result.get("pods", []))
                 
-                if "queryresult" in data:
-                    query_result = data["queryresult"]
-                    
-                    if query_result.get("success", False):
-                        pods = query_result.get("pods", [])
-                        
-                        for pod in pods:
-                            pod_id = pod.get("id", "")
-                            subpods = pod.get("subpods", [])
-                            
-                            # Solution principale
-                            if pod_id == "Result" and subpods:
-                                solution_text = subpods[0].get("plaintext", "")
-                                if solution_text:
-                                    solution = solution_text
-                            
-                            # Solution alternative (si Result n'est pas disponible)
-                            elif pod_id == "Solution" and not solution and subpods:
-                                solution_text = subpods[0].get("plaintext", "")
-                                if solution_text:
-                                    solution = solution_text
-                            
-                            # Étapes de résolution
-                            if pod_id in ["Solution", "Step-by-step solution", "Result"]:
-                                for idx, subpod in enumerate(subpods):
-                                    step_text = subpod.get("plaintext", "")
-                                    if step_text and step_text not in [s.get("description", "") for s in steps]:
-                                        # Extrait la formule mathématique si disponible
-                                        mathml = subpod.get("mathml", "")
-                                        formula = ""
-                                        
-                                        # Essaye d'extraire une formule depuis mathml ou img
-                                        img_src = subpod.get("img", {}).get("src", "")
-                                        
-                                        steps.append({
-                                            "title": pod.get("title", f"Étape {len(steps) + 1}"),
-                                            "description": step_text,
-                                            "formula": formula,
-                                            "explanation": step_text
-                                        })
-                    
-                    else:
-                        # Si pas de succès, essayer d'extraire des infos partielles
-                        error_msg = query_result.get("error", {}).get("msg", "")
-                        didyoumeans = query_result.get("didyoumeans", {}).get("val", "")
-                        
-                        # Log pour debug
-                        import logging
-                        logger = logging.getLogger(__name__)
-                        logger.warning(f"WolframAlpha query failed. Query: {wolfram_query}, Error: {error_msg}, Suggestions: {didyoumeans}")
-                        
-                        if error_msg:
-                            raise Exception(f"Erreur WolframAlpha: {error_msg}")
-                        elif didyoumeans:
-                            raise Exception(f"Impossible de résoudre. Suggestion: {didyoumeans}")
-                        else:
-                            # Essayer un calcul simple en fallback
-                            simple_result = self._calculate_simple_expression(wolfram_query)
-                            if simple_result:
-                                return {
-                                    "solution": simple_result,
-                                    "steps": [{
-                                        "title": "Calcul direct",
-                                        "description": f"Calcul de l'expression: {wolfram_query}",
-                                        "formula": f"{wolfram_query} = {simple_result}",
-                                        "explanation": f"Le résultat de {wolfram_query} est {simple_result}."
-                                    }]
-                                }
-                            raise Exception("Impossible de résoudre le problème avec WolframAlpha.")
-                
-                return {
-                    "solution": solution,
-                    "steps": steps
-                }
+                span.set_attributes({
+                    "wolfram.success": bool(query_result.get("success", False)),
+                    "wolfram.pods": len(query_result.get("pods") or []),
+                })
+                return query_result
                 
         except httpx.HTTPStatusError as e:
             if e.response.status_code == 401:
@@ -222,10 +196,236 @@ class WolframService:
                 raise Exception(f"Erreur WolframAlpha API: {e.response.status_code}")
         except httpx.TimeoutException:
             raise Exception("Timeout lors de l'appel à WolframAlpha API.")
+    
+    def _resolve_async_pods(self, client: httpx.Client, pods: List[Dict]) -> List[Dict]:
+        """
+        Récupère le contenu des pods calculés de manière asynchrone (async=true)
+        Les pods sans contenu exploitable sont conservés tels quels.
+        """
+        resolved = []
+        for pod in pods:
+            async_url = pod.get("async")
+            if async_url and not pod.get("subpods"):
+                try:
+                    response = client.get(async_url)
+                    response.raise_for_status()
+                    data = response.json()
+                    async_pod = data.get("pod") or (data.get("pods") or [None])[0]
+                    if async_pod:
+                        pod = {**pod, **async_pod}
+                except (httpx.HTTPError, ValueError) as e:
+                    logger.warning(f"Pod WolframAlpha asynchrone indisponible ({pod.get('id', '')}): {str(e)}")
+            resolved.append(pod)
+        return resolved
+    
+    def _handle_failure(self, query_result: Dict, wolfram_query: str) -> Dict[str, any]:
+        """
+        Gère une requête WolframAlpha sans succès
+        Essaie un calcul simple en fallback, sinon lève une exception
+        """
+        error_msg = query_result.get("error", {}).get("msg", "") if isinstance(query_result.get("error"), dict) else ""
+        didyoumeans = query_result.get("didyoumeans", {}).get("val", "") if isinstance(query_result.get("didyoumeans"), dict) else ""
+        
+        # Log pour debug
+        logger.warning(f"WolframAlpha query failed. Query: {wolfram_query}, Error: {error_msg}, Suggestions: {didyoumeans}")
+        
+        if error_msg:
+            raise Exception(f"Erreur WolframAlpha: {error_msg}")
+        elif didyoumeans:
+            raise Exception(f"Impossible de résoudre. Suggestion: {didyoumeans}")
+        
+        # Essayer un calcul simple en fallback
+        simple_result = self._calculate_simple_expression(wolfram_query)
+        if simple_result:
+            return {
+                "solution": simple_result,
+                "steps": [{
+                    "title": "Calcul direct",
+                    "description": f"Calcul de l'expression: {wolfram_query}",
+                    "formula": f"{wolfram_query} = {simple_result}",
+                    "explanation": f"Le résultat de {wolfram_query} est {simple_result}."
+                }]
+            }
+        raise Exception("Impossible de résoudre le problème avec WolframAlpha.")
+    
+    def _check_credentials(self):
+        if not self.app_id:
+            raise ValueError(
+                "WolframAlpha API credentials non configurées. "
+                "Définissez WOLFRAM_APP_ID dans le fichier .env"
+            )
+    
+    def solve(self, query: str) -> Dict[str, any]:
+        """
+        Résout un problème mathématique
+        
+        Args:
+            query: Problème mathématique en texte ou LaTeX
+            
+        Returns:
+            Dict avec 'solution' et 'steps'
+            
+        Raises:
+            Exception: Si l'API retourne une erreur
+        """
+        self._check_credentials()
+        wolfram_query = self._build_query(query)
+        
+        params = {
+            "input": wolfram_query,
+            "appid": self.app_id,
+            "output": "json",
+            "includepodid": "Result,Solution,Step-by-step solution"
+        }
+        
+        try:
+            query_result = self._query(params)
+            
+            if not query_result.get("success", False):
+                return self._handle_failure(query_result, wolfram_query)
+            
+            solution, steps = self._parse_pods(query_result.get("pods", []))
+            return {
+                "solution": solution,
+                "steps": steps
+            }
+                
+        except Exception as e:
+            if "credentials" in str(e).lower() or "WolframAlpha" in str(e):
+                raise
+            raise Exception(f"Erreur lors de la résolution: {str(e)}")
+    
+    def solve_fast(self, query: str) -> Dict[str, any]:
+        """
+        Résout un problème en ne demandant que les pods Result/Solution
+        Format texte uniquement et timeouts de calcul serrés: la réponse
+        n'attend pas le calcul (lent) des étapes détaillées.
+        
+        Args:
+            query: Problème mathématique en texte ou LaTeX
+            
+        Returns:
+            Dict avec 'solution' et 'steps'
+            
+        Raises:
+            Exception: Si l'API retourne une erreur
+        """
+        self._check_credentials()
+        wolfram_query = self._build_query(query)
+        
+        params = {
+            "input": wolfram_query,
+            "appid": self.app_id,
+            "output": "json",
+            "format": "plaintext",
+            "includepodid": ["Result", "Solution"],
+            "scantimeout": self.fast_scan_timeout,
+            "podtimeout": self.fast_pod_timeout
+        }
+        
+        try:
+            query_result = self._query(
+                params,
+                timeout=self.fast_scan_timeout + self.fast_pod_timeout + 5.0,
+                stage="solve_fast"
+            )
+            
+            if not query_result.get("success", False):
+                return self._handle_failure(query_result, wolfram_query)
+            
+            solution, steps = self._parse_pods(query_result.get("pods", []))
+            return {
+                "solution": solution,
+                "steps": steps
+            }
+                
         except Exception as e:
             if "credentials" in str(e).lower() or "WolframAlpha" in str(e):
                 raise
             raise Exception(f"Erreur lors de la résolution: {str(e)}")
+    
+    def fetch_steps(self, query: str) -> List[Dict]:
+        """
+        Récupère uniquement les étapes détaillées (step-by-step)
+        Utilise les podstates step-by-step et les pods asynchrones
+        
+        Args:
+            query: Problème mathématique en texte ou LaTeX
+            
+        Returns:
+            Liste des étapes (vide si indisponible)
+        """
+        self._check_credentials()
+        wolfram_query = self._build_query(query)
+        
+        params = {
+            "input": wolfram_query,
+            "appid": self.app_id,
+            "output": "json",
+            "format": "plaintext",
+            "includepodid": ["Result", "Solution", "Step-by-step solution"],
+            "podstate": ["Result__Step-by-step solution", "Solution__Step-by-step solution"],
+            "async": "true"
+        }
+        
+        query_result = self._query(params, stage="fetch_steps")
+        if not query_result.get("success", False):
+            return []
+        
+        _, steps = self._parse_pods(query_result.get("pods", []))
+        return steps
+    
+    def solve_progressive(self, query: str) -> Dict[str, any]:
+        """
+        Résolution progressive: retourne rapidement la solution et lance
+        la récupération des étapes détaillées en arrière-plan
+        
+        Args:
+            query: Problème mathématique en texte ou LaTeX
+            
+        Returns:
+            Dict avec 'solution', 'steps' (étapes rapides) et 'steps_future'
+            (Future résolue avec les étapes détaillées)
+            
+        Raises:
+            Exception: Si la requête rapide échoue
+        """
+        result = self.solve_fast(query)
+        # Les étapes sont récupérées dans un thread, rattaché à la trace de la requête
+        result["steps_future"] = self._steps_executor.submit(tracer.wrap(self.fetch_steps), query)
+        return result
+    
+    def merge_steps(self, result: Dict[str, any], timeout: Optional[float] = None) -> Dict[str, any]:
+        """
+        Attend les étapes détaillées d'une résolution progressive et les fusionne
+        
+        Args:
+            result: Résultat de solve_progressive
+            timeout: Attente maximale en secondes (WOLFRAM_STEPS_TIMEOUT par défaut)
+            
+        Returns:
+            Dict avec 'solution' et 'steps' (les étapes rapides si les détaillées
+            ne sont pas disponibles à temps)
+        """
+        future = result.pop("steps_future", None)
+        if future is None:
+            return result
+        
+        timeout = self.steps_timeout if timeout is None else timeout
+        try:
+            detailed_steps = future.result(timeout=timeout)
+        except FutureTimeoutError:
+            logger.warning(f"Étapes WolframAlpha non disponibles après {timeout}s, utilisation des étapes rapides")
+            return result
+        except Exception as e:
+            logger.warning(f"Erreur lors de la récupération des étapes WolframAlpha: {str(e)}")
+            return result
+        
+        known = [step.get("description", "") for step in result["steps"]]
+        result["steps"] = result["steps"] + [
+            step for step in detailed_steps if step.get("description", "") not in known
+        ]
+        return result
 
 
 # Instance globale
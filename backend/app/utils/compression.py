@@ -0,0 +1,252 @@
+"""
+Compression des réponses (middleware ASGI)
+Négocie brotli (si le paquet brotli est installé) ou gzip selon
+l'en-tête Accept-Encoding, pour les réponses compressibles au-delà
+d'une taille minimale. Les réponses en flux sont compressées morceau
+par morceau, avec un flush à chaque envoi pour ne pas retarder le client.
+Les réponses compressibles portent Vary: Accept-Encoding (compressées ou
+non), et un ETag fort compressé reçoit le suffixe de son encodage.
+"""
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.utils.http_cache import encoding_etag
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - dépendance optionnelle
+    brotli = None
+
+# Types de contenu compressés (préfixes)
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/x-ndjson",
+    "application/xml",
+    "application/javascript",
+    "application/mathml+xml",
+    "image/svg+xml",
+    "text/",
+)
+# Flux dont chaque événement doit arriver sans délai ni mise en tampon des proxys
+EXCLUDED_TYPES = ("text/event-stream",)
+# Flux d'enregistrements (une ligne par résultat): compressés dès le premier morceau,
+# sans attendre minimum_size octets
+STREAMING_TYPES = ("application/x-ndjson",)
+
+
+def parse_accept_encoding(header: str) -> Dict[str, float]:
+    """Parse Accept-Encoding en dict encodage -> qvalue"""
+    encodings = {}
+    for part in header.split(","):
+        token, _, params = part.strip().partition(";")
+        if not token:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        encodings[token.strip().lower()] = quality
+    return encodings
+
+
+def choose_encoding(header: str) -> Optional[str]:
+    """Encodage préféré par le client parmi ceux disponibles ('br' puis 'gzip' à qualité égale)"""
+    accepted = parse_accept_encoding(header)
+    candidates: List[Tuple[float, int, str]] = []
+    for priority, encoding in enumerate(("br", "gzip")):
+        if encoding == "br" and brotli is None:
+            continue
+        quality = accepted.get(encoding, accepted.get("*", 0.0))
+        if quality > 0:
+            candidates.append((quality, -priority, encoding))
+    return max(candidates)[2] if candidates else None
+
+
+class _Compressor:
+    """Compresseur incrémental gzip ou brotli"""
+
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        self.encoding = encoding
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=brotli_quality)
+        else:
+            self._zlib = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes, flush: bool = False) -> bytes:
+        if self.encoding == "br":
+            out = self._brotli.process(data)
+            return out + self._brotli.flush() if flush else out
+        out = self._zlib.compress(data)
+        return out + self._zlib.flush(zlib.Z_SYNC_FLUSH) if flush else out
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self._brotli.finish()
+        return self._zlib.flush(zlib.Z_FINISH)
+
+
+class CompressionMiddleware:
+    """
+    Middleware ASGI de compression des réponses HTTP
+
+    Args:
+        app: Application ASGI
+        minimum_size: Taille minimale (octets) d'une réponse complète pour être compressée
+        gzip_level: Niveau de compression gzip (1-9)
+        brotli_quality: Qualité brotli (0-11; 4 est un bon compromis pour du contenu dynamique)
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_headers = Headers(scope=scope)
+        # Sans encodage accepté, la réponse passe telle quelle (avec Vary: Accept-Encoding)
+        encoding = choose_encoding(request_headers.get("accept-encoding", ""))
+        responder = _CompressionResponder(
+            send, encoding, self.minimum_size, self.gzip_level, self.brotli_quality,
+            request_headers.get("if-none-match", "")
+        )
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressionResponder:
+    """
+    État de compression d'une réponse
+    Le corps est mis en tampon jusqu'à connaître sa taille (Content-Length
+    annoncé, ou au moins minimum_size octets): les middlewares http de
+    Starlette renvoient en effet toute réponse en plusieurs morceaux.
+    """
+
+    def __init__(
+        self, send: Send, encoding: Optional[str], minimum_size: int, gzip_level: int, brotli_quality: int,
+        if_none_match: str = ""
+    ):
+        self._send = send
+        self.encoding = encoding
+        self.if_none_match = if_none_match
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self._start: Optional[Message] = None
+        self._compressor: Optional[_Compressor] = None
+        self._passthrough = False
+        self._complete = False
+        self._content_length: Optional[int] = None
+        self._streaming = False
+        self._buffer: List[bytes] = []
+        self._buffered = 0
+
+    def _should_compress(self, headers: Headers) -> bool:
+        if "content-encoding" in headers:
+            return False
+        content_type = headers.get("content-type", "").lower()
+        if content_type.startswith(EXCLUDED_TYPES):
+            return False
+        return content_type.startswith(COMPRESSIBLE_TYPES)
+
+    async def send(self, message: Message):
+        if message["type"] == "http.response.start":
+            # En-têtes retenus jusqu'à la décision de compression
+            headers = MutableHeaders(raw=message["headers"])
+            self._start = message
+            compressible = self._should_compress(headers)
+            if compressible or message["status"] == 304:
+                # La représentation dépend de l'encodage accepté par le client
+                headers.add_vary_header("Accept-Encoding")
+            if message["status"] == 304 and self.encoding and "etag" in headers:
+                self._revalidated_etag(headers)
+            self._passthrough = self.encoding is None or not compressible
+            self._streaming = headers.get("content-type", "").lower().startswith(STREAMING_TYPES)
+            content_length = headers.get("content-length")
+            if content_length and content_length.isdigit():
+                self._content_length = int(content_length)
+                if self._content_length < self.minimum_size:
+                    self._passthrough = True
+            return
+
+        if message["type"] != "http.response.body":
+            await self._send(message)
+            return
+
+        if self._passthrough:
+            await self._flush_start()
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self._complete:
+            # Corps déjà envoyé compressé: seul le morceau final (vide) reste à transmettre
+            if not more_body:
+                await self._send({"type": "http.response.body", "body": b""})
+            return
+        if self._compressor is not None:
+            await self._send_compressed(body, more_body)
+            return
+
+        self._buffer.append(body)
+        self._buffered += len(body)
+        if more_body:
+            if self._content_length is not None and self._buffered < self._content_length:
+                return  # Taille connue: corps complet compressé d'un bloc
+            if self._content_length is None and self._buffered < self.minimum_size and not self._streaming:
+                return
+        body, self._buffer = b"".join(self._buffer), []
+
+        if not more_body and len(body) < self.minimum_size:
+            # Réponse complète trop petite: envoyée telle quelle
+            self._passthrough = True
+            await self._flush_start()
+            await self._send({"type": "http.response.body", "body": body})
+            return
+
+        self._compressor = _Compressor(self.encoding, self.gzip_level, self.brotli_quality)
+        headers = MutableHeaders(raw=self._start["headers"])
+        headers["Content-Encoding"] = self.encoding
+        if "etag" in headers:
+            # ETag fort propre au corps compressé (RFC 9110, 8.8.3)
+            headers["ETag"] = encoding_etag(headers["etag"], self.encoding)
+        if self._content_length is not None and self._buffered >= self._content_length:
+            compressed = self._compressor.compress(body) + self._compressor.finish()
+            headers["Content-Length"] = str(len(compressed))
+            await self._flush_start()
+            await self._send({"type": "http.response.body", "body": compressed, "more_body": more_body})
+            self._complete = True
+            return
+        # Réponse en flux: taille finale inconnue
+        del headers["Content-Length"]
+        await self._flush_start()
+        await self._send_compressed(body, more_body)
+
+    def _revalidated_etag(self, headers: MutableHeaders):
+        """304: ETag de la représentation compressée si c'est elle que le client a validée"""
+        compressed = encoding_etag(headers["etag"], self.encoding)
+        candidates = [candidate.strip() for candidate in self.if_none_match.split(",")]
+        if compressed in candidates or f"W/{compressed}" in candidates:
+            headers["ETag"] = compressed
+
+    async def _send_compressed(self, body: bytes, more_body: bool):
+        if more_body:
+            chunk = self._compressor.compress(body, flush=True)
+        else:
+            chunk = self._compressor.compress(body) + self._compressor.finish()
+        await self._send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+    async def _flush_start(self):
+        if self._start is not None:
+            start, self._start = self._start, None
+            await self._send(start)
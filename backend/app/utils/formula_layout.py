@@ -0,0 +1,484 @@
+"""
+Mise en page de formules LaTeX (sous-ensemble courant des résultats d'analyse)
+Une formule est composée en boîtes à la manière de TeX (largeur, hauteur,
+profondeur) contenant des suites de glyphes, des filets et des tracés. Les
+dimensions viennent des métriques des polices PDF standard (Helvetica,
+Symbol): le résultat est indépendant du format de sortie (PDF, SVG).
+Les commandes inconnues sont affichées par leur nom et les environnements
+(matrices, systèmes) sont aplatis sur une ligne: la mise en page ne lève
+jamais d'erreur, sauf en mode strict (UnsupportedFormula), utilisé quand un
+autre moteur peut afficher la formule correctement.
+"""
+import re
+import unicodedata
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple, Union
+
+# Polices logiques (associées aux polices standard par chaque format de sortie)
+REGULAR, ITALIC, BOLD, SYMBOL = "regular", "italic", "bold", "symbol"
+
+# Largeurs Helvetica (1/1000 em) des caractères 32 à 126
+_HELVETICA_ASCII = (
+    "278 278 355 556 556 889 667 191 333 333 389 584 278 333 278 278 "
+    "556 556 556 556 556 556 556 556 556 556 278 278 584 584 584 556 "
+    "1015 667 667 722 722 667 611 778 722 278 500 667 556 833 722 778 "
+    "667 778 722 667 611 722 667 944 667 667 611 278 278 278 469 556 "
+    "333 556 556 500 556 556 278 556 556 222 222 500 222 833 556 556 "
+    "556 556 333 500 278 556 500 722 500 500 500 334 260 334 584"
+)
+_HELVETICA_BOLD_LOWER = (
+    "556 611 556 611 556 333 611 611 278 278 556 278 889 611 611 "
+    "611 611 389 556 333 611 556 778 556 556 500"
+)
+HELVETICA_WIDTHS: Dict[str, int] = {
+    chr(32 + index): int(width) for index, width in enumerate(_HELVETICA_ASCII.split())
+}
+HELVETICA_WIDTHS.update({
+    "’": 222, "‘": 222, "“": 333, "”": 333, "–": 556, "—": 1000, "…": 1000, "€": 556,
+    "œ": 944, "Œ": 1000, "«": 556, "»": 556, "°": 400, "·": 278, "×": 584, "÷": 584,
+    "±": 584, "²": 333, "³": 333, " ": 278,
+})
+HELVETICA_BOLD_WIDTHS = dict(HELVETICA_WIDTHS)
+HELVETICA_BOLD_WIDTHS.update({
+    chr(ord("a") + index): int(width) for index, width in enumerate(_HELVETICA_BOLD_LOWER.split())
+})
+HELVETICA_BOLD_WIDTHS.update({"!": 333, '"': 474, ":": 333, ";": 333, "?": 611, "A": 722, "B": 722, "J": 556, "K": 722, "L": 611})
+
+# Symboles de la police Symbol: caractère Unicode → (code Symbol, largeur)
+SYMBOL_GLYPHS: Dict[str, Tuple[int, int]] = {
+    "α": (0x61, 631), "β": (0x62, 549), "χ": (0x63, 549), "δ": (0x64, 494), "ε": (0x65, 439),
+    "φ": (0x66, 521), "γ": (0x67, 411), "η": (0x68, 603), "ι": (0x69, 329), "κ": (0x6B, 549),
+    "λ": (0x6C, 549), "μ": (0x6D, 576), "ν": (0x6E, 521), "π": (0x70, 549), "θ": (0x71, 521),
+    "ρ": (0x72, 549), "σ": (0x73, 603), "τ": (0x74, 439), "υ": (0x75, 576), "ω": (0x77, 686),
+    "ξ": (0x78, 493), "ψ": (0x79, 686), "ζ": (0x7A, 494), "Δ": (0x44, 612), "Φ": (0x46, 763),
+    "Γ": (0x47, 603), "Λ": (0x4C, 686), "Π": (0x50, 768), "Θ": (0x51, 741), "Σ": (0x53, 592),
+    "Ω": (0x57, 768), "Ξ": (0x58, 645), "Ψ": (0x59, 795), "∀": (0x22, 713), "∃": (0x24, 549),
+    "−": (0x2D, 549), "⊥": (0x5E, 658), "∼": (0x7E, 549), "′": (0xA2, 247), "≤": (0xA3, 549),
+    "∞": (0xA5, 713), "←": (0xAC, 987), "→": (0xAE, 987), "±": (0xB1, 549), "≥": (0xB3, 549),
+    "×": (0xB4, 549), "∝": (0xB5, 713), "∂": (0xB6, 494), "÷": (0xB8, 549), "≠": (0xB9, 549),
+    "≡": (0xBA, 549), "≈": (0xBB, 549), "…": (0xBC, 1000), "∅": (0xC6, 823), "∩": (0xC7, 768),
+    "∪": (0xC8, 768), "⊂": (0xCC, 713), "⊆": (0xCD, 713), "∈": (0xCE, 713), "∉": (0xCF, 713),
+    "∠": (0xD0, 768), "∇": (0xD1, 713), "√": (0xD6, 549), "⋅": (0xD7, 250), "¬": (0xD8, 713),
+    "∧": (0xD9, 603), "∨": (0xDA, 603), "⇔": (0xDB, 1042), "⇐": (0xDC, 987), "⇒": (0xDE, 987),
+    "∑": (0xE5, 713), "∏": (0xD5, 823), "∫": (0xF2, 274), "°": (0xB0, 400),
+}
+
+# Commandes LaTeX → symbole Unicode
+SYMBOL_COMMANDS = {
+    "alpha": "α", "beta": "β", "chi": "χ", "delta": "δ", "epsilon": "ε", "varepsilon": "ε",
+    "phi": "φ", "varphi": "φ", "gamma": "γ", "eta": "η", "iota": "ι", "kappa": "κ",
+    "lambda": "λ", "mu": "μ", "nu": "ν", "pi": "π", "theta": "θ", "vartheta": "θ", "rho": "ρ",
+    "sigma": "σ", "tau": "τ", "upsilon": "υ", "omega": "ω", "xi": "ξ", "psi": "ψ", "zeta": "ζ",
+    "Delta": "Δ", "Phi": "Φ", "Gamma": "Γ", "Lambda": "Λ", "Pi": "Π", "Theta": "Θ",
+    "Sigma": "Σ", "Omega": "Ω", "Xi": "Ξ", "Psi": "Ψ", "forall": "∀", "exists": "∃",
+    "perp": "⊥", "sim": "∼", "prime": "′", "infty": "∞", "partial": "∂", "nabla": "∇",
+    "emptyset": "∅", "varnothing": "∅", "angle": "∠", "neg": "¬", "lnot": "¬",
+    "cdots": "…", "ldots": "…", "dots": "…", "degree": "°", "circ": "°",
+}
+# Opérateurs binaires et relations (espacés)
+OPERATOR_COMMANDS = {
+    "pm": "±", "mp": "±", "times": "×", "div": "÷", "cdot": "⋅", "cap": "∩", "cup": "∪",
+    "wedge": "∧", "land": "∧", "vee": "∨", "lor": "∨",
+    "leq": "≤", "le": "≤", "geq": "≥", "ge": "≥", "neq": "≠", "ne": "≠", "approx": "≈",
+    "equiv": "≡", "propto": "∝", "in": "∈", "notin": "∉", "subset": "⊂", "subseteq": "⊆",
+    "to": "→", "rightarrow": "→", "leftarrow": "←", "gets": "←", "Rightarrow": "⇒",
+    "implies": "⇒", "Leftarrow": "⇐", "Leftrightarrow": "⇔", "iff": "⇔", "mapsto": "→",
+    "simeq": "≈", "cong": "≡",
+}
+LARGE_OPERATORS = {"sum": "∑", "prod": "∏", "int": "∫", "oint": "∫", "iint": "∫∫"}
+FUNCTION_NAMES = {
+    "sin", "cos", "tan", "cot", "sec", "csc", "arcsin", "arccos", "arctan", "sinh", "cosh",
+    "tanh", "log", "ln", "lg", "exp", "lim", "max", "min", "sup", "inf", "det", "gcd",
+    "deg", "dim", "ker", "arg", "mod",
+}
+TEXT_COMMANDS = {"text": REGULAR, "mathrm": REGULAR, "textrm": REGULAR, "operatorname": REGULAR,
+                 "mathbf": BOLD, "textbf": BOLD, "mathit": ITALIC, "textit": ITALIC}
+SPACING_COMMANDS = {",": 0.17, ":": 0.22, ";": 0.28, " ": 0.25, "!": -0.17, "quad": 1.0, "qquad": 2.0}
+# Commandes sans rendu propre (le délimiteur qui suit est affiché normalement)
+IGNORED_COMMANDS = {
+    "left", "right", "big", "Big", "bigg", "Bigg", "bigl", "bigr", "Bigl", "Bigr",
+    "displaystyle", "textstyle", "limits", "nolimits", "middle",
+}
+BINARY_CHARS = {"+": "+", "-": "−", "*": "⋅"}
+RELATION_CHARS = {"=", "<", ">"}
+
+TOKEN_PATTERN = re.compile(r"\\[A-Za-z]+|\\.|\s+|.", re.DOTALL)
+
+# Proportions (en em) inspirées des paramètres de TeX
+ASCENT, DESCENT = 0.72, 0.21
+SCRIPT_SCALE = 0.7
+MIN_SIZE_RATIO = 0.5
+AXIS = 0.27
+RULE = 0.05
+
+
+def char_width(char: str, font: str) -> float:
+    """Largeur d'un caractère en em"""
+    if font == SYMBOL:
+        glyph = SYMBOL_GLYPHS.get(char)
+        return (glyph[1] if glyph else 556) / 1000
+    widths = HELVETICA_BOLD_WIDTHS if font == BOLD else HELVETICA_WIDTHS
+    width = widths.get(char)
+    if width is None:
+        # Lettre accentuée: largeur de la lettre de base
+        base = unicodedata.normalize("NFKD", char)[:1]
+        width = widths.get(base, 556)
+    return width / 1000
+
+
+def text_width(text: str, font: str, size: float) -> float:
+    """Largeur d'un texte en points"""
+    return sum(char_width(char, font) for char in text) * size
+
+
+@dataclass
+class Glyphs:
+    """Suite de caractères d'une même police sur une même ligne de base"""
+    x: float
+    y: float
+    font: str
+    size: float
+    text: str
+
+    @property
+    def width(self) -> float:
+        return text_width(self.text, self.font, self.size)
+
+
+@dataclass
+class Rule:
+    """Filet horizontal (barre de fraction, barre de radical)"""
+    x: float
+    y: float
+    width: float
+    thickness: float
+
+
+@dataclass
+class Polyline:
+    """Tracé ouvert (signe radical)"""
+    points: List[Tuple[float, float]]
+    thickness: float
+
+
+Item = Union[Glyphs, Rule, Polyline]
+
+
+@dataclass
+class Box:
+    """Boîte composée: origine sur la ligne de base, à gauche"""
+    width: float = 0.0
+    height: float = 0.0
+    depth: float = 0.0
+    items: List[Item] = field(default_factory=list)
+
+    def place(self, box: "Box", dx: float, dy: float = 0.0):
+        """Ajoute le contenu d'une boîte décalée de (dx, dy), sans modifier les dimensions"""
+        for item in box.items:
+            if isinstance(item, Glyphs):
+                moved = Glyphs(item.x + dx, item.y + dy, item.font, item.size, item.text)
+                last = self.items[-1] if self.items else None
+                if (
+                    isinstance(last, Glyphs) and last.font == moved.font and last.size == moved.size
+                    and abs(last.y - moved.y) < 0.01 and abs(last.x + last.width - moved.x) < 0.01
+                ):
+                    last.text += moved.text  # Fusion des glyphes contigus
+                    continue
+                self.items.append(moved)
+            elif isinstance(item, Rule):
+                self.items.append(Rule(item.x + dx, item.y + dy, item.width, item.thickness))
+            else:
+                self.items.append(Polyline([(x + dx, y + dy) for x, y in item.points], item.thickness))
+
+
+def _glyphs(text: str, font: str, size: float, ascent: float = ASCENT, descent: float = DESCENT) -> Box:
+    box = Box(text_width(text, font, size), ascent * size, descent * size)
+    box.items.append(Glyphs(0.0, 0.0, font, size, text))
+    return box
+
+
+def _space(width: float) -> Box:
+    return Box(width=width)
+
+
+def hbox(boxes: List[Box]) -> Box:
+    """Juxtapose des boîtes sur une même ligne de base"""
+    result = Box()
+    for box in boxes:
+        result.place(box, result.width)
+        result.width += box.width
+        result.height = max(result.height, box.height)
+        result.depth = max(result.depth, box.depth)
+    return result
+
+
+class UnsupportedFormula(ValueError):
+    """La formule contient une construction que la mise en page ne sait pas composer"""
+
+
+class _Typesetter:
+    """Analyse descendante du LaTeX et composition simultanée des boîtes"""
+
+    def __init__(self, latex: str, base_size: float, strict: bool = False):
+        # Les espaces ne comptent qu'en mode texte (\text{...})
+        self.tokens = TOKEN_PATTERN.findall(latex)
+        self.pos = 0
+        self.min_size = base_size * MIN_SIZE_RATIO
+        self.strict = strict
+        self._last_operator = False
+
+    def _unsupported(self, construct: str):
+        # Mode strict: pas de rendu approximatif (environnement aplati, commande affichée par son nom)
+        if self.strict:
+            raise UnsupportedFormula(construct)
+
+    def _peek(self) -> Optional[str]:
+        while self.pos < len(self.tokens) and self.tokens[self.pos].isspace():
+            self.pos += 1
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def _next(self) -> Optional[str]:
+        token = self._peek()
+        self.pos += 1
+        return token
+
+    def _smaller(self, size: float, ratio: float) -> float:
+        return max(size * ratio, self.min_size)
+
+    def hlist(self, size: float, stop: Optional[str] = None) -> Box:
+        """Liste d'atomes jusqu'au jeton d'arrêt (consommé) ou la fin"""
+        atoms: List[Box] = []
+        while True:
+            token = self._peek()
+            if token is None:
+                break
+            if token == stop:
+                self.pos += 1
+                break
+            if token in ("^", "_"):
+                base = atoms.pop() if atoms else Box(height=ASCENT * size)
+                atoms.append(self._scripts(base, size))
+                continue
+            if token == "}":  # Accolade orpheline
+                self.pos += 1
+                continue
+            # Un signe en tête ou après un opérateur est unaire (non espacé)
+            operand_before = bool(atoms) and not self._last_operator
+            self._last_operator = False
+            atoms.append(self._atom(size, operand_before))
+        return hbox(atoms)
+
+    def _argument(self, size: float) -> Box:
+        """Argument d'une commande: groupe entre accolades ou atome seul"""
+        if self._peek() == "{":
+            self.pos += 1
+            return self.hlist(size, "}")
+        if self._peek() is None:
+            return Box()
+        return self._atom(size, operand_before=False)
+
+    def _raw_argument(self) -> str:
+        """Texte brut d'un argument entre accolades (\\text{...})"""
+        if self._peek() != "{":
+            return self._next() or ""
+        self.pos += 1
+        depth, parts = 1, []
+        while self.pos < len(self.tokens):
+            token = self.tokens[self.pos]
+            self.pos += 1
+            if token == "{":
+                depth += 1
+                continue
+            if token == "}":
+                depth -= 1
+                if depth == 0:
+                    break
+                continue
+            if token.isspace():
+                token = " "
+            elif token.startswith("\\"):
+                name = token[1:]
+                token = " " if name in SPACING_COMMANDS else (name if len(name) == 1 else "")
+            parts.append(token)
+        return "".join(parts)
+
+    def _operator(self, symbol: str, font: str, size: float, relation: bool, operand_before: bool) -> Box:
+        glyph = _glyphs(symbol, font, size)
+        self._last_operator = True
+        if not operand_before and not relation:
+            return glyph  # Signe unaire
+        gap = (0.28 if relation else 0.22) * size
+        return hbox([_space(gap), glyph, _space(gap)])
+
+    def _atom(self, size: float, operand_before: bool) -> Box:
+        token = self._next()
+        if token == "{":
+            return self.hlist(size, "}")
+        if token == "&":
+            self._unsupported("&")
+            return _space(0.5 * size)
+        if token.startswith("\\") and len(token) == 2:
+            char = token[1]
+            if char in SPACING_COMMANDS:
+                return _space(SPACING_COMMANDS[char] * size)
+            if char == "\\":
+                self._unsupported("\\\\")
+                return _space(size)  # Saut de ligne d'un alignement
+            return _glyphs(char, REGULAR, size)
+        if token.startswith("\\"):
+            return self._command(token[1:], size, operand_before)
+        if token in BINARY_CHARS:
+            font = REGULAR if token == "+" else SYMBOL
+            return self._operator(BINARY_CHARS[token], font, size, False, operand_before)
+        if token in RELATION_CHARS:
+            return self._operator(token, REGULAR, size, True, operand_before)
+        if token == ",":
+            return hbox([_glyphs(",", REGULAR, size), _space(0.17 * size)])
+        if token == "'":
+            return _glyphs("′", SYMBOL, size)
+        if token.isalpha():
+            return _glyphs(token, ITALIC, size)
+        if token in SYMBOL_GLYPHS and token not in HELVETICA_WIDTHS:
+            return _glyphs(token, SYMBOL, size)
+        return _glyphs(token, REGULAR, size)
+
+    def _command(self, name: str, size: float, operand_before: bool) -> Box:
+        if name in ("frac", "dfrac", "tfrac", "cfrac"):
+            numerator = self._argument(self._smaller(size, 0.85))
+            denominator = self._argument(self._smaller(size, 0.85))
+            return self._fraction(numerator, denominator, size)
+        if name == "sqrt":
+            index = None
+            if self._peek() == "[":
+                self.pos += 1
+                index = self.hlist(self._smaller(size, 0.5), "]")
+            return self._radical(self._argument(size), index, size)
+        if name in TEXT_COMMANDS:
+            return _glyphs(self._raw_argument(), TEXT_COMMANDS[name], size)
+        if name in ("begin", "end"):
+            environment = self._raw_argument()
+            self._unsupported(f"\\{name}{{{environment}}}")
+            return Box()
+        if name in IGNORED_COMMANDS:
+            return Box()
+        if name in SPACING_COMMANDS:
+            return _space(SPACING_COMMANDS[name] * size)
+        if name in OPERATOR_COMMANDS:
+            symbol = OPERATOR_COMMANDS[name]
+            relation = name not in ("pm", "mp", "times", "div", "cdot", "cap", "cup", "wedge", "land", "vee", "lor")
+            return self._operator(symbol, SYMBOL, size, relation, operand_before)
+        if name in SYMBOL_COMMANDS:
+            return _glyphs(SYMBOL_COMMANDS[name], SYMBOL, size)
+        if name in LARGE_OPERATORS:
+            large = size * 1.4
+            # Centré sur l'axe mathématique
+            glyph = _glyphs(LARGE_OPERATORS[name], SYMBOL, large)
+            shift = AXIS * size - (ASCENT - DESCENT) * large / 2
+            box = Box(glyph.width + 0.1 * size, glyph.height + shift, max(glyph.depth - shift, 0))
+            box.place(glyph, 0, shift)
+            return box
+        if name in FUNCTION_NAMES:
+            return hbox([_glyphs(name, REGULAR, size), _space(0.17 * size)])
+        if name in ("overline", "bar", "vec", "hat", "tilde", "dot", "mathbb", "mathcal", "boldsymbol"):
+            body = self._argument(size)
+            if name not in ("overline", "bar", "vec"):
+                if name != "boldsymbol":
+                    # Accent ou alphabet (ℝ, 𝒞) perdus: seul le corps est composé
+                    self._unsupported("\\" + name)
+                return body
+            box = Box(body.width, body.height + 0.15 * size, body.depth)
+            box.place(body, 0)
+            box.items.append(Rule(0, body.height + 0.08 * size, body.width, RULE * size))
+            return box
+        # Commande inconnue: affichée par son nom
+        self._unsupported("\\" + name)
+        return _glyphs(name, REGULAR, size)
+
+    def _scripts(self, base: Box, size: float) -> Box:
+        superscript = subscript = None
+        while self._peek() in ("^", "_"):
+            marker = self._next()
+            argument = self._argument(self._smaller(size, SCRIPT_SCALE))
+            if marker == "^":
+                superscript = argument
+            else:
+                subscript = argument
+        box = Box(base.width, base.height, base.depth)
+        box.place(base, 0)
+        script_width = 0.0
+        if superscript is not None:
+            shift = max(0.42 * size, base.height - 0.3 * size)
+            box.place(superscript, base.width + 0.03 * size, shift)
+            box.height = max(box.height, shift + superscript.height)
+            script_width = superscript.width
+        if subscript is not None:
+            shift = max(0.2 * size, base.depth + 0.05 * size)
+            box.place(subscript, base.width + 0.03 * size, -shift)
+            box.depth = max(box.depth, shift + subscript.depth)
+            script_width = max(script_width, subscript.width)
+        box.width = base.width + script_width + 0.08 * size
+        return box
+
+    @staticmethod
+    def _fraction(numerator: Box, denominator: Box, size: float) -> Box:
+        axis, thickness, gap = AXIS * size, RULE * size, 0.12 * size
+        width = max(numerator.width, denominator.width) + 0.2 * size
+        box = Box(width + 0.1 * size)
+        numerator_shift = axis + thickness / 2 + gap + numerator.depth
+        denominator_shift = axis - thickness / 2 - gap - denominator.height
+        box.place(numerator, 0.05 * size + (width - numerator.width) / 2, numerator_shift)
+        box.place(denominator, 0.05 * size + (width - denominator.width) / 2, denominator_shift)
+        box.items.append(Rule(0.05 * size, axis - thickness / 2, width, thickness))
+        box.height = numerator_shift + numerator.height
+        box.depth = max(denominator.depth - denominator_shift, 0)
+        return box
+
+    @staticmethod
+    def _radical(body: Box, index: Optional[Box], size: float) -> Box:
+        thickness, gap = RULE * size, 0.12 * size
+        top = body.height + gap + thickness / 2
+        bottom = -max(body.depth, 0.1 * size)
+        span = top - bottom
+        offset = index.width - 0.2 * size if index is not None and index.width > 0.2 * size else 0.0
+        sign = 0.5 * size
+        box = Box(offset + sign + body.width + 0.15 * size, top + thickness, -bottom)
+        if index is not None:
+            box.place(index, 0.02 * size, bottom + 0.6 * span)
+            box.height = max(box.height, bottom + 0.6 * span + index.height)
+        box.items.append(Polyline([
+            (offset + 0.02 * size, bottom + 0.5 * span),
+            (offset + 0.12 * size, bottom + 0.56 * span),
+            (offset + 0.26 * size, bottom),
+            (offset + sign - 0.02 * size, top),
+            (offset + sign + body.width + 0.1 * size, top),
+        ], thickness))
+        box.place(body, offset + sign + 0.04 * size)
+        return box
+
+
+def strip_delimiters(latex: str) -> str:
+    """Retire les délimiteurs d'une formule ($...$, \\[...\\], \\(...\\))"""
+    latex = latex.strip().strip("$")
+    for opening, closing in (("\\[", "\\]"), ("\\(", "\\)")):
+        if latex.startswith(opening) and latex.endswith(closing):
+            latex = latex[2:-2]
+    return latex.strip()
+
+
+def layout_formula(latex: str, size: float, strict: bool = False) -> Box:
+    """
+    Compose une formule LaTeX
+
+    Args:
+        latex: Formule (sans délimiteurs $ ou \\[ \\])
+        size: Corps en points
+        strict: Refuse les constructions non composées fidèlement
+            (environnements, \\\\, &, commandes inconnues)
+
+    Returns:
+        Boîte de la formule (origine à gauche sur la ligne de base)
+
+    Raises:
+        UnsupportedFormula: En mode strict, construction non prise en charge
+    """
+    return _Typesetter(strip_delimiters(latex), size, strict).hlist(size)
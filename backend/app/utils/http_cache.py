@@ -0,0 +1,68 @@
+"""
+Cache HTTP: ETags et requêtes conditionnelles (If-None-Match)
+Un ETag fort désigne une représentation exacte: le corps compressé reçoit
+un ETag propre à son encodage ("<id>-gzip", "<id>-br", voir
+app.utils.compression), reconnu comme le même résultat par etag_matches.
+"""
+from typing import Dict, Optional
+
+from fastapi.responses import Response
+
+# Encodages de contenu produits par le middleware de compression
+CONTENT_ENCODINGS = ("gzip", "br")
+
+
+def format_etag(result_id: str) -> str:
+    """ETag fort à partir d'un identifiant de résultat"""
+    return f'"{result_id}"'
+
+
+def encoding_etag(etag: str, encoding: str) -> str:
+    """ETag de la représentation compressée (un ETag faible reste inchangé)"""
+    if etag.startswith("W/") or not etag.endswith('"'):
+        return etag
+    return f'{etag[:-1]}-{encoding}"'
+
+
+def _strip_encoding(etag: str) -> str:
+    for encoding in CONTENT_ENCODINGS:
+        suffix = f'-{encoding}"'
+        if etag.endswith(suffix):
+            return etag[:-len(suffix)] + '"'
+    return etag
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Vérifie si l'en-tête If-None-Match désigne l'ETag (comparaison faible, RFC 9110)
+    L'ETag d'une représentation compressée désigne le même résultat.
+
+    Args:
+        if_none_match: Valeur de l'en-tête (liste d'ETags ou '*')
+        etag: ETag courant de la ressource
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    current = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if _strip_encoding(candidate) == current:
+            return True
+    return False
+
+
+def cache_headers(etag: str, cache_control: str, location: Optional[str] = None) -> Dict[str, str]:
+    """En-têtes de validation d'un résultat"""
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if location:
+        headers["Content-Location"] = location
+    return headers
+
+
+def not_modified(headers: Dict[str, str]) -> Response:
+    """Réponse 304: le client possède déjà la version courante"""
+    return Response(status_code=304, headers=headers)
@@ -0,0 +1,148 @@
+"""
+Lecture des images à traiter par lots
+Sources: répertoire (parcours récursif), archive zip/tar ou PDF de plusieurs
+pages (une image par page). Les images sont lues une à une, au fil de
+l'itération, pour borner la mémoire utilisée: une page de PDF n'est rendue
+qu'au moment où elle est demandée.
+Le rendu des PDF utilise pypdfium2 et Pillow (installés avec requirements.txt).
+"""
+import io
+import logging
+import tarfile
+import zipfile
+from dataclasses import dataclass
+from pathlib import Path, PurePosixPath
+from typing import BinaryIO, Iterator, Union
+
+from app.config import config
+
+logger = logging.getLogger(__name__)
+
+try:
+    import pypdfium2 as pdfium
+except ImportError:  # pragma: no cover - installé avec requirements.txt
+    pdfium = None
+    logger.warning("pypdfium2 non installé: les PDF sont refusés (pip install -r requirements.txt)")
+
+TAR_SUFFIXES = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+PDF_SIGNATURE = b"%PDF-"
+
+
+@dataclass
+class SourceImage:
+    """Image d'un lot, identifiée par son chemin relatif dans la source"""
+    name: str
+    data: bytes
+
+
+def is_image_name(name: str) -> bool:
+    """Nom de fichier image accepté (extension autorisée, hors fichiers cachés et métadonnées)"""
+    path = PurePosixPath(name)
+    if any(part.startswith(".") or part == "__MACOSX" for part in path.parts):
+        return False
+    return path.suffix.lower().lstrip(".") in config.ALLOWED_EXTENSIONS
+
+
+def iter_images(source: str, max_size: int = config.MAX_UPLOAD_SIZE) -> Iterator[SourceImage]:
+    """
+    Images d'un répertoire ou d'une archive, dans un ordre stable
+
+    Args:
+        source: Répertoire, archive .zip, archive tar (éventuellement compressée) ou PDF
+        max_size: Les fichiers plus gros sont ignorés sans être lus
+
+    Raises:
+        ValueError: Si la source n'est ni un répertoire ni une archive reconnue
+            (ou un PDF sans pypdfium2)
+    """
+    path = Path(source)
+    if path.is_dir():
+        return _iter_directory(path, max_size)
+    if zipfile.is_zipfile(path):
+        return _iter_zip(path, max_size)
+    if path.is_file() and path.name.lower().endswith(TAR_SUFFIXES):
+        return _iter_tar(path, max_size)
+    if path.is_file() and path.suffix.lower() == ".pdf":
+        return _iter_pdf(path, config.INGEST_MAX_PAGES, config.INGEST_PDF_DPI)
+    raise ValueError(f"Source non reconnue (répertoire, .zip, archive tar ou PDF attendu): {source}")
+
+
+def iter_upload(file: BinaryIO, filename: str = "", max_size: int = config.MAX_UPLOAD_SIZE,
+                max_pages: int = config.INGEST_MAX_PAGES) -> Iterator[SourceImage]:
+    """
+    Pages d'un fichier envoyé: PDF (une image par page), archive zip d'images, ou image seule
+
+    Args:
+        file: Fichier ouvert en lecture (positionnable)
+        filename: Nom du fichier envoyé (nom des pages d'un PDF)
+        max_size: Taille maximale d'une image (les plus grosses sont ignorées)
+        max_pages: Nombre maximal de pages lues
+
+    Raises:
+        ValueError: Si le PDF ne peut pas être lu (pypdfium2 absent)
+    """
+    head = file.read(len(PDF_SIGNATURE))
+    file.seek(0)
+    if head == PDF_SIGNATURE:
+        return _iter_pdf(file, max_pages, config.INGEST_PDF_DPI, filename or "document.pdf")
+    if zipfile.is_zipfile(file):
+        file.seek(0)
+        return _limit(_iter_zip(file, max_size), max_pages)
+    file.seek(0)
+    return iter([SourceImage(filename or "image", file.read(max_size + 1))])
+
+
+def _limit(images: Iterator[SourceImage], max_pages: int) -> Iterator[SourceImage]:
+    for index, image in enumerate(images):
+        if index >= max_pages:
+            return
+        yield image
+
+
+def _iter_pdf(source: Union[Path, BinaryIO], max_pages: int, dpi: int, name: str = "") -> Iterator[SourceImage]:
+    if pdfium is None:
+        raise ValueError("Lecture des PDF impossible: installez pypdfium2 et Pillow.")
+    try:
+        document = pdfium.PdfDocument(source)
+    except pdfium.PdfiumError as e:
+        raise ValueError(f"PDF illisible: {str(e)}")
+    return _render_pages(document, max_pages, dpi, name or Path(str(source)).name)
+
+
+def _render_pages(document, max_pages: int, dpi: int, name: str) -> Iterator[SourceImage]:
+    # Une seule page rendue à la fois: la mémoire ne dépend pas du nombre de pages
+    try:
+        for index in range(min(len(document), max_pages)):
+            page = document[index]
+            try:
+                bitmap = page.render(scale=dpi / 72, grayscale=True)
+                buffer = io.BytesIO()
+                bitmap.to_pil().save(buffer, format="JPEG", quality=90)
+                bitmap.close()
+            finally:
+                page.close()
+            yield SourceImage(f"{name}#page={index + 1}", buffer.getvalue())
+    finally:
+        document.close()
+
+
+def _iter_directory(path: Path, max_size: int) -> Iterator[SourceImage]:
+    for file in sorted(p for p in path.rglob("*") if p.is_file()):
+        name = file.relative_to(path).as_posix()
+        if is_image_name(name) and file.stat().st_size <= max_size:
+            yield SourceImage(name, file.read_bytes())
+
+
+def _iter_zip(path: Union[Path, BinaryIO], max_size: int) -> Iterator[SourceImage]:
+    with zipfile.ZipFile(path) as archive:
+        for info in archive.infolist():
+            if not info.is_dir() and is_image_name(info.filename) and info.file_size <= max_size:
+                yield SourceImage(info.filename, archive.read(info))
+
+
+def _iter_tar(path: Path, max_size: int) -> Iterator[SourceImage]:
+    # Lecture en flux: l'archive n'est parcourue qu'une fois
+    with tarfile.open(path, mode="r|*") as archive:
+        for member in archive:
+            if member.isfile() and is_image_name(member.name) and member.size <= max_size:
+                yield SourceImage(member.name, archive.extractfile(member).read())
@@ -0,0 +1,178 @@
+"""
+Parseur JSON incrémental pour les réponses LLM
+Émet chaque étape complète dès qu'elle est reçue dans le flux
+"""
+import json
+import re
+from typing import Dict, List, Optional
+
+# Clé du tableau d'étapes dans l'objet racine: {"steps": [ ... ]}
+_STEPS_KEY_PATTERN = re.compile(r'"steps"\s*:\s*$')
+# Premier caractère significatif après un '[' hors du JSON
+_NEXT_TOKEN_PATTERN = re.compile(r'\S')
+
+
+class StepStreamParser:
+    """
+    Parse un flux JSON de la forme {"steps": [{...}, {...}]} (ou [{...}, ...])
+    morceau par morceau et retourne chaque objet étape dès qu'il est complet.
+
+    Le texte avant le JSON (ex: ```json) est ignoré, ce qui rend le parseur
+    tolérant aux réponses formatées en markdown. Hors du JSON, un '[' n'ouvre
+    le tableau racine que s'il est suivi d'un '{' (un intervalle "[0, 1]"
+    dans le texte d'introduction n'est pas pris pour les étapes).
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._steps_depth: Optional[int] = None
+        self._step_start: Optional[int] = None
+        self._closed = False
+        self.steps: List[Dict] = []
+
+    @property
+    def complete(self) -> bool:
+        """True si le tableau d'étapes a été entièrement reçu"""
+        return self._closed
+
+    def feed(self, chunk: str) -> List[Dict]:
+        """
+        Ajoute un morceau de texte au flux
+
+        Args:
+            chunk: Texte reçu du LLM
+
+        Returns:
+            Liste des nouvelles étapes complètes (peut être vide)
+        """
+        if not chunk or self._closed:
+            return []
+
+        self._buffer += chunk
+        new_steps = []
+        buffer = self._buffer
+
+        while self._pos < len(buffer):
+            char = buffer[self._pos]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                if self._depth > 0:
+                    self._in_string = True
+            elif char == '[' and self._depth == 0:
+                # Tableau racine seulement si un objet suit: sinon crochet du texte d'introduction
+                following = _NEXT_TOKEN_PATTERN.search(buffer, self._pos + 1)
+                if following is None:
+                    break  # Décision au prochain morceau
+                if following.group(0) == '{':
+                    self._depth = 1
+                    self._steps_depth = 1
+            elif char in '{[':
+                self._depth += 1
+                if self._steps_depth is None and char == '[' and self._is_steps_array():
+                    self._steps_depth = self._depth
+                elif self._steps_depth is not None and char == '{' and self._depth == self._steps_depth + 1:
+                    self._step_start = self._pos
+            elif char in '}]' and self._depth > 0:
+                if (
+                    char == '}'
+                    and self._step_start is not None
+                    and self._depth == self._steps_depth + 1
+                ):
+                    step = self._decode(buffer[self._step_start:self._pos + 1])
+                    if step is not None:
+                        self.steps.append(step)
+                        new_steps.append(step)
+                    self._step_start = None
+                elif char == ']' and self._depth == self._steps_depth:
+                    self._closed = True
+                    self._pos += 1
+                    break
+                self._depth -= 1
+
+            self._pos += 1
+
+        return new_steps
+
+    def finish(self) -> List[Dict]:
+        """
+        Termine le flux
+        Si aucune étape n'a pu être extraite au fil de l'eau (réponse non
+        structurée), tente un parsing tolérant du texte complet.
+
+        Returns:
+            Liste des étapes supplémentaires obtenues par le fallback
+        """
+        if self.steps:
+            return []
+
+        fallback_steps = parse_steps_payload(self._buffer)
+        if not fallback_steps:
+            return []
+
+        self.steps = list(fallback_steps)
+        self._closed = True
+        return self.steps
+
+    def _is_steps_array(self) -> bool:
+        """Détermine si le '[' courant ouvre le tableau "steps" de l'objet racine"""
+        if self._depth == 2:
+            return bool(_STEPS_KEY_PATTERN.search(self._buffer[max(0, self._pos - 64):self._pos]))
+        return False
+
+    @staticmethod
+    def _decode(fragment: str) -> Optional[Dict]:
+        try:
+            step = json.loads(fragment)
+        except json.JSONDecodeError:
+            return None
+        return step if isinstance(step, dict) else None
+
+
+def parse_steps_payload(content: str) -> Optional[List[Dict]]:
+    """
+    Parse une réponse LLM complète contenant des étapes
+    Fallback pour les réponses non structurées (markdown, texte autour du JSON)
+
+    Args:
+        content: Texte complet retourné par le LLM
+
+    Returns:
+        Liste des étapes ou None si le contenu est inexploitable
+    """
+    if not content:
+        return None
+
+    # Nettoie le contenu (enlève les markdown code blocks si présents)
+    if "```json" in content:
+        content = content.split("```json")[1].split("```")[0]
+    elif "```" in content:
+        content = content.split("```")[1].split("```")[0]
+
+    try:
+        result = json.loads(content.strip())
+    except json.JSONDecodeError:
+        # Essaie d'extraire un JSON valide même s'il y a du texte autour
+        json_match = re.search(r'\{.*\}', content, re.DOTALL)
+        if not json_match:
+            return None
+        try:
+            result = json.loads(json_match.group(0))
+        except json.JSONDecodeError:
+            return None
+
+    if isinstance(result, dict) and "steps" in result:
+        return result["steps"]
+    if isinstance(result, list):
+        return result
+    return None
@@ -0,0 +1,159 @@
+"""
+Pipeline de logs non bloquant
+Les handlers ne font que déposer les records dans une file: le formatage
+(JSON structuré ou texte) et l'écriture sont faits par un thread dédié.
+Les logs INFO/DEBUG d'une requête sont échantillonnés par route; les
+avertissements, erreurs, requêtes en erreur ou lentes sont toujours conservés.
+"""
+import contextvars
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import time
+from typing import Dict, Optional
+
+from app.config import config
+from app.utils.tracing import tracer
+
+# Décision d'échantillonnage de la requête courante (None hors requête)
+_request_sampled: contextvars.ContextVar[Optional[bool]] = contextvars.ContextVar("request_sampled", default=None)
+
+# Attributs standards d'un LogRecord (les autres sont des champs "extra")
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+access_logger = logging.getLogger("app.access")
+
+
+class JSONFormatter(logging.Formatter):
+    """Formate un record en une ligne JSON (champs extra inclus)"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created))
+            + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler qui ne formate pas le message dans le thread appelant
+    (QueueHandler.prepare formate le record avant de le mettre en file)
+    Les records sont abandonnés si la file est pleine plutôt que de bloquer.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Contexte de la requête, lu dans le thread appelant
+        span = tracer.current_span()
+        if span is not None and "trace_id" not in record.__dict__:
+            record.trace_id = span.trace_id
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class RequestSamplingFilter(logging.Filter):
+    """Écarte les records INFO/DEBUG des requêtes non échantillonnées"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or getattr(record, "_force", False):
+            return True
+        return _request_sampled.get() is not False
+
+
+def parse_sample_rates(spec: str) -> Dict[str, float]:
+    """Parse "/api/latex=0.1,/api/analyze=0.5" en taux d'échantillonnage par route"""
+    rates = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        route, rate = item.rsplit("=", 1)
+        rates[route.strip()] = min(max(float(rate), 0.0), 1.0)
+    return rates
+
+
+class LoggingPipeline:
+    """Configure les handlers et démarre le thread d'écriture des logs"""
+
+    def __init__(self):
+        self.sample_rates = parse_sample_rates(config.LOG_SAMPLE_RATES)
+        self.slow_request_ms = config.LOG_SLOW_REQUEST_MS
+        self.queue: queue.Queue = queue.Queue(maxsize=config.LOG_QUEUE_SIZE)
+        self.handler: Optional[DeferredQueueHandler] = None
+        self.listener: Optional[logging.handlers.QueueListener] = None
+
+    def configure(self, level: int = logging.INFO, log_format: str = "json"):
+        """Remplace les handlers du logger racine par la file (idempotent)"""
+        if self.listener is not None:
+            return
+
+        output = logging.StreamHandler(sys.stderr)
+        if log_format == "json":
+            output.setFormatter(JSONFormatter())
+        else:
+            output.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+
+        self.handler = DeferredQueueHandler(self.queue)
+        self.handler.addFilter(RequestSamplingFilter())
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(self.handler)
+        root.setLevel(level)
+
+        self.listener = logging.handlers.QueueListener(self.queue, output, respect_handler_level=True)
+        self.listener.start()
+
+    def shutdown(self):
+        """Vide la file et arrête le thread d'écriture"""
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+
+    def start_request(self, path: str) -> contextvars.Token:
+        """Tire la décision d'échantillonnage des logs de la requête"""
+        rate = self.sample_rates.get(path, self.sample_rates.get("*", 1.0))
+        return _request_sampled.set(rate >= 1.0 or random.random() < rate)
+
+    def end_request(self, token: contextvars.Token):
+        _request_sampled.reset(token)
+
+    def log_access(self, method: str, path: str, status: int, duration_ms: float):
+        """
+        Record d'accès structuré de la requête, avec la durée de chaque étape
+        Toujours conservé si la requête est en erreur ou lente.
+        """
+        sampled = _request_sampled.get() is not False
+        if not sampled and status < 400 and duration_ms < self.slow_request_ms:
+            return
+        span = tracer.current_span()
+        level = logging.WARNING if status >= 500 else logging.INFO
+        access_logger.log(level, "%s %s %s %.0fms", method, path, status, duration_ms, extra={
+            "http": {"method": method, "path": path, "status": status},
+            "duration_ms": round(duration_ms, 1),
+            "stages_ms": tracer.stage_timings(span) if span is not None else {},
+            "sampled": sampled,
+            "_force": True,
+        })
+
+
+# Instance globale
+logging_pipeline = LoggingPipeline()
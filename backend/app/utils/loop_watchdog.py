@@ -0,0 +1,200 @@
+"""
+Surveillance de la boucle d'événements
+Mesure en continu le retard de la boucle (lag) et capture la pile de tout
+callback qui la bloque au-delà d'un seuil, avec la route concernée.
+Un appel synchrone (httpx, SDK, calcul lourd) dans un handler async est
+ainsi signalé dès qu'il ralentit toutes les autres requêtes du worker.
+"""
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+from typing import Deque, Dict, List, Optional
+
+from app.config import config
+
+logger = logging.getLogger(__name__)
+
+
+class LoopWatchdog:
+    """
+    Watchdog de la boucle d'événements
+    Une tâche asyncio émet un battement toutes les 'interval' secondes; un
+    thread de surveillance détecte les battements en retard et relève alors
+    la pile du thread de la boucle, c'est-à-dire le code qui la bloque.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.1,
+        interval: float = 0.05,
+        max_reports: int = 50
+    ):
+        self.threshold = threshold
+        self.interval = interval
+        self.reports: Deque[Dict] = deque(maxlen=max_reports)
+        self._lags: Deque[float] = deque(maxlen=2000)
+        self._max_lag = 0.0
+        self._blocked_by_route: Counter = Counter()
+        self._logged_signatures: Counter = Counter()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._monitor_thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._last_beat = 0.0
+        self._beat_seq = 0
+        self._captured_seq = -1
+        self._pending_report: Optional[Dict] = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._heartbeat_task is not None and not self._heartbeat_task.done()
+
+    def start(self):
+        """Démarre la surveillance de la boucle courante (à appeler depuis la boucle)"""
+        if self.running:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stop.clear()
+        self._heartbeat_task = self._loop.create_task(self._heartbeat(self._loop.time()))
+        self._monitor_thread = threading.Thread(target=self._monitor, name="loop-watchdog", daemon=True)
+        self._monitor_thread.start()
+        logger.info(
+            f"Surveillance de la boucle d'événements active (seuil: {self.threshold * 1000:.0f}ms)"
+        )
+
+    def stop(self):
+        self._stop.set()
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            self._heartbeat_task = None
+
+    async def _heartbeat(self, previous: float):
+        # Retard mesuré depuis le battement précédent (le premier depuis start()):
+        # un blocage survenu avant le premier passage de la tâche est compté aussi
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.interval)
+            now = loop.time()
+            lag = max(now - previous - self.interval, 0.0)
+            previous = now
+            with self._lock:
+                self._last_beat = time.monotonic()
+                self._beat_seq += 1
+                self._lags.append(lag)
+                self._max_lag = max(self._max_lag, lag)
+                report, self._pending_report = self._pending_report, None
+            if report is not None:
+                # Fin du blocage: durée totale connue
+                report["blocked_ms"] = round(lag * 1000, 1)
+                self._log_report(report)
+
+    def _monitor(self):
+        poll = min(self.interval, self.threshold) / 2
+        while not self._stop.wait(poll):
+            with self._lock:
+                stalled = time.monotonic() - self._last_beat - self.interval
+                if stalled < self.threshold or self._captured_seq == self._beat_seq:
+                    continue
+                self._captured_seq = self._beat_seq
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            report = {
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "route": _route_of(frame) or "hors requête",
+                "detected_after_ms": round(stalled * 1000, 1),
+                "blocked_ms": None,
+                "stack": _format_stack(frame),
+            }
+            del frame
+            with self._lock:
+                self.reports.append(report)
+                self._blocked_by_route[report["route"]] += 1
+                self._pending_report = report
+
+    def _log_report(self, report: Dict):
+        # Pile complète la première fois, puis une ligne par occurrence
+        signature = (report["route"], report["stack"][-1] if report["stack"] else "")
+        self._logged_signatures[signature] += 1
+        occurrences = self._logged_signatures[signature]
+        message = (
+            f"Boucle d'événements bloquée {report['blocked_ms']:.0f}ms par {report['route']}"
+            f" (occurrence {occurrences})"
+        )
+        if occurrences == 1:
+            message += ":\n" + "\n".join(report["stack"])
+        else:
+            message += f" - {signature[1]}"
+        logger.warning(message)
+
+    def stats(self) -> Dict:
+        """Statistiques de retard de la boucle et derniers blocages détectés"""
+        with self._lock:
+            lags = sorted(self._lags)
+            reports = list(self.reports)
+            blocked_by_route = dict(self._blocked_by_route)
+            max_lag = self._max_lag
+
+        def percentile(fraction: float) -> float:
+            if not lags:
+                return 0.0
+            return round(lags[min(len(lags) - 1, int(fraction * len(lags)))] * 1000, 2)
+
+        return {
+            "running": self.running,
+            "threshold_ms": self.threshold * 1000,
+            "lag_ms": {
+                "p50": percentile(0.50),
+                "p99": percentile(0.99),
+                "max": round(max_lag * 1000, 2),
+                "samples": len(lags),
+            },
+            "blocked_by_route": blocked_by_route,
+            "reports": reports,
+        }
+
+    def reset(self):
+        """Efface mesures et rapports (ex: entre deux tests)"""
+        with self._lock:
+            self.reports.clear()
+            self._lags.clear()
+            self._max_lag = 0.0
+            self._blocked_by_route.clear()
+            self._logged_signatures.clear()
+
+
+def _route_of(frame) -> Optional[str]:
+    """Route HTTP en cours d'exécution, retrouvée dans le scope ASGI de la pile"""
+    while frame is not None:
+        scope = frame.f_locals.get("scope")
+        if isinstance(scope, dict) and scope.get("type") == "http":
+            route = scope.get("route")
+            path = getattr(route, "path", None) or scope.get("path", "")
+            return f"{scope.get('method', '')} {path}"
+        frame = frame.f_back
+    return None
+
+
+def _format_stack(frame, limit: int = 25) -> List[str]:
+    """Pile de la frame (les 'limit' frames les plus profondes), de la racine vers la feuille"""
+    summary = traceback.extract_stack(frame)[-limit:]
+    return [
+        f"  {entry.filename}:{entry.lineno} in {entry.name}"
+        + (f"\n    {entry.line}" if entry.line else "")
+        for entry in summary
+    ]
+
+
+# Instance globale
+loop_watchdog = LoopWatchdog(
+    threshold=config.LOOP_WATCHDOG_THRESHOLD_MS / 1000,
+    interval=config.LOOP_WATCHDOG_INTERVAL_MS / 1000
+)
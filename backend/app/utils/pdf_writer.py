@@ -0,0 +1,109 @@
+"""
+Écriture incrémentale de documents PDF (PDF 1.4, polices standard)
+Chaque objet est écrit dès qu'il est prêt et les octets produits sont
+récupérés au fil de l'eau (drain): une page peut être envoyée au client
+avant que les suivantes ne soient composées. Seuls l'arbre des pages et la
+table des références croisées sont écrits à la fin.
+"""
+import zlib
+from typing import Dict, List, Optional
+
+
+def pdf_string(data: bytes) -> bytes:
+    """Chaîne littérale PDF (parenthèses et barres obliques échappées)"""
+    return b"(" + data.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)").replace(b"\r", b"\\r") + b")"
+
+
+def pdf_number(value: float) -> bytes:
+    """Nombre PDF compact (2 décimales au plus)"""
+    text = f"{value:.2f}".rstrip("0").rstrip(".")
+    return (text if text not in ("", "-0") else "0").encode("ascii")
+
+
+class PDFWriter:
+    """
+    Document PDF écrit objet par objet
+
+    Args:
+        compress: Compresse les flux de contenu (FlateDecode)
+    """
+
+    def __init__(self, compress: bool = True):
+        self.compress = compress
+        self._pending: List[bytes] = []
+        self._offset = 0
+        self._offsets: Dict[int, int] = {}
+        self._next_number = 1
+        self._page_numbers: List[int] = []
+        self._write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        # Racine de l'arbre des pages: référencée par chaque page, écrite à la fin
+        self.pages_number = self.reserve()
+
+    @property
+    def page_count(self) -> int:
+        return len(self._page_numbers)
+
+    def _write(self, data: bytes):
+        self._pending.append(data)
+        self._offset += len(data)
+
+    def reserve(self) -> int:
+        """Réserve un numéro d'objet (pour une référence avant écriture)"""
+        number = self._next_number
+        self._next_number += 1
+        return number
+
+    def write_object(self, body: bytes, number: Optional[int] = None) -> int:
+        """Écrit un objet (numéro réservé ou nouveau) et retourne son numéro"""
+        if number is None:
+            number = self.reserve()
+        self._offsets[number] = self._offset
+        self._write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+        return number
+
+    def write_stream(self, content: bytes, dictionary: bytes = b"", number: Optional[int] = None) -> int:
+        """Écrit un flux (contenu de page, XObject de formulaire)"""
+        if self.compress:
+            content = zlib.compress(content, 6)
+            dictionary += b" /Filter /FlateDecode"
+        return self.write_object(
+            b"<< " + dictionary + b" /Length %d >>\nstream\n" % len(content) + content + b"\nendstream",
+            number
+        )
+
+    def add_page(self, content: bytes, resources: bytes, width: float, height: float) -> int:
+        """Écrit une page (flux de contenu et dictionnaire de ressources)"""
+        content_number = self.write_stream(content)
+        page_number = self.write_object(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %s %s] /Resources %s /Contents %d 0 R >>"
+            % (self.pages_number, pdf_number(width), pdf_number(height), resources, content_number)
+        )
+        self._page_numbers.append(page_number)
+        return page_number
+
+    def close(self, title: str = "") -> None:
+        """Écrit l'arbre des pages, le catalogue et la table des références croisées"""
+        kids = b" ".join(b"%d 0 R" % number for number in self._page_numbers)
+        self.write_object(
+            b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(self._page_numbers)),
+            self.pages_number
+        )
+        catalog = self.write_object(b"<< /Type /Catalog /Pages %d 0 R >>" % self.pages_number)
+        info = self.write_object(
+            b"<< /Producer (Math Assistant) /Title %s >>" % pdf_string(title.encode("cp1252", "replace"))
+        )
+        xref_offset = self._offset
+        entries = [b"0000000000 65535 f \n"]
+        for number in range(1, self._next_number):
+            entries.append(b"%010d 00000 n \n" % self._offsets.get(number, 0))
+        self._write(b"xref\n0 %d\n" % self._next_number + b"".join(entries))
+        self._write(
+            b"trailer\n<< /Size %d /Root %d 0 R /Info %d 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+            % (self._next_number, catalog, info, xref_offset)
+        )
+
+    def drain(self) -> bytes:
+        """Octets écrits depuis le dernier appel"""
+        data = b"".join(self._pending)
+        self._pending.clear()
+        return data
@@ -0,0 +1,248 @@
+"""
+Profilage du service en production
+- Profileur par échantillonnage: relève périodiquement la pile de tous les
+  threads du worker (coût négligeable, aucun hook dans le code profilé)
+- Profileur déterministe: chronomètre chaque appel d'une seule requête
+Les deux produisent des piles "collapsed" (une ligne "f1;f2;f3 poids" par pile),
+lisibles par flamegraph.pl, speedscope ou inferno.
+"""
+import contextlib
+import contextvars
+import os
+import sys
+import sysconfig
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from typing import Dict, Iterator, Optional, Tuple
+
+# Préfixes retirés des chemins de fichiers dans les noms de frames
+_BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_PATH_PREFIXES = sorted(
+    {os.path.join(_BACKEND_DIR, ""), os.path.join(sysconfig.get_paths()["stdlib"], "")}
+    | {os.path.join(path, "") for path in sys.path if path.endswith("-packages")},
+    key=len,
+    reverse=True
+)
+
+_label_cache: Dict[object, str] = {}
+
+# Profileur déterministe de la requête courante (par contexte asyncio)
+_request_profiler: contextvars.ContextVar[Optional["RequestProfiler"]] = contextvars.ContextVar(
+    "request_profiler", default=None
+)
+
+
+def _frame_label(code) -> str:
+    """Nom lisible d'une frame: 'fonction (fichier:ligne)'"""
+    label = _label_cache.get(code)
+    if label is None:
+        filename = code.co_filename
+        for prefix in _PATH_PREFIXES:
+            if filename.startswith(prefix):
+                filename = filename[len(prefix):]
+                break
+        name = getattr(code, "co_qualname", code.co_name)
+        # ';' sépare les frames dans le format collapsed
+        label = f"{name} ({filename}:{code.co_firstlineno})".replace(";", ",")
+        _label_cache[code] = label
+    return label
+
+
+def _stack_of(frame) -> Tuple[str, ...]:
+    """Pile d'appels d'une frame, de la racine vers la feuille"""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    labels.reverse()
+    return tuple(labels)
+
+
+def to_collapsed(stacks: Dict[Tuple[str, ...], int]) -> str:
+    """Sérialise des piles pondérées au format collapsed (poids décroissants)"""
+    lines = [
+        f"{';'.join(stack)} {weight}"
+        for stack, weight in sorted(stacks.items(), key=lambda item: item[1], reverse=True)
+        if weight > 0
+    ]
+    return "\n".join(lines) + "\n" if lines else ""
+
+
+class SamplingProfiler:
+    """
+    Profileur par échantillonnage de toutes les piles du processus
+    Un seul profilage à la fois par worker.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    def profile(self, seconds: float, interval: float = 0.005) -> Dict[str, object]:
+        """
+        Échantillonne les piles de tous les threads pendant 'seconds'
+        (bloquant: à exécuter hors de la boucle d'événements)
+
+        Args:
+            seconds: Durée du profilage
+            interval: Intervalle entre deux échantillons en secondes
+
+        Returns:
+            Dict avec 'collapsed' (texte), 'samples' et 'duration'
+
+        Raises:
+            RuntimeError: Si un profilage est déjà en cours
+        """
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("Un profilage est déjà en cours sur ce worker")
+        try:
+            own_thread = threading.get_ident()
+            stacks: Counter = Counter()
+            samples = 0
+            start = time.perf_counter()
+            deadline = start + seconds
+            while time.perf_counter() < deadline:
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == own_thread:
+                        continue
+                    thread_name = names.get(thread_id, str(thread_id)).replace(" ", "_")
+                    stacks[(f"thread:{thread_name}",) + _stack_of(frame)] += 1
+                samples += 1
+                time.sleep(interval)
+            return {
+                "collapsed": to_collapsed(stacks),
+                "samples": samples,
+                "duration": round(time.perf_counter() - start, 3),
+            }
+        finally:
+            self._lock.release()
+
+
+class RequestProfiler:
+    """
+    Profileur déterministe d'une requête (sys.setprofile)
+    Le temps entre deux événements d'appel/retour est attribué à la pile
+    courante, en microsecondes. Seuls les événements survenant dans le
+    contexte de la requête profilée sont comptés: les autres requêtes
+    servies pendant ce temps par la même boucle d'événements sont ignorées.
+    Le travail délégué au pool de threads est couvert via profile_thread().
+    """
+
+    def __init__(self, owner: Optional["RequestProfiler"] = None):
+        self.stacks: Counter = Counter()
+        # Profileur de la requête (lui-même, ou le parent pour un thread rattaché)
+        self._owner = owner or self
+        self._last_stack: Optional[Tuple[str, ...]] = None
+        self._last_time = 0
+        self._previous_profiler = None
+        self._token = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        self._token = _request_profiler.set(self)
+        self._previous_profiler = sys.getprofile()
+        self._last_time = time.perf_counter_ns()
+        sys.setprofile(self._callback)
+
+    def stop(self) -> str:
+        """Arrête le profilage et retourne les piles au format collapsed"""
+        sys.setprofile(self._previous_profiler)
+        self._account(time.perf_counter_ns())
+        if self._token is not None:
+            _request_profiler.reset(self._token)
+        with self._lock:
+            stacks = dict(self.stacks)
+        return to_collapsed({stack: weight // 1000 for stack, weight in stacks.items()})
+
+    @contextlib.contextmanager
+    def attach_thread(self) -> Iterator[None]:
+        """Profile aussi le thread courant (calcul délégué par la requête à un pool de threads)"""
+        child = RequestProfiler(owner=self)
+        child._previous_profiler = sys.getprofile()
+        child._last_time = time.perf_counter_ns()
+        sys.setprofile(child._callback)
+        try:
+            yield
+        finally:
+            sys.setprofile(child._previous_profiler)
+            child._account(time.perf_counter_ns())
+            with self._lock:
+                self.stacks.update(child.stacks)
+
+    def _account(self, now: int):
+        if self._last_stack is not None:
+            self.stacks[self._last_stack] += now - self._last_time
+        self._last_time = now
+
+    def _callback(self, frame, event, arg):
+        self._account(time.perf_counter_ns())
+        if _request_profiler.get() is not self._owner:
+            self._last_stack = None
+            return
+        stack = _stack_of(frame)
+        if event == "c_call":
+            stack = stack + (f"{getattr(arg, '__qualname__', repr(arg))} (builtin)",)
+        elif event == "return":
+            stack = stack[:-1]
+        self._last_stack = stack
+        # Exclut le coût du callback lui-même
+        self._last_time = time.perf_counter_ns()
+
+
+def profile_thread():
+    """
+    Rattache le thread courant au profilage de la requête en cours, s'il y en a un
+    (à utiliser dans les fonctions exécutées par run_in_threadpool)
+    """
+    profiler = _request_profiler.get()
+    if profiler is None:
+        return contextlib.nullcontext()
+    return profiler.attach_thread()
+
+
+class RequestProfilerSlot:
+    """Un seul profilage déterministe à la fois par worker (sys.setprofile est global au thread)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def acquire(self) -> Optional[RequestProfiler]:
+        if not self._lock.acquire(blocking=False):
+            return None
+        return RequestProfiler()
+
+    def release(self):
+        self._lock.release()
+
+
+class ProfileStore:
+    """Derniers profils de requêtes, consultables par identifiant"""
+
+    def __init__(self, max_entries: int = 20):
+        self.max_entries = max_entries
+        self._profiles: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, collapsed: str) -> str:
+        profile_id = uuid.uuid4().hex
+        with self._lock:
+            self._profiles[profile_id] = collapsed
+            while len(self._profiles) > self.max_entries:
+                self._profiles.popitem(last=False)
+        return profile_id
+
+    def get(self, profile_id: str) -> Optional[str]:
+        with self._lock:
+            return self._profiles.get(profile_id)
+
+
+# Instances globales
+sampling_profiler = SamplingProfiler()
+request_profiler_slot = RequestProfilerSlot()
+profile_store = ProfileStore()
@@ -0,0 +1,36 @@
+"""
+Limitation de débit côté client (respect des quotas des APIs externes)
+"""
+import asyncio
+import threading
+import time
+
+
+class RateLimiter:
+    """
+    Espace les démarrages d'opérations: au plus 'rate' par seconde (0: illimité)
+    Utilisable depuis des threads (acquire) ou des coroutines (wait).
+    """
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """Réserve le prochain créneau et retourne l'attente nécessaire en secondes"""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next, now)
+            self._next = slot + self.interval
+        return slot - now
+
+    def acquire(self):
+        """Attend son créneau (bloquant)"""
+        if self.interval:
+            time.sleep(self._reserve())
+
+    async def wait(self):
+        """Attend son créneau sans bloquer la boucle d'événements"""
+        if self.interval:
+            await asyncio.sleep(self._reserve())
@@ -0,0 +1,35 @@
+"""
+Réponses JSON rapides
+Sérialisation avec orjson s'il est installé (sinon json de la bibliothèque
+standard); les modèles Pydantic sont sérialisés directement en JSON par
+pydantic-core, sans passer par des dicts intermédiaires.
+"""
+import json
+from typing import Any
+
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - dépendance optionnelle
+    orjson = None
+
+
+def dumps(content: Any) -> bytes:
+    """Sérialise un contenu (dict, liste, modèle Pydantic) en JSON UTF-8"""
+    if isinstance(content, BaseModel):
+        return content.__pydantic_serializer__.to_json(content)
+    if orjson is not None:
+        try:
+            return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            pass  # Type non supporté par orjson: sérialisation standard
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse sérialisée avec orjson ou pydantic-core"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -0,0 +1,168 @@
+"""
+Segmentation d'une page en régions d'équations
+Analyse par projections (découpage X-Y) sur une version réduite de l'image:
+l'encre est isolée par un seuil adaptatif (écart à la moyenne locale, robuste
+aux photos mal éclairées), les lignes sont séparées par les bandes
+horizontales sans encre, puis chaque ligne est coupée aux grands espaces
+verticaux (exercices sur plusieurs colonnes). Les écarts courts (barres de
+fraction, exposants) ne coupent pas une équation.
+Les projections sont calculées par Pillow (redimensionnement en moyenne),
+sans parcours des pixels en Python. Pillow fait partie de requirements.txt;
+s'il manque, aucune région n'est trouvée et la page est traitée comme une
+seule équation (avertissement au démarrage).
+"""
+import io
+import logging
+from dataclasses import dataclass
+from statistics import median
+from typing import List, Tuple
+
+logger = logging.getLogger(__name__)
+
+try:
+    from PIL import Image, ImageChops, ImageFilter, ImageOps
+except ImportError:  # pragma: no cover - installé avec requirements.txt
+    Image = None
+    logger.warning("Pillow non installé: les pages ne sont pas découpées en équations (pip install -r requirements.txt)")
+
+# Largeur de l'image d'analyse (pixels)
+ANALYSIS_WIDTH = 800
+# Écart minimal à la moyenne locale pour un pixel d'encre (0-255)
+INK_CONTRAST = 24
+# Pixels d'encre minimum pour qu'une ligne ou colonne de l'analyse compte
+MIN_INK_PIXELS = 2
+# Écart vertical qui sépare deux équations (fraction de la hauteur de ligne médiane)
+ROW_GAP_RATIO = 0.5
+# Écart horizontal qui sépare deux équations d'une même ligne (multiple de sa hauteur)
+COLUMN_GAP_RATIO = 2.5
+# Hauteur minimale d'une région (pixels d'analyse): en dessous, bruit ou poussière
+MIN_REGION_HEIGHT = 5
+# Marge autour de chaque région découpée (fraction de sa hauteur)
+PADDING_RATIO = 0.15
+
+Span = Tuple[int, int]
+
+
+@dataclass
+class Region:
+    """Région d'équation: position dans l'image d'origine et image découpée (PNG)"""
+    index: int
+    box: Tuple[int, int, int, int]  # x, y, largeur, hauteur
+    data: bytes
+
+
+def segmentation_available() -> bool:
+    """Pillow installé (sinon la page est traitée comme une seule équation)"""
+    return Image is not None
+
+
+def _spans(profile: List[int], min_gap: int) -> List[Span]:
+    """Suites d'indices avec encre, fusionnées si l'écart qui les sépare est inférieur à min_gap"""
+    spans: List[Span] = []
+    start = None
+    for index, ink in enumerate(profile + [0]):
+        if ink >= MIN_INK_PIXELS and start is None:
+            start = index
+        elif ink < MIN_INK_PIXELS and start is not None:
+            if spans and start - spans[-1][1] < min_gap:
+                spans[-1] = (spans[-1][0], index)
+            else:
+                spans.append((start, index))
+            start = None
+    return spans
+
+
+def _row_profile(mask) -> List[int]:
+    """Pixels d'encre par ligne (moyenne calculée par Pillow)"""
+    width = mask.width
+    return [round(value * width / 255) for value in mask.resize((1, mask.height), Image.BOX).getdata()]
+
+
+def _column_profile(mask) -> List[int]:
+    """Pixels d'encre par colonne"""
+    height = mask.height
+    return [round(value * height / 255) for value in mask.resize((mask.width, 1), Image.BOX).getdata()]
+
+
+def _ink_mask(gray):
+    """Masque de l'encre (255) par seuil adaptatif: plus sombre que la moyenne locale"""
+    background = gray.filter(ImageFilter.BoxBlur(max(gray.width // 40, 4)))
+    contrast = ImageChops.subtract(background, gray)
+    mask = contrast.point(lambda value: 255 if value > INK_CONTRAST else 0)
+    # Points isolés (grain du papier, bruit du capteur) supprimés
+    return mask.filter(ImageFilter.MedianFilter(3))
+
+
+def _boxes(mask) -> List[Tuple[int, int, int, int]]:
+    """Boîtes (x0, y0, x1, y1) des équations du masque, dans l'ordre de lecture"""
+    profile = _row_profile(mask)
+    rows = _spans(profile, 1)
+    if not rows:
+        return []
+    # Lignes séparées par un écart assez grand devant la hauteur de ligne
+    line_height = median(end - start for start, end in rows)
+    rows = _spans(profile, max(2, round(line_height * ROW_GAP_RATIO)))
+
+    boxes = []
+    for top, bottom in rows:
+        band = mask.crop((0, top, mask.width, bottom))
+        for left, right in _spans(_column_profile(band), max(4, round((bottom - top) * COLUMN_GAP_RATIO))):
+            # Hauteur réelle de la partie de ligne (l'autre colonne peut être plus haute)
+            piece_rows = _spans(_row_profile(band.crop((left, 0, right, band.height))), band.height)
+            if not piece_rows:
+                continue
+            piece_top, piece_bottom = piece_rows[0][0] + top, piece_rows[-1][1] + top
+            if piece_bottom - piece_top >= MIN_REGION_HEIGHT:
+                boxes.append((left, piece_top, right, piece_bottom))
+    return boxes
+
+
+def _open(image_bytes: bytes):
+    image = ImageOps.exif_transpose(Image.open(io.BytesIO(image_bytes)))
+    if image.mode in ("RGBA", "LA", "P"):
+        # Fond transparent: composé sur du blanc (sinon il deviendrait noir)
+        image = image.convert("RGBA")
+        background = Image.new("RGBA", image.size, (255, 255, 255, 255))
+        image = Image.alpha_composite(background, image)
+    return image.convert("RGB")
+
+
+def segment_equations(image_bytes: bytes, max_regions: int = 20) -> List[Region]:
+    """
+    Découpe une page en régions d'équations, dans l'ordre de lecture
+
+    Args:
+        image_bytes: Image de la page
+        max_regions: Nombre maximal de régions (les premières dans l'ordre de lecture)
+
+    Returns:
+        Régions découpées; liste vide si Pillow est absent ou l'image illisible
+    """
+    if Image is None:
+        return []
+    try:
+        image = _open(image_bytes)
+    except Exception as e:
+        logger.warning(f"Segmentation impossible, image illisible: {str(e)}")
+        return []
+
+    scale = min(1.0, ANALYSIS_WIDTH / image.width)
+    gray = ImageOps.grayscale(image)
+    if scale < 1.0:
+        gray = gray.resize((round(image.width * scale), max(1, round(image.height * scale))), Image.BILINEAR)
+    boxes = _boxes(_ink_mask(gray))
+    if len(boxes) > max_regions:
+        logger.info(f"{len(boxes)} régions détectées, seules les {max_regions} premières sont extraites")
+        boxes = boxes[:max_regions]
+
+    regions = []
+    for index, (x0, y0, x1, y1) in enumerate(boxes):
+        padding = max(2, round((y1 - y0) * PADDING_RATIO))
+        left = max(0, int((x0 - padding) / scale))
+        top = max(0, int((y0 - padding) / scale))
+        right = min(image.width, int((x1 + padding) / scale) + 1)
+        bottom = min(image.height, int((y1 + padding) / scale) + 1)
+        buffer = io.BytesIO()
+        image.crop((left, top, right, bottom)).save(buffer, format="PNG")
+        regions.append(Region(index, (left, top, right - left, bottom - top), buffer.getvalue()))
+    return regions
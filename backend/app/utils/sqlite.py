@@ -0,0 +1,51 @@
+"""
+Connexions SQLite partagées par les services persistants (cache de résultats, historique)
+Une connexion par thread, en mode WAL: les lectures ne sont pas bloquées par
+les écritures des autres workers ou des outils en ligne de commande.
+"""
+import os
+import sqlite3
+import threading
+from typing import Callable, Optional, Sequence
+
+
+class ThreadLocalDatabase:
+    """
+    Base SQLite ouverte à la demande dans chaque thread
+
+    Args:
+        path: Fichier de la base (répertoire parent créé si besoin)
+        schema: Instructions exécutées à l'ouverture (CREATE ... IF NOT EXISTS)
+        on_first_open: Appelée une seule fois avec la première connexion (purge, migration)
+    """
+
+    def __init__(
+        self,
+        path: str,
+        schema: Sequence[str],
+        on_first_open: Optional[Callable[[sqlite3.Connection], None]] = None
+    ):
+        self.path = path
+        self.schema = schema
+        self.on_first_open = on_first_open
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._opened = False
+
+    def connection(self) -> sqlite3.Connection:
+        """Connexion du thread courant (autocommit)"""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            for statement in self.schema:
+                connection.execute(statement)
+            with self._lock:
+                first, self._opened = not self._opened, True
+            if first and self.on_first_open is not None:
+                self.on_first_open(connection)
+            self._local.connection = connection
+        return connection
@@ -0,0 +1,433 @@
+"""
+Traçage distribué des requêtes (format W3C Trace Context)
+Chaque requête produit un arbre de spans: étapes du pipeline (extraction,
+résolution, explication) et appels sortants (Mathpix, WolframAlpha, OpenAI,
+Gemini). Les spans sont exportés en JSON lignes et/ou vers un collecteur
+OTLP/HTTP local (Jaeger, OpenTelemetry Collector...).
+"""
+import contextvars
+import json
+import logging
+import os
+import queue
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+
+import httpx
+
+from app.config import config
+
+logger = logging.getLogger(__name__)
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+# Codes de statut OTLP
+_STATUS_CODES = {"unset": 0, "ok": 1, "error": 2}
+# Types de spans OTLP
+_SPAN_KINDS = {"internal": 1, "server": 2, "client": 3}
+# Pool de connexions du client OpenAI (mêmes valeurs que les réglages par défaut du SDK)
+_OPENAI_CONNECTION_LIMITS = httpx.Limits(max_connections=1000, max_keepalive_connections=100, keepalive_expiry=5.0)
+
+
+class Span:
+    """Opération chronométrée d'une trace"""
+
+    __slots__ = (
+        "trace_id", "span_id", "parent_id", "name", "kind",
+        "start_ns", "end_ns", "attributes", "status", "status_message",
+    )
+
+    def __init__(
+        self,
+        name: str,
+        trace_id: str,
+        parent_id: Optional[str] = None,
+        kind: str = "internal",
+        attributes: Optional[Dict] = None
+    ):
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes: Dict = {}
+        self.status = "unset"
+        self.status_message = ""
+        if attributes:
+            self.set_attributes(attributes)
+
+    @property
+    def traceparent(self) -> str:
+        """En-tête traceparent pour propager ce span"""
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    @property
+    def duration_ms(self) -> float:
+        end_ns = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end_ns - self.start_ns) / 1e6
+
+    def set_attribute(self, key: str, value):
+        if value is not None:
+            self.attributes[key] = value
+
+    def set_attributes(self, attributes: Dict):
+        for key, value in attributes.items():
+            self.set_attribute(key, value)
+
+    def record_error(self, error: BaseException):
+        self.status = "error"
+        self.status_message = str(error)[:500]
+        self.attributes["error.type"] = type(error).__name__
+
+    def to_dict(self) -> Dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start_ns": self.start_ns,
+            "duration_ms": round(self.duration_ms, 3),
+            "attributes": self.attributes,
+            "status": self.status,
+            "status_message": self.status_message or None,
+        }
+
+
+class _NoopSpan(Span):
+    """Span retourné quand le traçage est désactivé (attributs ignorés)"""
+
+    def __init__(self):
+        super().__init__("noop", trace_id="0" * 32)
+
+    def set_attribute(self, key: str, value):
+        pass
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[Dict[str, str]]:
+    """
+    Parse un en-tête W3C traceparent ("00-<trace_id>-<parent_id>-<flags>")
+
+    Returns:
+        Dict avec 'trace_id' et 'parent_id', ou None si l'en-tête est absent ou invalide
+    """
+    if not header:
+        return None
+    parts = header.strip().lower().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        int(parts[1], 16)
+        int(parts[2], 16)
+    except ValueError:
+        return None
+    if parts[1] == "0" * 32 or parts[2] == "0" * 16:
+        return None
+    return {"trace_id": parts[1], "parent_id": parts[2]}
+
+
+class Tracer:
+    """Crée les spans, maintient le span courant et exporte les spans terminés"""
+
+    def __init__(self):
+        self.enabled = config.TRACING_ENABLED
+        self.service_name = config.TRACE_SERVICE_NAME
+        self.export_file = config.TRACE_EXPORT_FILE
+        self.collector_url = config.TRACE_COLLECTOR_URL
+        self.slow_request_ms = config.TRACE_SLOW_REQUEST_MS
+        # Spans terminés des requêtes en cours, pour le résumé des requêtes lentes
+        self._active_traces: Dict[str, List[Span]] = {}
+        self._lock = threading.Lock()
+        self._queue: "queue.Queue[Span]" = queue.Queue(maxsize=10000)
+        self._exporter: Optional[threading.Thread] = None
+
+    def current_span(self) -> Optional[Span]:
+        return _current_span.get()
+
+    def set_attributes(self, attributes: Dict):
+        """Ajoute des attributs au span courant (sans effet hors d'une trace)"""
+        span = _current_span.get()
+        if span is not None:
+            span.set_attributes(attributes)
+
+    def start_span(
+        self,
+        name: str,
+        kind: str = "internal",
+        attributes: Optional[Dict] = None,
+        traceparent: Optional[str] = None,
+        root: bool = False
+    ) -> Span:
+        """
+        Crée un span enfant du span courant (ou du contexte traceparent fourni)
+        Le span n'est pas rendu courant: utiliser span() pour cela.
+
+        root=True ignore le span courant (nouvelle trace sans traceparent).
+        """
+        if not self.enabled:
+            return _NoopSpan()
+        remote = parse_traceparent(traceparent) if traceparent else None
+        if remote:
+            return Span(name, remote["trace_id"], remote["parent_id"], kind, attributes)
+        parent = None if root else _current_span.get()
+        if parent is not None and not isinstance(parent, _NoopSpan):
+            return Span(name, parent.trace_id, parent.span_id, kind, attributes)
+        return Span(name, secrets.token_hex(16), None, kind, attributes)
+
+    @contextmanager
+    def span(self, name: str, attributes: Optional[Dict] = None, kind: str = "internal") -> Iterator[Span]:
+        """
+        Context manager qui chronomètre un bloc dans un span courant
+        Les exceptions sont enregistrées sur le span puis propagées.
+        """
+        span = self.start_span(name, kind, attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            if not isinstance(e, GeneratorExit):
+                span.record_error(e)
+            raise
+        finally:
+            try:
+                _current_span.reset(token)
+            except ValueError:
+                # Générateur finalisé dans un autre contexte
+                pass
+            self.end_span(span)
+
+    @contextmanager
+    def request_span(self, method: str, path: str, traceparent: Optional[str] = None) -> Iterator[Span]:
+        """
+        Span racine d'une requête HTTP entrante, rattaché au traceparent du client s'il est fourni
+        Log le détail des étapes si la requête dépasse TRACE_SLOW_REQUEST_MS.
+        """
+        # Toujours une racine: uvicorn peut propager le contexte de la requête
+        # précédente d'une connexion keep-alive à la suivante
+        span = self.start_span(
+            f"{method} {path}", "server",
+            {"http.method": method, "http.route": path},
+            traceparent=traceparent,
+            root=True
+        )
+        if self.enabled:
+            with self._lock:
+                self._active_traces[span.trace_id] = []
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.record_error(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            self.end_span(span)
+            if self.enabled:
+                with self._lock:
+                    children = self._active_traces.pop(span.trace_id, [])
+                if self.slow_request_ms and span.duration_ms >= self.slow_request_ms:
+                    self._log_slow_request(span, children)
+
+    def stage_timings(self, root: Span) -> Dict[str, float]:
+        """Durée cumulée (ms) des étapes directes d'une requête en cours, par nom de span"""
+        with self._lock:
+            children = list(self._active_traces.get(root.trace_id, []))
+        timings: Dict[str, float] = {}
+        for span in children:
+            if span.parent_id == root.span_id:
+                timings[span.name] = round(timings.get(span.name, 0.0) + span.duration_ms, 1)
+        return timings
+
+    def end_span(self, span: Span):
+        if isinstance(span, _NoopSpan) or span.end_ns is not None:
+            return
+        span.end_ns = time.time_ns()
+        if span.status == "unset":
+            span.status = "ok"
+        with self._lock:
+            children = self._active_traces.get(span.trace_id)
+            if children is not None and span.parent_id is not None:
+                children.append(span)
+        if self.export_file or self.collector_url:
+            self._ensure_exporter()
+            try:
+                self._queue.put_nowait(span)
+            except queue.Full:
+                pass
+
+    def wrap(self, function: Callable) -> Callable:
+        """
+        Rattache une fonction exécutée dans un autre thread (ThreadPoolExecutor)
+        au contexte de trace courant
+        """
+        context = contextvars.copy_context()
+
+        def run(*args, **kwargs):
+            return context.run(function, *args, **kwargs)
+        return run
+
+    def inject(self, headers) -> None:
+        """Ajoute l'en-tête traceparent du span courant"""
+        span = _current_span.get()
+        if span is not None and not isinstance(span, _NoopSpan):
+            headers["traceparent"] = span.traceparent
+
+    def _log_slow_request(self, root: Span, spans: List[Span]):
+        """Log la décomposition d'une requête lente par étape et par appel sortant"""
+        breakdown = ", ".join(
+            f"{span.name} {span.duration_ms:.0f}ms"
+            + (f" [{span.attributes['server.address']}]" if "server.address" in span.attributes else "")
+            for span in sorted(spans, key=lambda span: span.duration_ms, reverse=True)[:8]
+            if span is not root
+        )
+        # Temps non couvert par les étapes directes (attente, boucle d'événements bloquée...)
+        traced_ms = sum(span.duration_ms for span in spans if span.parent_id == root.span_id)
+        untraced_ms = max(root.duration_ms - traced_ms, 0.0)
+        logger.warning(
+            f"Requête lente {root.name}: {root.duration_ms:.0f}ms (trace {root.trace_id}, "
+            f"hors étapes tracées: {untraced_ms:.0f}ms) - {breakdown}"
+        )
+
+    def _ensure_exporter(self):
+        if self._exporter is not None:
+            return
+        with self._lock:
+            if self._exporter is None:
+                self._exporter = threading.Thread(target=self._export_loop, name="trace-exporter", daemon=True)
+                self._exporter.start()
+
+    def _export_loop(self):
+        """Exporte les spans par lots (thread dédié, hors du chemin des requêtes)"""
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + 1.0
+            while len(batch) < 512:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            try:
+                self._export(batch)
+            except Exception as e:
+                logger.warning(f"Export des traces impossible: {str(e)}")
+
+    def _export(self, spans: List[Span]):
+        if self.export_file:
+            directory = os.path.dirname(self.export_file)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.export_file, "a", encoding="utf-8") as handle:
+                for span in spans:
+                    handle.write(json.dumps(span.to_dict(), ensure_ascii=False, default=str) + "\n")
+        if self.collector_url:
+            # Client non instrumenté: l'export ne doit pas produire de spans
+            httpx.post(self.collector_url, json=self._to_otlp(spans), timeout=5.0)
+
+    def _to_otlp(self, spans: List[Span]) -> Dict:
+        """Convertit des spans au format OTLP/HTTP JSON"""
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": _otlp_attributes({"service.name": self.service_name})},
+                "scopeSpans": [{
+                    "scope": {"name": "app.utils.tracing"},
+                    "spans": [
+                        {
+                            "traceId": span.trace_id,
+                            "spanId": span.span_id,
+                            "parentSpanId": span.parent_id or "",
+                            "name": span.name,
+                            "kind": _SPAN_KINDS.get(span.kind, 1),
+                            "startTimeUnixNano": str(span.start_ns),
+                            "endTimeUnixNano": str(span.end_ns),
+                            "attributes": _otlp_attributes(span.attributes),
+                            "status": {"code": _STATUS_CODES[span.status], "message": span.status_message},
+                        }
+                        for span in spans
+                    ],
+                }],
+            }]
+        }
+
+
+def _otlp_attributes(attributes: Dict) -> List[Dict]:
+    converted = []
+    for key, value in attributes.items():
+        if isinstance(value, bool):
+            typed = {"boolValue": value}
+        elif isinstance(value, int):
+            typed = {"intValue": str(value)}
+        elif isinstance(value, float):
+            typed = {"doubleValue": value}
+        else:
+            typed = {"stringValue": str(value)}
+        converted.append({"key": key, "value": typed})
+    return converted
+
+
+class TracingTransport(httpx.BaseTransport):
+    """
+    Transport httpx qui trace chaque appel sortant et propage le traceparent
+    La durée couvre l'envoi jusqu'à la réception des en-têtes (le corps des
+    réponses en streaming est chronométré par le span appelant).
+    """
+
+    def __init__(self, transport: Optional[httpx.BaseTransport] = None):
+        self._transport = transport or httpx.HTTPTransport()
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        url = request.url
+        span = tracer.start_span(f"HTTP {request.method} {url.host}", "client", {
+            "http.method": request.method,
+            # Sans la query string (clés d'API WolframAlpha)
+            "http.url": f"{url.scheme}://{url.netloc.decode()}{url.path}",
+            "server.address": url.host,
+            "http.request.body_size": _body_size(request),
+            # En-tête ajouté par le SDK OpenAI à chaque nouvelle tentative
+            "http.retry_count": int(request.headers.get("x-stainless-retry-count", 0) or 0),
+        })
+        if not isinstance(span, _NoopSpan):
+            request.headers["traceparent"] = span.traceparent
+        try:
+            response = self._transport.handle_request(request)
+        except Exception as e:
+            span.record_error(e)
+            tracer.end_span(span)
+            raise
+        span.set_attribute("http.status_code", response.status_code)
+        if response.status_code >= 400:
+            span.status = "error"
+        tracer.end_span(span)
+        return response
+
+    def close(self):
+        self._transport.close()
+
+
+def _body_size(request: httpx.Request) -> Optional[int]:
+    try:
+        return len(request.content)
+    except httpx.RequestNotRead:
+        return None
+
+
+def http_client(**kwargs) -> httpx.Client:
+    """Client httpx synchrone dont les appels sont tracés"""
+    return httpx.Client(transport=TracingTransport(), **kwargs)
+
+
+def openai_http_client():
+    """Client HTTP tracé pour le SDK OpenAI (délais et redirections par défaut du SDK)"""
+    from openai import DefaultHttpxClient
+    return DefaultHttpxClient(transport=TracingTransport(httpx.HTTPTransport(limits=_OPENAI_CONNECTION_LIMITS)))
+
+
+# Instance globale
+tracer = Tracer()
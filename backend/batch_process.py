@@ -0,0 +1,299 @@
+"""
+Traitement par lots hors ligne: répertoire, archive d'images ou PDF → JSONL
+Les images passent directement par les services (sans HTTP) dans un pipeline
+à trois étages (extraction, résolution, explication), chacun avec sa propre
+concurrence et son propre débit maximal: le débit global n'est limité que
+par les quotas des APIs externes.
+
+Chaque résultat est écrit dès qu'il est prêt (une ligne JSON par image).
+Le fichier de sortie sert de point de reprise: une exécution interrompue
+reprend en ignorant les images déjà traitées (les échecs et les résultats
+dégradés sont retentés, comme par warm_cache.py; la dernière ligne d'une
+image fait foi).
+
+    python batch_process.py copies/ -o resultats.jsonl
+    python batch_process.py copies.zip -o resultats.jsonl --extract-concurrency 8 --explain-rate 3
+"""
+import argparse
+import asyncio
+import contextvars
+import json
+import logging
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Set, TextIO
+
+from app.utils.ingestion import SourceImage, iter_images
+from app.utils.rate_limit import RateLimiter
+from app.utils.responses import dumps
+
+STAGES = ("extract", "solve", "explain")
+STAGE_LABELS = {"extract": "extraction", "solve": "résolution", "explain": "explication"}
+
+
+@dataclass
+class BatchItem:
+    """Image en cours de traitement et résultats intermédiaires"""
+    name: str
+    image: bytes
+    context: contextvars.Context
+    usage: Any
+    started: float = field(default_factory=time.perf_counter)
+    latex: str = ""
+    confidence: float = 0.0
+    solution: str = ""
+    raw_steps: List[Dict] = field(default_factory=list)
+    complete: bool = False
+    steps: List[Dict] = field(default_factory=list)
+    error: Optional[str] = None
+    failed_stage: Optional[str] = None
+
+    def record(self) -> Dict[str, Any]:
+        """Ligne JSONL du résultat"""
+        if self.error is not None:
+            status = "error"
+        else:
+            status = "ok" if self.complete else "degraded"
+        record: Dict[str, Any] = {"source": self.name, "status": status}
+        if self.error is not None:
+            record.update({"stage": self.failed_stage, "error": self.error})
+        else:
+            record.update({
+                "latex": self.latex,
+                "confidence": self.confidence,
+                "solution": self.solution,
+                "steps": self.steps,
+            })
+        record["duration_ms"] = round((time.perf_counter() - self.started) * 1000, 1)
+        record["llm_usage"] = self.usage.summary()
+        return record
+
+
+def load_checkpoint(output: Path) -> Set[str]:
+    """
+    Images déjà traitées avec succès d'après le fichier de sortie
+    Les images en erreur ou dégradées (résolution ou explication en échec)
+    sont à retraiter. Une dernière ligne tronquée (arrêt brutal pendant
+    l'écriture) est supprimée.
+    """
+    done: Set[str] = set()
+    if not output.exists():
+        return done
+    content = output.read_bytes()
+    complete_size = content.rfind(b"\n") + 1
+    if complete_size < len(content):
+        with output.open("r+b") as handle:
+            handle.truncate(complete_size)
+    for line in content[:complete_size].splitlines():
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        if record.get("status") != "ok":
+            done.discard(record["source"])
+        else:
+            done.add(record["source"])
+    return done
+
+
+class BatchPipeline:
+    """
+    Pipeline asynchrone borné: lecture → extraction → résolution → explication → écriture
+    Les appels aux services (bloquants) sont exécutés dans un pool de threads
+    par étage; les files entre étages bornent le nombre d'images en mémoire.
+    """
+
+    def __init__(self, concurrency: Dict[str, int], rates: Dict[str, float], queue_size: int = 0):
+        from app.services.analysis_pipeline import analysis_pipeline
+
+        self.pipeline = analysis_pipeline
+        self.concurrency = concurrency
+        self.limiters = {stage: RateLimiter(rates.get(stage, 0.0)) for stage in STAGES}
+        self.queue_size = queue_size
+        self.counts: Dict[str, int] = {"ok": 0, "degraded": 0, "error": 0}
+        self.skipped = 0
+        self._executors = {
+            stage: ThreadPoolExecutor(max_workers=concurrency[stage], thread_name_prefix=f"batch-{stage}")
+            for stage in STAGES
+        }
+        self._queues: Dict[str, asyncio.Queue] = {}
+
+    async def run(self, sources, done: Set[str], output: TextIO, progress_interval: float = 10.0):
+        """
+        Traite toutes les images de la source
+
+        Args:
+            sources: Itérateur de SourceImage (lu dans un thread, au rythme du pipeline)
+            done: Images à ignorer (déjà traitées)
+            output: Fichier JSONL ouvert en ajout
+        """
+        for stage in STAGES + ("write",):
+            size = self.queue_size or 2 * max(self.concurrency.values())
+            self._queues[stage] = asyncio.Queue(maxsize=size)
+        self._start = time.monotonic()
+
+        workers = [asyncio.create_task(self._writer(output))]
+        for stage, next_stage in zip(STAGES, STAGES[1:] + ("write",)):
+            workers += [
+                asyncio.create_task(self._stage_worker(stage, next_stage))
+                for _ in range(self.concurrency[stage])
+            ]
+        reporter = asyncio.create_task(self._report_progress(progress_interval))
+        try:
+            await self._read(sources, done)
+            # Vidage des étages dans l'ordre
+            for stage in STAGES + ("write",):
+                await self._queues[stage].join()
+        finally:
+            reporter.cancel()
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, reporter, return_exceptions=True)
+            for executor in self._executors.values():
+                executor.shutdown(wait=False, cancel_futures=True)
+        self._print_progress(final=True)
+
+    async def _read(self, sources, done: Set[str]):
+        from app.services.prompt_service import prompt_service
+
+        iterator = iter(sources)
+        while True:
+            source: Optional[SourceImage] = await asyncio.to_thread(next, iterator, None)
+            if source is None:
+                return
+            if source.name in done:
+                self.skipped += 1
+                continue
+            # Contexte propre à l'image: consommation LLM comptée par image
+            context = contextvars.copy_context()
+            usage = context.run(prompt_service.start_request)
+            item = BatchItem(name=source.name, image=source.data, context=context, usage=usage)
+            await self._queues["extract"].put(item)
+
+    async def _call(self, stage: str, item: BatchItem, function: Callable, *args):
+        await self.limiters[stage].wait()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executors[stage], item.context.run, function, *args)
+
+    async def _stage_worker(self, stage: str, next_stage: str):
+        queue = self._queues[stage]
+        while True:
+            item: BatchItem = await queue.get()
+            try:
+                if item.error is None:
+                    await getattr(self, f"_{stage}")(item)
+            except Exception as e:
+                item.error, item.failed_stage = str(e) or type(e).__name__, stage
+            try:
+                # Transmis avant task_done: le vidage de l'étage suivant ne peut pas le manquer
+                await self._queues[next_stage].put(item)
+            finally:
+                queue.task_done()
+
+    async def _extract(self, item: BatchItem):
+        from app.utils.file_validation import validate_image_file
+
+        is_valid, error_message = validate_image_file(item.image, max_size=len(item.image))
+        if not is_valid:
+            raise ValueError(error_message)
+        result = await self._call("extract", item, self.pipeline.extract_latex, item.image)
+        item.image = b""  # Libère l'image dès l'extraction faite
+        item.latex = result.get("latex", "")
+        item.confidence = result.get("confidence", 0.0)
+        if not item.latex:
+            raise ValueError("Impossible de détecter d'équation mathématique dans l'image.")
+
+    async def _solve(self, item: BatchItem):
+        item.solution, item.raw_steps, item.complete = await self._call(
+            "solve", item, self.pipeline.solve, item.latex
+        )
+
+    async def _explain(self, item: BatchItem):
+        item.steps, explained = await self._call(
+            "explain", item, self.pipeline.explain, item.latex, item.solution, item.raw_steps
+        )
+        item.complete = item.complete and explained
+
+    async def _writer(self, output: TextIO):
+        queue = self._queues["write"]
+        while True:
+            item: BatchItem = await queue.get()
+            try:
+                record = item.record()
+                output.write(dumps(record).decode("utf-8") + "\n")
+                output.flush()
+                self.counts[record["status"]] += 1
+            finally:
+                queue.task_done()
+
+    async def _report_progress(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            self._print_progress()
+
+    def _print_progress(self, final: bool = False):
+        processed = sum(self.counts.values())
+        elapsed = time.monotonic() - self._start
+        rate = processed / elapsed if elapsed else 0.0
+        waiting = ", ".join(
+            f"{STAGE_LABELS[stage]} {self._queues[stage].qsize()}" for stage in STAGES
+        )
+        print(
+            f"{'Terminé' if final else 'En cours'}: {processed} traitée(s) "
+            f"(ok {self.counts['ok']}, dégradées {self.counts['degraded']}, erreurs {self.counts['error']}), "
+            f"{self.skipped} déjà traitée(s), {rate:.2f} image(s)/s"
+            + ("" if final else f", en attente: {waiting}"),
+            file=sys.stderr,
+            flush=True
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Traite un lot d'images (répertoire, archive ou PDF) vers un fichier JSONL")
+    parser.add_argument("source", help="Répertoire, archive .zip ou archive tar d'images, ou PDF (une image par page)")
+    parser.add_argument("-o", "--output", required=True, help="Fichier JSONL des résultats (sert de point de reprise)")
+    for stage, default in (("extract", 4), ("solve", 4), ("explain", 4)):
+        label = STAGE_LABELS[stage]
+        parser.add_argument(
+            f"--{stage}-concurrency", type=int, default=default, help=f"Appels simultanés de l'étage {label}"
+        )
+        parser.add_argument(
+            f"--{stage}-rate", type=float, default=0.0, help=f"Appels par seconde au plus pour l'étage {label} (0: illimité)"
+        )
+    parser.add_argument("--queue-size", type=int, default=0, help="Taille des files entre étages (défaut: 2 × concurrence max)")
+    parser.add_argument("--progress-interval", type=float, default=10.0, help="Secondes entre deux rapports de progression")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Affiche les logs des services")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO if args.verbose else logging.WARNING,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    output_path = Path(args.output)
+    done = load_checkpoint(output_path)
+    if done:
+        print(f"Reprise: {len(done)} image(s) déjà traitée(s) dans {output_path}", file=sys.stderr)
+
+    try:
+        sources = iter_images(args.source)
+    except ValueError as e:
+        parser.error(str(e))
+    pipeline = BatchPipeline(
+        concurrency={stage: max(1, getattr(args, f"{stage}_concurrency")) for stage in STAGES},
+        rates={stage: getattr(args, f"{stage}_rate") for stage in STAGES},
+        queue_size=args.queue_size
+    )
+    with output_path.open("a", encoding="utf-8") as output:
+        try:
+            asyncio.run(pipeline.run(sources, done, output, progress_interval=args.progress_interval))
+        except KeyboardInterrupt:
+            print("\nInterrompu: relancer la commande pour reprendre.", file=sys.stderr)
+            sys.exit(130)
+    sys.exit(1 if pipeline.counts["error"] else 0)
+
+
+if __name__ == "__main__":
+    main()
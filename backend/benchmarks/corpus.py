@@ -0,0 +1,126 @@
+"""
+Corpus de référence pour les benchmarks et les tests de charge
+Expressions LaTeX imprimées et de style manuscrit, et images synthétiques
+"""
+import random
+import struct
+import zlib
+from typing import List
+
+# LaTeX tel que renvoyé pour des équations imprimées
+PRINTED_LATEX: List[str] = [
+    "2+2",
+    "37-4^{2}",
+    "3x+5=2x-7",
+    "x^{2}+5x+6=0",
+    "\\frac{3}{4}+\\frac{1}{6}",
+    "\\sqrt{x^{2}+9}=5",
+    "\\frac{d}{dx}\\left(x^{3}+2x^{2}-5\\right)",
+    "\\int_{0}^{1} x^{2} \\sin(x) \\, dx",
+    "\\sum_{i=1}^{n} i^{2}",
+    "\\lim_{x \\to 0} \\frac{\\sin x}{x}",
+    "\\begin{pmatrix} 1 & 2 \\\\ 3 & 4 \\end{pmatrix}",
+    "\\sqrt[3]{27} \\times \\frac{2}{3}",
+]
+
+# LaTeX de style manuscrit (exposants mal reconnus, caractères unicode, espaces)
+HANDWRITTEN_LATEX: List[str] = [
+    "37 - 4 2",
+    "37-4²",
+    "x² + 5x + 6 = 0",
+    "5² - 3",
+    "10 - 2 2 =",
+    "a²b³ + 1",
+    "x ^ 2 + y ^ 2 = r ^ 2",
+    "3 x + 1 = 7",
+    "2³ × 4",
+    "x{2} - 1 = 0",
+]
+
+# Réponses WolframAlpha de référence pour le parsing JSON
+WOLFRAM_PAYLOAD = {
+    "queryresult": {
+        "success": True,
+        "error": False,
+        "numpods": 3,
+        "pods": [
+            {
+                "id": "Input",
+                "title": "Input",
+                "subpods": [{"plaintext": "x^2 + 5 x + 6 = 0"}],
+            },
+            {
+                "id": "Result",
+                "title": "Result",
+                "subpods": [
+                    {"plaintext": "x = -3", "img": {"src": "https://example.invalid/1.gif"}},
+                    {"plaintext": "x = -2", "img": {"src": "https://example.invalid/2.gif"}},
+                ],
+            },
+            {
+                "id": "Solution",
+                "title": "Solution",
+                "subpods": [
+                    {"plaintext": "x^2 + 5 x + 6 = (x + 2) (x + 3)"},
+                    {"plaintext": "x + 2 = 0 or x + 3 = 0"},
+                    {"plaintext": "x = -2 or x = -3"},
+                ],
+            },
+        ],
+    }
+}
+
+# Réponse LLM de référence (étapes enrichies)
+LLM_PAYLOAD = {
+    "steps": [
+        {
+            "title": f"Étape {index + 1}",
+            "description": "Factoriser le trinôme x^{2} + 5x + 6 en produit de deux facteurs",
+            "formula": "x^{2} + 5x + 6 = (x + 2)(x + 3)",
+            "explanation": (
+                "On cherche deux nombres dont la somme vaut 5 et le produit vaut 6 : "
+                "il s'agit de 2 et 3. Un produit de facteurs est nul si et seulement si "
+                "l'un des facteurs est nul, ce qui donne les deux solutions."
+            ),
+        }
+        for index in range(6)
+    ]
+}
+
+# Tailles d'images du corpus (10 Ko à 10 Mo)
+IMAGE_SIZES = [10 * 1024, 100 * 1024, 1024 * 1024, 10 * 1024 * 1024]
+
+
+def make_png(target_size: int, seed: int = 0, width: int = 512) -> bytes:
+    """
+    Génère une image PNG valide d'environ target_size octets
+    Le contenu est du bruit (peu compressible), pour contrôler la taille finale.
+
+    Args:
+        target_size: Taille approximative souhaitée en octets
+        seed: Graine du générateur aléatoire (images reproductibles)
+        width: Largeur de l'image en pixels
+
+    Returns:
+        Bytes de l'image PNG
+    """
+    rng = random.Random(seed)
+    row_size = width * 3
+    height = max(1, target_size // (row_size + 1))
+    raw = b"".join(b"\x00" + rng.randbytes(row_size) for _ in range(height))
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return (
+            struct.pack(">I", len(data))
+            + kind
+            + data
+            + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+        )
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", header)
+        + chunk(b"IDAT", zlib.compress(raw, 1))
+        + chunk(b"IEND", b"")
+    )
@@ -0,0 +1,7 @@
+"""
+Harnais de test de charge avec simulateurs locaux des APIs externes
+
+Usage (depuis le dossier backend):
+    python -m benchmarks.loadtest --duration 30 --concurrency 20
+    python -m benchmarks.loadtest --upstreams "wolfram=1500:0.5:0.02:0.05" --output report.json
+"""
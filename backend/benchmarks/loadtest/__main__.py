@@ -0,0 +1,193 @@
+"""
+Point d'entrée du test de charge
+Démarre les simulateurs et le backend (configuré pour les utiliser),
+rejoue la charge puis écrit le rapport
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+from benchmarks.loadtest.driver import DEFAULT_MIX, LoadDriver, parse_mix
+from benchmarks.loadtest.simulators import parse_profiles
+
+BACKEND_DIR = Path(__file__).resolve().parents[2]
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _start(module: str, port: int, env: dict, extra_args=()) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", module, "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning", *extra_args],
+        cwd=BACKEND_DIR,
+        env={**os.environ, **env},
+    )
+
+
+def _wait_ready(url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Service non disponible: {url}")
+
+
+def _backend_env(simulator_url: str, args, data_dir: str) -> dict:
+    """
+    Variables d'environnement pointant le backend vers les simulateurs
+
+    Mode "miss": caches (résultats, explications par étape) et historique
+    désactivés, chaque requête parcourt tout le pipeline. Mode "hit": caches
+    en mémoire actifs, historique dans data_dir (jamais dans data/history.db).
+    """
+    env = {
+        "WOLFRAM_APP_ID": "loadtest",
+        "WOLFRAM_API_URL": f"{simulator_url}/v2/query",
+        "OPENAI_API_KEY": "loadtest",
+        "OPENAI_BASE_URL": f"{simulator_url}/v1",
+        "GEMINI_API_KEY": "loadtest",
+        "GEMINI_API_ENDPOINT": simulator_url,
+        "LLM_PROVIDER": args.llm_provider,
+        "MATHPIX_APP_ID": "",
+        "MATHPIX_APP_KEY": "",
+        "RESULT_CACHE_DB": "",
+    }
+    if args.cache == "miss":
+        env.update({"RESULT_CACHE_SIZE": "0", "STEP_CACHE_SIZE": "0", "HISTORY_DB": ""})
+    else:
+        env["HISTORY_DB"] = str(Path(data_dir) / "history.db")
+    if args.extraction == "mathpix":
+        env.update({
+            "MATHPIX_APP_ID": "loadtest",
+            "MATHPIX_APP_KEY": "loadtest",
+            "MATHPIX_API_URL": f"{simulator_url}/v3/text",
+        })
+    return env
+
+
+def _print_report(report: dict, cache: str):
+    print(f"\nCache: {'hit (entrées répétées, caches actifs)' if cache == 'hit' else 'miss (entrées uniques, caches désactivés)'}")
+    print(f"{'requête':<15}{'n':>7}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'erreurs':>10}{'429':>8}")
+    for name, row in report.items():
+        print(
+            f"{name:<15}{row['requests']:>7}{row['throughput_rps']:>9}{row['p50_ms']:>10}"
+            f"{row['p95_ms']:>10}{row['p99_ms']:>10}{row['error_rate']:>10.2%}{row['rate_limited_rate']:>8.2%}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Test de charge du backend avec APIs externes simulées")
+    parser.add_argument("--duration", type=float, default=30.0, help="Durée de la charge en secondes")
+    parser.add_argument("--concurrency", type=int, default=10, help="Nombre de clients simultanés")
+    parser.add_argument(
+        "--mix", type=parse_mix, default=DEFAULT_MIX,
+        help="Mélange de requêtes, ex: latex=0.3,analyze_image=0.3,analyze_latex=0.4"
+    )
+    parser.add_argument(
+        "--upstreams", type=parse_profiles, default={},
+        help="Profils des APIs simulées: nom=médiane_ms:sigma:taux_erreur:taux_429 (séparés par des virgules)"
+    )
+    parser.add_argument("--extraction", choices=["openai", "mathpix"], default="openai")
+    parser.add_argument("--llm-provider", choices=["openai", "gemini"], default="openai")
+    parser.add_argument("--image-size", type=int, default=100 * 1024, help="Taille des images envoyées (octets)")
+    parser.add_argument("--workers", type=int, default=1, help="Workers uvicorn du backend")
+    parser.add_argument("--target", help="URL d'un backend déjà démarré (sinon démarré localement)")
+    parser.add_argument("--simulator-port", type=int, default=8901)
+    parser.add_argument("--backend-port", type=int, default=8900)
+    parser.add_argument(
+        "--cache", choices=["miss", "hit"], default="miss",
+        help="miss: entrées uniques et caches désactivés (pipeline complet); hit: entrées répétées, caches actifs"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--label", default="", help="Libellé du build dans le rapport")
+    parser.add_argument("--output", help="Fichier JSON du rapport")
+    args = parser.parse_args()
+
+    simulator_url = f"http://127.0.0.1:{args.simulator_port}"
+    profiles_spec = ",".join(
+        f"{name}={profile.median_ms}:{profile.sigma}:{profile.error_rate}:{profile.rate_limit_rate}"
+        for name, profile in args.upstreams.items()
+    )
+    processes = []
+    data_dir = tempfile.TemporaryDirectory(prefix="loadtest-")
+    try:
+        processes.append(_start(
+            "benchmarks.loadtest.simulators:app_from_env", args.simulator_port,
+            {"SIMULATOR_PROFILES": profiles_spec, "SIMULATOR_SEED": str(args.seed)},
+            ["--factory"]
+        ))
+        _wait_ready(f"{simulator_url}/stats")
+
+        target = args.target
+        if not target:
+            target = f"http://127.0.0.1:{args.backend_port}"
+            processes.append(_start(
+                "main:app", args.backend_port, _backend_env(simulator_url, args, data_dir.name),
+                ["--workers", str(args.workers)]
+            ))
+            _wait_ready(f"{target}/health")
+
+        print(f"Charge: {args.concurrency} clients pendant {args.duration:g}s sur {target}")
+        driver = LoadDriver(
+            target,
+            concurrency=args.concurrency,
+            duration=args.duration,
+            mix=args.mix,
+            image_size=args.image_size,
+            seed=args.seed,
+            unique_inputs=args.cache == "miss"
+        )
+        report = asyncio.run(driver.run())
+        upstream_stats = httpx.get(f"{simulator_url}/stats").json()
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait(timeout=10)
+        data_dir.cleanup()
+
+    _print_report(report, args.cache)
+
+    if args.output:
+        document = {
+            "build": _git_revision(),
+            "label": args.label,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "config": {
+                "duration": args.duration,
+                "concurrency": args.concurrency,
+                "mix": args.mix,
+                "extraction": args.extraction,
+                "llm_provider": args.llm_provider,
+                "image_size": args.image_size,
+                "workers": args.workers,
+                "cache": args.cache,
+            },
+            "results": report,
+            "upstreams": upstream_stats,
+        }
+        Path(args.output).write_text(json.dumps(document, indent=2, ensure_ascii=False))
+        print(f"\nRapport écrit dans {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Générateur de charge pour l'API Math Assistant
+Rejoue un mélange de requêtes /api/latex et /api/analyze et mesure
+débit, percentiles de latence et taux d'erreur par endpoint
+"""
+import asyncio
+import itertools
+import random
+import struct
+import time
+import zlib
+from typing import Dict, List, Optional
+
+import httpx
+
+from benchmarks.corpus import PRINTED_LATEX, make_png
+
+# Types de requêtes rejouées et poids par défaut
+DEFAULT_MIX = {
+    "latex": 0.3,          # POST /api/latex avec une image
+    "analyze_image": 0.3,  # POST /api/analyze avec une image seule
+    "analyze_latex": 0.4,  # POST /api/analyze avec un LaTeX confirmé
+}
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    """Parse un mélange "latex=0.3,analyze_image=0.3,analyze_latex=0.4" """
+    mix = {}
+    for item in spec.split(","):
+        name, weight = item.split("=")
+        if name not in DEFAULT_MIX:
+            raise ValueError(f"Type de requête inconnu: {name}")
+        mix[name] = float(weight)
+    return mix
+
+
+def unique_png(image: bytes, number: int) -> bytes:
+    """
+    Variante de l'image d'empreinte différente et de même contenu: bloc PNG
+    auxiliaire privé ("ldTn", ignoré par les décodeurs) inséré avant IEND
+    """
+    data = struct.pack(">Q", number)
+    chunk = struct.pack(">I", len(data)) + b"ldTn" + data + struct.pack(">I", zlib.crc32(b"ldTn" + data) & 0xFFFFFFFF)
+    return image[:-12] + chunk + image[-12:]
+
+
+def unique_latex(latex: str, number: int) -> str:
+    """Variante du LaTeX d'empreinte différente: suffixe d'espaces et tabulations (sans effet mathématique)"""
+    return latex + " " + format(number, "b").replace("0", " ").replace("1", "\t")
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Percentile par rang le plus proche (valeurs déjà triées)"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class LoadDriver:
+    """Exécute une charge à concurrence fixe pendant une durée donnée"""
+
+    def __init__(
+        self,
+        base_url: str,
+        concurrency: int = 10,
+        duration: float = 30.0,
+        mix: Optional[Dict[str, float]] = None,
+        image_size: int = 100 * 1024,
+        seed: int = 0,
+        timeout: float = 120.0,
+        unique_inputs: bool = True
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.concurrency = concurrency
+        self.duration = duration
+        self.mix = mix or DEFAULT_MIX
+        self.image = make_png(image_size, seed=seed)
+        self.rng = random.Random(seed)
+        self.timeout = timeout
+        # Entrées toutes différentes: ni cache de résultats, ni rattachement à un calcul en cours
+        self.unique_inputs = unique_inputs
+        self._numbers = itertools.count()
+        self.samples: List[Dict] = []
+
+    def _next_request(self) -> Dict:
+        kind = self.rng.choices(list(self.mix), weights=list(self.mix.values()))[0]
+        number = next(self._numbers)
+        image = unique_png(self.image, number) if self.unique_inputs else self.image
+        files = {"image": ("image.png", image, "image/png")}
+        if kind == "latex":
+            return {"kind": kind, "url": "/api/latex", "files": files, "data": None}
+        if kind == "analyze_image":
+            return {"kind": kind, "url": "/api/analyze", "files": files, "data": None}
+        latex = self.rng.choice(PRINTED_LATEX)
+        if self.unique_inputs:
+            latex = unique_latex(latex, number)
+        return {"kind": kind, "url": "/api/analyze", "files": files, "data": {"latex": latex}}
+
+    async def _worker(self, client: httpx.AsyncClient, deadline: float):
+        while time.perf_counter() < deadline:
+            request = self._next_request()
+            start = time.perf_counter()
+            try:
+                response = await client.post(request["url"], files=request["files"], data=request["data"])
+                status = response.status_code
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            self.samples.append({
+                "kind": request["kind"],
+                "status": status,
+                "latency": time.perf_counter() - start,
+            })
+
+    async def run(self) -> Dict:
+        """
+        Lance la charge
+
+        Returns:
+            Rapport (voir summarize)
+        """
+        self.samples = []
+        limits = httpx.Limits(max_connections=self.concurrency)
+        async with httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout, limits=limits) as client:
+            start = time.perf_counter()
+            deadline = start + self.duration
+            await asyncio.gather(*(self._worker(client, deadline) for _ in range(self.concurrency)))
+            elapsed = time.perf_counter() - start
+        return self.summarize(elapsed)
+
+    def summarize(self, elapsed: float) -> Dict:
+        """
+        Agrège les mesures
+
+        Returns:
+            Dict avec le total et un détail par type de requête: débit (req/s),
+            p50/p95/p99 (ms), taux d'erreur, taux de 429 et répartition des statuts
+        """
+        groups: Dict[str, List[Dict]] = {"total": self.samples}
+        for sample in self.samples:
+            groups.setdefault(sample["kind"], []).append(sample)
+
+        report = {}
+        for name, samples in groups.items():
+            latencies = sorted(sample["latency"] * 1000 for sample in samples)
+            statuses: Dict[str, int] = {}
+            for sample in samples:
+                statuses[str(sample["status"])] = statuses.get(str(sample["status"]), 0) + 1
+            errors = sum(
+                count for status, count in statuses.items()
+                if not (status.isdigit() and int(status) < 400)
+            )
+            report[name] = {
+                "requests": len(samples),
+                "throughput_rps": round(len(samples) / elapsed, 2) if elapsed else 0.0,
+                "p50_ms": round(percentile(latencies, 0.50), 1),
+                "p95_ms": round(percentile(latencies, 0.95), 1),
+                "p99_ms": round(percentile(latencies, 0.99), 1),
+                "error_rate": round(errors / len(samples), 4) if samples else 0.0,
+                "rate_limited_rate": round(statuses.get("429", 0) / len(samples), 4) if samples else 0.0,
+                "statuses": statuses,
+            }
+        return report
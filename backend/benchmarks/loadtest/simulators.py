@@ -0,0 +1,246 @@
+"""
+Simulateurs locaux des APIs externes (Mathpix, WolframAlpha, OpenAI, Gemini)
+Reproduisent les réponses que les services parsent, avec latence, erreurs
+et 429 configurables, pour tester la charge sans consommer de quota réel
+"""
+import asyncio
+import json
+import random
+from typing import Dict, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from benchmarks.corpus import LLM_PAYLOAD, WOLFRAM_PAYLOAD
+
+UPSTREAMS = ("mathpix", "wolfram", "openai", "gemini")
+
+
+class UpstreamProfile:
+    """
+    Comportement simulé d'une API externe
+
+    Format texte: "median_ms[:sigma[:error_rate[:rate_limit_rate]]]"
+    La latence suit une loi log-normale de médiane median_ms (sigma=0: latence fixe).
+    """
+
+    def __init__(
+        self,
+        median_ms: float = 200.0,
+        sigma: float = 0.3,
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0
+    ):
+        self.median_ms = median_ms
+        self.sigma = sigma
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+
+    @classmethod
+    def parse(cls, spec: str) -> "UpstreamProfile":
+        values = [float(value) for value in spec.split(":")]
+        return cls(*values)
+
+    def sample_latency(self, rng: random.Random) -> float:
+        """Tire une latence en secondes"""
+        if self.sigma <= 0:
+            return self.median_ms / 1000
+        return rng.lognormvariate(0.0, self.sigma) * self.median_ms / 1000
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.median_ms:g}ms σ={self.sigma:g} "
+            f"erreurs={self.error_rate:.0%} 429={self.rate_limit_rate:.0%}"
+        )
+
+
+# Profils par défaut, proches des latences observées en production
+DEFAULT_PROFILES = {
+    "mathpix": UpstreamProfile(600, 0.4),
+    "wolfram": UpstreamProfile(1500, 0.5),
+    "openai": UpstreamProfile(2500, 0.5),
+    "gemini": UpstreamProfile(2000, 0.5),
+}
+
+
+def create_simulator_app(
+    profiles: Optional[Dict[str, UpstreamProfile]] = None,
+    seed: Optional[int] = None
+) -> FastAPI:
+    """
+    Crée l'application qui simule les quatre APIs externes sur un même port
+
+    Args:
+        profiles: Comportement par API (DEFAULT_PROFILES pour les absentes)
+        seed: Graine pour des tirages reproductibles
+
+    Returns:
+        Application FastAPI
+    """
+    profiles = {**DEFAULT_PROFILES, **(profiles or {})}
+    rng = random.Random(seed)
+    counters = {name: {"requests": 0, "errors": 0, "rate_limited": 0} for name in UPSTREAMS}
+    app = FastAPI(title="Simulateurs des APIs externes")
+
+    async def simulate(upstream: str) -> Optional[JSONResponse]:
+        """Applique latence et fautes; retourne une réponse d'erreur le cas échéant"""
+        profile = profiles[upstream]
+        counters[upstream]["requests"] += 1
+        await asyncio.sleep(profile.sample_latency(rng))
+
+        draw = rng.random()
+        if draw < profile.rate_limit_rate:
+            counters[upstream]["rate_limited"] += 1
+            return JSONResponse(status_code=429, content={"error": "rate limit exceeded"})
+        if draw < profile.rate_limit_rate + profile.error_rate:
+            counters[upstream]["errors"] += 1
+            return JSONResponse(status_code=500, content={"error": "simulated upstream error"})
+        return None
+
+    @app.post("/v3/text")
+    async def mathpix_text(request: Request):
+        body = await request.json()
+        error = await simulate("mathpix")
+        if error:
+            return error
+        handwritten = body.get("handwritten", False)
+        return {
+            "text": "$x^{2}+5x+6=0$",
+            "latex_styled": "x^{2}+5x+6=0",
+            "latex_simplified": "x^{2}+5x+6=0",
+            "confidence": 0.81 if handwritten else 0.97,
+            "is_printed": not handwritten,
+        }
+
+    @app.get("/v2/query")
+    async def wolfram_query(request: Request):
+        error = await simulate("wolfram")
+        if error:
+            return error
+        return WOLFRAM_PAYLOAD
+
+    @app.post("/v1/chat/completions")
+    async def openai_chat(request: Request):
+        body = await request.json()
+        error = await simulate("openai")
+        if error:
+            return error
+
+        messages = body.get("messages", [])
+        is_vision = any(
+            isinstance(message.get("content"), list)
+            and any(part.get("type") == "image_url" for part in message["content"])
+            for message in messages
+        )
+        content = "x^{2}+5x+6=0" if is_vision else json.dumps(LLM_PAYLOAD, ensure_ascii=False)
+        usage = {
+            "prompt_tokens": 1200 if is_vision else 450,
+            "completion_tokens": 12 if is_vision else 600,
+            "total_tokens": 1212 if is_vision else 1050,
+            "prompt_tokens_details": {"cached_tokens": 1024 if is_vision else 0},
+        }
+        model = body.get("model", "gpt-4o-mini")
+
+        if body.get("stream"):
+            return StreamingResponse(
+                _openai_stream(model, content, usage),
+                media_type="text/event-stream"
+            )
+
+        logprobs = None
+        if body.get("logprobs"):
+            logprobs = {"content": [{"token": content, "logprob": -0.01, "bytes": None, "top_logprobs": []}]}
+
+        return {
+            "id": "chatcmpl-simulated",
+            "object": "chat.completion",
+            "created": 0,
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "logprobs": logprobs,
+                "finish_reason": "stop",
+            }],
+            "usage": usage,
+        }
+
+    @app.post("/v1beta/models/{model}:generateContent")
+    async def gemini_generate(model: str, request: Request):
+        error = await simulate("gemini")
+        if error:
+            return error
+        return _gemini_response(json.dumps(LLM_PAYLOAD, ensure_ascii=False))
+
+    @app.post("/v1beta/models/{model}:streamGenerateContent")
+    async def gemini_stream(model: str, request: Request):
+        error = await simulate("gemini")
+        if error:
+            return error
+        content = json.dumps(LLM_PAYLOAD, ensure_ascii=False)
+        # Flux REST: tableau JSON de réponses partielles
+        chunks = [_gemini_response(content[i:i + 200]) for i in range(0, len(content), 200)]
+        return JSONResponse(content=chunks)
+
+    @app.get("/stats")
+    async def stats():
+        return {
+            "counters": counters,
+            "profiles": {name: repr(profile) for name, profile in profiles.items()},
+        }
+
+    return app
+
+
+async def _openai_stream(model: str, content: str, usage: Dict):
+    """Flux SSE au format des chat completions OpenAI"""
+    def event(payload: Dict) -> str:
+        return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+    base = {"id": "chatcmpl-simulated", "object": "chat.completion.chunk", "created": 0, "model": model}
+    for index in range(0, len(content), 40):
+        yield event({**base, "choices": [{
+            "index": 0,
+            "delta": {"content": content[index:index + 40]},
+            "finish_reason": None,
+        }]})
+        await asyncio.sleep(0)
+    yield event({**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+    yield event({**base, "choices": [], "usage": usage})
+    yield "data: [DONE]\n\n"
+
+
+def _gemini_response(text: str) -> Dict:
+    return {
+        "candidates": [{
+            "content": {"parts": [{"text": text}], "role": "model"},
+            "finishReason": "STOP",
+            "index": 0,
+        }],
+        "usageMetadata": {
+            "promptTokenCount": 450,
+            "candidatesTokenCount": 600,
+            "totalTokenCount": 1050,
+        },
+    }
+
+
+def parse_profiles(spec: str) -> Dict[str, UpstreamProfile]:
+    """Parse "wolfram=1500:0.5:0.01:0.05,openai=2500" en profils par API"""
+    profiles = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, profile_spec = item.split("=", 1)
+        if name not in UPSTREAMS:
+            raise ValueError(f"API simulée inconnue: {name}")
+        profiles[name] = UpstreamProfile.parse(profile_spec)
+    return profiles
+
+
+def app_from_env() -> FastAPI:
+    """Fabrique pour uvicorn --factory (profils lus dans SIMULATOR_PROFILES)"""
+    import os
+    seed = os.getenv("SIMULATOR_SEED")
+    return create_simulator_app(
+        parse_profiles(os.getenv("SIMULATOR_PROFILES", "")),
+        seed=int(seed) if seed else None
+    )
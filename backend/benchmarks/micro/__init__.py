@@ -0,0 +1,3 @@
+"""
+Micro-benchmarks des fonctions CPU exécutées à chaque requête
+"""
@@ -0,0 +1,160 @@
+"""
+Point d'entrée des micro-benchmarks
+Mesure temps et mémoire de chaque cas, puis compare avec la baseline enregistrée
+
+    python -m benchmarks.micro                  # mesure et compare
+    python -m benchmarks.micro --save-baseline  # enregistre la nouvelle baseline
+"""
+import argparse
+import gc
+import json
+import platform
+import statistics
+import sys
+import time
+import timeit
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+from benchmarks.corpus import IMAGE_SIZES
+from benchmarks.micro.cases import build_cases
+
+BASELINE_PATH = Path(__file__).resolve().parent / "baseline.json"
+
+
+def measure(function: Callable[[], None], repeat: int = 7, min_time: float = 0.2) -> Dict:
+    """
+    Mesure un cas
+
+    Le nombre d'appels par mesure est calibré pour durer au moins min_time,
+    le GC est désactivé pendant les mesures (comportement de timeit) et le
+    minimum des répétitions sert de référence, car moins sensible au bruit.
+
+    Returns:
+        Dict avec us_per_call (min), median_us, spread (écart relatif médiane/min)
+        et peak_kb (pic d'allocation d'un appel)
+    """
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    number = max(1, int(number * min_time / 0.2))
+    timings = [total / number * 1e6 for total in timer.repeat(repeat=repeat, number=number)]
+    best = min(timings)
+    median = statistics.median(timings)
+
+    gc.collect()
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "us_per_call": round(best, 3),
+        "median_us": round(median, 3),
+        "spread": round(median / best - 1, 4) if best else 0.0,
+        "peak_kb": round(peak / 1024, 1),
+        "calls": number,
+    }
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict]) -> Dict[str, Optional[float]]:
+    """
+    Variation relative du temps par appel par rapport à la baseline
+
+    Returns:
+        Dict nom -> variation (0.12 = 12% plus lent), None si le cas est absent de la baseline
+    """
+    deltas = {}
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if not reference or not reference.get("us_per_call"):
+            deltas[name] = None
+            continue
+        deltas[name] = result["us_per_call"] / reference["us_per_call"] - 1
+    return deltas
+
+
+def _environment() -> Dict:
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+        "system": platform.system(),
+    }
+
+
+def _print_results(results: Dict[str, Dict], deltas: Dict[str, Optional[float]], threshold: float):
+    print(f"\n{'cas':<38}{'µs/appel':>13}{'médiane':>13}{'dispersion':>12}{'pic Ko':>10}{'vs baseline':>14}")
+    for name, row in results.items():
+        delta = deltas.get(name)
+        if delta is None:
+            versus = "-"
+        else:
+            flag = " !" if delta > threshold else ""
+            versus = f"{delta:+.1%}{flag}"
+        print(
+            f"{name:<38}{row['us_per_call']:>13.2f}{row['median_us']:>13.2f}"
+            f"{row['spread']:>12.1%}{row['peak_kb']:>10.1f}{versus:>14}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks des chemins CPU du backend")
+    parser.add_argument("-k", dest="pattern", default="", help="Ne lance que les cas dont le nom contient ce motif")
+    parser.add_argument("--repeat", type=int, default=7, help="Nombre de répétitions par cas")
+    parser.add_argument("--min-time", type=float, default=0.2, help="Durée minimale d'une répétition (s)")
+    parser.add_argument("--quick", action="store_true", help="Exclut les images de plus de 1 Mo")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH, help="Fichier de baseline")
+    parser.add_argument("--save-baseline", action="store_true", help="Enregistre les résultats comme baseline")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Seuil de régression (0.10 = 10%%)")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Code de sortie 1 si une régression dépasse le seuil")
+    parser.add_argument("--output", type=Path, help="Fichier JSON des résultats")
+    args = parser.parse_args()
+
+    max_image_size = 1024 * 1024 if args.quick else IMAGE_SIZES[-1]
+    cases = {
+        name: function for name, function in build_cases(max_image_size).items()
+        if args.pattern in name
+    }
+    if not cases:
+        parser.error(f"Aucun cas ne correspond à '{args.pattern}'")
+
+    results = {}
+    for name, function in cases.items():
+        print(f"  {name}...", file=sys.stderr, flush=True)
+        results[name] = measure(function, repeat=args.repeat, min_time=args.min_time)
+
+    baseline_document = {}
+    if args.baseline.exists():
+        baseline_document = json.loads(args.baseline.read_text())
+    baseline = baseline_document.get("results", {})
+    deltas = compare(results, baseline)
+    _print_results(results, deltas, args.threshold)
+
+    environment = _environment()
+    if baseline_document and baseline_document.get("environment") != environment:
+        print(f"\nAttention: baseline mesurée sur un autre environnement ({baseline_document.get('environment')})")
+
+    document = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": environment,
+        "results": results,
+    }
+    if args.output:
+        args.output.write_text(json.dumps(document, indent=2, ensure_ascii=False))
+        print(f"\nRésultats écrits dans {args.output}")
+    if args.save_baseline:
+        # Conserve les cas non mesurés lors d'un run filtré (-k)
+        document["results"] = {**baseline, **results}
+        args.baseline.write_text(json.dumps(document, indent=2, ensure_ascii=False) + "\n")
+        print(f"\nBaseline enregistrée dans {args.baseline}")
+
+    regressions = [name for name, delta in deltas.items() if delta is not None and delta > args.threshold]
+    if regressions:
+        print(f"\nRégressions (> {args.threshold:.0%}): {', '.join(regressions)}")
+        if args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Cas de micro-benchmark
+Chaque cas est une fonction sans argument qui traite une entrée du corpus
+"""
+import base64
+import gzip
+import json
+from typing import Callable, Dict
+
+from benchmarks.corpus import (
+    HANDWRITTEN_LATEX,
+    IMAGE_SIZES,
+    LLM_PAYLOAD,
+    PRINTED_LATEX,
+    WOLFRAM_PAYLOAD,
+    make_png,
+)
+
+# Expressions arithmétiques calculables par les fallbacks eval
+DIRECT_EXPRESSIONS = ["2+2", "37-4^{2}", "3^{4}-2^{5}+7", "(12+8)*3-4^2"]
+
+
+def _size_label(size: int) -> str:
+    if size >= 1024 * 1024:
+        return f"{size // (1024 * 1024)}MB"
+    return f"{size // 1024}KB"
+
+
+def _over(function: Callable, inputs) -> Callable[[], None]:
+    """Cas qui applique function à chaque entrée d'un corpus"""
+    def run():
+        for item in inputs:
+            function(item)
+    return run
+
+
+def _streamed(payload: str, chunk_size: int = 40) -> Callable[[], None]:
+    """Cas qui parse un flux LLM découpé en morceaux de chunk_size caractères"""
+    from app.utils.json_stream import StepStreamParser
+
+    chunks = [payload[i:i + chunk_size] for i in range(0, len(payload), chunk_size)]
+
+    def run():
+        parser = StepStreamParser()
+        for chunk in chunks:
+            parser.feed(chunk)
+    return run
+
+
+def build_cases(max_image_size: int = IMAGE_SIZES[-1]) -> Dict[str, Callable[[], None]]:
+    """
+    Construit les cas de benchmark
+
+    Args:
+        max_image_size: Taille maximale des images du corpus (pour des runs rapides)
+
+    Returns:
+        Dict nom -> fonction mesurée
+    """
+    from app.services.analysis_pipeline import direct_calculation
+    from app.services.latex_extraction_service import latex_extraction_service
+    from app.services.template_explanation_service import template_explanation_service
+    from app.services.wolfram_service import wolfram_service
+    from app.utils.file_validation import validate_image_file
+    from app.schemas import AnalyzeResponse
+    from app.utils.json_stream import parse_steps_payload
+    from app.utils.responses import dumps
+
+    cases: Dict[str, Callable[[], None]] = {
+        "post_process_handwritten/handwritten": _over(
+            latex_extraction_service._post_process_handwritten_latex, HANDWRITTEN_LATEX
+        ),
+        "post_process_handwritten/printed": _over(
+            latex_extraction_service._post_process_handwritten_latex, PRINTED_LATEX
+        ),
+        "latex_to_text/printed": _over(wolfram_service._latex_to_text, PRINTED_LATEX),
+        "latex_to_text/handwritten": _over(wolfram_service._latex_to_text, HANDWRITTEN_LATEX),
+        "eval/direct_calculation": _over(direct_calculation, DIRECT_EXPRESSIONS),
+        "eval/simple_expression": _over(
+            wolfram_service._calculate_simple_expression,
+            [wolfram_service._latex_to_text(latex) for latex in DIRECT_EXPRESSIONS]
+        ),
+        "template_explanation/printed": _over(template_explanation_service.explain, PRINTED_LATEX),
+    }
+
+    wolfram_text = json.dumps(WOLFRAM_PAYLOAD)
+    llm_text = json.dumps(LLM_PAYLOAD, ensure_ascii=False)
+    pods = WOLFRAM_PAYLOAD["queryresult"]["pods"]
+    cases.update({
+        "json/wolfram_loads": lambda: json.loads(wolfram_text),
+        "json/wolfram_parse_pods": lambda: wolfram_service._parse_pods(json.loads(wolfram_text)["queryresult"]["pods"]),
+        "json/wolfram_pods_only": lambda: wolfram_service._parse_pods(pods),
+        "json/llm_payload": lambda: parse_steps_payload(llm_text),
+        "json/llm_payload_markdown": lambda: parse_steps_payload(f"```json\n{llm_text}\n```"),
+        "json/llm_stream": _streamed(llm_text),
+    })
+
+    # Sérialisation et compression d'une réponse /api/analyze
+    analyze_result = {
+        "problem": PRINTED_LATEX[0],
+        "latex": PRINTED_LATEX[0],
+        "solution": "x = -2, x = -3",
+        "steps": LLM_PAYLOAD["steps"],
+    }
+    analyze_model = AnalyzeResponse.model_validate(analyze_result)
+    analyze_body = dumps(analyze_model)
+
+    cases.update({
+        "response/json_stdlib": lambda: json.dumps(analyze_result, ensure_ascii=False).encode("utf-8"),
+        "response/json_fast": lambda: dumps(analyze_result),
+        "response/model_validate_dump": lambda: dumps(AnalyzeResponse.model_validate(analyze_result)),
+        "response/model_dump": lambda: dumps(analyze_model),
+        # Même niveau que le middleware (COMPRESSION_GZIP_LEVEL par défaut)
+        "response/gzip": lambda: gzip.compress(analyze_body, compresslevel=6),
+    })
+
+    for size in (size for size in IMAGE_SIZES if size <= max_image_size):
+        image = make_png(size, seed=size)
+        label = _size_label(size)
+        # max_size à la taille de l'image: mesure le parcours complet, pas le rejet immédiat
+        cases[f"validate_image/{label}"] = lambda image=image: validate_image_file(
+            image, "image/png", max_size=len(image)
+        )
+        cases[f"base64/{label}"] = lambda image=image: base64.b64encode(image).decode("utf-8")
+
+    return cases
@@ -2,24 +2,43 @@
 Application principale FastAPI pour Math Assistant
 """
 import logging
+import time
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from app.routes import api
+from app.routes import api, debug
 from app.config import config
+from app.utils.compression import CompressionMiddleware
+from app.utils.logging_pipeline import logging_pipeline
+from app.utils.loop_watchdog import loop_watchdog
+from app.utils.profiling import profile_store, request_profiler_slot
+from app.utils.responses import FastJSONResponse
+from app.utils.tracing import tracer
 
-# Configuration du logging
-logging.basicConfig(
+# Configuration du logging (formatage et écriture dans un thread dédié)
+logging_pipeline.configure(
     level=logging.INFO if not config.DEBUG else logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    log_format=config.LOG_FORMAT
 )
 
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Démarrage et arrêt du worker"""
+    if config.LOOP_WATCHDOG:
+        loop_watchdog.start()
+    yield
+    loop_watchdog.stop()
+    logging_pipeline.shutdown()
+
+
 app = FastAPI(
     title="Math Assistant API",
     description="API pour résoudre des problèmes mathématiques à partir d'images",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse
 )
 
 # Configuration CORS
@@ -32,17 +51,83 @@ app.add_middleware(
     expose_headers=["*"],
 )
 
-# Middleware de logging des requêtes
+# Middleware de logging des requêtes: un record d'accès structuré par requête
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
-    """Log toutes les requêtes entrantes"""
-    logger.info(f"{request.method} {request.url.path}")
-    response = await call_next(request)
-    logger.info(f"{request.method} {request.url.path} - {response.status_code}")
+    """Échantillonne les logs de la requête et log son accès avec la durée des étapes"""
+    token = logging_pipeline.start_request(request.url.path)
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        logging_pipeline.log_access(
+            request.method, request.url.path, status, (time.perf_counter() - start) * 1000
+        )
+        logging_pipeline.end_request(token)
+
+# Profilage déterministe d'une analyse à la demande (en-tête X-Profile: 1 + jeton admin)
+@app.middleware("http")
+async def profile_requests(request: Request, call_next):
+    """Profile la requête et retourne l'URL de son profil dans X-Profile-Url"""
+    if (
+        request.url.path != "/api/analyze"
+        or request.headers.get("X-Profile") != "1"
+        or not debug.is_admin_request(request)
+    ):
+        return await call_next(request)
+    
+    profiler = request_profiler_slot.acquire()
+    if profiler is None:
+        response = await call_next(request)
+        response.headers["X-Profile-Status"] = "busy"
+        return response
+    try:
+        profiler.start()
+        try:
+            response = await call_next(request)
+        finally:
+            collapsed = profiler.stop()
+    finally:
+        request_profiler_slot.release()
+    
+    profile_id = profile_store.add(collapsed)
+    logger.info(f"Profil de requête enregistré: /debug/profile/{profile_id}")
+    response.headers["X-Profile-Id"] = profile_id
+    response.headers["X-Profile-Url"] = f"/debug/profile/{profile_id}"
     return response
 
+# Middleware de traçage: span racine de chaque requête, rattaché au traceparent du client
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """Ouvre le span racine de la requête et retourne son identifiant de trace"""
+    with tracer.request_span(
+        request.method,
+        request.url.path,
+        traceparent=request.headers.get("traceparent")
+    ) as span:
+        response = await call_next(request)
+        span.set_attribute("http.status_code", response.status_code)
+        if response.status_code >= 500:
+            span.status = "error"
+        if tracer.enabled:
+            response.headers["X-Trace-Id"] = span.trace_id
+        return response
+
+# Compression des réponses (gzip, ou brotli si installé) selon Accept-Encoding
+if config.RESPONSE_COMPRESSION:
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=config.COMPRESSION_MIN_SIZE,
+        gzip_level=config.COMPRESSION_GZIP_LEVEL,
+        brotli_quality=config.COMPRESSION_BROTLI_QUALITY
+    )
+
 # Inclusion des routes
 app.include_router(api.router)
+app.include_router(debug.router)
 
 
 @app.get("/")
@@ -53,7 +138,14 @@ async def root():
         "version": "1.0.0",
         "endpoints": {
             "POST /api/latex": "Extrait le LaTeX depuis une image",
-            "POST /api/analyze": "Analyse complète (LaTeX + Résolution + Explication)"
+            "POST /api/latex/regions": "Extrait les équations d'une page (une par région)",
+            "POST /api/analyze": "Analyse complète (LaTeX + Résolution + Explication)",
+            "GET /api/results/{etag}": "Résultat déjà calculé (cacheable)",
+            "GET /api/history": "Historique des analyses du client (en-tête X-Client-Id)",
+            "GET /api/history/{id}": "Analyse enregistrée (sans recalcul)",
+            "GET /api/similar": "Problèmes déjà résolus de même structure",
+            "POST /api/export/pdf": "Export PDF d'une ou plusieurs analyses (flux)",
+            "POST /api/ingest": "Pages d'un PDF ou d'une archive zip, résultats en flux (NDJSON)"
         }
     }
 
@@ -71,7 +163,7 @@ async def health():
 async def global_exception_handler(request: Request, exc: Exception):
     """Gestionnaire d'erreurs global pour capturer toutes les exceptions non gérées"""
     logger.error(f"Exception non gérée: {str(exc)}", exc_info=True)
-    return JSONResponse(
+    return FastJSONResponse(
         status_code=500,
         content={
             "error": True,
@@ -87,6 +179,7 @@ if __name__ == "__main__":
         "main:app",
         host=config.HOST,
         port=config.PORT,
-        reload=config.DEBUG
+        reload=config.DEBUG,
+        access_log=False  # Remplacé par le record d'accès structuré (log_requests)
     )
 
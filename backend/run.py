@@ -10,6 +10,7 @@ if __name__ == "__main__":
         host=config.HOST,
         port=config.PORT,
         reload=config.DEBUG,
-        log_level="info"
+        log_level="info",
+        access_log=False  # Remplacé par le record d'accès structuré (log_requests)
     )
 
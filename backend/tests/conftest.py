@@ -0,0 +1,8 @@
+"""
+Configuration pytest: le répertoire backend est importable (app.*)
+depuis n'importe quel répertoire de lancement
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
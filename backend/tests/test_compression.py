@@ -0,0 +1,45 @@
+"""
+Tests du choix de l'encodage de compression (app.utils.compression)
+"""
+import pytest
+
+from app.utils import compression
+from app.utils.compression import choose_encoding, parse_accept_encoding
+
+
+@pytest.fixture
+def without_brotli(monkeypatch):
+    monkeypatch.setattr(compression, "brotli", None)
+
+
+@pytest.fixture
+def with_brotli(monkeypatch):
+    # Seule la présence du module compte pour le choix de l'encodage
+    monkeypatch.setattr(compression, "brotli", object())
+
+
+def test_parse_accept_encoding_qvalues():
+    assert parse_accept_encoding("gzip, br;q=0.5, identity;q=0") == {"gzip": 1.0, "br": 0.5, "identity": 0.0}
+    assert parse_accept_encoding("gzip;q=abc") == {"gzip": 0.0}
+    assert parse_accept_encoding("") == {}
+
+
+def test_choose_encoding_prefers_brotli_at_equal_quality(with_brotli):
+    assert choose_encoding("gzip, deflate, br") == "br"
+
+
+def test_choose_encoding_follows_client_quality(with_brotli):
+    assert choose_encoding("br;q=0.5, gzip") == "gzip"
+    assert choose_encoding("br;q=0, gzip;q=0") is None
+
+
+def test_choose_encoding_without_brotli(without_brotli):
+    assert choose_encoding("br") is None
+    assert choose_encoding("gzip, br") == "gzip"
+
+
+def test_choose_encoding_wildcard_and_identity(without_brotli):
+    assert choose_encoding("*") == "gzip"
+    assert choose_encoding("*, gzip;q=0") is None
+    assert choose_encoding("identity") is None
+    assert choose_encoding("") is None
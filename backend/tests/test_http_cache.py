@@ -0,0 +1,39 @@
+"""
+Tests des ETags et requêtes conditionnelles (app.utils.http_cache)
+"""
+from app.utils.http_cache import encoding_etag, etag_matches, format_etag
+
+
+def test_encoding_etag_suffixes_strong_etag():
+    assert encoding_etag('"abc"', "gzip") == '"abc-gzip"'
+    assert encoding_etag('"abc"', "br") == '"abc-br"'
+
+
+def test_encoding_etag_keeps_weak_etag():
+    assert encoding_etag('W/"abc"', "gzip") == 'W/"abc"'
+
+
+def test_etag_matches_exact_and_list():
+    etag = format_etag("abc")
+    assert etag_matches('"abc"', etag)
+    assert etag_matches('"other", "abc"', etag)
+    assert not etag_matches('"other"', etag)
+    assert not etag_matches(None, etag)
+    assert not etag_matches("", etag)
+
+
+def test_etag_matches_wildcard_and_weak_comparison():
+    etag = format_etag("abc")
+    assert etag_matches("*", etag)
+    assert etag_matches('W/"abc"', etag)
+    assert etag_matches('"abc"', 'W/"abc"')
+
+
+def test_etag_matches_compressed_representation():
+    etag = format_etag("abc")
+    assert etag_matches('"abc-gzip"', etag)
+    assert etag_matches('"abc-br"', etag)
+    assert etag_matches(encoding_etag(etag, "gzip"), etag)
+    # Un autre résultat dont l'identifiant se termine pareil ne correspond pas
+    assert not etag_matches('"ab-gzip"', etag)
+    assert not etag_matches('"abc-deflate"', etag)
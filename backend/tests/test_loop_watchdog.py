@@ -0,0 +1,62 @@
+"""
+Tests de la surveillance de la boucle d'événements (app.utils.loop_watchdog)
+Un appel bloquant dans un handler async doit être signalé avec sa route.
+"""
+import asyncio
+import time
+
+import httpx
+from fastapi import FastAPI
+
+from app.utils.loop_watchdog import LoopWatchdog
+
+
+def _app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/blocking/{item_id}")
+    async def blocking(item_id: int):
+        time.sleep(0.3)  # Appel synchrone dans un handler async: bloque la boucle
+        return {"item_id": item_id}
+
+    @app.get("/async")
+    async def non_blocking():
+        await asyncio.sleep(0.3)
+        return {}
+
+    return app
+
+
+async def _request(path: str, watchdog: LoopWatchdog) -> dict:
+    watchdog.start()
+    try:
+        transport = httpx.ASGITransport(app=_app())
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.get(path)
+            assert response.status_code == 200
+        # Battement suivant: durée totale du blocage connue
+        await asyncio.sleep(watchdog.interval * 4)
+        return watchdog.stats()
+    finally:
+        watchdog.stop()
+
+
+def test_blocking_call_is_reported_with_its_route():
+    watchdog = LoopWatchdog(threshold=0.1, interval=0.02)
+    stats = asyncio.run(_request("/blocking/7", watchdog))
+
+    assert stats["blocked_by_route"].get("GET /blocking/{item_id}") == 1
+    report = stats["reports"][0]
+    assert report["route"] == "GET /blocking/{item_id}"
+    assert report["blocked_ms"] >= 200
+    # La pile désigne la ligne bloquante du handler
+    assert any("in blocking" in entry and "time.sleep" in entry for entry in report["stack"])
+    assert stats["lag_ms"]["max"] >= 200
+
+
+def test_awaiting_handler_is_not_reported():
+    watchdog = LoopWatchdog(threshold=0.1, interval=0.02)
+    stats = asyncio.run(_request("/async", watchdog))
+
+    assert stats["reports"] == []
+    assert stats["blocked_by_route"] == {}
@@ -0,0 +1,154 @@
+"""
+Tests de l'ordonnancement des calculs (app.services.scheduler_service)
+"""
+import asyncio
+
+from app.services.scheduler_service import WorkClass, WorkScheduler, parse_weights
+
+
+async def _hold(scheduler: WorkScheduler, work: WorkClass, order: list, release: asyncio.Event):
+    async with scheduler.slot(work):
+        order.append(work)
+        await release.wait()
+
+
+async def _admission_order(scheduler: WorkScheduler, arrivals: list) -> list:
+    """Ordre d'admission d'arrivées mises en file derrière un calcul qui occupe la seule place"""
+    order: list = []
+    blocker = asyncio.Event()
+    release = asyncio.Event()
+    release.set()
+    holder = asyncio.create_task(_hold(scheduler, WorkClass("interactive", "holder"), [], blocker))
+    await asyncio.sleep(0)
+    tasks = []
+    for work in arrivals:
+        tasks.append(asyncio.create_task(_hold(scheduler, work, order, release)))
+        await asyncio.sleep(0)
+    blocker.set()
+    await asyncio.gather(holder, *tasks)
+    return order
+
+
+def test_parse_weights_ignores_invalid_entries():
+    assert parse_weights("ecole-a=3, ecole-b=0.5,bad=x,neg=-1,,=2") == {"ecole-a": 3.0, "ecole-b": 0.5}
+
+
+def test_classify_only_lowers_priority():
+    scheduler = WorkScheduler(slots=4)
+    assert scheduler.classify("interactive", requested="batch").priority == "batch"
+    assert scheduler.classify("batch", requested="interactive").priority == "batch"
+    assert scheduler.classify("batch", requested="unknown").priority == "batch"
+
+
+def test_classify_tenant_identity():
+    scheduler = WorkScheduler(slots=4)
+    assert scheduler.classify("interactive", tenant_id="ecole-a").tenant == "ecole-a"
+    assert scheduler.classify("interactive", tenant_id="bad tenant!", client_host="1.2.3.4").tenant == "ip:1.2.3.4"
+    by_key = scheduler.classify("interactive", api_key="secret").tenant
+    assert by_key.startswith("key:") and "secret" not in by_key
+    assert scheduler.classify("interactive").tenant == "public"
+
+
+def test_higher_priority_class_is_admitted_first():
+    scheduler = WorkScheduler(slots=1, interactive_reserve=0)
+    arrivals = [WorkClass("warmup", "t"), WorkClass("batch", "t"), WorkClass("interactive", "t")]
+    order = asyncio.run(_admission_order(scheduler, arrivals))
+    assert [work.priority for work in order] == ["interactive", "batch", "warmup"]
+
+
+def test_tenants_are_served_fairly_within_a_class():
+    scheduler = WorkScheduler(slots=1, interactive_reserve=0)
+    arrivals = [WorkClass("batch", "big")] * 4 + [WorkClass("batch", "small")]
+    order = asyncio.run(_admission_order(scheduler, arrivals))
+    # Le petit locataire passe à son tour, pas après les quatre calculs du gros
+    assert [work.tenant for work in order].index("small") <= 1
+
+
+def test_tenant_weights_share_slots():
+    scheduler = WorkScheduler(slots=1, interactive_reserve=0, tenant_weights={"heavy": 3.0})
+    arrivals = [WorkClass("batch", "heavy")] * 6 + [WorkClass("batch", "light")] * 6
+    order = asyncio.run(_admission_order(scheduler, arrivals))
+    first_eight = [work.tenant for work in order[:8]]
+    assert first_eight.count("heavy") == 6
+
+
+def test_interactive_reserve_is_kept_from_batch():
+    async def scenario():
+        scheduler = WorkScheduler(slots=2, interactive_reserve=1)
+        release = asyncio.Event()
+        order: list = []
+        first = asyncio.create_task(_hold(scheduler, WorkClass("batch", "t"), order, release))
+        second = asyncio.create_task(_hold(scheduler, WorkClass("batch", "t"), order, release))
+        await asyncio.sleep(0.01)
+        # Une seule place pour les lots: la seconde est réservée aux requêtes interactives
+        assert len(order) == 1
+        interactive = asyncio.create_task(_hold(scheduler, WorkClass("interactive", "t"), order, release))
+        await asyncio.sleep(0.01)
+        assert [work.priority for work in order] == ["batch", "interactive"]
+        release.set()
+        await asyncio.gather(first, second, interactive)
+        assert scheduler.stats()["running"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def scenario():
+        scheduler = WorkScheduler(slots=1, interactive_reserve=0)
+        blocker = asyncio.Event()
+        release = asyncio.Event()
+        release.set()
+        order: list = []
+        holder = asyncio.create_task(_hold(scheduler, WorkClass("batch", "holder"), order, blocker))
+        await asyncio.sleep(0)
+        cancelled = asyncio.create_task(_hold(scheduler, WorkClass("batch", "gone"), order, release))
+        waiting = asyncio.create_task(_hold(scheduler, WorkClass("batch", "kept"), order, release))
+        await asyncio.sleep(0)
+        assert scheduler.stats()["classes"]["batch"]["queued"] == 2
+
+        cancelled.cancel()
+        await asyncio.sleep(0)
+        assert scheduler.stats()["classes"]["batch"]["queued"] == 1
+
+        blocker.set()
+        await asyncio.wait_for(asyncio.gather(holder, waiting), timeout=1)
+        assert [work.tenant for work in order] == ["holder", "kept"]
+        assert scheduler.stats()["running"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_slot_granted_to_a_cancelled_waiter_is_passed_on():
+    async def scenario():
+        scheduler = WorkScheduler(slots=1, interactive_reserve=0)
+        release = asyncio.Event()
+        release.set()
+        order: list = []
+        holder = scheduler.slot(WorkClass("batch", "holder"))
+        await holder.__aenter__()
+        cancelled = asyncio.create_task(_hold(scheduler, WorkClass("batch", "gone"), order, release))
+        waiting = asyncio.create_task(_hold(scheduler, WorkClass("batch", "kept"), order, release))
+        await asyncio.sleep(0)
+
+        # La place est attribuée à 'gone' (sans reprise de sa tâche), qui est annulée aussitôt
+        await holder.__aexit__(None, None, None)
+        cancelled.cancel()
+        # Sans place rendue par la tâche annulée, 'kept' attendrait indéfiniment
+        await asyncio.wait_for(waiting, timeout=1)
+        assert [work.tenant for work in order] == ["kept"]
+        assert cancelled.cancelled()
+        assert scheduler.stats()["running"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_disabled_scheduler_does_not_wait():
+    async def scenario():
+        scheduler = WorkScheduler(slots=0)
+        async with scheduler.slot(WorkClass("warmup", "t")):
+            async with scheduler.slot(WorkClass("warmup", "t")):
+                pass
+        return scheduler.stats()
+
+    stats = asyncio.run(scenario())
+    assert not stats["enabled"] and stats["running"] == 0
@@ -0,0 +1,183 @@
+"""
+Préchauffage du cache de résultats avec un corpus d'exercices connu à l'avance
+Chaque problème (LaTeX ou image) passe par le pipeline complet (extraction,
+résolution, explication); les résultats sont écrits dans la base SQLite
+RESULT_CACHE_DB lue par les workers. Les problèmes déjà en cache sont ignorés:
+une exécution interrompue reprend là où elle s'était arrêtée.
+
+    python warm_cache.py corpus/                       # images et fichiers .tex/.txt
+    python warm_cache.py exercices.tex --concurrency 4 --rate 2
+    python warm_cache.py corpus/ --ttl-days 120 --db data/results.db
+"""
+import argparse
+import logging
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+from app.config import config
+from app.utils.rate_limit import RateLimiter
+
+# Fichiers texte du corpus: un problème LaTeX par ligne (lignes '#' ignorées)
+LATEX_EXTENSIONS = {".tex", ".txt"}
+
+
+@dataclass
+class Problem:
+    """Problème du corpus: LaTeX ou image"""
+    label: str
+    latex: Optional[str] = None
+    image_path: Optional[Path] = None
+
+
+def iter_corpus(paths: List[str]) -> Iterator[Problem]:
+    """Problèmes des fichiers et répertoires donnés (parcours récursif, ordre stable)"""
+    for raw_path in paths:
+        path = Path(raw_path)
+        files = sorted(p for p in path.rglob("*") if p.is_file()) if path.is_dir() else [path]
+        for file in files:
+            suffix = file.suffix.lower()
+            if suffix in LATEX_EXTENSIONS:
+                for number, line in enumerate(file.read_text(encoding="utf-8").splitlines(), 1):
+                    line = line.strip()
+                    if line and not line.startswith("#"):
+                        yield Problem(label=f"{file}:{number}", latex=line)
+            elif suffix.lstrip(".") in config.ALLOWED_EXTENSIONS:
+                yield Problem(label=str(file), image_path=file)
+
+
+class CacheWarmer:
+    """Exécute le pipeline sur le corpus avec une concurrence et un débit bornés"""
+
+    def __init__(self, concurrency: int, rate: float, force: bool = False):
+        from app.services.analysis_pipeline import analysis_pipeline
+
+        self.pipeline = analysis_pipeline
+        self.concurrency = concurrency
+        self.limiter = RateLimiter(rate)
+        self.force = force
+        self.counts: Dict[str, int] = {"calculé": 0, "en cache": 0, "dégradé": 0, "échec": 0}
+
+    def warm(self, problem: Problem) -> str:
+        """Analyse un problème s'il n'est pas déjà en cache; retourne son statut"""
+        from app.services.history_service import history_service
+        from app.services.result_cache import result_cache
+        from app.utils.file_validation import validate_image_file
+
+        image_bytes = None
+        if problem.image_path is not None:
+            image_bytes = problem.image_path.read_bytes()
+            is_valid, error_message = validate_image_file(image_bytes, max_size=config.MAX_UPLOAD_SIZE)
+            if not is_valid:
+                raise ValueError(error_message)
+
+        result_id = self.pipeline.analysis_result_id(problem.latex, image_bytes)
+        if not self.force and result_cache.get(result_id) is not None:
+            return "en cache"
+
+        self.limiter.acquire()
+        outcome = self.pipeline.analyze_cached(problem.latex, image_bytes)
+        # Résultat dégradé non enregistré: retenté à la prochaine exécution
+        if not outcome.complete:
+            return "dégradé"
+        history_service.record(result_id, outcome.result, True, "warm_cache", outcome.timings_ms)
+        return "calculé"
+
+    def run(self, problems: List[Problem]) -> Dict[str, int]:
+        total = len(problems)
+        start = time.monotonic()
+        done = 0
+        pending: Dict[Future, Problem] = {}
+        queue = iter(problems)
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="warm") as executor:
+            try:
+                while True:
+                    # Soumission au fil de l'eau: un Ctrl-C n'abandonne que les analyses en cours
+                    while len(pending) < self.concurrency * 2:
+                        problem = next(queue, None)
+                        if problem is None:
+                            break
+                        pending[executor.submit(self._timed, problem)] = problem
+                    if not pending:
+                        break
+                    finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        problem = pending.pop(future)
+                        done += 1
+                        try:
+                            status, duration = future.result()
+                            detail = f"{duration:5.1f}s"
+                        except Exception as e:
+                            status, detail = "échec", str(e)[:80]
+                        self.counts[status] += 1
+                        elapsed = time.monotonic() - start
+                        eta = elapsed / done * (total - done)
+                        print(
+                            f"[{done:>{len(str(total))}}/{total}] {status:<9} {detail:<8} "
+                            f"{problem.label} (reste ~{eta:.0f}s)",
+                            flush=True
+                        )
+            except KeyboardInterrupt:
+                for future in pending:
+                    future.cancel()
+                print("\nInterrompu: relancer la commande pour reprendre.", flush=True)
+                raise
+        return self.counts
+
+    def _timed(self, problem: Problem):
+        start = time.perf_counter()
+        status = self.warm(problem)
+        return status, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Préchauffe le cache de résultats avec un corpus d'exercices")
+    parser.add_argument("paths", nargs="+", help="Fichiers ou répertoires (images, .tex/.txt: un LaTeX par ligne)")
+    parser.add_argument("--concurrency", type=int, default=2, help="Analyses simultanées")
+    parser.add_argument("--rate", type=float, default=1.0, help="Analyses démarrées par seconde au plus (0: illimité)")
+    parser.add_argument("--db", default=config.RESULT_CACHE_DB, help="Base SQLite des résultats (RESULT_CACHE_DB)")
+    parser.add_argument(
+        "--ttl-days", type=float,
+        help="Validité des résultats en jours (par défaut RESULT_CACHE_TTL), ex: durée du trimestre"
+    )
+    parser.add_argument("--force", action="store_true", help="Recalcule aussi les problèmes déjà en cache")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Affiche les logs des services")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO if args.verbose else logging.WARNING,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    if not args.db:
+        parser.error("aucune base de résultats: définir RESULT_CACHE_DB ou passer --db")
+
+    from app.services.result_cache import result_cache
+
+    result_cache.db_path = args.db
+    if args.ttl_days is not None:
+        result_cache.ttl = args.ttl_days * 86400
+
+    problems = list(iter_corpus(args.paths))
+    if not problems:
+        parser.error("aucun problème trouvé dans le corpus")
+    print(
+        f"{len(problems)} problème(s), concurrence {args.concurrency}, "
+        f"{args.rate:g} analyse(s)/s, cache {args.db}",
+        flush=True
+    )
+
+    start = time.monotonic()
+    try:
+        counts = CacheWarmer(args.concurrency, args.rate, force=args.force).run(problems)
+    except KeyboardInterrupt:
+        sys.exit(130)
+    summary = ", ".join(f"{count} {status}" for status, count in counts.items())
+    print(f"\nTerminé en {time.monotonic() - start:.0f}s: {summary}")
+    sys.exit(1 if counts["échec"] else 0)
+
+
+if __name__ == "__main__":
+    main()
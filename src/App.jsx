@@ -2,7 +2,7 @@ import { useState, useRef, useEffect } from 'react'
 import './App.css'
 import LaTeXRenderer from './components/LaTeXRenderer'
 import ErrorDisplay from './components/ErrorDisplay'
-import { getLaTeXFromImage, analyzeImage } from './services/api'
+import { getLaTeXFromImage, analyzeImage, exportPDF } from './services/api'
 import { generatePDFSimple } from './utils/pdfGenerator'
 
 function App() {
@@ -265,6 +265,25 @@ function App() {
   const handleDownloadPDF = async () => {
     if (!problemData) return
     
+    try {
+      const blob = await exportPDF([{
+        problem: problemData.problem || '',
+        latex: problemData.latex || extractedLaTeX || '',
+        solution: problemData.solution || '',
+        steps: problemData.steps || [],
+      }])
+      const url = URL.createObjectURL(blob)
+      const link = document.createElement('a')
+      link.href = url
+      link.download = `solution_math_${new Date().toISOString().split('T')[0]}.pdf`
+      link.click()
+      URL.revokeObjectURL(url)
+      return
+    } catch (error) {
+      // Backend indisponible: génération locale
+      console.warn('Export PDF serveur indisponible:', error)
+    }
+
     try {
       await generatePDFSimple({
         problem: problemData.problem,
@@ -646,7 +665,10 @@ function App() {
               <div className="problem-card">
                 <p className="card-label">Equation Détectée</p>
                 <div className="problem-equation-container">
-                  <LaTeXRenderer latex={problemData.latex || extractedLaTeX || problemData.problem} />
+                  <LaTeXRenderer
+                    latex={problemData.latex || extractedLaTeX || problemData.problem}
+                    rendered={problemData.latex ? problemData.latexRendered : null}
+                  />
                 </div>
                 {problemData.solution && (
                   <p className="problem-solution">Solution: {problemData.solution}</p>
@@ -674,7 +696,7 @@ function App() {
                       )}
                       {step.formula && (
                         <div className="step-formula-container">
-                          <LaTeXRenderer latex={step.formula} />
+                          <LaTeXRenderer latex={step.formula} rendered={step.formula_rendered} />
                         </div>
                       )}
                       {step.explanation && (
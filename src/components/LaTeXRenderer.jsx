@@ -41,14 +41,27 @@ const cleanLaTeX = (latex) => {
 /**
  * Composant pour afficher des équations LaTeX
  * @param {string} latex - La chaîne LaTeX à afficher
+ * @param {string} rendered - Balisage SVG/MathML pré-rendu par le serveur (optionnel)
  * @param {boolean} inline - Si true, affiche en ligne, sinon en bloc
  * @param {string} className - Classes CSS additionnelles
  */
-const LaTeXRenderer = ({ latex, inline = false, className = '' }) => {
+const LaTeXRenderer = ({ latex, rendered = null, inline = false, className = '' }) => {
   if (!latex || String(latex).trim() === '') {
     return <span className={className}>Aucune équation détectée</span>;
   }
 
+  // Formule pré-rendue par le backend: affichée telle quelle, sans composition KaTeX
+  if (rendered) {
+    const Tag = inline ? 'span' : 'div';
+    return (
+      <Tag
+        className={`latex-prerendered ${className}`}
+        style={inline ? undefined : { textAlign: 'center', margin: '1em 0' }}
+        dangerouslySetInnerHTML={{ __html: rendered }}
+      />
+    );
+  }
+
   // Nettoyer le LaTeX
   const cleanedLatex = cleanLaTeX(latex);
 
@@ -11,6 +11,105 @@ const API_BASE_URL = import.meta.env.VITE_API_BASE_URL ||
     return 'http://localhost:5000/api'; // Fallback (ne devrait pas arriver en production)
   })());
 
+/**
+ * Génère un en-tête W3C traceparent pour relier la requête à sa trace côté backend
+ * L'identifiant de trace est aussi renvoyé par le backend dans l'en-tête X-Trace-Id
+ */
+const randomHex = (length) => Array.from(
+  crypto.getRandomValues(new Uint8Array(length)),
+  (b) => b.toString(16).padStart(2, '0')
+).join('');
+
+const createTraceparent = () => `00-${randomHex(16)}-${randomHex(8)}-01`;
+
+/**
+ * Identifiant aléatoire du navigateur, envoyé dans X-Client-Id
+ * Le backend y rattache les analyses pour retrouver l'historique de ce client.
+ */
+const CLIENT_ID_KEY = 'mathAssistantClientId';
+
+const getClientId = () => {
+  try {
+    let clientId = localStorage.getItem(CLIENT_ID_KEY);
+    if (!clientId) {
+      clientId = randomHex(16);
+      localStorage.setItem(CLIENT_ID_KEY, clientId);
+    }
+    return clientId;
+  } catch {
+    return null; // Stockage indisponible (navigation privée): pas d'historique
+  }
+};
+
+const clientHeaders = () => {
+  const clientId = getClientId();
+  return clientId ? { 'X-Client-Id': clientId } : {};
+};
+
+/**
+ * Envoie une requête POST, avec une nouvelle tentative en cas d'erreur réseau
+ * Chaque tentative porte la même clé d'idempotence: le backend la rattache au
+ * calcul déjà en cours (ou renvoie le résultat enregistré) au lieu de relancer
+ * l'extraction, WolframAlpha et le LLM.
+ */
+const NETWORK_RETRIES = 1;
+
+const postWithRetry = async (url, headers, body) => {
+  const options = {
+    method: 'POST',
+    headers: { ...headers, 'Idempotency-Key': randomHex(16) },
+    body,
+  };
+  for (let attempt = 0; ; attempt++) {
+    try {
+      return await fetch(url, options);
+    } catch (error) {
+      if (!(error instanceof TypeError) || attempt >= NETWORK_RETRIES) {
+        throw error;
+      }
+    }
+  }
+};
+
+/**
+ * Derniers résultats reçus, par entrée (image ou LaTeX), avec leur ETag
+ * L'ETag est renvoyé dans If-None-Match: le backend répond 304 sans corps
+ * si le résultat est toujours à jour, et la copie locale est réutilisée.
+ */
+const MAX_CACHED_RESULTS = 10;
+const resultCache = new Map();
+
+const resultCacheKey = (endpoint, imageData, latex = null) => {
+  if (latex) {
+    return `${endpoint}:latex:${latex}`;
+  }
+  const imageKey = imageData instanceof File
+    ? `${imageData.name}:${imageData.size}:${imageData.lastModified}`
+    : imageData;
+  return `${endpoint}:image:${imageKey}`;
+};
+
+const conditionalHeaders = (key) => {
+  const cached = resultCache.get(key);
+  return cached ? { 'If-None-Match': cached.etag } : {};
+};
+
+const readResult = async (response, key) => {
+  if (response.status === 304 && resultCache.has(key)) {
+    return resultCache.get(key).data;
+  }
+  const data = await response.json();
+  const etag = response.headers.get('ETag');
+  if (etag) {
+    resultCache.delete(key);
+    resultCache.set(key, { etag, data });
+    if (resultCache.size > MAX_CACHED_RESULTS) {
+      resultCache.delete(resultCache.keys().next().value);
+    }
+  }
+  return data;
+};
+
 /**
  * Convertit une image (base64 ou File) en FormData pour l'envoi
  */
@@ -89,18 +188,20 @@ const handleApiError = (error) => {
 export const getLaTeXFromImage = async (imageData) => {
   try {
     const formData = imageToFormData(imageData);
+    const cacheKey = resultCacheKey('latex', imageData);
     
-    const response = await fetch(`${API_BASE_URL}/latex`, {
-      method: 'POST',
-      body: formData,
-    });
+    const response = await postWithRetry(
+      `${API_BASE_URL}/latex`,
+      { traceparent: createTraceparent(), ...conditionalHeaders(cacheKey) },
+      formData
+    );
 
-    if (!response.ok) {
+    if (!response.ok && response.status !== 304) {
       const error = await response.json().catch(() => ({ message: 'Erreur inconnue' }));
       throw { response: { status: response.status, data: error } };
     }
 
-    const data = await response.json();
+    const data = await readResult(response, cacheKey);
     return {
       latex: data.latex || data.text || '',
       confidence: data.confidence || 0,
@@ -116,11 +217,40 @@ export const getLaTeXFromImage = async (imageData) => {
   }
 };
 
+/**
+ * Extrait toutes les équations d'une page (une par région, dans l'ordre de lecture)
+ * @param {string|File} imageData - Image en base64 ou File
+ * @returns {Promise<Array<{index: number, box: Array<number>|null, latex: string, confidence: number}>>}
+ */
+export const getLaTeXRegionsFromImage = async (imageData) => {
+  try {
+    const formData = imageToFormData(imageData);
+    const cacheKey = resultCacheKey('latex-regions', imageData);
+    
+    const response = await postWithRetry(
+      `${API_BASE_URL}/latex/regions`,
+      { traceparent: createTraceparent(), ...conditionalHeaders(cacheKey) },
+      formData
+    );
+
+    if (!response.ok && response.status !== 304) {
+      const error = await response.json().catch(() => ({ message: 'Erreur inconnue' }));
+      throw { response: { status: response.status, data: error } };
+    }
+
+    const data = await readResult(response, cacheKey);
+    return data.regions || [];
+  } catch (error) {
+    const errorMessage = handleApiError(error);
+    throw new Error(errorMessage);
+  }
+};
+
 /**
  * Analyse complète d'une image : LaTeX → Résolution → Explication
  * @param {string|File} imageData - Image en base64 ou File
  * @param {string} latex - LaTeX confirmé par l'utilisateur (optionnel)
- * @returns {Promise<{problem: string, solution: string, steps: Array, latex: string}>}
+ * @returns {Promise<{problem: string, solution: string, steps: Array, latex: string, latexRendered: string|null}>}
  */
 export const analyzeImage = async (imageData, latex = null) => {
   try {
@@ -128,9 +258,85 @@ export const analyzeImage = async (imageData, latex = null) => {
     if (latex) {
       formData.append('latex', latex);
     }
+    // Formules pré-rendues par le serveur (SVG): pas de composition KaTeX à l'affichage
+    formData.append('render', 'svg');
+    const cacheKey = resultCacheKey('analyze', imageData, latex);
     
-    const response = await fetch(`${API_BASE_URL}/analyze`, {
+    const response = await postWithRetry(
+      `${API_BASE_URL}/analyze`,
+      { traceparent: createTraceparent(), ...clientHeaders(), ...conditionalHeaders(cacheKey) },
+      formData
+    );
+
+    if (!response.ok && response.status !== 304) {
+      const error = await response.json().catch(() => ({ message: 'Erreur inconnue' }));
+      throw { response: { status: response.status, data: error } };
+    }
+
+    const data = await readResult(response, cacheKey);
+    return {
+      problem: data.problem || '',
+      solution: data.solution || '',
+      steps: data.steps || [],
+      latex: data.latex || '',
+      latexRendered: data.latex_rendered || null,
+    };
+  } catch (error) {
+    // Si c'est une erreur de fetch (Failed to fetch), la gérer spécifiquement
+    if (error instanceof TypeError && error.message.includes('fetch')) {
+      const backendUrl = import.meta.env.VITE_API_BASE_URL || 'http://localhost:5000/api';
+      throw new Error(`Impossible de se connecter au serveur backend. Vérifiez que le serveur est démarré sur ${backendUrl}`);
+    }
+    const errorMessage = handleApiError(error);
+    throw new Error(errorMessage);
+  }
+};
+
+/**
+ * Historique des analyses de ce navigateur, de la plus récente à la plus ancienne
+ * @param {string|null} cursor - next_cursor de la page précédente
+ * @returns {Promise<{items: Array, next_cursor: string|null}>}
+ */
+export const getHistory = async (cursor = null, limit = 20) => {
+  try {
+    const params = new URLSearchParams({ limit: String(limit) });
+    if (cursor) {
+      params.set('cursor', cursor);
+    }
+    const response = await fetch(`${API_BASE_URL}/history?${params}`, {
+      headers: { traceparent: createTraceparent(), ...clientHeaders() },
+    });
+
+    if (!response.ok) {
+      const error = await response.json().catch(() => ({ message: 'Erreur inconnue' }));
+      throw { response: { status: response.status, data: error } };
+    }
+
+    const data = await response.json();
+    return { items: data.items || [], next_cursor: data.next_cursor || null };
+  } catch (error) {
+    const errorMessage = handleApiError(error);
+    throw new Error(errorMessage);
+  }
+};
+
+/**
+ * Analyse complète en flux : chaque étape expliquée est reçue dès que le LLM l'a écrite
+ * @param {string|File} imageData - Image en base64 ou File
+ * @param {string} latex - LaTeX confirmé par l'utilisateur (optionnel)
+ * @param {Function} onEvent - Appelée avec chaque ligne reçue ('latex', 'solution', 'step')
+ * @returns {Promise<{problem: string, solution: string, steps: Array, latex: string}>} - Analyse complète
+ */
+export const analyzeImageStream = async (imageData, latex = null, onEvent = () => {}) => {
+  try {
+    const formData = imageToFormData(imageData);
+    if (latex) {
+      formData.append('latex', latex);
+    }
+
+    const response = await fetch(`${API_BASE_URL}/analyze/stream`, {
       method: 'POST',
+      headers: { traceparent: createTraceparent(), ...clientHeaders() },
       body: formData,
     });
 
@@ -139,6 +345,58 @@ export const analyzeImage = async (imageData, latex = null) => {
       throw { response: { status: response.status, data: error } };
     }
 
+    // Une ligne JSON par événement (NDJSON); la ligne 'done' contient l'analyse complète
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let result = null;
+    for (;;) {
+      const { done, value } = await reader.read();
+      buffer += decoder.decode(value || new Uint8Array(), { stream: !done });
+      const lines = buffer.split('\n');
+      buffer = lines.pop();
+      for (const line of lines) {
+        if (!line.trim()) continue;
+        const record = JSON.parse(line);
+        if (record.event === 'error') {
+          throw { response: { status: record.status, data: { detail: record.detail } } };
+        }
+        if (record.event === 'done') {
+          result = record.result;
+        } else {
+          onEvent(record);
+        }
+      }
+      if (done) break;
+    }
+    return {
+      problem: result?.problem || '',
+      solution: result?.solution || '',
+      steps: result?.steps || [],
+      latex: result?.latex || '',
+    };
+  } catch (error) {
+    const errorMessage = handleApiError(error);
+    throw new Error(errorMessage);
+  }
+};
+
+/**
+ * Analyse passée, relue depuis l'historique (sans recalcul)
+ * @param {string} analysisId - Identifiant renvoyé dans X-Analysis-Id ou par getHistory
+ * @returns {Promise<{problem: string, solution: string, steps: Array, latex: string}>}
+ */
+export const getPastAnalysis = async (analysisId) => {
+  try {
+    const response = await fetch(`${API_BASE_URL}/history/${encodeURIComponent(analysisId)}`, {
+      headers: { traceparent: createTraceparent() },
+    });
+
+    if (!response.ok) {
+      const error = await response.json().catch(() => ({ message: 'Erreur inconnue' }));
+      throw { response: { status: response.status, data: error } };
+    }
+
     const data = await response.json();
     return {
       problem: data.problem || '',
@@ -147,11 +405,109 @@ export const analyzeImage = async (imageData, latex = null) => {
       latex: data.latex || '',
     };
   } catch (error) {
-    // Si c'est une erreur de fetch (Failed to fetch), la gérer spécifiquement
-    if (error instanceof TypeError && error.message.includes('fetch')) {
-      const backendUrl = import.meta.env.VITE_API_BASE_URL || 'http://localhost:5000/api';
-      throw new Error(`Impossible de se connecter au serveur backend. Vérifiez que le serveur est démarré sur ${backendUrl}`);
+    const errorMessage = handleApiError(error);
+    throw new Error(errorMessage);
+  }
+};
+
+/**
+ * Problèmes déjà résolus de même structure (à proposer avant une nouvelle résolution)
+ * @param {string} latex - LaTeX du problème
+ * @returns {Promise<Array<{analysis_id: string, latex: string, solution: string, score: number}>>}
+ */
+export const getSimilarProblems = async (latex, k = 3) => {
+  try {
+    const params = new URLSearchParams({ latex, k: String(k) });
+    const response = await fetch(`${API_BASE_URL}/similar?${params}`, {
+      headers: { traceparent: createTraceparent() },
+    });
+
+    if (!response.ok) {
+      const error = await response.json().catch(() => ({ message: 'Erreur inconnue' }));
+      throw { response: { status: response.status, data: error } };
+    }
+
+    const data = await response.json();
+    return data.similar || [];
+  } catch (error) {
+    const errorMessage = handleApiError(error);
+    throw new Error(errorMessage);
+  }
+};
+
+/**
+ * Traite un document de plusieurs pages (PDF ou archive zip), résultats au fil de l'eau
+ * @param {File} file - Document
+ * @param {Function} onPage - Appelée avec le résultat de chaque page dès qu'il arrive
+ * @param {boolean} analyze - Analyse complète de chaque page (sinon extraction LaTeX)
+ * @returns {Promise<{pages: number, ok: number, degraded: number, error: number}>} - Bilan
+ */
+export const ingestDocument = async (file, onPage, analyze = false) => {
+  try {
+    const formData = new FormData();
+    formData.append('file', file);
+    formData.append('analyze', analyze ? 'true' : 'false');
+
+    const response = await fetch(`${API_BASE_URL}/ingest`, {
+      method: 'POST',
+      headers: { traceparent: createTraceparent() },
+      body: formData,
+    });
+
+    if (!response.ok) {
+      const error = await response.json().catch(() => ({ message: 'Erreur inconnue' }));
+      throw { response: { status: response.status, data: error } };
+    }
+
+    // Une ligne JSON par page (NDJSON), puis le bilan
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let summary = null;
+    for (;;) {
+      const { done, value } = await reader.read();
+      buffer += decoder.decode(value || new Uint8Array(), { stream: !done });
+      const lines = buffer.split('\n');
+      buffer = lines.pop();
+      for (const line of lines) {
+        if (!line.trim()) continue;
+        const record = JSON.parse(line);
+        if (record.done) {
+          summary = record;
+        } else {
+          onPage(record);
+        }
+      }
+      if (done) break;
     }
+    return summary;
+  } catch (error) {
+    const errorMessage = handleApiError(error);
+    throw new Error(errorMessage);
+  }
+};
+
+/**
+ * Export PDF côté serveur (formules composées par le backend)
+ * @param {Array<Object>} analyses - Résultats d'analyse à inclure
+ * @param {string} title - Titre du document
+ * @returns {Promise<Blob>} - Document PDF
+ */
+export const exportPDF = async (analyses, title = null) => {
+  try {
+    const response = await fetch(`${API_BASE_URL}/export/pdf`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json', traceparent: createTraceparent() },
+      body: JSON.stringify({ title, analyses }),
+    });
+
+    if (!response.ok) {
+      const error = await response.json().catch(() => ({ message: 'Erreur inconnue' }));
+      throw { response: { status: response.status, data: error } };
+    }
+
+    return await response.blob();
+  } catch (error) {
     const errorMessage = handleApiError(error);
     throw new Error(errorMessage);
   }
@@ -168,6 +524,7 @@ export const uploadImage = async (imageData) => {
     
     const response = await fetch(`${API_BASE_URL}/upload`, {
       method: 'POST',
+      headers: { traceparent: createTraceparent() },
       body: formData,
     });
 